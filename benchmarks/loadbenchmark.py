@@ -0,0 +1,215 @@
+import contextlib
+import itertools
+import json
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import requests
+from absl import app, flags
+
+from benchmarks.serverprocess import SERVER_URL, run_server, wait_until_ready
+from simple_jetson_nano_detection_server.latencyhistogram import LatencyHistogram
+
+_BACKEND = flags.DEFINE_enum(
+    name='backend',
+    default='engine',
+    enum_values=['engine', 'simulated', 'external'],
+    help='"engine" starts the server with the engine from --server_args, "simulated" starts a server with a simulated '
+    'model that needs no GPU, and "external" benchmarks the server already running at --server_url',
+)
+
+_IMAGE_PATHS = flags.DEFINE_list(
+    name='image_paths',
+    default=['images/bus.jpg'],
+    help='Images to send in the detection requests, in turn',
+)
+
+_CONCURRENCY = flags.DEFINE_integer(
+    name='concurrency',
+    default=1,
+    lower_bound=1,
+    help='Number of requests that can be outstanding at once',
+)
+
+_REQUEST_RATE = flags.DEFINE_float(
+    name='request_rate',
+    default=0.0,
+    lower_bound=0.0,
+    help='Requests per second to send regardless of how fast the server responds. '
+    'Set to 0 to send the next request as soon as the previous one is responded instead',
+)
+
+_DURATION_S = flags.DEFINE_float(
+    name='duration_s',
+    default=30.0,
+    lower_bound=0.0,
+    help='Duration in seconds to send requests for',
+)
+
+_REQUEST_TIMEOUT_S = flags.DEFINE_float(
+    name='request_timeout_s',
+    default=10.0,
+    lower_bound=0.0,
+    help='Count a request as an error if it is not responded within this many seconds',
+)
+
+_READY_TIMEOUT_S = flags.DEFINE_float(
+    name='ready_timeout_s',
+    default=600.0,
+    lower_bound=0.0,
+    help='Give up if the server is not ready within this many seconds',
+)
+
+_OUTPUT_PATH = flags.DEFINE_string(
+    name='output_path',
+    default=None,
+    help='If set, also write the results as JSON to this file',
+)
+
+_PERCENTILES = (50, 95, 99)
+
+
+# Encodes the image the same way Frigate's DeepStack detector does, with requests.post(data=..., files=...).
+# Returns the request body and its Content-Type.
+def _build_frigate_request(image_data: bytes) -> Tuple[bytes, str]:
+  request = requests.Request('POST', 'http://localhost', data={'api_key': ''}, files={'image': image_data}).prepare()
+  assert isinstance(request.body, bytes)
+  return request.body, request.headers['Content-Type']
+
+
+class _LoadGenerator:
+
+  def __init__(self, detection_url: str, frigate_requests: List[Tuple[bytes, str]], request_rate: float,
+               duration_s: float) -> None:
+    self._detection_url = detection_url
+    self._frigate_requests = frigate_requests
+    self._request_rate = request_rate
+    self._duration_s = duration_s
+
+    self._lock = threading.Lock()
+    self._sequence = itertools.count()
+    self._start_s = 0.0
+    self._latencies = LatencyHistogram()
+    self._errors: Dict[str, int] = {}
+    self._successes = 0
+
+  # Returns the index of the next request and when it should be sent.
+  # With a request rate, the schedule is fixed in advance so a slow server cannot slow down the arrivals.
+  def _get_next_request(self) -> Tuple[int, float]:
+    with self._lock:
+      index = next(self._sequence)
+    if self._request_rate == 0:
+      return index, time.perf_counter()
+    return index, self._start_s + index / self._request_rate
+
+  # Latency is measured from when the request was scheduled, so requests delayed by all workers being busy are
+  # counted as slow instead of being left out.
+  def _run_worker(self) -> None:
+    session = requests.Session()
+    latencies = LatencyHistogram()
+    errors: Dict[str, int] = {}
+    successes = 0
+
+    while True:
+      index, scheduled_s = self._get_next_request()
+      if scheduled_s - self._start_s >= self._duration_s:
+        break
+      time.sleep(max(scheduled_s - time.perf_counter(), 0))
+
+      body, content_type = self._frigate_requests[index % len(self._frigate_requests)]
+      error = None
+      try:
+        response = session.post(self._detection_url,
+                                data=body,
+                                headers={'Content-Type': content_type},
+                                timeout=_REQUEST_TIMEOUT_S.value)
+        if response.status_code != 200:
+          error = f'http_{response.status_code}'
+        elif not response.json()['success']:
+          error = 'detection_failure'
+      except requests.Timeout:
+        error = 'timeout'
+      except requests.ConnectionError:
+        error = 'connection_error'
+
+      if error is None:
+        successes += 1
+        latencies.record(int((time.perf_counter() - scheduled_s) * 1e9))
+      else:
+        errors[error] = errors.get(error, 0) + 1
+
+    with self._lock:
+      self._latencies.merge(latencies)
+      for error, count in errors.items():
+        self._errors[error] = self._errors.get(error, 0) + count
+      self._successes += successes
+
+  def run(self, concurrency: int) -> Dict:
+    threads = [threading.Thread(target=self._run_worker, name=f'load-{i}') for i in range(concurrency)]
+    self._start_s = time.perf_counter()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    elapsed_s = time.perf_counter() - self._start_s
+
+    error_count = sum(self._errors.values())
+    total = self._successes + error_count
+    results = {
+        'requests': total,
+        'successes': self._successes,
+        'errors': self._errors,
+        'error_rate': error_count / total if total > 0 else 0.0,
+        'elapsed_s': elapsed_s,
+        'throughput_rps': self._successes / elapsed_s,
+    }
+    if self._latencies.count > 0:
+      results['latency_ms'] = {
+          **{f'p{p}': self._latencies.get_percentile(p) / 1e6 for p in _PERCENTILES},
+          'max': self._latencies.max_ns / 1e6,
+          'mean': self._latencies.sum_ns / self._latencies.count / 1e6,
+      }
+    return results
+
+
+# Raises the server's size limits to fit the largest request, --server_args can still override them.
+@contextlib.contextmanager
+def _run_backend(frigate_requests: List[Tuple[bytes, str]]) -> Iterator[None]:
+  if _BACKEND.value == 'external':
+    yield
+    return
+
+  module = 'benchmarks.simulatedserver' if _BACKEND.value == 'simulated' else 'simple_jetson_nano_detection_server.main'
+  max_content_length = max(len(body) for body, _ in frigate_requests)
+  size_args = [f'--max_content_length={max_content_length}', f'--max_image_data_bytes={max_content_length}']
+  with run_server(module, size_args):
+    yield
+
+
+def main(args: List[str]) -> None:
+  frigate_requests: List[Tuple[bytes, str]] = []
+  for image_path in _IMAGE_PATHS.value:
+    with open(image_path, 'rb') as fp:
+      frigate_requests.append(_build_frigate_request(fp.read()))
+
+  with _run_backend(frigate_requests):
+    wait_until_ready(SERVER_URL.value, _READY_TIMEOUT_S.value)
+    load_generator = _LoadGenerator(f'{SERVER_URL.value}/v1/vision/detection', frigate_requests, _REQUEST_RATE.value,
+                                    _DURATION_S.value)
+    results = {
+        'backend': _BACKEND.value,
+        'concurrency': _CONCURRENCY.value,
+        'request_rate': _REQUEST_RATE.value,
+        'image_paths': _IMAGE_PATHS.value,
+        **load_generator.run(_CONCURRENCY.value),
+    }
+
+  if _OUTPUT_PATH.value is not None:
+    with open(_OUTPUT_PATH.value, 'w') as fp:
+      json.dump(results, fp, indent=2)
+  print(json.dumps(results))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,74 @@
+import json
+import time
+from enum import Enum, auto
+from typing import List
+
+from absl import app, flags
+from line_protocol_cache.lineprotocolcache import LineProtocolCache
+
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import Prediction
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+_REQUESTS = flags.DEFINE_integer(
+    name='requests',
+    default=100000,
+    lower_bound=1,
+    help='Number of simulated requests for each mode',
+)
+
+
+class _PerformanceCheckpoint(Enum):
+  PARSE_REQUEST_BODY = auto()
+  PARSE_MULTIPART_BOUNDARY = auto()
+  COMPUTE_RESPONSE = auto()
+  SEND_RESPONSE = auto()
+
+
+_IMAGE_DATA = b'\xff' * 32 * 1024
+_PREDICTIONS = [
+    Prediction.build(x_min=132, x_max=177, y_min=104, y_max=141, label='car', confidence=0.6460136771202087),
+    Prediction.build(x_min=264, x_max=319, y_min=173, y_max=179, label='person', confidence=0.42441198229789734),
+    Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='car', confidence=0.29746994376182556),
+    Prediction.build(x_min=10, x_max=20, y_min=30, y_max=40, label='dog', confidence=0.5),
+    Prediction.build(x_min=50, x_max=60, y_min=70, y_max=80, label='bicycle', confidence=0.75),
+]
+
+
+# Makes the same metrics calls as one detection request in HttpRequestDispatcher and YoloPredictor.
+def _simulate_request() -> None:
+  tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker()
+  for checkpoint in _PerformanceCheckpoint:
+    with tracker(checkpoint):
+      pass
+
+  YoloPredictor._record_image_size(_IMAGE_DATA)
+  YoloPredictor._record_coco_categories(_PREDICTIONS)
+  tracker.aggregate('http_request_dispatcher', {'response_code': 200})
+
+
+# Only measures the time spent on the request thread, flushing happens in the background.
+def _measure_ns_per_request(generate_metrics: bool) -> float:
+  with MetricsAggregator(enabled=generate_metrics):
+    start_ns = time.perf_counter_ns()
+    for _ in range(_REQUESTS.value):
+      _simulate_request()
+    return (time.perf_counter_ns() - start_ns) / _REQUESTS.value
+
+
+def main(args: List[str]) -> None:
+  with LineProtocolCache():
+    off_ns = _measure_ns_per_request(generate_metrics=False)
+    on_ns = _measure_ns_per_request(generate_metrics=True)
+
+  print(
+      json.dumps({
+          'generate_metrics_off_ns_per_request': off_ns,
+          'generate_metrics_on_ns_per_request': on_ns,
+          'overhead_ns_per_request': on_ns - off_ns,
+      }))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,222 @@
+import json
+import os
+import random
+import sys
+import timeit
+from email.message import Message
+from enum import Enum, auto
+from typing import Callable, Dict, List, Tuple
+
+import requests
+from absl import app, flags, logging
+
+from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.eventmetricstracker import EventMetricsTracker
+from simple_jetson_nano_detection_server.httprequesdispatcher import HttpRequestDispatcher
+from simple_jetson_nano_detection_server.imagedataextractor import ImageDataExtractor
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import (Prediction, PredictionJsonEncoder,
+                                                            PredictionResponseEncoder)
+
+_BASELINE_PATH = flags.DEFINE_string(
+    name='baseline_path',
+    default='data/benchmarks/microbenchmark-baseline.json',
+    help='Path to the results to compare against',
+)
+
+_SAVE_BASELINE = flags.DEFINE_bool(
+    name='save_baseline',
+    default=False,
+    help='Save the results to --baseline_path instead of comparing against it',
+)
+
+_REGRESSION_THRESHOLD = flags.DEFINE_float(
+    name='regression_threshold',
+    default=0.2,
+    lower_bound=0.0,
+    help='A benchmark regressed if it is slower than the baseline by more than this ratio',
+)
+
+_REPEATS = flags.DEFINE_integer(
+    name='repeats',
+    default=5,
+    lower_bound=1,
+    help='Number of times to time each benchmark. The fastest time is reported, as the slower ones are noise',
+)
+
+_PREDICTION_COUNTS = (0, 5, 100)
+# Encoding is also benchmarked with many predictions, where the cost per prediction dominates.
+_ENCODE_PREDICTION_COUNTS = _PREDICTION_COUNTS + (1000,)
+
+# The same as the names of an Ultralytics model trained on COCO.
+_NAMES = {i: label.value for i, label in enumerate(CocoLabel)}
+
+
+class _PerformanceCheckpoint(Enum):
+  PARSE_REQUEST_BODY = auto()
+  PARSE_MULTIPART_BOUNDARY = auto()
+  COMPUTE_RESPONSE = auto()
+  SEND_RESPONSE = auto()
+
+
+class _NestedCheckpoint(Enum):
+  EXTRACT_IMAGE_DATA = auto()
+  PREDICT = auto()
+  MODEL_PREDICT = auto()
+  ENCODE_RESPONSE = auto()
+
+
+class _EventMetricsFields(Enum):
+  IMAGES = auto()
+  IMAGE_BYTES = auto()
+
+
+# A 32KiB image encoded the same way as Frigate does, which is the largest image size observed.
+def _build_request() -> Tuple[bytes, Message]:
+  scan_bytes = 32 * 1024 - 4
+  image_data = b'\xff\xd8' + random.Random(0).getrandbits(8 * scan_bytes).to_bytes(scan_bytes, 'big') + b'\xff\xd9'
+  request = requests.Request('POST', 'http://localhost', data={'api_key': ''}, files={'image': image_data}).prepare()
+  assert isinstance(request.body, bytes)
+
+  headers = Message()
+  headers['Content-Type'] = request.headers['Content-Type']
+  headers['Content-Length'] = str(len(request.body))
+  return request.body, headers
+
+
+# The raw outputs of the model, as YoloPredictor reads them from the results.
+def _build_model_outputs(count: int) -> List[Tuple[List[float], float, float]]:
+  rng = random.Random(count)
+  outputs: List[Tuple[List[float], float, float]] = []
+  for _ in range(count):
+    x_min, y_min = rng.uniform(0, 160), rng.uniform(0, 160)
+    xyxy = [x_min, y_min, x_min + rng.uniform(0, 160), y_min + rng.uniform(0, 160)]
+    outputs.append((xyxy, rng.uniform(0.25, 0.95), float(rng.randrange(len(_NAMES)))))
+  return outputs
+
+
+def _build_predictions(outputs: List[Tuple[List[float], float, float]]) -> List[Prediction]:
+  return [
+      Prediction.build(x_min=int(xyxy[0]),
+                       y_min=int(xyxy[1]),
+                       x_max=int(xyxy[2]),
+                       y_max=int(xyxy[3]),
+                       confidence=float(confidence),
+                       label=str(_NAMES.get(int(class_id)))) for xyxy, confidence, class_id in outputs
+  ]
+
+
+def _finalize_prediction_output(predictions: List[Prediction]) -> None:
+  tracker: EventMetricsTracker[CocoLabel] = EventMetricsTracker()
+  for prediction in predictions:
+    tracker.increment(prediction.label, 1, {'confidence_percent': int(prediction.confidence * 100)})
+  tracker.finalize('prediction_output', {'model_device': 'auto', 'model_image_size': 320, 'model_precision': 'fp16'})
+
+
+def _finalize_prediction_input(image_data_bytes: int) -> None:
+  tracker: EventMetricsTracker[_EventMetricsFields] = EventMetricsTracker()
+  tracker.increment(_EventMetricsFields.IMAGES)
+  tracker.increment(_EventMetricsFields.IMAGE_BYTES, image_data_bytes)
+  tracker.finalize('prediction_input')
+
+
+# Tracks the same spans as one detection request in HttpRequestDispatcher and the code it calls.
+def _track_request() -> Dict[str, int]:
+  tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker()
+  with tracker(_PerformanceCheckpoint.PARSE_REQUEST_BODY):
+    pass
+  with tracker(_PerformanceCheckpoint.PARSE_MULTIPART_BOUNDARY):
+    pass
+  with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE), tracker.as_current():
+    with PerformanceTracker.span(_NestedCheckpoint.EXTRACT_IMAGE_DATA):
+      pass
+    with PerformanceTracker.span(_NestedCheckpoint.PREDICT):
+      with PerformanceTracker.span(_NestedCheckpoint.MODEL_PREDICT):
+        pass
+    with PerformanceTracker.span(_NestedCheckpoint.ENCODE_RESPONSE):
+      pass
+  with tracker(_PerformanceCheckpoint.SEND_RESPONSE):
+    pass
+  return tracker.get_latencies_ns()
+
+
+def _get_benchmarks() -> Dict[str, Callable[[], object]]:
+  request_body, headers = _build_request()
+  multipart_boundary = str(headers.get_param('boundary'))
+  # Only the headers are needed to parse the boundary, so the handler is not connected to a socket.
+  dispatcher: HttpRequestDispatcher = HttpRequestDispatcher.__new__(HttpRequestDispatcher)
+  dispatcher.headers = headers  # type: ignore
+
+  benchmarks: Dict[str, Callable[[], object]] = {
+      'get_first_image_data_32kib': lambda: ImageDataExtractor.get_first_image_data(request_body, multipart_boundary),
+      'get_post_multipart_boundary': dispatcher._get_post_multipart_boundary,
+      'event_metrics_tracker_finalize_prediction_input': lambda: _finalize_prediction_input(32 * 1024),
+      'performance_tracker_request': _track_request,
+  }
+  for count in _PREDICTION_COUNTS:
+    outputs = _build_model_outputs(count)
+    benchmarks[f'prediction_build_{count}'] = lambda outputs=outputs: _build_predictions(outputs)
+    if count > 0:
+      predictions = _build_predictions(outputs)
+      benchmarks[f'event_metrics_tracker_finalize_prediction_output_{count}'] = (
+          lambda predictions=predictions: _finalize_prediction_output(predictions))
+
+  # The JSON encoder is the previous way of encoding the response, kept for comparison.
+  for count in _ENCODE_PREDICTION_COUNTS:
+    predictions = _build_predictions(_build_model_outputs(count))
+    response = {'predictions': predictions, 'success': True}
+    benchmarks[f'prediction_json_encode_{count}'] = (
+        lambda response=response: json.dumps(response, cls=PredictionJsonEncoder).encode())
+    benchmarks[f'prediction_response_encode_{count}'] = (
+        lambda predictions=predictions: PredictionResponseEncoder.encode(predictions, True))
+  return benchmarks
+
+
+# Returns the fastest time per call in nanoseconds. Each timing runs for at least 0.2s to reduce the timer overhead.
+def _measure_ns_per_call(benchmark: Callable[[], object]) -> float:
+  timer = timeit.Timer(benchmark)
+  number, _ = timer.autorange()
+  return min(timer.repeat(repeat=_REPEATS.value, number=number)) / number * 1e9
+
+
+def main(args: List[str]) -> None:
+  results = {name: _measure_ns_per_call(benchmark) for name, benchmark in _get_benchmarks().items()}
+
+  if _SAVE_BASELINE.value:
+    os.makedirs(os.path.dirname(_BASELINE_PATH.value) or '.', exist_ok=True)
+    with open(_BASELINE_PATH.value, 'w') as fp:
+      json.dump(results, fp, indent=2)
+    print(json.dumps(results))
+    return
+
+  baseline: Dict[str, float] = {}
+  if os.path.exists(_BASELINE_PATH.value):
+    with open(_BASELINE_PATH.value, 'r') as fp:
+      baseline = json.load(fp)
+  else:
+    logging.warning(f'No baseline at {_BASELINE_PATH.value}, run with --save_baseline first to detect regressions.')
+
+  regressions: List[str] = []
+  for name, ns_per_call in results.items():
+    baseline_ns_per_call = baseline.get(name)
+    ratio = None if baseline_ns_per_call is None else ns_per_call / baseline_ns_per_call
+    regressed = ratio is not None and ratio > 1 + _REGRESSION_THRESHOLD.value
+    if regressed:
+      regressions.append(name)
+    print(
+        json.dumps({
+            'benchmark': name,
+            'ns_per_call': ns_per_call,
+            'baseline_ns_per_call': baseline_ns_per_call,
+            'ratio': ratio,
+            'regressed': regressed,
+        }))
+
+  if len(regressions) > 0:
+    logging.error(f'{len(regressions)} benchmarks regressed by more than {_REGRESSION_THRESHOLD.value:.0%}: '
+                  f'{regressions}')
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,49 @@
+import contextlib
+import signal
+import subprocess
+import sys
+import time
+from typing import Iterator, List
+
+import requests
+from absl import flags, logging
+
+SERVER_ARGS = flags.DEFINE_list(
+    name='server_args',
+    default=[],
+    help='Extra command line flags passed to the server, e.g. --flagfile=data/flags/detection-server.txt',
+)
+
+SERVER_URL = flags.DEFINE_string(
+    name='server_url',
+    default='http://127.0.0.1:32168',
+    help='The URL the server is reachable at once started. Must match the IP and port in --server_args',
+)
+
+
+# Starts the server module in a separate process, and interrupts it on exit like pressing Ctrl+C would.
+@contextlib.contextmanager
+def run_server(module: str = 'simple_jetson_nano_detection_server.main',
+               args: List[str] = []) -> Iterator[subprocess.Popen]:
+  command = [sys.executable, '-m', module, *args, *SERVER_ARGS.value]
+  logging.info(f'Starting server with {command=}.')
+  server = subprocess.Popen(command)
+
+  try:
+    yield server
+  finally:
+    server.send_signal(signal.SIGINT)
+    server.wait(timeout=30)
+
+
+def wait_until_ready(server_url: str, timeout_s: float, poll_interval_s: float = 0.1) -> None:
+  start_s = time.perf_counter()
+  while time.perf_counter() - start_s < timeout_s:
+    try:
+      if requests.head(server_url, timeout=1.0).status_code == 200:
+        return
+    except requests.ConnectionError:
+      pass
+    time.sleep(poll_interval_s)
+
+  raise TimeoutError(f'Server at {server_url} is not ready after {timeout_s}s')
@@ -0,0 +1,95 @@
+import random
+import time
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, List, NamedTuple
+
+from absl import app, flags, logging
+from line_protocol_cache.lineprotocolcache import LineProtocolCache
+
+from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.httprequesdispatcher import HttpRequestDispatcher
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceScheduler
+from simple_jetson_nano_detection_server.main import GENERATE_METRICS, SERVER_IP, SERVER_PORT
+from simple_jetson_nano_detection_server.memorymonitor import MemoryMonitor
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.predictorpool import PREDICTOR_POOL_SIZE, PredictorPool
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.sharedmemoryserver import SharedMemoryServer
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+_SIMULATED_INFERENCE_MS = flags.DEFINE_float(
+    name='simulated_inference_ms',
+    default=30.0,
+    lower_bound=0.0,
+    help='Duration in milliseconds that each simulated prediction sleeps for',
+)
+
+_SIMULATED_PREDICTIONS = flags.DEFINE_integer(
+    name='simulated_predictions',
+    default=5,
+    lower_bound=0,
+    help='Number of boxes returned by each simulated prediction',
+)
+
+
+class _Values(NamedTuple):
+  values: List[Any]
+
+  def tolist(self) -> List[Any]:
+    return self.values
+
+
+class _SimulatedBoxes(NamedTuple):
+  xyxy: _Values
+  conf: _Values
+  cls: _Values
+
+
+class _SimulatedResult(NamedTuple):
+  boxes: _SimulatedBoxes
+  speed: Dict[str, float]
+
+
+# Stands in for an Ultralytics model. Sleeping releases the GIL like TensorRT inference does, so the rest of the
+# request path behaves as it would with a real engine.
+class _SimulatedModel:
+
+  def __init__(self, inference_ms: float, prediction_count: int) -> None:
+    self.names = {i: label.value for i, label in enumerate(CocoLabel)}
+    self._inference_ms = inference_ms
+    self._prediction_count = prediction_count
+
+  def predict(self, source: str, **kwargs) -> List[_SimulatedResult]:
+    time.sleep(self._inference_ms / 1000)
+
+    xyxy: List[List[float]] = []
+    for _ in range(self._prediction_count):
+      x_min, y_min = random.uniform(0, 160), random.uniform(0, 160)
+      xyxy.append([x_min, y_min, x_min + random.uniform(0, 160), y_min + random.uniform(0, 160)])
+    boxes = _SimulatedBoxes(
+        xyxy=_Values(xyxy),
+        conf=_Values([random.uniform(0.25, 0.95) for _ in range(self._prediction_count)]),
+        cls=_Values([float(random.randrange(len(self.names))) for _ in range(self._prediction_count)]),
+    )
+    return [_SimulatedResult(boxes, {'preprocess': 0.0, 'inference': self._inference_ms, 'postprocess': 0.0})]
+
+
+# Serves the detection endpoint with a simulated model, so the HTTP and request handling overhead can be benchmarked
+# on any machine. Unlike main, it skips importing Ultralytics and warming up, and is ready right away.
+def main(args: List[str]) -> None:
+  with LineProtocolCache(), MetricsAggregator(enabled=GENERATE_METRICS.value), MemoryMonitor(), \
+      InferenceScheduler(), SharedMemoryServer():
+    PredictorPool.set_predictors([
+        YoloPredictor(_SimulatedModel(_SIMULATED_INFERENCE_MS.value, _SIMULATED_PREDICTIONS.value))
+        for _ in range(PREDICTOR_POOL_SIZE.value)
+    ])
+    ServerStats.set_engines(['simulated'])
+    ServerReadiness.set_ready()
+
+    logging.info('Starting HTTP server with a simulated model.')
+    ThreadingHTTPServer((SERVER_IP.value, SERVER_PORT.value), HttpRequestDispatcher).serve_forever()
+
+
+if __name__ == '__main__':
+  app.run(main)
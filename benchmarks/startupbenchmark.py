@@ -0,0 +1,69 @@
+import json
+import time
+from typing import Dict, List
+
+import requests
+from absl import app, flags
+
+from benchmarks.serverprocess import SERVER_URL, run_server
+
+_IMAGE_PATH = flags.DEFINE_string(
+    name='image_path',
+    default='images/bus.jpg',
+    help='The image to send in the detection requests',
+)
+
+_POLL_INTERVAL_S = flags.DEFINE_float(
+    name='poll_interval_s',
+    default=0.05,
+    lower_bound=0.0,
+    help='Duration in seconds between polling the server',
+)
+
+_TIMEOUT_S = flags.DEFINE_float(
+    name='timeout_s',
+    default=600.0,
+    lower_bound=0.0,
+    help='Give up if the server does not return a successful detection within this many seconds',
+)
+
+
+def _measure_startup(server_url: str, image_data: bytes) -> Dict[str, float]:
+  start_s = time.perf_counter()
+  timestamps_s: Dict[str, float] = {}
+
+  while time.perf_counter() - start_s < _TIMEOUT_S.value:
+    try:
+      head_response = requests.head(server_url, timeout=1.0)
+    except requests.ConnectionError:
+      time.sleep(_POLL_INTERVAL_S.value)
+      continue
+    timestamps_s.setdefault('http_server_bound_s', time.perf_counter() - start_s)
+
+    if head_response.status_code != 200:
+      time.sleep(_POLL_INTERVAL_S.value)
+      continue
+    timestamps_s.setdefault('ready_s', time.perf_counter() - start_s)
+
+    response = requests.post(f'{server_url}/v1/vision/detection', files={'image': image_data}, timeout=10.0)
+    if response.status_code == 200 and response.json()['success']:
+      timestamps_s['first_detection_s'] = time.perf_counter() - start_s
+      return timestamps_s
+
+    time.sleep(_POLL_INTERVAL_S.value)
+
+  raise TimeoutError(f'No successful detection after {_TIMEOUT_S.value}s, got {timestamps_s=}')
+
+
+def main(args: List[str]) -> None:
+  with open(_IMAGE_PATH.value, 'rb') as fp:
+    image_data = fp.read()
+
+  with run_server():
+    timestamps_s = _measure_startup(SERVER_URL.value, image_data)
+
+  print(json.dumps(timestamps_s))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,217 @@
+import contextlib
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterator, List
+from urllib.parse import urlsplit
+
+import requests
+from absl import app, flags
+
+from benchmarks.serverprocess import SERVER_URL, run_server, wait_until_ready
+from simple_jetson_nano_detection_server.latencyhistogram import LatencyHistogram
+from simple_jetson_nano_detection_server.sharedmemoryclient import SharedMemoryClient
+from simple_jetson_nano_detection_server.websocket import OPCODE_BINARY, WebSocketConnection
+
+_BACKEND = flags.DEFINE_enum(
+    name='backend',
+    default='simulated',
+    enum_values=['engine', 'simulated', 'external'],
+    help='"engine" starts the server with the engine from --server_args, "simulated" starts a server with a simulated '
+    'model that returns right away, and "external" benchmarks the server already running at --server_url and '
+    '--socket_path',
+)
+
+_SOCKET_PATH = flags.DEFINE_string(
+    name='socket_path',
+    default='/tmp/simple-jetson-nano-detection-server.sock',
+    help='The --shared_memory_socket_path of the server',
+)
+
+_IMAGE_PATHS = flags.DEFINE_list(
+    name='image_paths',
+    default=['images/bus.jpg'],
+    help='Images to send in the detection requests, in turn',
+)
+
+_CONCURRENCY = flags.DEFINE_integer(
+    name='concurrency',
+    default=1,
+    lower_bound=1,
+    help='Number of clients sending requests at once over each transport',
+)
+
+_DURATION_S = flags.DEFINE_float(
+    name='duration_s',
+    default=10.0,
+    lower_bound=0.0,
+    help='Duration in seconds to send requests for over each transport',
+)
+
+_READY_TIMEOUT_S = flags.DEFINE_float(
+    name='ready_timeout_s',
+    default=600.0,
+    lower_bound=0.0,
+    help='Give up if the server is not ready within this many seconds',
+)
+
+_OUTPUT_PATH = flags.DEFINE_string(
+    name='output_path',
+    default=None,
+    help='If set, also write the results as JSON to this file',
+)
+
+_PERCENTILES = (50, 95, 99)
+
+
+# Returns a function that sends the image at the index and returns if the detection succeeded. Each client is used by
+# one thread, and is closed by the exit stack.
+def _connect_http(stack: contextlib.ExitStack, images: List[bytes]) -> Callable[[int], bool]:
+  session = stack.enter_context(requests.Session())
+  # Encodes the images ahead of time the same way Frigate's DeepStack detector does, so only sending them is timed.
+  detection_requests = [
+      requests.Request('POST', f'{SERVER_URL.value}/v1/vision/detection',
+                       data={'api_key': ''},
+                       files={'image': image_data}).prepare() for image_data in images
+  ]
+
+  def detect(index: int) -> bool:
+    response = session.send(detection_requests[index])
+    return response.status_code == 200 and response.json()['success']
+
+  return detect
+
+
+def _connect_shared_memory(stack: contextlib.ExitStack, images: List[bytes]) -> Callable[[int], bool]:
+  client = stack.enter_context(SharedMemoryClient(_SOCKET_PATH.value))
+
+  def detect(index: int) -> bool:
+    response_code, response = client.detect(images[index])
+    return response_code == 200 and json.loads(response)['success']
+
+  return detect
+
+
+# Waits for the response to each frame before sending the next one, so no frame is dropped.
+def _connect_detection_stream(stack: contextlib.ExitStack, images: List[bytes]) -> Callable[[int], bool]:
+  server_url = urlsplit(SERVER_URL.value)
+  connection = WebSocketConnection.connect(server_url.hostname or '127.0.0.1', server_url.port or 80,
+                                           '/v1/vision/detection/stream', 1024 * 1024)
+  stack.callback(connection.close_streams)
+  stack.callback(connection.close)
+
+  def detect(index: int) -> bool:
+    connection.send(OPCODE_BINARY, images[index])
+    message = connection.receive()
+    return message is not None and json.loads(message[1]).get('success', False)
+
+  return detect
+
+
+# Each client sends its next request as soon as the previous one is responded, so the latencies are the round trips.
+def _run_transport(connect: Callable[[contextlib.ExitStack, List[bytes]], Callable[[int], bool]],
+                   images: List[bytes]) -> Dict:
+  with contextlib.ExitStack() as stack:
+    # Connects before starting the clock, as the shared memory clients lease their slots when connecting.
+    clients = [connect(stack, images) for _ in range(_CONCURRENCY.value)]
+    return _run_clients(clients, len(images))
+
+
+def _run_clients(clients: List[Callable[[int], bool]], image_count: int) -> Dict:
+  lock = threading.Lock()
+  latencies = LatencyHistogram()
+  errors = [0]
+
+  def run_client(detect: Callable[[int], bool], end_s: float) -> None:
+    client_latencies = LatencyHistogram()
+    client_errors = 0
+    index = 0
+    while time.perf_counter() < end_s:
+      start_ns = time.perf_counter_ns()
+      if detect(index % image_count):
+        client_latencies.record(time.perf_counter_ns() - start_ns)
+      else:
+        client_errors += 1
+      index += 1
+
+    with lock:
+      latencies.merge(client_latencies)
+      errors[0] += client_errors
+
+  start_s = time.perf_counter()
+  threads = [
+      threading.Thread(target=run_client, args=(detect, start_s + _DURATION_S.value), name=f'client-{i}')
+      for i, detect in enumerate(clients)
+  ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed_s = time.perf_counter() - start_s
+
+  results = {
+      'successes': latencies.count,
+      'errors': errors[0],
+      'throughput_rps': latencies.count / elapsed_s,
+  }
+  if latencies.count > 0:
+    results['latency_ms'] = {
+        **{f'p{p}': latencies.get_percentile(p) / 1e6 for p in _PERCENTILES},
+        'max': latencies.max_ns / 1e6,
+        'mean': latencies.sum_ns / latencies.count / 1e6,
+    }
+  return results
+
+
+# Enables the shared memory transport with a slot for each client, and raises the size limits to fit the largest image.
+@contextlib.contextmanager
+def _run_backend(images: List[bytes]) -> Iterator[None]:
+  if _BACKEND.value == 'external':
+    yield
+    return
+
+  max_image_bytes = max(len(image_data) for image_data in images)
+  args = [
+      f'--shared_memory_socket_path={_SOCKET_PATH.value}',
+      f'--shared_memory_slots={_CONCURRENCY.value}',
+      f'--shared_memory_slot_bytes={max_image_bytes}',
+      f'--max_content_length={max_image_bytes + 1024}',
+      f'--max_image_data_bytes={max_image_bytes}',
+      f'--detection_stream_max_frame_bytes={max_image_bytes}',
+  ]
+  if _BACKEND.value == 'simulated':
+    # Predicting takes no time, so the difference between the transports is not hidden behind the inference.
+    with run_server('benchmarks.simulatedserver', [*args, '--simulated_inference_ms=0']):
+      yield
+  else:
+    with run_server('simple_jetson_nano_detection_server.main', args):
+      yield
+
+
+# Compares the latency of sending the same images over HTTP, over the detection stream and over the shared memory
+# transport.
+def main(args: List[str]) -> None:
+  images: List[bytes] = []
+  for image_path in _IMAGE_PATHS.value:
+    with open(image_path, 'rb') as fp:
+      images.append(fp.read())
+
+  with _run_backend(images):
+    wait_until_ready(SERVER_URL.value, _READY_TIMEOUT_S.value)
+    results = {
+        'backend': _BACKEND.value,
+        'concurrency': _CONCURRENCY.value,
+        'image_paths': _IMAGE_PATHS.value,
+        'http': _run_transport(_connect_http, images),
+        'detection_stream': _run_transport(_connect_detection_stream, images),
+        'shared_memory': _run_transport(_connect_shared_memory, images),
+    }
+
+  if _OUTPUT_PATH.value is not None:
+    with open(_OUTPUT_PATH.value, 'w') as fp:
+      json.dump(results, fp, indent=2)
+  print(json.dumps(results))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -16,6 +16,11 @@ setuptools.setup(
     entry_points={
         'console_scripts': [
             'simple-jetson-nano-detection-server = simple_jetson_nano_detection_server.main:app_run_main',
+            'simple-jetson-nano-bulk-detector = simple_jetson_nano_detection_server.bulkdetector:app_run_main',
+            'simple-jetson-nano-detection-journal-query = simple_jetson_nano_detection_server.detectionjournalquery:app_run_main',
+            'simple-jetson-nano-engine-builder = simple_jetson_nano_detection_server.enginebuilder:app_run_main',
+            'simple-jetson-nano-slow-request-replayer = simple_jetson_nano_detection_server.slowrequestreplayer:app_run_main',
+            'simple-jetson-nano-traffic-replayer = simple_jetson_nano_detection_server.trafficreplayer:app_run_main',
         ],
     },
 )
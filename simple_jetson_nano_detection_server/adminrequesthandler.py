@@ -0,0 +1,113 @@
+import json
+import os
+from typing import Dict, NamedTuple
+
+from absl import flags
+
+from simple_jetson_nano_detection_server.enginemanifest import ENGINE_MANIFEST_PATH, EngineManifest, EngineSpec
+from simple_jetson_nano_detection_server.enginereloader import EngineReloader
+from simple_jetson_nano_detection_server.requesttracer import RequestTracer
+from simple_jetson_nano_detection_server.samplingprofiler import SamplingProfiler
+from simple_jetson_nano_detection_server.slowrequestrecorder import SLOW_REQUESTS_DUMP_DIR, SlowRequestRecorder
+
+ENABLE_ADMIN_ENDPOINTS = flags.DEFINE_bool(
+    name='enable_admin_endpoints',
+    default=False,
+    help='Serve the /admin endpoints for debugging, such as profiling. Do not expose them to untrusted clients',
+)
+
+_PROFILER_MAX_DURATION_S = flags.DEFINE_float(
+    name='profiler_max_duration_s',
+    default=60.0,
+    lower_bound=0.0,
+    help='Maximum duration in seconds that a profiling started from the /admin/profile endpoint can run for',
+)
+
+
+class AdminResponse(NamedTuple):
+  code: int
+  content_type: str
+  body: str
+
+  @classmethod
+  def json(cls, code: int, content: Dict) -> 'AdminResponse':
+    return cls(code, 'application/json', json.dumps(content))
+
+
+class AdminRequestHandler:
+
+  @classmethod
+  def get_response(cls, method: str, path: str, query: Dict[str, str]) -> AdminResponse:
+    if path == '/admin/profile' and method == 'POST':
+      return cls._start_profiler(query)
+    if path == '/admin/profile' and method == 'GET':
+      return cls._get_profile()
+    if path == '/admin/slow-requests' and method == 'GET':
+      return cls._get_slow_requests()
+    if path == '/admin/slow-requests/dump' and method == 'POST':
+      return AdminResponse.json(200, {'path': SlowRequestRecorder.dump(SLOW_REQUESTS_DUMP_DIR.value)})
+    if path == '/admin/reload' and method == 'POST':
+      return cls._start_reload(query)
+    if path == '/admin/reload' and method == 'GET':
+      return AdminResponse.json(200, EngineReloader.get_status())
+    if path == '/admin/trace' and method == 'GET':
+      return cls._get_trace()
+    return AdminResponse.json(404, {'message': f'No admin endpoint for {method} {path}'})
+
+  # Profiling runs in the background, so the server keeps serving detection requests while being profiled.
+  @classmethod
+  def _start_profiler(cls, query: Dict[str, str]) -> AdminResponse:
+    duration_s = float(query.get('duration_s', '10'))
+    assert 0 < duration_s <= _PROFILER_MAX_DURATION_S.value, (
+        f'Expected duration_s to be in (0, {_PROFILER_MAX_DURATION_S.value}], got {duration_s} instead')
+    mode = query.get('mode', 'wall')
+    assert mode in ('wall', 'cpu'), f'Expected mode to be "wall" or "cpu", got "{mode}" instead'
+
+    if not SamplingProfiler.start(duration_s, wall_clock=mode == 'wall'):
+      return AdminResponse.json(409, {'message': 'Profiling is already running'})
+    return AdminResponse.json(202, {'duration_s': duration_s, 'mode': mode})
+
+  @classmethod
+  def _get_profile(cls) -> AdminResponse:
+    if SamplingProfiler.is_running():
+      return AdminResponse.json(409, {'message': 'Profiling is still running'})
+
+    collapsed_stacks = SamplingProfiler.get_collapsed_stacks()
+    if collapsed_stacks is None:
+      return AdminResponse.json(404, {'message': 'No profiling has been run'})
+    return AdminResponse(200, 'text/plain', collapsed_stacks)
+
+  # Reloads the engine at engine_path, or the engine built for engine_spec according to --engine_manifest_path.
+  # Without either, reloads the engine the server was started with, resolving --engine_spec again.
+  @classmethod
+  def _start_reload(cls, query: Dict[str, str]) -> AdminResponse:
+    assert not ('engine_path' in query and 'engine_spec' in query), (
+        'Expected at most one of engine_path and engine_spec')
+    if 'engine_path' in query:
+      engine_path = query['engine_path']
+    elif 'engine_spec' in query:
+      engine_path = EngineManifest(ENGINE_MANIFEST_PATH.value).get_engine_path(EngineSpec.parse(query['engine_spec']))
+    else:
+      engine_path = EngineReloader.get_default_engine_path()
+    assert os.path.exists(engine_path), f'Engine file {engine_path} does not exist'
+
+    if not EngineReloader.start(engine_path):
+      return AdminResponse.json(409, {'message': 'The server is still starting up or another reload is running'})
+    return AdminResponse.json(202, {'engine_path': engine_path})
+
+  @classmethod
+  def _get_trace(cls) -> AdminResponse:
+    if not RequestTracer.is_enabled():
+      return AdminResponse.json(404, {'message': 'Request tracing is disabled, set --request_trace_window_s to enable'})
+    return AdminResponse.json(200, RequestTracer.get_trace())
+
+  # Images are left out to keep the response small, they are included when dumping.
+  @classmethod
+  def _get_slow_requests(cls) -> AdminResponse:
+    slow_requests = []
+    for slow_request in SlowRequestRecorder.get_slow_requests():
+      content = slow_request.to_json_dict()
+      content['image_data'] = None
+      content['has_image_data'] = slow_request.image_data is not None
+      slow_requests.append(content)
+    return AdminResponse.json(200, {'slow_requests': slow_requests})
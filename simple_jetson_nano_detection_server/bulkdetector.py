@@ -0,0 +1,221 @@
+import collections
+import functools
+import glob
+import json
+import os
+import tarfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from absl import app, flags, logging
+
+from simple_jetson_nano_detection_server.enginemanifest import EngineSpec
+from simple_jetson_nano_detection_server.main import ENGINE_SPEC, get_engine_path
+from simple_jetson_nano_detection_server.prediction import Prediction, PredictionResponseEncoder
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+# Importing numpy and OpenCV is slow, only do it for type checking. They are imported when the first image is decoded.
+if TYPE_CHECKING:
+  import numpy
+
+_BULK_INPUTS = flags.DEFINE_list(
+    name='bulk_inputs',
+    default=None,
+    required=True,
+    help='Directories, tar archives or glob patterns of the images to detect objects in, e.g. '
+    '"snapshots/,frames.tar.gz,archive/**/*.jpg". Directories are searched recursively',
+)
+
+_BULK_OUTPUT_PATH = flags.DEFINE_string(
+    name='bulk_output_path',
+    default=None,
+    required=True,
+    help='Path to write the predictions of each image to, one JSON object per line',
+)
+
+_BULK_BATCH_SIZE = flags.DEFINE_integer(
+    name='bulk_batch_size',
+    default=None,
+    lower_bound=1,
+    help='Number of images predicted at once. Must be the batch size the engine was built with. '
+    'Defaults to the batch size of --engine_spec, or 1 with --engine_path',
+)
+
+_BULK_DECODE_WORKERS = flags.DEFINE_integer(
+    name='bulk_decode_workers',
+    default=4,
+    lower_bound=1,
+    help='Number of threads decoding the images while the previous batch is predicted',
+)
+
+_BULK_RESUME = flags.DEFINE_bool(
+    name='bulk_resume',
+    default=True,
+    help='If true, skip the images already in --bulk_output_path and append the rest. '
+    'If false, overwrite --bulk_output_path',
+)
+
+_BULK_REPORT_INTERVAL_S = flags.DEFINE_float(
+    name='bulk_report_interval_s',
+    default=10.0,
+    lower_bound=0.0,
+    help='Log the throughput every this many seconds',
+)
+
+_IMAGE_EXTENSIONS = ('.bmp', '.jpeg', '.jpg', '.png', '.webp')
+
+
+def _read_file(path: str) -> bytes:
+  with open(path, 'rb') as fp:
+    return fp.read()
+
+
+# Yields the name and a function reading the content of each image. The content must be read before the next image is
+# yielded, and images that are skipped are never read. The order is stable so a resumed run skips the same images.
+# Images in archives are named after the archive and the member, e.g. "frames.tar.gz:front_door/0001.jpg".
+def iterate_images(inputs: List[str]) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+  for input_path in inputs:
+    if os.path.isfile(input_path) and tarfile.is_tarfile(input_path):
+      yield from _iterate_archive(input_path)
+      continue
+
+    if os.path.isdir(input_path):
+      paths = glob.glob(os.path.join(glob.escape(input_path), '**', '*'), recursive=True)
+    else:
+      paths = glob.glob(input_path, recursive=True)
+    for path in sorted(paths):
+      if path.lower().endswith(_IMAGE_EXTENSIONS) and os.path.isfile(path):
+        yield path, functools.partial(_read_file, path)
+
+
+# Streams the members in the order they were archived, so a compressed archive is decompressed once and never seeked.
+def _iterate_archive(archive_path: str) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+  with tarfile.open(archive_path, 'r|*') as archive:
+    for member in archive:
+      if member.isfile() and member.name.lower().endswith(_IMAGE_EXTENSIONS):
+        member_file = archive.extractfile(member)
+        assert member_file is not None, f'Expected member "{member.name}" to be a file'
+        yield f'{archive_path}:{member.name}', member_file.read
+
+
+# Detects objects in archived images offline, without the transport of the HTTP server. The images are decoded on
+# threads while the previous batch is predicted, and predicted in batches with the same predictor as the server.
+# Each image is written as soon as its batch is predicted, so a run that stopped can be resumed from the output.
+class BulkDetector:
+
+  def __init__(self, predictor: YoloPredictor, output_path: str, batch_size: int, decode_workers: int,
+               report_interval_s: float) -> None:
+    self._predictor = predictor
+    self._output_path = output_path
+    self._batch_size = batch_size
+    self._decode_workers = decode_workers
+    self._report_interval_s = report_interval_s
+
+  # Returns the names of the images already in the output. A line cut short by a stopped run is removed, so the lines
+  # appended after it are valid.
+  @classmethod
+  def load_done_images(cls, output_path: str) -> Set[str]:
+    if not os.path.exists(output_path):
+      return set()
+
+    with open(output_path, 'rb+') as fp:
+      content = fp.read()
+      complete_length = content.rfind(b'\n') + 1
+      if complete_length < len(content):
+        logging.warning(f'Removing the incomplete last line of {output_path}.')
+        fp.truncate(complete_length)
+    return {json.loads(line)['image'] for line in content[:complete_length].splitlines()}
+
+  # Returns the number of images predicted, skipped and failed to decode, and the throughput.
+  def run(self, images: Iterator[Tuple[str, Callable[[], bytes]]], resume: bool) -> Dict[str, Any]:
+    done_images = self.load_done_images(self._output_path) if resume else set()
+    self._predicted = 0
+    self._failed = 0
+    skipped = 0
+
+    start_s = time.perf_counter()
+    self._next_report_s = start_s + self._report_interval_s
+    with open(self._output_path, 'ab' if resume else 'wb') as output, \
+        ThreadPoolExecutor(max_workers=self._decode_workers, thread_name_prefix='bulk-decode') as executor:
+      pending: Deque[Tuple[str, 'Future[Optional[numpy.ndarray]]']] = collections.deque()
+      for name, read_image in images:
+        if name in done_images:
+          skipped += 1
+          continue
+        pending.append((name, executor.submit(YoloPredictor.decode_image, read_image())))
+
+        # Keeps a batch decoding while the one before it is predicted.
+        if len(pending) >= 2 * self._batch_size:
+          self._predict([pending.popleft() for _ in range(self._batch_size)], output, start_s)
+      while len(pending) > 0:
+        self._predict([pending.popleft() for _ in range(min(self._batch_size, len(pending)))], output, start_s)
+
+    elapsed_s = time.perf_counter() - start_s
+    return {
+        'predicted': self._predicted,
+        'skipped': skipped,
+        'failed': self._failed,
+        'elapsed_s': elapsed_s,
+        'throughput_ips': self._predicted / elapsed_s if elapsed_s > 0 else 0.0,
+    }
+
+  # The lines are written in the order the images were yielded, including the ones that could not be decoded.
+  def _predict(self, batch: List[Tuple[str, 'Future[Optional[numpy.ndarray]]']], output: BinaryIO,
+               start_s: float) -> None:
+    decoded = [(name, future.result()) for name, future in batch]
+    images = [image for _, image in decoded if image is not None]
+
+    predictions: List[List[Prediction]] = []
+    if len(images) > 0:
+      # An engine built for a fixed batch size only predicts full batches, so the last batch is padded and the
+      # predictions of the padding are discarded.
+      padding = [images[-1]] * (self._batch_size - len(images))
+      predictions = self._predictor.predict_batch(images + padding)[:len(images)]
+
+    lines: List[bytes] = []
+    prediction_iterator = iter(predictions)
+    for name, image in decoded:
+      if image is None:
+        logging.warning(f'Failed to decode {name}.')
+        response = PredictionResponseEncoder.encode([], False)
+      else:
+        response = PredictionResponseEncoder.encode(next(prediction_iterator), True)
+      lines.append(b'{"image": %s, ' % json.dumps(name).encode() + response[1:] + b'\n')
+
+    output.write(b''.join(lines))
+    output.flush()
+    self._predicted += len(images)
+    self._failed += len(decoded) - len(images)
+
+    now_s = time.perf_counter()
+    if now_s >= self._next_report_s:
+      logging.info(f'Predicted {self._predicted} images at {self._predicted / (now_s - start_s):.1f} images/s.')
+      self._next_report_s = now_s + self._report_interval_s
+
+
+def _get_batch_size() -> int:
+  if _BULK_BATCH_SIZE.value is not None:
+    return _BULK_BATCH_SIZE.value
+  if ENGINE_SPEC.value is not None:
+    return EngineSpec.parse(ENGINE_SPEC.value).batch_size
+  return 1
+
+
+def main(args: List[str]) -> None:
+  from ultralytics import YOLO
+  engine_path = get_engine_path()
+  logging.info(f'Loading engine file from {engine_path}.')
+  predictor = YoloPredictor(YOLO(engine_path, task='detect'))
+
+  detector = BulkDetector(predictor, _BULK_OUTPUT_PATH.value, _get_batch_size(), _BULK_DECODE_WORKERS.value,
+                          _BULK_REPORT_INTERVAL_S.value)
+  print(json.dumps(detector.run(iterate_images(_BULK_INPUTS.value), _BULK_RESUME.value)))
+
+
+def app_run_main() -> None:
+  app.run(main)
+
+
+if __name__ == '__main__':
+  app_run_main()
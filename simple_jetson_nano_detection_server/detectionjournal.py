@@ -0,0 +1,244 @@
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple
+
+from absl import flags, logging
+
+from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.prediction import Prediction
+
+_DETECTION_JOURNAL_DIR = flags.DEFINE_string(
+    name='detection_journal_dir',
+    default=None,
+    help='If set, append every detection to segment files in this directory, so the detections can be queried with '
+    'simple-jetson-nano-detection-journal-query',
+)
+
+_DETECTION_JOURNAL_SEGMENT_BYTES = flags.DEFINE_integer(
+    name='detection_journal_segment_bytes',
+    default=64 * 1024 * 1024,  # 64MiB.
+    lower_bound=1,
+    help='Start a new segment file once the current one would grow beyond this size in bytes',
+)
+
+_DETECTION_JOURNAL_QUEUE_SIZE = flags.DEFINE_integer(
+    name='detection_journal_queue_size',
+    default=1000,
+    lower_bound=1,
+    help='Maximum number of responses waiting to be written. Detections are not journaled while the queue is full',
+)
+
+# Each record is one detection: timestamp, camera, label id, confidence and the box coordinates x_min, y_min, x_max and
+# y_max. The camera is truncated to 32 bytes, and the label id is the index of the label in CocoLabel.
+_RECORD = struct.Struct('<q32sHfHHHH')
+_TIMESTAMP = struct.Struct('<q')
+_CAMERA_BYTES = 32
+
+_LABELS = list(CocoLabel)
+_LABEL_IDS = {label: label_id for label_id, label in enumerate(_LABELS)}
+
+_SEGMENT_PREFIX = 'detections-'
+_SEGMENT_SUFFIX = '.journal'
+
+
+@dataclass(frozen=True)
+class JournalRecord:
+  timestamp_ns: int
+  camera: str
+  label: CocoLabel
+  confidence: float
+  x_min: int
+  y_min: int
+  x_max: int
+  y_max: int
+
+
+# Padded the same way as struct packs the camera, so it can be compared with the unpacked camera.
+def encode_camera(camera: str) -> bytes:
+  return camera.encode()[:_CAMERA_BYTES].ljust(_CAMERA_BYTES, b'\0')
+
+
+def get_label_id(label: CocoLabel) -> int:
+  return _LABEL_IDS[label]
+
+
+# Returns the segment files in the order they were written.
+def get_segment_paths(journal_dir: str) -> List[str]:
+  names = [n for n in os.listdir(journal_dir) if n.startswith(_SEGMENT_PREFIX) and n.endswith(_SEGMENT_SUFFIX)]
+  names.sort(key=lambda n: int(n[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+  return [os.path.join(journal_dir, n) for n in names]
+
+
+# Reads a segment file written by DetectionJournal by memory-mapping it, so only the records being read are loaded.
+# The records are sorted by timestamp, so the records of a time range are found with a binary search.
+# A record that was not completely written, e.g. because the server was killed, is left out.
+class JournalSegment:
+
+  def __init__(self, segment_path: str) -> None:
+    self._fp = open(segment_path, 'rb')
+    size = os.fstat(self._fp.fileno()).st_size
+    self._length = size // _RECORD.size
+    self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if self._length > 0 else None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    self.close()
+
+  def close(self) -> None:
+    if self._mmap is not None:
+      self._mmap.close()
+    self._fp.close()
+
+  def __len__(self) -> int:
+    return self._length
+
+  def __getitem__(self, index: int) -> JournalRecord:
+    timestamp_ns, camera, label_id, confidence, x_min, y_min, x_max, y_max = self.get_raw(index)
+    return JournalRecord(timestamp_ns, camera.rstrip(b'\0').decode(errors='replace'), _LABELS[label_id], confidence,
+                         x_min, y_min, x_max, y_max)
+
+  # Returns the unpacked fields without decoding them, which is faster for filtering.
+  def get_raw(self, index: int) -> Tuple[int, bytes, int, float, int, int, int, int]:
+    assert self._mmap is not None
+    return _RECORD.unpack_from(self._mmap, index * _RECORD.size)
+
+  def get_timestamp_ns(self, index: int) -> int:
+    assert self._mmap is not None
+    return _TIMESTAMP.unpack_from(self._mmap, index * _RECORD.size)[0]
+
+  # Returns the index of the first record at or after the timestamp.
+  def find(self, timestamp_ns: int) -> int:
+    low, high = 0, self._length
+    while low < high:
+      middle = (low + high) // 2
+      if self.get_timestamp_ns(middle) < timestamp_ns:
+        low = middle + 1
+      else:
+        high = middle
+    return low
+
+
+# Appends the detections to segment files when --detection_journal_dir is set.
+# The files are written by a background thread, so the request path only puts the predictions into a queue.
+# The thread writes everything that was queued in one batch, and starts a new segment when the current one is full.
+# If writing fails, e.g. the disk is full, journaling stops and the server keeps serving.
+class DetectionJournal:
+
+  _queue: Optional['queue.Queue[Optional[Tuple[int, str, List[Prediction]]]]'] = None
+  _thread: Optional[threading.Thread] = None
+  _dropped_lock = threading.Lock()
+  _dropped = 0
+
+  def __enter__(self):
+    cls = type(self)
+    assert cls._thread is None, 'DetectionJournal is already running'
+    if _DETECTION_JOURNAL_DIR.value is None:
+      return self
+
+    os.makedirs(_DETECTION_JOURNAL_DIR.value, exist_ok=True)
+    logging.info(f'Journaling detections to {_DETECTION_JOURNAL_DIR.value}.')
+
+    cls._dropped = 0
+    cls._queue = queue.Queue(maxsize=_DETECTION_JOURNAL_QUEUE_SIZE.value)
+    cls._thread = threading.Thread(target=cls._run,
+                                   args=(cls._queue, _DETECTION_JOURNAL_DIR.value,
+                                         _DETECTION_JOURNAL_SEGMENT_BYTES.value),
+                                   name='detection-journal',
+                                   daemon=True)
+    cls._thread.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._thread is None:
+      return
+
+    journal_queue = cls._queue
+    cls._queue = None
+    # The queue can be full. Stops waiting for room once the writer thread is gone, e.g. after failing to write.
+    while journal_queue is not None and cls._thread.is_alive():
+      try:
+        journal_queue.put(None, timeout=0.1)
+        break
+      except queue.Full:
+        pass
+    cls._thread.join()
+    cls._thread = None
+    if cls._dropped > 0:
+      logging.warning(f'Detections of {cls._dropped} responses were not journaled because the queue was full.')
+
+  @classmethod
+  def record(cls, camera: str, predictions: List[Prediction]) -> None:
+    journal_queue = cls._queue
+    if journal_queue is None or len(predictions) == 0:
+      return
+
+    try:
+      journal_queue.put_nowait((time.time_ns(), camera, predictions))
+    except queue.Full:
+      with cls._dropped_lock:
+        cls._dropped += 1
+
+  @classmethod
+  def _run(cls, journal_queue: 'queue.Queue[Optional[Tuple[int, str, List[Prediction]]]]', journal_dir: str,
+           segment_bytes: int) -> None:
+    try:
+      cls._write(journal_queue, journal_dir, segment_bytes)
+    except Exception:
+      logging.exception(f'Failed to journal detections to {journal_dir}, stopping journaling.')
+      # Stops accepting detections, unless the journal has already been exited.
+      if cls._queue is journal_queue:
+        cls._queue = None
+
+  @classmethod
+  def _write(cls, journal_queue: 'queue.Queue[Optional[Tuple[int, str, List[Prediction]]]]', journal_dir: str,
+             segment_bytes: int) -> None:
+    segment_fp: Optional[BinaryIO] = None
+    segment_size = 0
+    segment_id = 0
+    last_timestamp_ns = 0
+    stopped = False
+    try:
+      while not stopped:
+        items = [journal_queue.get()]
+        while not journal_queue.empty():
+          items.append(journal_queue.get_nowait())
+
+        batch = bytearray()
+        for item in items:
+          if item is None:
+            stopped = True
+            break
+          # The requests are timestamped on their own threads, so they can be queued slightly out of order.
+          # Keeping the timestamps from going backwards keeps the segments sorted for the binary search.
+          timestamp_ns, camera, predictions = item
+          last_timestamp_ns = max(timestamp_ns, last_timestamp_ns)
+          encoded_camera = encode_camera(camera)
+          for p in predictions:
+            batch += _RECORD.pack(last_timestamp_ns, encoded_camera, _LABEL_IDS[p.label], p.confidence, p.x_min,
+                                  p.y_min, p.x_max, p.y_max)
+        if len(batch) == 0:
+          continue
+
+        if segment_fp is None or segment_size + len(batch) > segment_bytes:
+          if segment_fp is not None:
+            segment_fp.close()
+          # Segments are named by the time they were started, which is kept unique if the clock goes backwards.
+          segment_id = max(time.time_ns(), segment_id + 1)
+          segment_fp = open(os.path.join(journal_dir, f'{_SEGMENT_PREFIX}{segment_id}{_SEGMENT_SUFFIX}'), 'wb')
+          segment_size = 0
+
+        # Flushes after each batch, so the segments can be queried while the server is running.
+        segment_fp.write(batch)
+        segment_fp.flush()
+        segment_size += len(batch)
+    finally:
+      if segment_fp is not None:
+        segment_fp.close()
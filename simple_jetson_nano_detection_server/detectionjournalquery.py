@@ -0,0 +1,123 @@
+import json
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from absl import app, flags
+
+from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.detectionjournal import (JournalRecord, JournalSegment, encode_camera,
+                                                                  get_label_id, get_segment_paths)
+
+_JOURNAL_DIR = flags.DEFINE_string(
+    name='journal_dir',
+    default=None,
+    required=True,
+    help='Path to a directory written with --detection_journal_dir',
+)
+
+_START_TIME = flags.DEFINE_string(
+    name='start_time',
+    default=None,
+    help='If set, only include the detections at or after this time in ISO 8601 format, e.g. "2024-05-01T08:00:00". '
+    'Times without a timezone are in the local timezone',
+)
+
+_END_TIME = flags.DEFINE_string(
+    name='end_time',
+    default=None,
+    help='If set, only include the detections before this time in ISO 8601 format',
+)
+
+_LABEL = flags.DEFINE_enum_class(
+    name='label',
+    default=None,
+    enum_class=CocoLabel,
+    case_sensitive=False,
+    help='If set, only include the detections of this label',
+)
+
+_CAMERA = flags.DEFINE_string(
+    name='camera',
+    default=None,
+    help='If set, only include the detections of this camera',
+)
+
+_SUMMARY = flags.DEFINE_bool(
+    name='summary',
+    default=False,
+    help='If true, print the number of detections of each camera and label instead of the detections',
+)
+
+
+def _parse_time_ns(value: Optional[str]) -> Optional[int]:
+  if value is None:
+    return None
+  return int(datetime.fromisoformat(value).timestamp() * 1e9)
+
+
+# Yields the detections in the time range that match the label and camera. Each segment is memory-mapped, and only the
+# records in the time range are read, so the journal does not have to fit in memory.
+def query(journal_dir: str,
+          start_ns: Optional[int] = None,
+          end_ns: Optional[int] = None,
+          label: Optional[CocoLabel] = None,
+          camera: Optional[str] = None) -> Iterator[JournalRecord]:
+  label_id = None if label is None else get_label_id(label)
+  encoded_camera = None if camera is None else encode_camera(camera)
+
+  for segment_path in get_segment_paths(journal_dir):
+    with JournalSegment(segment_path) as segment:
+      if len(segment) == 0:
+        continue
+      # Records are sorted within a segment, but not across segments, as the clock can go backwards across restarts,
+      # e.g. Jetson Nano has no RTC and boots with a stale time until NTP syncs. So every segment is checked.
+      if end_ns is not None and segment.get_timestamp_ns(0) >= end_ns:
+        continue
+      if start_ns is not None and segment.get_timestamp_ns(len(segment) - 1) < start_ns:
+        continue
+
+      for index in range(0 if start_ns is None else segment.find(start_ns), len(segment)):
+        timestamp_ns, record_camera, record_label_id, *_ = segment.get_raw(index)
+        if end_ns is not None and timestamp_ns >= end_ns:
+          break
+        if (label_id is None or record_label_id == label_id) and (encoded_camera is None or
+                                                                  record_camera == encoded_camera):
+          yield segment[index]
+
+
+def _get_summary(records: Iterator[JournalRecord]) -> Dict[str, Dict[str, int]]:
+  summary: Dict[str, Dict[str, int]] = {}
+  for record in records:
+    labels = summary.setdefault(record.camera, {})
+    labels[record.label.value] = labels.get(record.label.value, 0) + 1
+  return {camera: dict(sorted(labels.items())) for camera, labels in sorted(summary.items())}
+
+
+def main(args: List[str]) -> None:
+  records = query(_JOURNAL_DIR.value, _parse_time_ns(_START_TIME.value), _parse_time_ns(_END_TIME.value), _LABEL.value,
+                  _CAMERA.value)
+
+  if _SUMMARY.value:
+    print(json.dumps(_get_summary(records)))
+    return
+
+  for record in records:
+    print(json.dumps({
+        'time': datetime.fromtimestamp(record.timestamp_ns / 1e9).isoformat(),
+        'timestamp_ns': record.timestamp_ns,
+        'camera': record.camera,
+        'label': record.label.value,
+        'confidence': record.confidence,
+        'x_min': record.x_min,
+        'y_min': record.y_min,
+        'x_max': record.x_max,
+        'y_max': record.y_max,
+    }))
+
+
+def app_run_main() -> None:
+  app.run(main)
+
+
+if __name__ == '__main__':
+  app_run_main()
@@ -1,10 +1,16 @@
-import json
+from enum import Enum, auto
+from typing import Optional
 
 from absl import flags, logging
 
+from simple_jetson_nano_detection_server.detectionjournal import DetectionJournal
 from simple_jetson_nano_detection_server.imagedataextractor import ImageDataExtractor
-from simple_jetson_nano_detection_server.prediction import PredictionJsonEncoder
-from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+from simple_jetson_nano_detection_server.inferencescheduler import (CameraOverloadedError, DeadlineExceededError,
+                                                                    InferenceRejectedError, InferenceScheduler,
+                                                                    RequestRateExceededError, RequestSupersededError)
+from simple_jetson_nano_detection_server.memorymonitor import MemoryMonitor
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import PredictionResponseEncoder
 
 _LOG_RESPONSE = flags.DEFINE_bool(
     name='log_response',
@@ -12,15 +18,45 @@ _LOG_RESPONSE = flags.DEFINE_bool(
     help='If true, log the detection response',
 )
 
+# The HTTP response codes of the requests responded without predicting. The same codes are used by every transport, so
+# the clients can tell the reasons apart the same way.
+REJECTION_RESPONSE_CODES = {
+    CameraOverloadedError: 429,
+    RequestSupersededError: 409,
+    DeadlineExceededError: 504,
+    RequestRateExceededError: 429,
+}
+
+
+class _PerformanceCheckpoint(Enum):
+  EXTRACT_IMAGE_DATA = auto()
+  PREDICT = auto()
+  ENCODE_RESPONSE = auto()
+
 
 class DetectionRequestHandler:
 
+  # Without a multipart boundary, the request body is the image itself, e.g. read in place by SharedMemoryServer.
   @classmethod
-  def get_response(cls, request_body: bytes, multipart_boundary: str) -> str:
+  def get_response(cls, request_body: bytes, multipart_boundary: Optional[str], camera: str,
+                   deadline_ns: Optional[int]) -> bytes:
+    sampled = MemoryMonitor.sample_allocations()
+
     try:
-      image_data = ImageDataExtractor.get_first_image_data(request_body, multipart_boundary)
-      predictions = YoloPredictor.predict(image_data)
+      with PerformanceTracker.span(_PerformanceCheckpoint.EXTRACT_IMAGE_DATA), MemoryMonitor.track_allocations(
+          _PerformanceCheckpoint.EXTRACT_IMAGE_DATA, sampled):
+        if multipart_boundary is None:
+          image_data = request_body
+        else:
+          image_data = ImageDataExtractor.get_first_image_data(request_body, multipart_boundary)
+      with PerformanceTracker.span(_PerformanceCheckpoint.PREDICT), MemoryMonitor.track_allocations(
+          _PerformanceCheckpoint.PREDICT, sampled):
+        predictions = InferenceScheduler.predict(camera, image_data, deadline_ns)
+      DetectionJournal.record(camera, predictions)
       response = {'predictions': predictions, 'success': True}
+    except InferenceRejectedError:
+      # Responded with its own response code instead of a failed detection, so the client can tell them apart.
+      raise
     except Exception:
       logging.exception('Detection failed')
       response = {'predictions': [], 'success': False}
@@ -28,4 +64,6 @@ class DetectionRequestHandler:
     if _LOG_RESPONSE.value:
       logging.info(f'{response=}')
 
-    return json.dumps(response, cls=PredictionJsonEncoder)
+    with PerformanceTracker.span(_PerformanceCheckpoint.ENCODE_RESPONSE), MemoryMonitor.track_allocations(
+        _PerformanceCheckpoint.ENCODE_RESPONSE, sampled):
+      return PredictionResponseEncoder.encode(response['predictions'], response['success'])
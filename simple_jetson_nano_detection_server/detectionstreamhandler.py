@@ -0,0 +1,148 @@
+import collections
+import itertools
+import json
+import threading
+from enum import Enum, auto
+from typing import BinaryIO, Deque, Tuple
+
+from absl import flags
+
+from simple_jetson_nano_detection_server.detectionrequesthandler import (REJECTION_RESPONSE_CODES,
+                                                                         DetectionRequestHandler)
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceRejectedError
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.requesttracer import RequestTracer
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.websocket import (CLOSE_UNSUPPORTED_DATA, OPCODE_BINARY, OPCODE_TEXT,
+                                                           WebSocketConnection)
+
+_DETECTION_STREAM_MAX_PENDING_FRAMES = flags.DEFINE_integer(
+    name='detection_stream_max_pending_frames',
+    default=1,
+    lower_bound=1,
+    help='Number of frames of a detection stream waiting for the frame being predicted. Once full, the oldest waiting '
+    'frame is dropped for the newest one',
+)
+
+_DETECTION_STREAM_MAX_FRAME_BYTES = flags.DEFINE_integer(
+    name='detection_stream_max_frame_bytes',
+    default=64 * 1024,  # The same as --max_image_data_bytes.
+    lower_bound=1,
+    help='Maximum image size in bytes of a detection stream frame. The stream is closed if a frame is bigger',
+)
+
+
+class _PerformanceCheckpoint(Enum):
+  COMPUTE_RESPONSE = auto()
+  SEND_RESPONSE = auto()
+
+
+# Predicts the frames of a stream one at a time on its own thread, while the request handler thread receives them.
+# Receiving never waits for the predictions, so a camera sending faster than it is predicted has its oldest waiting
+# frames dropped instead of its frames delayed further and further.
+class _DetectionStream:
+
+  def __init__(self, connection: WebSocketConnection, camera: str, max_pending_frames: int) -> None:
+    self._connection = connection
+    self._camera = camera
+    self._max_pending_frames = max_pending_frames
+    self._condition = threading.Condition()
+    self._pending_frames: Deque[Tuple[int, bytes]] = collections.deque()
+    self._closed = False
+
+  def run(self) -> None:
+    thread = threading.Thread(target=self._predict_frames, name='detection-stream', daemon=True)
+    thread.start()
+    try:
+      self._receive_frames()
+    finally:
+      with self._condition:
+        self._closed = True
+        self._condition.notify()
+      thread.join()
+
+  # The frames are numbered in the order they are received, starting from 0.
+  def _receive_frames(self) -> None:
+    for sequence in itertools.count():
+      message = self._connection.receive()
+      if message is None:
+        return
+      opcode, image_data = message
+      if opcode != OPCODE_BINARY:
+        self._connection.close(CLOSE_UNSUPPORTED_DATA, 'Expected binary messages with an image each')
+        return
+
+      ServerStats.start_request()
+      dropped_sequence = None
+      with self._condition:
+        if len(self._pending_frames) >= self._max_pending_frames:
+          dropped_sequence, _ = self._pending_frames.popleft()
+        self._pending_frames.append((sequence, image_data))
+        self._condition.notify()
+
+      if dropped_sequence is not None:
+        self._drop(dropped_sequence)
+        self._send(b'{"sequence": %d, "dropped": true}' % dropped_sequence)
+
+  # The frames still waiting once the stream is closed are dropped, as there is no one to respond to.
+  def _predict_frames(self) -> None:
+    while True:
+      with self._condition:
+        self._condition.wait_for(lambda: len(self._pending_frames) > 0 or self._closed)
+        if self._closed:
+          for dropped_sequence, _ in self._pending_frames:
+            self._drop(dropped_sequence)
+          self._pending_frames.clear()
+          return
+        sequence, image_data = self._pending_frames.popleft()
+
+      self._predict(sequence, image_data)
+
+  # Predicts the same way as the HTTP requests, and responds with the same JSON tagged with the sequence number.
+  def _predict(self, sequence: int, image_data: bytes) -> None:
+    tracker: PerformanceTracker[_PerformanceCheckpoint] = RequestTracer.create_tracker()
+    try:
+      with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE), tracker.as_current():
+        response = DetectionRequestHandler.get_response(image_data, None, self._camera, None)
+      response_code = 200
+      message = b'{"sequence": %d, ' % sequence + response[1:]
+    except InferenceRejectedError as e:
+      response_code = REJECTION_RESPONSE_CODES[type(e)]
+      message = json.dumps({
+          'sequence': sequence,
+          'response_code': response_code,
+          'class': type(e).__name__,
+          'message': str(e),
+      }).encode()
+
+    with tracker(_PerformanceCheckpoint.SEND_RESPONSE):
+      self._send(message)
+    tracker.aggregate('detection_stream', {'response_code': response_code})
+    RequestTracer.record(tracker, 'detection_stream', {'response_code': response_code, 'camera': self._camera})
+    ServerStats.finish_request(response_code, tracker.get_latencies_ns())
+
+  def _drop(self, sequence: int) -> None:
+    MetricsAggregator.increment('detection_stream', {'dropped_frames': 1},
+                                {'camera': ServerStats.get_tracked_camera(self._camera)})
+    ServerStats.finish_request(409)
+
+  # The client may have gone away, which the receiving thread finds out about.
+  def _send(self, message: bytes) -> None:
+    try:
+      self._connection.send(OPCODE_TEXT, message)
+    except (OSError, ValueError):
+      pass
+
+
+# Serves a detection stream over a WebSocket upgraded by HttpRequestDispatcher, for a client sending the frames of a
+# camera continuously. Each binary message is an image, and each image is answered with a text message of the same JSON
+# as the HTTP response, tagged with the sequence number of the image. This saves parsing the headers and the multipart
+# body of each frame, and each stream has at most one frame predicting at a time.
+class DetectionStreamHandler:
+
+  # Returns once the stream is closed by either side.
+  @classmethod
+  def serve(cls, rfile: BinaryIO, wfile: BinaryIO, camera: str) -> None:
+    connection = WebSocketConnection(rfile, wfile, _DETECTION_STREAM_MAX_FRAME_BYTES.value)
+    _DetectionStream(connection, camera, _DETECTION_STREAM_MAX_PENDING_FRAMES.value).run()
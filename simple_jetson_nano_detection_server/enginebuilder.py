@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from absl import app, flags, logging
+
+from simple_jetson_nano_detection_server.enginemanifest import (ENGINE_MANIFEST_PATH, EngineManifest,
+                                                                EngineManifestEntry, EngineSpec)
+
+_ENGINE_SPECS = flags.DEFINE_list(
+    name='engine_specs',
+    default=['yolo11n:320:fp16:1', 'yolo11s:320:fp16:1', 'yolo11m:320:fp16:1'],
+    help='The engines to build, in the format of "model:image_size:precision:batch_size". '
+    'The weights are read from "pytorch/<model>.pt" under --models_dir',
+)
+
+_MODELS_DIR = flags.DEFINE_string(
+    name='models_dir',
+    default='data/yolo11/models',
+    help='Directory that contains the "pytorch" directory with the weights. '
+    'The exported files are written to the "onnx" and "tensorrt" directories under it',
+)
+
+_ONNX_EXPORT_WORKERS = flags.DEFINE_integer(
+    name='onnx_export_workers',
+    default=2,
+    lower_bound=1,
+    help='Number of processes exporting ONNX files in parallel. Each process uses about 1GB of memory',
+)
+
+_WORKSPACE_BYTES = flags.DEFINE_integer(
+    name='tensorrt_workspace_bytes',
+    default=1 << 30,  # 1GiB.
+    lower_bound=0,
+    help='Maximum workspace size TensorRT may use when building an engine',
+)
+
+
+# ProcessPoolExecutor can only run functions that can be pickled, so it cannot run the classmethods directly.
+def _export_onnx_in_worker(weights_path: str, image_size: int, batch_size: int, onnx_path: str) -> None:
+  EngineBuilder._export_onnx(weights_path, image_size, batch_size, onnx_path)
+
+
+class EngineBuilder:
+
+  # Builds the engines that are missing or outdated, and returns the number of engines built.
+  @classmethod
+  def build(cls, specs: List[EngineSpec], models_dir: str, manifest: EngineManifest, onnx_export_workers: int) -> int:
+    weights_paths = {spec.model: os.path.join(models_dir, 'pytorch', f'{spec.model}.pt') for spec in specs}
+    for weights_path in weights_paths.values():
+      if not os.path.exists(weights_path):
+        cls._download_weights(weights_path)
+    weights_sha256 = {model: cls._hash_file(path) for model, path in weights_paths.items()}
+
+    pending: List[Tuple[str, EngineSpec]] = []
+    for spec in specs:
+      key = cls._get_manifest_key(spec, weights_paths[spec.model], weights_sha256[spec.model])
+      entry = manifest.get(key)
+      if entry is not None and os.path.exists(entry.engine_path):
+        logging.info(f'Engine for {spec} is up to date at {entry.engine_path}, skipping.')
+        continue
+      pending.append((key, spec))
+
+    if len(pending) == 0:
+      return 0
+
+    # The ONNX file does not depend on the precision, so the specs that only differ in precision share one export.
+    onnx_paths: Dict[EngineSpec, str] = {}
+    for _, spec in pending:
+      onnx_name = f'{spec.model}-{spec.image_size}' + ('' if spec.batch_size == 1 else f'-b{spec.batch_size}')
+      onnx_paths[spec] = os.path.join(models_dir, 'onnx', f'{onnx_name}.onnx')
+    os.makedirs(os.path.join(models_dir, 'onnx'), exist_ok=True)
+    os.makedirs(os.path.join(models_dir, 'tensorrt'), exist_ok=True)
+
+    onnx_exports = {
+        (weights_paths[spec.model], spec.image_size, spec.batch_size, onnx_paths[spec]) for _, spec in pending
+    }
+    cls._export_onnx_files(sorted(onnx_exports), onnx_export_workers)
+
+    # Building engines uses the GPU and most of the memory, so they are built one at a time.
+    for key, spec in pending:
+      engine_path = os.path.join(models_dir, 'tensorrt', f'{spec.name}.engine')
+      logging.info(f'Building engine for {spec} at {engine_path}.')
+      cls._export_engine(onnx_paths[spec], spec.half, engine_path)
+
+      manifest.put(
+          key,
+          EngineManifestEntry(
+              model=spec.model,
+              image_size=spec.image_size,
+              precision=spec.precision,
+              batch_size=spec.batch_size,
+              weights_path=weights_paths[spec.model],
+              weights_sha256=weights_sha256[spec.model],
+              onnx_path=onnx_paths[spec],
+              engine_path=engine_path,
+              built_at_ns=time.time_ns(),
+          ))
+      manifest.save()
+
+    return len(pending)
+
+  @classmethod
+  def _export_onnx_files(cls, onnx_exports: List[Tuple[str, int, int, str]], workers: int) -> None:
+    for _, _, _, onnx_path in onnx_exports:
+      logging.info(f'Exporting {onnx_path}.')
+
+    if workers == 1:
+      for onnx_export in onnx_exports:
+        cls._export_onnx(*onnx_export)
+      return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      futures = [executor.submit(_export_onnx_in_worker, *onnx_export) for onnx_export in onnx_exports]
+      for future in futures:
+        future.result()
+
+  @classmethod
+  def _hash_file(cls, path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fp:
+      for chunk in iter(lambda: fp.read(1 << 20), b''):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+  # The weights path is part of the key, so the models with the same weights, e.g. a copy renamed for fine-tuning, each
+  # get their own engine instead of sharing the entry of the first one.
+  @classmethod
+  def _get_manifest_key(cls, spec: EngineSpec, weights_path: str, weights_sha256: str) -> str:
+    parameters = {
+        'weights_path': weights_path,
+        'weights_sha256': weights_sha256,
+        'image_size': spec.image_size,
+        'precision': spec.precision,
+        'batch_size': spec.batch_size,
+    }
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+  # Ultralytics downloads the pre-trained weights when the file name matches one of its released models.
+  @classmethod
+  def _download_weights(cls, weights_path: str) -> None:
+    from ultralytics.utils.downloads import attempt_download_asset
+
+    logging.info(f'Downloading {weights_path}.')
+    attempt_download_asset(weights_path)
+
+  # Runs on CPU so multiple exports can run in parallel without competing for the GPU.
+  @classmethod
+  def _export_onnx(cls, weights_path: str, image_size: int, batch_size: int, onnx_path: str) -> None:
+    from ultralytics import YOLO
+
+    # Ultralytics writes the ONNX file next to the weights, so each export gets its own copy to avoid collisions.
+    with tempfile.TemporaryDirectory() as temp_dir:
+      temp_weights_path = shutil.copy(weights_path, temp_dir)
+      exported_path = YOLO(temp_weights_path, task='detect').export(format='onnx',
+                                                                    imgsz=image_size,
+                                                                    batch=batch_size,
+                                                                    simplify=True,
+                                                                    device='cpu')
+      shutil.move(exported_path, onnx_path)
+
+  # Mirrors the TensorRT export in Ultralytics, which always re-exports the ONNX file first.
+  # The engine file is prefixed with the ONNX metadata so Ultralytics can read the class names when loading it.
+  @classmethod
+  def _export_engine(cls, onnx_path: str, half: bool, engine_path: str) -> None:
+    import onnx
+    import tensorrt as trt
+
+    metadata = {p.key: p.value for p in onnx.load(onnx_path, load_external_data=False).metadata_props}
+
+    logger = trt.Logger(trt.Logger.INFO)
+    builder = trt.Builder(logger)
+    config = builder.create_builder_config()
+    if int(trt.__version__.split('.')[0]) >= 10:
+      config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, _WORKSPACE_BYTES.value)
+    else:
+      config.max_workspace_size = _WORKSPACE_BYTES.value
+    if half:
+      assert builder.platform_has_fast_fp16, 'The platform does not support fp16'
+      config.set_flag(trt.BuilderFlag.FP16)
+
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+    assert parser.parse_from_file(onnx_path), f'Failed to parse {onnx_path}'
+
+    serialized_engine = builder.build_serialized_network(network, config)
+    assert serialized_engine is not None, f'Failed to build engine from {onnx_path}'
+
+    encoded_metadata = json.dumps(metadata).encode()
+    temp_path = engine_path + '.tmp'
+    with open(temp_path, 'wb') as fp:
+      fp.write(len(encoded_metadata).to_bytes(4, byteorder='little', signed=True))
+      fp.write(encoded_metadata)
+      fp.write(serialized_engine)
+    os.replace(temp_path, engine_path)
+
+
+def main(args: List[str]) -> None:
+  specs = [EngineSpec.parse(spec) for spec in _ENGINE_SPECS.value]
+  manifest = EngineManifest(ENGINE_MANIFEST_PATH.value)
+
+  built = EngineBuilder.build(specs, _MODELS_DIR.value, manifest, _ONNX_EXPORT_WORKERS.value)
+  logging.info(f'Built {built} engines, {len(specs) - built} were up to date.')
+
+
+def app_run_main() -> None:
+  app.run(main)
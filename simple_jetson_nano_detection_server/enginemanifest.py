@@ -0,0 +1,103 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from absl import flags
+
+ENGINE_MANIFEST_PATH = flags.DEFINE_string(
+    name='engine_manifest_path',
+    default='data/yolo11/models/manifest.json',
+    help='Path to the manifest that records how each TensorRT engine file was built',
+)
+
+_PRECISIONS = ('fp16', 'fp32')
+
+
+@dataclass(frozen=True)
+class EngineSpec:
+  model: str
+  image_size: int
+  precision: str
+  batch_size: int
+
+  def __post_init__(self) -> None:
+    assert len(self.model) > 0, 'Model name cannot be empty'
+    assert self.image_size > 0, f'Expected image size to be > 0, got {self.image_size} instead'
+    assert self.precision in _PRECISIONS, (
+        f'Expected precision to be one of {_PRECISIONS}, got "{self.precision}" instead')
+    assert self.batch_size > 0, f'Expected batch size to be > 0, got {self.batch_size} instead'
+
+  # Parses specs in the format of "model:image_size:precision:batch_size", e.g. "yolo11s:320:fp16:1".
+  @classmethod
+  def parse(cls, spec: str):
+    parts = spec.split(':')
+    assert len(parts) == 4, (
+        f'Expected spec in the format of "model:image_size:precision:batch_size", got "{spec}" instead')
+    return cls(parts[0], int(parts[1]), parts[2], int(parts[3]))
+
+  @property
+  def half(self) -> bool:
+    return self.precision == 'fp16'
+
+  # Engine file name without the extension. Batch size of 1 is omitted to keep the names used by earlier exports.
+  @property
+  def name(self) -> str:
+    name = f'{self.model}-{self.image_size}-{self.precision}'
+    if self.batch_size != 1:
+      name += f'-b{self.batch_size}'
+    return name
+
+  def __str__(self) -> str:
+    return f'{self.model}:{self.image_size}:{self.precision}:{self.batch_size}'
+
+
+@dataclass(frozen=True)
+class EngineManifestEntry:
+  model: str
+  image_size: int
+  precision: str
+  batch_size: int
+  weights_path: str
+  weights_sha256: str
+  onnx_path: str
+  engine_path: str
+  built_at_ns: int
+
+  @property
+  def spec(self) -> EngineSpec:
+    return EngineSpec(self.model, self.image_size, self.precision, self.batch_size)
+
+
+# Maps a hash of the source weights and build parameters to the engine file built from them.
+class EngineManifest:
+
+  def __init__(self, path: str) -> None:
+    self._path = path
+    self._entries: Dict[str, EngineManifestEntry] = {}
+
+    if os.path.exists(path):
+      with open(path, 'r') as fp:
+        content = json.load(fp)
+      self._entries = {key: EngineManifestEntry(**entry) for key, entry in content['engines'].items()}
+
+  def get(self, key: str) -> Optional[EngineManifestEntry]:
+    return self._entries.get(key)
+
+  def put(self, key: str, entry: EngineManifestEntry) -> None:
+    self._entries[key] = entry
+
+  # Returns the most recently built engine file for the spec.
+  def get_engine_path(self, spec: EngineSpec) -> str:
+    entries = [e for e in self._entries.values() if e.spec == spec and os.path.exists(e.engine_path)]
+    assert len(entries) > 0, f'No engine file for {spec} was found in {self._path}'
+    return max(entries, key=lambda e: e.built_at_ns).engine_path
+
+  # Writes to a temporary file first so an interrupted build never leaves a corrupted manifest.
+  def save(self) -> None:
+    content = {'engines': {key: asdict(entry) for key, entry in sorted(self._entries.items())}}
+
+    temp_path = self._path + '.tmp'
+    with open(temp_path, 'w') as fp:
+      json.dump(content, fp, indent=2)
+    os.replace(temp_path, self._path)
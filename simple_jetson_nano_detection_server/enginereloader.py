@@ -0,0 +1,169 @@
+import gc
+import signal
+import sys
+import threading
+import time
+from enum import Enum, auto
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from absl import logging
+
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.predictorpool import PREDICTOR_POOL_SIZE, PredictorPool
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.warmuprunner import WarmupRunner
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+# Importing ultralytics is slow, only do it for type checking. It was already imported by main during startup.
+if TYPE_CHECKING:
+  import ultralytics
+
+
+class _ReloadCheckpoint(Enum):
+  LOAD_ENGINE = auto()
+  WARMUP = auto()
+  DRAIN = auto()
+  RELEASE = auto()
+
+
+# Only empties the cache if PyTorch was already imported by Ultralytics, importing it here would take too long.
+def _empty_cuda_cache() -> None:
+  torch = sys.modules.get('torch')
+  if torch is not None and torch.cuda.is_available():
+    torch.cuda.empty_cache()
+
+
+# Loads and warms up an engine in the background while the current engine keeps serving, then switches the predictions
+# to it and releases the replaced engine once the predictions using it have finished.
+# The engine is loaded once for each predictor of PredictorPool.
+# A reload is started with SIGHUP or the /admin/reload endpoint. If loading or warming up fails, the current engine
+# keeps serving.
+class EngineReloader:
+
+  _lock = threading.Lock()
+  _thread: Optional[threading.Thread] = None
+  _get_default_engine_path: Optional[Callable[[], str]] = None
+  _previous_sighup_handler: Any = None
+  _status: Dict[str, Any] = {}
+  _last_reload: Optional[Dict[str, Any]] = None
+
+  # The default engine path is resolved on every reload, so a newly built engine of --engine_spec is picked up.
+  def __init__(self, get_default_engine_path: Callable[[], str]) -> None:
+    self._get_default_engine_path_on_enter = get_default_engine_path
+
+  # Must be entered from the main thread, as signal handlers can only be set there.
+  def __enter__(self):
+    cls = type(self)
+    cls._get_default_engine_path = self._get_default_engine_path_on_enter
+    cls._previous_sighup_handler = signal.signal(signal.SIGHUP, cls._on_sighup)
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    signal.signal(signal.SIGHUP, cls._previous_sighup_handler)
+    cls.join()
+    cls._get_default_engine_path = None
+
+  @classmethod
+  def get_default_engine_path(cls) -> str:
+    assert cls._get_default_engine_path is not None, 'EngineReloader is not running'
+    return cls._get_default_engine_path()
+
+  # Returns false if the server is still starting up or another reload is running.
+  @classmethod
+  def start(cls, engine_path: str) -> bool:
+    with cls._lock:
+      if cls._thread is not None or not ServerReadiness.is_ready():
+        return False
+      cls._status = {'engine_path': engine_path, 'stage': _ReloadCheckpoint.LOAD_ENGINE.name.lower()}
+      cls._thread = threading.Thread(target=cls._run, args=(engine_path,), name='engine-reloader', daemon=True)
+      cls._thread.start()
+      return True
+
+  @classmethod
+  def is_running(cls) -> bool:
+    return cls._thread is not None
+
+  @classmethod
+  def join(cls) -> None:
+    thread = cls._thread
+    if thread is not None:
+      thread.join()
+
+  # Returns the stage of the running reload, and the result of the last finished reload.
+  @classmethod
+  def get_status(cls) -> Dict[str, Any]:
+    with cls._lock:
+      return {
+          'running': dict(cls._status) if cls._thread is not None else None,
+          'last_reload': cls._last_reload,
+      }
+
+  # Importing is fast as main already imported ultralytics.
+  @classmethod
+  def _load_model(cls, engine_path: str) -> 'ultralytics.YOLO':
+    from ultralytics import YOLO
+    return YOLO(engine_path, task='detect')
+
+  @classmethod
+  def _on_sighup(cls, signum: int, frame: Any) -> None:
+    try:
+      engine_path = cls.get_default_engine_path()
+    except Exception:
+      logging.exception('Failed to resolve the engine path to reload.')
+      return
+
+    if not cls.start(engine_path):
+      logging.warning('Ignoring SIGHUP, the server is still starting up or another reload is running.')
+
+  @classmethod
+  def _set_stage(cls, checkpoint: _ReloadCheckpoint) -> None:
+    with cls._lock:
+      cls._status['stage'] = checkpoint.name.lower()
+
+  @classmethod
+  def _run(cls, engine_path: str) -> None:
+    tracker: PerformanceTracker[_ReloadCheckpoint] = PerformanceTracker()
+    result: Dict[str, Any] = {'engine_path': engine_path, 'finished_at_ns': 0, 'success': False}
+    try:
+      # Ultralytics defers deserializing the engine until the first prediction, which is counted towards warmup.
+      logging.info(f'Reloading engine file from {engine_path}.')
+      with tracker(_ReloadCheckpoint.LOAD_ENGINE):
+        predictors = [YoloPredictor(cls._load_model(engine_path)) for _ in range(PREDICTOR_POOL_SIZE.value)]
+
+      # The warmup predictions share the GPU with the requests, which are slower until it finishes.
+      cls._set_stage(_ReloadCheckpoint.WARMUP)
+      with tracker(_ReloadCheckpoint.WARMUP):
+        result['warmup_iterations'] = WarmupRunner.run_predictors(predictors)
+
+      previous_predictors = PredictorPool.set_predictors(predictors)
+      del predictors
+      ServerStats.set_engines([engine_path])
+      logging.info(f'Switched to engine file {engine_path}.')
+
+      cls._set_stage(_ReloadCheckpoint.DRAIN)
+      with tracker(_ReloadCheckpoint.DRAIN):
+        PredictorPool.wait_until_released(previous_predictors)
+
+      # The engine's device memory is freed once nothing refers to the models.
+      cls._set_stage(_ReloadCheckpoint.RELEASE)
+      with tracker(_ReloadCheckpoint.RELEASE):
+        del previous_predictors
+        gc.collect()
+        _empty_cuda_cache()
+      result['success'] = True
+    except Exception as e:
+      logging.exception(f'Failed to reload engine file from {engine_path}, keep serving with the current engine.')
+      result['error'] = f'{type(e).__name__}: {e}'
+
+    latencies_ns = tracker.get_latencies_ns()
+    tracker.aggregate('engine_reload', {'success': str(result['success']).lower()})
+    logging.info(f'Reload finished after {sum(latencies_ns.values()) / 1e9:.1f}s, success={result["success"]}.')
+
+    result['finished_at_ns'] = time.time_ns()
+    result['latencies_ns'] = latencies_ns
+    with cls._lock:
+      cls._last_reload = result
+      cls._status = {}
+      cls._thread = None
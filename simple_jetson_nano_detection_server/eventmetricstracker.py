@@ -1,39 +1,48 @@
-import json
 import time
 from enum import Enum
 from typing import Dict, Generic, List, Tuple, TypeVar, Union
 
 from influxdb_client.client.write.point import Point
 
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+
 EventMetricsFields = TypeVar(name='EventMetricsFields', bound=Enum)
+_TagItems = Tuple[Tuple[str, Union[str, int]], ...]
 
 
 class EventMetricsTracker(Generic[EventMetricsFields]):
 
   def __init__(self) -> None:
-    self._values: Dict[Tuple[EventMetricsFields, str], int] = {}
+    self._values: Dict[Tuple[EventMetricsFields, _TagItems], int] = {}
 
   def record(self, field: EventMetricsFields, value: int, tags: Dict[str, Union[str, int]] = {}) -> None:
-    json_tags = json.dumps(tags)
-    key = (field, json_tags)
+    key = (field, tuple(tags.items()))
     self._values[key] = value
 
   def increment(self, field: EventMetricsFields, amount: int = 1, tags: Dict[str, Union[str, int]] = {}) -> None:
-    json_tags = json.dumps(tags)
-    key = (field, json_tags)
+    key = (field, tuple(tags.items()))
     self._values[key] = self._values.get(key, 0) + amount
 
+  # Adds the values to the counters in MetricsAggregator instead of building the points on the request path.
+  def aggregate(self, measurement: str, extra_tags: Dict[str, Union[str, int]] = {}) -> None:
+    assert len(self._values) > 0, 'Nothing to aggregate'
+
+    fields_by_tags: Dict[_TagItems, Dict[str, int]] = {}
+    for (field, tags), value in self._values.items():
+      fields_by_tags.setdefault(tags, {})[field.name.lower()] = value
+
+    for tags, fields in fields_by_tags.items():
+      MetricsAggregator.increment(measurement, fields, {**dict(tags), **extra_tags})
+
   def finalize(self, measurement: str, extra_tags: Dict[str, Union[str, int]] = {}) -> List[Point]:
     assert len(self._values) > 0, 'Nothing to finalize'
     time_ns = time.time_ns()
     points: List[Point] = []
 
-    for (field, json_tags), value in self._values.items():
-      tags: Dict[str, Union[str, int]] = json.loads(json_tags)
-
+    for (field, tags), value in self._values.items():
       point = Point(measurement).field(field.name.lower(), value).time(time_ns)
 
-      for key, value in tags.items():
+      for key, value in tags:
         point.tag(key, value)
       for key, value in extra_tags.items():
         point.tag(key, value)
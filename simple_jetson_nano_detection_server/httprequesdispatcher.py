@@ -1,14 +1,26 @@
 import json
+import time
 import traceback
 from email.message import Message
 from enum import Enum, auto
 from http.server import BaseHTTPRequestHandler
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlsplit
 
 from absl import flags
-from line_protocol_cache.lineprotocolcache import LineProtocolCache
 
-from simple_jetson_nano_detection_server.detectionrequesthandler import DetectionRequestHandler
+from simple_jetson_nano_detection_server.adminrequesthandler import ENABLE_ADMIN_ENDPOINTS, AdminRequestHandler
+from simple_jetson_nano_detection_server.detectionrequesthandler import (REJECTION_RESPONSE_CODES,
+                                                                         DetectionRequestHandler)
+from simple_jetson_nano_detection_server.detectionstreamhandler import DetectionStreamHandler
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceRejectedError
 from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.requesttracer import RequestTracer
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.slowrequestrecorder import SlowRequestRecorder
+from simple_jetson_nano_detection_server.trafficrecorder import TrafficRecorder
+from simple_jetson_nano_detection_server.websocket import get_accept_key
 
 _MAX_CONTENT_LENGTH = flags.DEFINE_integer(
     name='max_content_length',
@@ -17,6 +29,20 @@ _MAX_CONTENT_LENGTH = flags.DEFINE_integer(
     help='Maximum HTTP Content-Length value that is allowed. The value is inclusive',
 )
 
+_CAMERA_ID_HEADER = flags.DEFINE_string(
+    name='camera_id_header',
+    default='X-Camera-Id',
+    help='HTTP header that identifies the camera of a detection request, for sharing the inference fairly among the '
+    'cameras. If the header is missing, the "camera" query parameter is used, then the client IP address',
+)
+
+_DEADLINE_HEADER = flags.DEFINE_string(
+    name='deadline_header',
+    default='X-Request-Deadline-Ms',
+    help='HTTP header with the number of milliseconds the client waits for the response of a detection request. '
+    'The request is responded with HTTP 504 instead of predicting if it is still queued by then',
+)
+
 
 class _PerformanceCheckpoint(Enum):
   PARSE_REQUEST_BODY = auto()
@@ -27,46 +53,163 @@ class _PerformanceCheckpoint(Enum):
 
 class HttpRequestDispatcher(BaseHTTPRequestHandler):
 
-  # Allows the client to query if the server is up.
+  # Allows the client to query if the server is up and has finished warming up.
   def do_HEAD(self) -> None:
-    self.send_response_only(200)
+    self.send_response_only(200 if ServerReadiness.is_ready() else 503)
     self.end_headers()
 
-  def do_POST(self) -> None:
-    if self.path != '/v1/vision/detection':
+  # Serves the stats collected by ServerStats. Available during startup so the clients can watch the progress.
+  # Also upgrades the detection streams to WebSockets.
+  def do_GET(self) -> None:
+    if self._is_admin_request():
+      self._handle_admin_request()
+    elif urlsplit(self.path).path == '/v1/vision/detection/stream':
+      self._handle_detection_stream()
+    elif self.path == '/metrics':
+      self._send_text_response(200, 'text/plain; version=0.0.4', ServerStats.get_prometheus_text())
+    elif self.path == '/stats':
+      self._send_text_response(200, 'application/json', json.dumps(ServerStats.get_stats()))
+    else:
       self.send_response_only(404)
       self.end_headers()
+
+  def do_POST(self) -> None:
+    if self._is_admin_request():
+      self._handle_admin_request()
       return
 
-    tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker()
+    arrival_ns = time.monotonic_ns()
+    ServerStats.start_request()
+    # The request is finished even if the handler raised, e.g. when the client disconnected while the response was
+    # written, so it does not stay in flight.
+    response_code = 500
+    latencies_ns: Dict[str, int] = {}
+    try:
+      url = urlsplit(self.path)
+      if url.path != '/v1/vision/detection':
+        response_code = 404
+        self.send_response_only(404)
+        self.end_headers()
+        return
 
+      if not ServerReadiness.is_ready():
+        response_code = 503
+        self.send_response_only(503)
+        self.end_headers()
+        return
+
+      tracker: PerformanceTracker[_PerformanceCheckpoint] = RequestTracer.create_tracker()
+      camera = self._get_camera(url.query)
+      response_code = self._handle_detection_request(tracker, camera, arrival_ns)
+      tracker.aggregate('http_request_dispatcher', {'response_code': response_code})
+      RequestTracer.record(tracker, 'http_request_dispatcher', {'response_code': response_code, 'camera': camera})
+      latencies_ns = tracker.get_latencies_ns()
+    except ConnectionError:
+      # The client closed the connection before the response was sent, which nginx logs as 499.
+      response_code = 499
+      raise
+    finally:
+      ServerStats.finish_request(response_code, latencies_ns)
+
+  def _handle_detection_request(self, tracker: PerformanceTracker[_PerformanceCheckpoint], camera: str,
+                                arrival_ns: int) -> int:
+    # Stay empty if the request is found invalid before they are parsed.
+    request_body = b''
+    multipart_boundary = ''
     try:
+      deadline_ns = self._get_deadline_ns(arrival_ns)
       with tracker(_PerformanceCheckpoint.PARSE_REQUEST_BODY):
         request_body = self._get_post_request_body()
       with tracker(_PerformanceCheckpoint.PARSE_MULTIPART_BOUNDARY):
         multipart_boundary = self._get_post_multipart_boundary()
-      with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE):
-        response = DetectionRequestHandler.get_response(request_body, multipart_boundary)
+      with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE), tracker.as_current():
+        response = DetectionRequestHandler.get_response(request_body, multipart_boundary, camera, deadline_ns)
+      response_code = 200
+    except InferenceRejectedError as e:
+      response_code = REJECTION_RESPONSE_CODES[type(e)]
+      response = json.dumps({'class': type(e).__name__, 'message': str(e)}).encode()
     except Exception as e:
-      with tracker(_PerformanceCheckpoint.SEND_RESPONSE):
-        self.send_response_only(400)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        response = {
-            'class': type(e).__name__,
-            'message': str(e),
-            'traceback': traceback.format_tb(e.__traceback__),
-        }
-        self.wfile.write(json.dumps(response).encode())
-      LineProtocolCache.put(tracker.finalize('http_request_dispatcher', {'response_code': 400}))
-      return
+      response_code = 400
+      response = json.dumps({
+          'class': type(e).__name__,
+          'message': str(e),
+          'traceback': traceback.format_tb(e.__traceback__),
+      }).encode()
 
     with tracker(_PerformanceCheckpoint.SEND_RESPONSE):
-      self.send_response_only(200)
+      self.send_response_only(response_code)
       self.send_header('Content-Type', 'application/json')
       self.end_headers()
-      self.wfile.write(response.encode())
-    LineProtocolCache.put(tracker.finalize('http_request_dispatcher', {'response_code': 200}))
+      self.wfile.write(response)
+    latencies_ns = tracker.get_latencies_ns()
+    if response_code == 200:
+      SlowRequestRecorder.offer(latencies_ns, request_body, multipart_boundary, response)
+    # The rejected and the invalid requests are recorded too, so the replayed traffic has the same mix of them.
+    TrafficRecorder.record(latencies_ns, dict(self.headers.items()), request_body, response_code, response)
+    return response_code
+
+  # Serves the stream on the request handler thread until it is closed.
+  def _handle_detection_stream(self) -> None:
+    if not ServerReadiness.is_ready():
+      self.send_response_only(503)
+      self.end_headers()
+      return
+
+    key = self.headers['Sec-WebSocket-Key']
+    if (self.headers['Upgrade'] or '').lower() != 'websocket' or key is None:
+      self._send_text_response(400, 'application/json',
+                               json.dumps({'message': 'Expected a WebSocket upgrade request with Sec-WebSocket-Key'}))
+      return
+
+    # Clients only accept the upgrade over HTTP/1.1. The connection is not reused after the stream.
+    self.protocol_version = 'HTTP/1.1'
+    self.send_response_only(101)
+    self.send_header('Upgrade', 'websocket')
+    self.send_header('Connection', 'Upgrade')
+    self.send_header('Sec-WebSocket-Accept', get_accept_key(key))
+    self.end_headers()
+    self.close_connection = True
+    DetectionStreamHandler.serve(self.rfile, self.wfile, self._get_camera(urlsplit(self.path).query))
+
+  # Frigate does not identify the camera, so a client that cannot set the header can put it in the URL instead, e.g.
+  # "/v1/vision/detection?camera=front_door". Falling back to the IP address tells apart the cameras on their own.
+  def _get_camera(self, query: str) -> str:
+    camera = self.headers[_CAMERA_ID_HEADER.value]
+    if camera is None:
+      camera = dict(parse_qsl(query)).get('camera')
+    if camera is None:
+      camera = self.client_address[0]
+    return camera
+
+  # Returns the deadline compared with time.monotonic_ns(), or None if the client did not set one.
+  def _get_deadline_ns(self, arrival_ns: int) -> Optional[int]:
+    deadline_ms = self.headers[_DEADLINE_HEADER.value]
+    if deadline_ms is None:
+      return None
+    assert deadline_ms.isdigit(), (
+        f'Expected {_DEADLINE_HEADER.value} to be a non-negative integer, got "{deadline_ms}" instead')
+    return arrival_ns + int(deadline_ms) * 1000000
+
+  def _is_admin_request(self) -> bool:
+    return ENABLE_ADMIN_ENDPOINTS.value and self.path.startswith('/admin/')
+
+  def _handle_admin_request(self) -> None:
+    url = urlsplit(self.path)
+    try:
+      response = AdminRequestHandler.get_response(self.command, url.path, dict(parse_qsl(url.query)))
+    except Exception as e:
+      self._send_text_response(400, 'application/json', json.dumps({'class': type(e).__name__, 'message': str(e)}))
+      return
+
+    self._send_text_response(response.code, response.content_type, response.body)
+
+  def _send_text_response(self, code: int, content_type: str, text: str) -> None:
+    body = text.encode()
+    self.send_response_only(code)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
 
   def _get_post_request_body(self) -> bytes:
     content_length = int(self.headers['Content-Length'])
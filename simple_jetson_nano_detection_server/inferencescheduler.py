@@ -0,0 +1,476 @@
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Dict, List, Optional, Tuple
+
+from absl import flags
+
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.overflowlane import OverflowLane
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import Prediction
+from simple_jetson_nano_detection_server.predictorpool import PREDICTOR_POOL_SIZE, PredictorPool
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+
+_CAMERA_WEIGHTS = flags.DEFINE_list(
+    name='camera_weights',
+    default=[],
+    help='Share of the inference each camera gets when cameras compete for it, in the format "camera:weight", '
+    'e.g. "front_door:2,backyard:1". Cameras not listed get --default_camera_weight',
+)
+
+_DEFAULT_CAMERA_WEIGHT = flags.DEFINE_float(
+    name='default_camera_weight',
+    default=1.0,
+    lower_bound=0.001,
+    help='Weight of the cameras not listed in --camera_weights',
+)
+
+_CAMERA_MAX_OUTSTANDING = flags.DEFINE_list(
+    name='camera_max_outstanding',
+    default=[],
+    help='Maximum number of requests from each camera that can be queued or predicting at once, in the format '
+    '"camera:count". More requests from the camera are responded with HTTP 429. '
+    'Cameras not listed get --default_camera_max_outstanding',
+)
+
+_DEFAULT_CAMERA_MAX_OUTSTANDING = flags.DEFINE_integer(
+    name='default_camera_max_outstanding',
+    default=0,
+    lower_bound=0,
+    help='Maximum number of outstanding requests of the cameras not listed in --camera_max_outstanding. '
+    'Set to 0 for no limit',
+)
+
+_SUPERSEDE_QUEUED_FRAMES = flags.DEFINE_bool(
+    name='supersede_queued_frames',
+    default=False,
+    help='If true, a queued request is responded with HTTP 409 right away when a newer request from the same camera '
+    'arrives, so only the latest frame of each camera is predicted. Only enable it if each camera is identified on '
+    'its own, see --camera_id_header',
+)
+
+_MAX_TRACKED_CAMERAS = flags.DEFINE_integer(
+    name='max_tracked_cameras',
+    default=32,
+    lower_bound=1,
+    help='Maximum number of cameras whose requests are counted by camera in the stats and the metrics, in the order '
+    'they first arrived. The requests of more cameras are counted under the "other" camera',
+)
+
+_OVERFLOW_QUEUE_WAIT_MS = flags.DEFINE_float(
+    name='overflow_queue_wait_ms',
+    default=200.0,
+    lower_bound=0.0,
+    help='Predict a request on the overflow lane instead if it would wait longer than this for the GPU, estimated '
+    'from the requests ahead of it and the average prediction latency. Only used with --overflow_model_path',
+)
+
+# Weight of the latest prediction in the moving average of the prediction latency.
+_PREDICT_LATENCY_SMOOTHING = 0.1
+
+
+class _PerformanceCheckpoint(Enum):
+  QUEUE_WAIT = auto()
+
+
+class _Lane(Enum):
+  GPU = 'gpu'
+  CPU = 'cpu'
+
+
+# The request was responded without predicting, because the server would not have predicted it in time anyway.
+class InferenceRejectedError(Exception):
+  pass
+
+
+class CameraOverloadedError(InferenceRejectedError):
+  pass
+
+
+class RequestSupersededError(InferenceRejectedError):
+  pass
+
+
+class DeadlineExceededError(InferenceRejectedError):
+  pass
+
+
+class RequestRateExceededError(InferenceRejectedError):
+  pass
+
+
+_REJECTION_REASONS = {
+    CameraOverloadedError: 'overloaded',
+    RequestSupersededError: 'superseded',
+    DeadlineExceededError: 'expired',
+    RequestRateExceededError: 'rate_limited',
+}
+
+
+@dataclass
+class _Job:
+  camera: str
+  image_data: bytes
+  tracker: Optional[PerformanceTracker]
+  enqueued_ns: int
+  # Compared with time.monotonic_ns(). None if the client has no deadline.
+  deadline_ns: Optional[int]
+  done: threading.Event = field(default_factory=threading.Event)
+  queued: bool = False
+  lane: _Lane = _Lane.GPU
+  queue_wait_ns: int = 0
+  predictions: Optional[List[Prediction]] = None
+  exception: Optional[Exception] = None
+
+
+def _parse_camera_values(values: List[str]) -> Dict[str, str]:
+  camera_values: Dict[str, str] = {}
+  for value in values:
+    camera, separator, camera_value = value.rpartition(':')
+    assert separator == ':' and camera != '', f'Expected the format "camera:value", got "{value}" instead'
+    camera_values[camera] = camera_value
+  return camera_values
+
+
+# Runs the predictions on --predictor_pool_size background threads, in the order of self-clocked weighted fair queueing.
+# Each queued request is tagged with a virtual finish time: the later of the current virtual time and the finish time
+# of the previous request of the same camera, plus 1/weight. The request with the earliest finish time runs next,
+# so a camera sending more requests than its share waits behind the other cameras instead of delaying them.
+# A queued request is responded without predicting if its deadline passed, or if it was superseded by a newer request
+# from the same camera. The newer request takes its place in the queue, so the camera does not lose its turn.
+# When a request would wait longer than --overflow_queue_wait_ms, it is predicted on the OverflowLane instead, if idle.
+class InferenceScheduler:
+
+  _condition = threading.Condition()
+  _queue: List[Tuple[float, int, _Job]] = []
+  _sequence = itertools.count()
+  _virtual_time = 0.0
+  _finish_times: Dict[str, float] = {}
+  # The finish times of the cameras without outstanding requests that are later than the virtual time, by finish time.
+  _idle_finish_times: List[Tuple[float, str]] = []
+  _outstanding: Dict[str, int] = {}
+  _weights: Dict[str, float] = {}
+  _max_outstanding: Dict[str, int] = {}
+  _default_weight = 1.0
+  _default_max_outstanding = 0
+  _supersede_queued_frames = False
+  _overflow_queue_wait_ns = 0
+  # Number of requests predicting on the GPU, and the moving average of their latency.
+  _predicting = 0
+  _average_predict_ns = 0.0
+  # The queued request of each camera, only kept when superseding.
+  _queued_jobs: Dict[str, _Job] = {}
+  # Limits set by ThermalGovernor while the board is hot. None if not limited.
+  _max_predicting: Optional[int] = None
+  _max_request_rate: Optional[float] = None
+  # Token bucket of the requests accepted, holding up to 1 second of requests at the maximum rate.
+  _request_tokens = 0.0
+  _request_tokens_updated_ns = 0
+
+  _stop_requested = False
+  _threads: List[threading.Thread] = []
+
+  def __enter__(self):
+    cls = type(self)
+    assert len(cls._threads) == 0, 'InferenceScheduler is already running'
+
+    # The camera values are parsed once, instead of on every request.
+    cls._weights = {camera: float(weight) for camera, weight in _parse_camera_values(_CAMERA_WEIGHTS.value).items()}
+    assert all(weight > 0 for weight in cls._weights.values()), (
+        f'Expected the weights to be > 0, got {cls._weights} instead')
+    cls._max_outstanding = {
+        camera: int(count) for camera, count in _parse_camera_values(_CAMERA_MAX_OUTSTANDING.value).items()
+    }
+    cls._default_weight = _DEFAULT_CAMERA_WEIGHT.value
+    cls._default_max_outstanding = _DEFAULT_CAMERA_MAX_OUTSTANDING.value
+    cls._supersede_queued_frames = _SUPERSEDE_QUEUED_FRAMES.value
+    cls._overflow_queue_wait_ns = int(_OVERFLOW_QUEUE_WAIT_MS.value * 1e6)
+    ServerStats.set_max_cameras(_MAX_TRACKED_CAMERAS.value)
+
+    cls._virtual_time = 0.0
+    cls._finish_times = {}
+    cls._idle_finish_times = []
+    cls._predicting = 0
+    cls._average_predict_ns = 0.0
+    cls._max_predicting = None
+    cls._max_request_rate = None
+    cls._stop_requested = False
+    # One thread for each predictor, so all of them are kept busy.
+    cls._threads = [
+        threading.Thread(target=cls._run, name=f'inference-scheduler-{i}', daemon=True)
+        for i in range(PREDICTOR_POOL_SIZE.value)
+    ]
+    for thread in cls._threads:
+      thread.start()
+    ServerStats.set_queue_depth_callback(cls.get_queue_depth)
+    return self
+
+  # Finishes the queued requests before returning.
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if len(cls._threads) == 0:
+      return
+
+    ServerStats.set_queue_depth_callback(None)
+    with cls._condition:
+      cls._stop_requested = True
+      cls._condition.notify_all()
+    for thread in cls._threads:
+      thread.join()
+    cls._threads = []
+
+  @classmethod
+  def is_running(cls) -> bool:
+    return len(cls._threads) > 0
+
+  # Limits the number of requests predicting on the GPU at once and the number of requests accepted per second, until
+  # set to None. Requests beyond the rate are responded with RequestRateExceededError instead of queueing.
+  @classmethod
+  def set_limits(cls, max_predicting: Optional[int], max_request_rate: Optional[float]) -> None:
+    assert max_predicting is None or max_predicting > 0, (
+        f'Expected max_predicting to be > 0, got {max_predicting} instead')
+    assert max_request_rate is None or max_request_rate > 0, (
+        f'Expected max_request_rate to be > 0, got {max_request_rate} instead')
+    with cls._condition:
+      cls._max_predicting = max_predicting
+      if max_request_rate != cls._max_request_rate:
+        cls._max_request_rate = max_request_rate
+        cls._request_tokens = max(max_request_rate or 0.0, 1.0)
+        cls._request_tokens_updated_ns = time.monotonic_ns()
+      cls._condition.notify_all()
+
+  # The moving average of the prediction latency on the GPU, 0 until the first prediction finished.
+  @classmethod
+  def get_average_predict_ns(cls) -> float:
+    with cls._condition:
+      return cls._average_predict_ns
+
+  # Predicts on the image once it is the camera's turn. Predicts right away on the calling thread if the scheduler is
+  # not running, e.g. during warmup. The current tracker of the calling thread tracks the spans of the prediction.
+  # Raises InferenceRejectedError if the request was responded without predicting.
+  @classmethod
+  def predict(cls, camera: str, image_data: bytes, deadline_ns: Optional[int]) -> List[Prediction]:
+    if len(cls._threads) == 0:
+      return PredictorPool.predict(image_data)
+
+    job = _Job(camera, image_data, PerformanceTracker.get_current(), time.perf_counter_ns(), deadline_ns)
+    try:
+      cls._enqueue(job)
+      if job.lane == _Lane.CPU:
+        cls._predict_on_overflow_lane(job)
+      else:
+        # Stops waiting at the deadline, unless the request has started predicting by then.
+        timeout_s = None if deadline_ns is None else max(deadline_ns - time.monotonic_ns(), 0) / 1e9
+        if not job.done.wait(timeout_s):
+          cls._cancel(job, DeadlineExceededError('Deadline exceeded while the request was queued'))
+          job.done.wait()
+        # Tracked on this thread, which is the one that waited, so the span does not overlap the predictions of the
+        # scheduler thread on a timeline.
+        if not isinstance(job.exception, InferenceRejectedError):
+          PerformanceTracker.add_span(_PerformanceCheckpoint.QUEUE_WAIT, job.queue_wait_ns,
+                                      job.enqueued_ns + job.queue_wait_ns)
+    except InferenceRejectedError as e:
+      cls._count_rejection(camera, e)
+      raise
+
+    if job.exception is not None:
+      if isinstance(job.exception, InferenceRejectedError):
+        cls._count_rejection(camera, job.exception)
+      raise job.exception
+
+    tracked_camera = ServerStats.get_tracked_camera(camera)
+    tags = {'camera': tracked_camera, 'lane': job.lane.value}
+    MetricsAggregator.increment('inference_scheduler', {'requests': 1}, tags)
+    MetricsAggregator.record_latencies('inference_scheduler', {'queue_wait': job.queue_wait_ns}, tags)
+    ServerStats.record_camera_request(tracked_camera, job.queue_wait_ns)
+
+    assert job.predictions is not None
+    return job.predictions
+
+  @classmethod
+  def _enqueue(cls, job: _Job) -> None:
+    if job.deadline_ns is not None and time.monotonic_ns() >= job.deadline_ns:
+      raise DeadlineExceededError('Deadline exceeded before the request was queued')
+
+    with cls._condition:
+      superseded_job = cls._queued_jobs.get(job.camera) if cls._supersede_queued_frames else None
+      if superseded_job is not None:
+        finish_time, sequence = cls._remove_queued(superseded_job)
+      else:
+        outstanding = cls._outstanding.get(job.camera, 0)
+        max_outstanding = cls._max_outstanding.get(job.camera, cls._default_max_outstanding)
+        if max_outstanding != 0 and outstanding >= max_outstanding:
+          raise CameraOverloadedError(f'Camera "{job.camera}" already has {max_outstanding} outstanding requests')
+        if not cls._take_request_token():
+          raise RequestRateExceededError(f'Server is accepting at most {cls._max_request_rate} requests per second')
+        finish_time = (max(cls._virtual_time, cls._finish_times.get(job.camera, 0.0)) +
+                       1 / cls._weights.get(job.camera, cls._default_weight))
+        cls._finish_times[job.camera] = finish_time
+        sequence = next(cls._sequence)
+
+      cls._outstanding[job.camera] = cls._outstanding.get(job.camera, 0) + 1
+      if superseded_job is None and cls._is_gpu_behind(finish_time) and OverflowLane.try_acquire():
+        job.lane = _Lane.CPU
+        return
+      heapq.heappush(cls._queue, (finish_time, sequence, job))
+      job.queued = True
+      if cls._supersede_queued_frames:
+        cls._queued_jobs[job.camera] = job
+      cls._condition.notify()
+
+    if superseded_job is not None:
+      superseded_job.exception = RequestSupersededError(f'A newer request from camera "{job.camera}" arrived')
+      cls._finish(superseded_job)
+
+  # Must be called with the condition held. A request superseding a queued one takes no token, as it adds no work.
+  @classmethod
+  def _take_request_token(cls) -> bool:
+    if cls._max_request_rate is None:
+      return True
+    now_ns = time.monotonic_ns()
+    elapsed_s = (now_ns - cls._request_tokens_updated_ns) / 1e9
+    cls._request_tokens = min(cls._request_tokens + elapsed_s * cls._max_request_rate,
+                              max(cls._max_request_rate, 1.0))
+    cls._request_tokens_updated_ns = now_ns
+    if cls._request_tokens < 1:
+      return False
+    cls._request_tokens -= 1
+    return True
+
+  # Estimates the queue wait from the requests that would be predicted before this one. The estimate is 0 until the
+  # first prediction finished, so no request is sent to the overflow lane before the GPU latency is known.
+  @classmethod
+  def _is_gpu_behind(cls, finish_time: float) -> bool:
+    ahead = sum(1 for queued_finish_time, _, _ in cls._queue if queued_finish_time <= finish_time) + cls._predicting
+    parallelism = len(cls._threads) if cls._max_predicting is None else min(len(cls._threads), cls._max_predicting)
+    return ahead * cls._average_predict_ns / parallelism > cls._overflow_queue_wait_ns
+
+  @classmethod
+  def _predict_on_overflow_lane(cls, job: _Job) -> None:
+    job.queue_wait_ns = time.perf_counter_ns() - job.enqueued_ns
+    try:
+      job.predictions = OverflowLane.predict(job.image_data)
+    except Exception as e:
+      job.exception = e
+    finally:
+      cls._finish(job)
+
+  # Responds the request with the exception if it is still queued. Does nothing if it has started predicting.
+  @classmethod
+  def _cancel(cls, job: _Job, exception: InferenceRejectedError) -> None:
+    with cls._condition:
+      if not job.queued:
+        return
+      cls._remove_queued(job)
+    job.exception = exception
+    cls._finish(job)
+
+  # Removes the queued request and returns its position in the queue. The queue only has a few requests, so it's
+  # simpler to search it than to leave the removed requests in it.
+  @classmethod
+  def _remove_queued(cls, job: _Job) -> Tuple[float, int]:
+    index = next(i for i, (_, _, queued_job) in enumerate(cls._queue) if queued_job is job)
+    finish_time, sequence, _ = cls._queue.pop(index)
+    heapq.heapify(cls._queue)
+    cls._mark_dequeued(job)
+    return finish_time, sequence
+
+  @classmethod
+  def _mark_dequeued(cls, job: _Job) -> None:
+    job.queued = False
+    if cls._queued_jobs.get(job.camera) is job:
+      del cls._queued_jobs[job.camera]
+
+  @classmethod
+  def _count_rejection(cls, camera: str, exception: InferenceRejectedError) -> None:
+    reason = _REJECTION_REASONS[type(exception)]
+    tracked_camera = ServerStats.get_tracked_camera(camera)
+    MetricsAggregator.increment('inference_scheduler', {reason: 1}, {'camera': tracked_camera})
+    ServerStats.record_camera_rejection(tracked_camera, reason)
+
+  @classmethod
+  def get_queue_depth(cls) -> int:
+    with cls._condition:
+      return len(cls._queue)
+
+  # Must be called with the condition held.
+  @classmethod
+  def _is_predicting_limited(cls) -> bool:
+    return cls._max_predicting is not None and cls._predicting >= cls._max_predicting
+
+  @classmethod
+  def _run(cls) -> None:
+    while True:
+      with cls._condition:
+        while (len(cls._queue) == 0 or cls._is_predicting_limited()) and not cls._stop_requested:
+          cls._condition.wait()
+        if len(cls._queue) == 0:
+          return
+        finish_time, _, job = heapq.heappop(cls._queue)
+        cls._virtual_time = finish_time
+        cls._forget_idle_finish_times()
+        cls._mark_dequeued(job)
+
+        if job.deadline_ns is not None and time.monotonic_ns() >= job.deadline_ns:
+          expired = True
+        else:
+          expired = False
+          cls._predicting += 1
+
+      if expired:
+        job.exception = DeadlineExceededError('Deadline exceeded while the request was queued')
+        cls._finish(job)
+        continue
+
+      job.queue_wait_ns = time.perf_counter_ns() - job.enqueued_ns
+      start_ns = time.perf_counter_ns()
+      try:
+        with job.tracker.as_current() if job.tracker is not None else contextlib.nullcontext():
+          job.predictions = PredictorPool.predict(job.image_data)
+      except Exception as e:
+        job.exception = e
+      finally:
+        with cls._condition:
+          cls._predicting -= 1
+          # Wakes a thread waiting for the number of predictions to drop below the limit.
+          if cls._max_predicting is not None:
+            cls._condition.notify()
+          predict_ns = time.perf_counter_ns() - start_ns
+          if cls._average_predict_ns == 0:
+            cls._average_predict_ns = float(predict_ns)
+          else:
+            cls._average_predict_ns += (predict_ns - cls._average_predict_ns) * _PREDICT_LATENCY_SMOOTHING
+        cls._finish(job)
+
+  # A camera's finish time can be forgotten once it has no outstanding requests and the virtual time has caught up
+  # with it, as the next request of the camera starts from the virtual time then. This keeps the state from growing
+  # with the number of clients. The requests cancelled while queued and the ones predicted on the overflow lane do not
+  # advance the virtual time, so the finish time of their camera is kept until it does, and the camera keeps its debt.
+  @classmethod
+  def _finish(cls, job: _Job) -> None:
+    with cls._condition:
+      outstanding = cls._outstanding[job.camera] - 1
+      if outstanding == 0:
+        del cls._outstanding[job.camera]
+        finish_time = cls._finish_times[job.camera]
+        if finish_time <= cls._virtual_time:
+          del cls._finish_times[job.camera]
+        else:
+          heapq.heappush(cls._idle_finish_times, (finish_time, job.camera))
+      else:
+        cls._outstanding[job.camera] = outstanding
+    job.done.set()
+
+  # Must be called with the condition held. A camera that has sent requests again since is left alone, as is a
+  # finish time that has been replaced.
+  @classmethod
+  def _forget_idle_finish_times(cls) -> None:
+    while len(cls._idle_finish_times) > 0 and cls._idle_finish_times[0][0] <= cls._virtual_time:
+      finish_time, camera = heapq.heappop(cls._idle_finish_times)
+      if camera not in cls._outstanding and cls._finish_times.get(camera) == finish_time:
+        del cls._finish_times[camera]
@@ -0,0 +1,69 @@
+import math
+from typing import List
+
+# Each power of two range is split into this many buckets, bounding the relative error of a percentile to 1/32.
+_SUB_BUCKET_BITS = 5
+_SUB_BUCKET_COUNT = 1 << _SUB_BUCKET_BITS
+
+# About 18 minutes. Larger values are counted in the last bucket, but are still reflected exactly in max and sum.
+MAX_TRACKABLE_NS = (1 << 40) - 1
+
+
+def _get_bucket_index(value_ns: int) -> int:
+  if value_ns < 2 * _SUB_BUCKET_COUNT:
+    return value_ns
+  shift = value_ns.bit_length() - _SUB_BUCKET_BITS - 1
+  return (shift + 1) * _SUB_BUCKET_COUNT + (value_ns >> shift) - _SUB_BUCKET_COUNT
+
+
+# Returns the largest value that falls into the bucket.
+def _get_bucket_upper_bound(index: int) -> int:
+  if index < 2 * _SUB_BUCKET_COUNT:
+    return index
+  shift = index // _SUB_BUCKET_COUNT - 1
+  return ((index % _SUB_BUCKET_COUNT + _SUB_BUCKET_COUNT + 1) << shift) - 1
+
+
+_BUCKET_COUNT = _get_bucket_index(MAX_TRACKABLE_NS) + 1
+
+
+# A log-bucketed histogram of latencies in nanoseconds with a fixed memory footprint, similar to HdrHistogram.
+# Histograms use the same buckets, so histograms recorded by different threads or processes can be merged.
+class LatencyHistogram:
+
+  def __init__(self) -> None:
+    self._buckets: List[int] = [0] * _BUCKET_COUNT
+    self.count = 0
+    self.sum_ns = 0
+    self.max_ns = 0
+
+  def record(self, value_ns: int) -> None:
+    assert value_ns >= 0, f'Expected latency to be >= 0, got {value_ns} instead'
+    self._buckets[_get_bucket_index(min(value_ns, MAX_TRACKABLE_NS))] += 1
+    self.count += 1
+    self.sum_ns += value_ns
+    if value_ns > self.max_ns:
+      self.max_ns = value_ns
+
+  def merge(self, other: 'LatencyHistogram') -> None:
+    for index, count in enumerate(other._buckets):
+      if count != 0:
+        self._buckets[index] += count
+    self.count += other.count
+    self.sum_ns += other.sum_ns
+    self.max_ns = max(self.max_ns, other.max_ns)
+
+  # Returns the smallest recorded value that is greater than or equal to the percentage of all values,
+  # rounded up to the upper bound of its bucket but never above the max.
+  def get_percentile(self, percentile: float) -> int:
+    assert 0 < percentile <= 100, f'Expected percentile to be in (0, 100], got {percentile} instead'
+    assert self.count > 0, 'Cannot get percentile of an empty histogram'
+
+    rank = math.ceil(self.count * percentile / 100)
+    seen = 0
+    for index, count in enumerate(self._buckets):
+      seen += count
+      if seen >= rank:
+        return min(_get_bucket_upper_bound(index), self.max_ns)
+
+    return self.max_ns
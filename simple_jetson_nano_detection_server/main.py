@@ -1,13 +1,27 @@
-from contextlib import nullcontext
-from http.server import HTTPServer
+import threading
+from enum import Enum, auto
+from http.server import HTTPServer, ThreadingHTTPServer
 from typing import List
-from unittest.mock import Mock, patch
 
 from absl import app, flags, logging
 from line_protocol_cache.lineprotocolcache import LineProtocolCache
-from ultralytics import YOLO
 
+from simple_jetson_nano_detection_server.detectionjournal import DetectionJournal
+from simple_jetson_nano_detection_server.enginemanifest import ENGINE_MANIFEST_PATH, EngineManifest, EngineSpec
+from simple_jetson_nano_detection_server.enginereloader import EngineReloader
 from simple_jetson_nano_detection_server.httprequesdispatcher import HttpRequestDispatcher
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceScheduler
+from simple_jetson_nano_detection_server.memorymonitor import MemoryMonitor
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.overflowlane import OverflowLane
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.predictorpool import PREDICTOR_POOL_SIZE, PredictorPool
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.sharedmemoryserver import SharedMemoryServer
+from simple_jetson_nano_detection_server.thermalgovernor import ThermalGovernor
+from simple_jetson_nano_detection_server.trafficrecorder import TrafficRecorder
+from simple_jetson_nano_detection_server.warmuprunner import WarmupRunner
 from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
 
 ENGINE_PATH = flags.DEFINE_string(
@@ -16,6 +30,13 @@ ENGINE_PATH = flags.DEFINE_string(
     help='Path to the exported TensorRT engine file',
 )
 
+ENGINE_SPEC = flags.DEFINE_string(
+    name='engine_spec',
+    default=None,
+    help='If set, load the engine built for this spec according to --engine_manifest_path instead of --engine_path. '
+    'The format is "model:image_size:precision:batch_size", e.g. "yolo11s:320:fp16:1"',
+)
+
 SERVER_IP = flags.DEFINE_string(
     name='server_ip',
     default='0.0.0.0',
@@ -35,30 +56,76 @@ GENERATE_METRICS = flags.DEFINE_bool(
 )
 
 
-def _inhibit_lpc(for_real: bool = True):
-  if for_real:
-    return patch.object(LineProtocolCache, LineProtocolCache.put.__name__, Mock(return_value=None))
-  return nullcontext()
+class _StartupCheckpoint(Enum):
+  BIND_HTTP_SERVER = auto()
+  IMPORT_MODULES = auto()
+  LOAD_ENGINE = auto()
+  WARMUP = auto()
 
 
-def main(args: List[str]) -> None:
-  with LineProtocolCache():
+def get_engine_path() -> str:
+  if ENGINE_SPEC.value is None:
+    return ENGINE_PATH.value
+  return EngineManifest(ENGINE_MANIFEST_PATH.value).get_engine_path(EngineSpec.parse(ENGINE_SPEC.value))
+
+
+def _start_up(http_server: HTTPServer, tracker: PerformanceTracker[_StartupCheckpoint]) -> None:
+  try:
+    # Importing ultralytics also imports torch, which takes a long time on Jetson Nano.
+    logging.info('Importing modules.')
+    with tracker(_StartupCheckpoint.IMPORT_MODULES):
+      from ultralytics import YOLO
+
+    # Ultralytics defers deserializing the engine until the first prediction, which is counted towards warmup.
+    # Each predictor loads its own copy of the engine.
+    engine_path = get_engine_path()
+    logging.info(f'Loading engine file from {engine_path} for {PREDICTOR_POOL_SIZE.value} predictors.')
+    with tracker(_StartupCheckpoint.LOAD_ENGINE):
+      predictors = [YoloPredictor(YOLO(engine_path, task='detect')) for _ in range(PREDICTOR_POOL_SIZE.value)]
+      PredictorPool.set_predictors(predictors)
+    ServerStats.set_engines([engine_path])
+
+    # Run predictions to load the engine into GPU while generate no metrics.
+    logging.info('Warming up.')
+    MetricsAggregator.set_enabled(False)
+    with tracker(_StartupCheckpoint.WARMUP):
+      iterations = WarmupRunner.run_predictors(predictors)
+    MetricsAggregator.set_enabled(True)
 
-    # Load the engine file.
-    logging.info(f'Loading engine file from {ENGINE_PATH.value}.')
-    model = YOLO(ENGINE_PATH.value, task='detect')
-    YoloPredictor.set_model(model)
+    # The overflow lane is loaded and warmed up in the background, requests are only predicted on the GPU until then.
+    if OverflowLane.start():
+      logging.info('Starting overflow lane.')
+  except Exception:
+    logging.exception('Startup failed, shutting down HTTP server.')
+    http_server.shutdown()
+    return
 
-    # Do one prediction to load the engine into GPU while generate no metrics.
-    logging.info('Running prediction on images/bus.jpg.')
-    with open('images/bus.jpg', 'rb') as fp, _inhibit_lpc():
-      YoloPredictor.predict(fp.read())
+  logging.info(f'Warmup finished after {iterations} predictions, server is ready.')
+  ServerReadiness.set_ready()
+  if GENERATE_METRICS.value:
+    LineProtocolCache.put(tracker.finalize('startup').field('warmup_iterations', iterations))
 
+
+def main(args: List[str]) -> None:
+  with LineProtocolCache(), MetricsAggregator(enabled=GENERATE_METRICS.value), MemoryMonitor(), TrafficRecorder(), \
+      DetectionJournal(), OverflowLane(), InferenceScheduler(), EngineReloader(get_engine_path), ThermalGovernor(), \
+      SharedMemoryServer():
+    tracker: PerformanceTracker[_StartupCheckpoint] = PerformanceTracker()
+
+    # Bind the HTTP server early so the clients see 503 instead of connection refused during startup.
+    # Each request is handled on its own thread, and InferenceScheduler decides the order they are predicted in.
     logging.info('Starting HTTP server.')
-    with _inhibit_lpc(not GENERATE_METRICS.value):
-      http_server = HTTPServer((SERVER_IP.value, SERVER_PORT.value), HttpRequestDispatcher)
-      http_server.serve_forever()
+    with tracker(_StartupCheckpoint.BIND_HTTP_SERVER):
+      http_server = ThreadingHTTPServer((SERVER_IP.value, SERVER_PORT.value), HttpRequestDispatcher)
+    threading.Thread(target=_start_up, args=(http_server, tracker), name='startup', daemon=True).start()
+    http_server.serve_forever()
+
+    assert ServerReadiness.is_ready(), 'HTTP server was shut down before startup finished'
 
 
 def app_run_main() -> None:
   app.run(main)
+
+
+if __name__ == '__main__':
+  app_run_main()
@@ -0,0 +1,193 @@
+import contextlib
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from enum import Enum
+from typing import Any, Dict, Iterator, Optional, Union
+
+from absl import flags, logging
+
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+
+_MEMORY_REPORT_INTERVAL_S = flags.DEFINE_float(
+    name='memory_report_interval_s',
+    default=10.0,
+    lower_bound=0.001,
+    help='Duration in seconds between taking snapshots of the memory usage',
+)
+
+_ALLOCATION_SAMPLING_RATE = flags.DEFINE_float(
+    name='allocation_sampling_rate',
+    default=0.0,
+    lower_bound=0.0,
+    upper_bound=1.0,
+    help='Fraction of the detection requests for which the Python memory allocations of each stage are traced. '
+    'Tracing slows down the sampled requests considerably. Set to 0 to disable',
+)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+Snapshot = Dict[str, Union[int, float]]
+
+
+def _get_rss_bytes() -> int:
+  with open('/proc/self/statm', 'r') as fp:
+    return int(fp.read().split()[1]) * _PAGE_SIZE
+
+
+# Only reports CUDA memory if PyTorch was already imported by Ultralytics, importing it here would take too long.
+# TensorRT allocates its device memory outside of PyTorch, which is only reflected in the free memory.
+def _get_cuda_memory() -> Snapshot:
+  torch = sys.modules.get('torch')
+  if torch is None or not torch.cuda.is_available():
+    return {}
+
+  free_bytes, total_bytes = torch.cuda.mem_get_info()
+  return {
+      'cuda_allocated_bytes': torch.cuda.memory_allocated(),
+      'cuda_reserved_bytes': torch.cuda.memory_reserved(),
+      'cuda_free_bytes': free_bytes,
+      'cuda_total_bytes': total_bytes,
+  }
+
+
+# Periodically takes snapshots of the memory usage from a background thread, and reports them to MetricsAggregator as
+# the "memory" measurement. Garbage collection pauses are timed with gc.callbacks while the monitor is running.
+# A fraction of the detection requests can also have the allocations of each stage traced with tracemalloc.
+class MemoryMonitor:
+
+  # Reentrant because garbage collection, and therefore _on_gc(), can be triggered while the lock is held.
+  _lock = threading.RLock()
+  _snapshot: Snapshot = {}
+  _gc_start_ns = 0
+  _gc_pauses = [0, 0, 0]
+  _gc_pause_ns = [0, 0, 0]
+  _gc_max_pause_ns = 0
+  _allocations: Dict[str, Dict[str, int]] = {}
+  _allocation_sampling_rate = 0.0
+  # tracemalloc is process-wide, so only one request at a time can be traced.
+  _tracing_lock = threading.Lock()
+
+  _stop_requested = threading.Event()
+  _thread: Optional[threading.Thread] = None
+
+  def __enter__(self):
+    cls = type(self)
+    assert cls._thread is None, 'MemoryMonitor is already running'
+
+    cls._allocation_sampling_rate = _ALLOCATION_SAMPLING_RATE.value
+    gc.callbacks.append(cls._on_gc)
+    cls._stop_requested.clear()
+    cls._thread = threading.Thread(target=cls._run, name='memory-monitor', daemon=True)
+    cls._thread.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._thread is None:
+      return
+
+    cls._stop_requested.set()
+    cls._thread.join()
+    cls._thread = None
+    gc.callbacks.remove(cls._on_gc)
+    cls._allocation_sampling_rate = 0.0
+
+  @classmethod
+  def take_snapshot(cls) -> Snapshot:
+    snapshot: Snapshot = {
+        'rss_bytes': _get_rss_bytes(),
+        'python_allocated_blocks': sys.getallocatedblocks(),
+    }
+    for generation, (count, stats) in enumerate(zip(gc.get_count(), gc.get_stats())):
+      snapshot[f'gc_count_gen{generation}'] = count
+      snapshot[f'gc_collections_gen{generation}'] = stats['collections']
+    with cls._lock:
+      for generation in range(3):
+        snapshot[f'gc_pauses_gen{generation}'] = cls._gc_pauses[generation]
+        snapshot[f'gc_pause_ns_gen{generation}'] = cls._gc_pause_ns[generation]
+      snapshot['gc_max_pause_ns'] = cls._gc_max_pause_ns
+    snapshot.update(_get_cuda_memory())
+
+    with cls._lock:
+      cls._snapshot = snapshot
+    return snapshot
+
+  @classmethod
+  def get_stats(cls) -> Dict[str, Any]:
+    with cls._lock:
+      return {
+          'snapshot': dict(cls._snapshot),
+          'allocations': {stage: dict(allocation) for stage, allocation in cls._allocations.items()},
+      }
+
+  # Decides if the allocations of the current request should be traced. Never samples if tracemalloc was already
+  # started elsewhere, e.g. with "-X tracemalloc", because stopping it would interfere.
+  @classmethod
+  def sample_allocations(cls) -> bool:
+    return (cls._allocation_sampling_rate > 0 and random.random() < cls._allocation_sampling_rate and
+            not tracemalloc.is_tracing())
+
+  # Traces the Python memory allocations of a stage of a sampled request. The peak is the most memory allocated at once
+  # during the stage, and the retained bytes are still allocated at the end of the stage.
+  # The stage is not traced if another request is being traced, as their allocations could not be told apart.
+  @classmethod
+  @contextlib.contextmanager
+  def track_allocations(cls, checkpoint: Enum, sampled: bool) -> Iterator[None]:
+    if not sampled or not cls._tracing_lock.acquire(blocking=False):
+      yield
+      return
+
+    try:
+      tracemalloc.start()
+      try:
+        yield
+      finally:
+        retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cls._record_allocations(checkpoint.name.lower(), retained_bytes, peak_bytes)
+    finally:
+      cls._tracing_lock.release()
+
+  @classmethod
+  def _record_allocations(cls, stage: str, retained_bytes: int, peak_bytes: int) -> None:
+    with cls._lock:
+      allocation = cls._allocations.get(stage)
+      if allocation is None:
+        allocation = cls._allocations[stage] = {'count': 0, 'retained_bytes': 0, 'peak_bytes': 0, 'max_peak_bytes': 0}
+      allocation['count'] += 1
+      allocation['retained_bytes'] += retained_bytes
+      allocation['peak_bytes'] += peak_bytes
+      allocation['max_peak_bytes'] = max(allocation['max_peak_bytes'], peak_bytes)
+
+    MetricsAggregator.increment('request_allocations', {
+        'count': 1,
+        'retained_bytes': retained_bytes,
+        'peak_bytes': peak_bytes
+    }, {'stage': stage})
+
+  @classmethod
+  def _on_gc(cls, phase: str, info: Dict[str, int]) -> None:
+    if phase == 'start':
+      cls._gc_start_ns = time.perf_counter_ns()
+      return
+
+    pause_ns = time.perf_counter_ns() - cls._gc_start_ns
+    generation = info['generation']
+    with cls._lock:
+      cls._gc_pauses[generation] += 1
+      cls._gc_pause_ns[generation] += pause_ns
+      cls._gc_max_pause_ns = max(cls._gc_max_pause_ns, pause_ns)
+
+  @classmethod
+  def _run(cls) -> None:
+    while not cls._stop_requested.is_set():
+      try:
+        MetricsAggregator.record('memory', cls.take_snapshot())
+      except Exception:
+        logging.exception('Failed to take memory snapshot')
+      cls._stop_requested.wait(timeout=_MEMORY_REPORT_INTERVAL_S.value)
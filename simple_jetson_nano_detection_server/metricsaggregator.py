@@ -0,0 +1,202 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from absl import flags, logging
+from influxdb_client.client.write.point import Point
+from line_protocol_cache.lineprotocolcache import LineProtocolCache
+
+from simple_jetson_nano_detection_server.latencyhistogram import LatencyHistogram
+
+_FLUSH_INTERVAL_S = flags.DEFINE_float(
+    name='metrics_flush_interval_s',
+    default=10.0,
+    lower_bound=0.001,
+    help='Duration in seconds between flushing the aggregated metrics to InfluxDB data points',
+)
+
+_FLUSH_BATCH_SIZE = flags.DEFINE_integer(
+    name='metrics_flush_batch_size',
+    default=1000,
+    lower_bound=1,
+    help='Flush before the interval has elapsed once this many updates were aggregated since the last flush',
+)
+
+_RAW_POINTS = flags.DEFINE_bool(
+    name='metrics_raw_points',
+    default=False,
+    help='Also generate one data point for every request with the duration of each stage, '
+    'in addition to the latency percentiles of each flush interval',
+)
+
+_PERCENTILES = (50, 90, 99)
+
+Tags = Dict[str, Union[str, int]]
+_TagItems = Tuple[Tuple[str, Union[str, int]], ...]
+_SeriesKey = Tuple[str, _TagItems]
+_HistogramKey = Tuple[str, _TagItems, str]
+
+
+# Aggregates metrics in memory and periodically flushes them to LineProtocolCache from a background thread.
+# Updates only take a lock and bump the values, so they are cheap enough for the request path.
+# Counters are summed, gauges keep the last value and latencies are recorded into histograms.
+# All of them are reset after each flush.
+class MetricsAggregator:
+
+  _lock = threading.Lock()
+  _counters: Dict[_SeriesKey, Dict[str, int]] = {}
+  _gauges: Dict[_SeriesKey, Dict[str, Union[int, float]]] = {}
+  _histograms: Dict[_HistogramKey, LatencyHistogram] = {}
+  _pending_updates = 0
+  _flush_batch_size = 1
+  _raw_points = False
+
+  _enabled = False
+  _flush_requested = threading.Event()
+  _stop_requested = threading.Event()
+  _thread: Optional[threading.Thread] = None
+
+  def __init__(self, enabled: bool = True) -> None:
+    self._enabled_on_enter = enabled
+
+  def __enter__(self):
+    cls = type(self)
+    assert cls._thread is None, 'MetricsAggregator is already running'
+    if not self._enabled_on_enter:
+      return self
+
+    cls._flush_batch_size = _FLUSH_BATCH_SIZE.value
+    cls._raw_points = _RAW_POINTS.value
+    cls._stop_requested.clear()
+    cls._thread = threading.Thread(target=cls._run, name='metrics-aggregator', daemon=True)
+    cls._thread.start()
+    cls._enabled = True
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._thread is None:
+      return
+
+    cls._enabled = False
+    cls._stop_requested.set()
+    cls._flush_requested.set()
+    cls._thread.join()
+    cls._thread = None
+    cls.flush()
+
+  @classmethod
+  def is_enabled(cls) -> bool:
+    return cls._enabled
+
+  @classmethod
+  def is_raw_points_enabled(cls) -> bool:
+    return cls._enabled and cls._raw_points
+
+  # Temporarily stops aggregating updates, e.g. during warmup.
+  @classmethod
+  def set_enabled(cls, enabled: bool) -> None:
+    cls._enabled = enabled and cls._thread is not None
+
+  @classmethod
+  def increment(cls, measurement: str, fields: Dict[str, int], tags: Tags = {}) -> None:
+    if not cls._enabled:
+      return
+
+    key = (measurement, tuple(sorted(tags.items())))
+    with cls._lock:
+      counters = cls._counters.get(key)
+      if counters is None:
+        counters = cls._counters[key] = {}
+      for field, amount in fields.items():
+        counters[field] = counters.get(field, 0) + amount
+      cls._pending_updates += 1
+      pending_updates = cls._pending_updates
+
+    if pending_updates >= cls._flush_batch_size:
+      cls._flush_requested.set()
+
+  @classmethod
+  def record(cls, measurement: str, fields: Dict[str, Union[int, float]], tags: Tags = {}) -> None:
+    if not cls._enabled:
+      return
+
+    key = (measurement, tuple(sorted(tags.items())))
+    with cls._lock:
+      gauges = cls._gauges.get(key)
+      if gauges is None:
+        gauges = cls._gauges[key] = {}
+      gauges.update(fields)
+      cls._pending_updates += 1
+      pending_updates = cls._pending_updates
+
+    if pending_updates >= cls._flush_batch_size:
+      cls._flush_requested.set()
+
+  # Records the latency of each stage into the histogram of the series, with the stage added as the "stage" tag.
+  @classmethod
+  def record_latencies(cls, measurement: str, latencies_ns: Dict[str, int], tags: Tags = {}) -> None:
+    if not cls._enabled:
+      return
+
+    tag_items = tuple(sorted(tags.items()))
+    with cls._lock:
+      for stage, latency_ns in latencies_ns.items():
+        key = (measurement, tag_items, stage)
+        histogram = cls._histograms.get(key)
+        if histogram is None:
+          histogram = cls._histograms[key] = LatencyHistogram()
+        histogram.record(latency_ns)
+      cls._pending_updates += 1
+      pending_updates = cls._pending_updates
+
+    if pending_updates >= cls._flush_batch_size:
+      cls._flush_requested.set()
+
+  # Swaps out the aggregated values while holding the lock, then builds the points without blocking the updates.
+  @classmethod
+  def flush(cls) -> None:
+    with cls._lock:
+      counters, cls._counters = cls._counters, {}
+      gauges, cls._gauges = cls._gauges, {}
+      histograms, cls._histograms = cls._histograms, {}
+      cls._pending_updates = 0
+
+    if len(counters) == 0 and len(gauges) == 0 and len(histograms) == 0:
+      return
+
+    time_ns = time.time_ns()
+    points: List[Point] = []
+    for values in (counters, gauges):
+      for (measurement, tags), fields in values.items():
+        point = Point(measurement).time(time_ns)
+        for key, value in tags:
+          point.tag(key, value)
+        for field, value in fields.items():
+          point.field(field, value)
+        points.append(point)
+
+    for (measurement, tags, stage), histogram in histograms.items():
+      point = Point(measurement).time(time_ns)
+      for key, value in tags:
+        point.tag(key, value)
+      point.tag('stage', stage)
+      point.field('count', histogram.count)
+      point.field('sum_ns', histogram.sum_ns)
+      point.field('max_ns', histogram.max_ns)
+      for percentile in _PERCENTILES:
+        point.field(f'p{percentile}_ns', histogram.get_percentile(percentile))
+      points.append(point)
+
+    LineProtocolCache.put(points)
+
+  @classmethod
+  def _run(cls) -> None:
+    while not cls._stop_requested.is_set():
+      cls._flush_requested.wait(timeout=_FLUSH_INTERVAL_S.value)
+      cls._flush_requested.clear()
+
+      try:
+        cls.flush()
+      except Exception:
+        logging.exception('Failed to flush metrics')
@@ -0,0 +1,173 @@
+import contextlib
+import os
+import threading
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import TYPE_CHECKING, List, Optional, Set
+
+from absl import flags, logging
+
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import Prediction
+from simple_jetson_nano_detection_server.warmuprunner import WarmupRunner
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+# Importing ultralytics is slow, only do it for type checking. It was already imported by main during startup.
+if TYPE_CHECKING:
+  import ultralytics
+
+_OVERFLOW_MODEL_PATH = flags.DEFINE_string(
+    name='overflow_model_path',
+    default=None,
+    help='If set, predict with this model on the CPU when the GPU falls behind, see --overflow_queue_wait_ms. '
+    'Use a small model exported to ONNX with the same --image_size, e.g. "data/yolo11/models/onnx/yolo11n-320.onnx"',
+)
+
+_OVERFLOW_LANE_CPUS = flags.DEFINE_integer(
+    name='overflow_lane_cpus',
+    default=2,
+    lower_bound=1,
+    help='Number of CPUs the overflow lane predicts on. The lane is pinned to the last CPUs available to the server, '
+    'so it cannot starve the threads handling the HTTP requests on the other CPUs',
+)
+
+
+class _PerformanceCheckpoint(Enum):
+  OVERFLOW_LANE = auto()
+
+
+@dataclass
+class _Request:
+  image_data: bytes
+  tracker: Optional[PerformanceTracker]
+  done: threading.Event = field(default_factory=threading.Event)
+  predictions: Optional[List[Prediction]] = None
+  exception: Optional[Exception] = None
+
+
+# Returns the last CPUs available to the server.
+def _get_lane_cpus(count: int) -> Set[int]:
+  cpus = sorted(os.sched_getaffinity(0))
+  assert count < len(cpus), (f'Expected --overflow_lane_cpus to be < {len(cpus)} to leave a CPU for the HTTP requests, '
+                             f'got {count} instead')
+  return set(cpus[-count:])
+
+
+# Predicts with a small model on the CPU, one request at a time, on a thread pinned to --overflow_lane_cpus.
+# The threads created by the lane thread inherit its CPU affinity, including the thread pool ONNX Runtime creates when
+# Ultralytics loads the model on the first prediction. So the model is loaded and warmed up on the lane thread.
+# InferenceScheduler acquires the lane for a request instead of queueing it for the GPU when the GPU falls behind.
+class OverflowLane:
+
+  _condition = threading.Condition()
+  _thread: Optional[threading.Thread] = None
+  _stop_requested = False
+  _ready = False
+  _busy = False
+  _request: Optional[_Request] = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._thread is None:
+      return
+
+    with cls._condition:
+      cls._stop_requested = True
+      cls._condition.notify_all()
+    cls._thread.join()
+    cls._thread = None
+    cls._ready = False
+    cls._busy = False
+
+  # Starts loading the model in the background. Returns false if --overflow_model_path is not set.
+  # Should be started once the server is ready, so loading the model does not slow down the warmup of the GPU.
+  @classmethod
+  def start(cls) -> bool:
+    if _OVERFLOW_MODEL_PATH.value is None:
+      return False
+
+    # Picked before the lane thread pins itself to them, as the affinity of the calling thread includes all the CPUs.
+    cpus = _get_lane_cpus(_OVERFLOW_LANE_CPUS.value)
+    with cls._condition:
+      assert cls._thread is None, 'OverflowLane is already running'
+      cls._stop_requested = False
+      cls._ready = False
+      cls._busy = False
+      cls._thread = threading.Thread(target=cls._run,
+                                     args=(_OVERFLOW_MODEL_PATH.value, cpus),
+                                     name='overflow-lane',
+                                     daemon=True)
+      cls._thread.start()
+    return True
+
+  # Reserves the lane for one prediction. Returns false if the lane is not ready or already predicting.
+  @classmethod
+  def try_acquire(cls) -> bool:
+    with cls._condition:
+      if not cls._ready or cls._busy:
+        return False
+      cls._busy = True
+      return True
+
+  # Predicts on the lane thread, which releases the lane afterwards. The lane must be acquired first.
+  # The current tracker of the calling thread tracks the spans of the prediction.
+  # Raises if the lane was stopped after it was acquired, as the lane thread would never pick up the request.
+  @classmethod
+  def predict(cls, image_data: bytes) -> List[Prediction]:
+    request = _Request(image_data, PerformanceTracker.get_current())
+    with cls._condition:
+      assert cls._busy and cls._request is None, 'The overflow lane must be acquired before prediction'
+      if cls._stop_requested:
+        cls._busy = False
+        raise RuntimeError('The overflow lane was stopped')
+      cls._request = request
+      cls._condition.notify_all()
+
+    request.done.wait()
+    if request.exception is not None:
+      raise request.exception
+    assert request.predictions is not None
+    return request.predictions
+
+  # Importing is fast as main already imported ultralytics.
+  @classmethod
+  def _load_model(cls, model_path: str) -> 'ultralytics.YOLO':
+    from ultralytics import YOLO
+    return YOLO(model_path, task='detect')
+
+  @classmethod
+  def _run(cls, model_path: str, cpus: Set[int]) -> None:
+    try:
+      os.sched_setaffinity(0, cpus)
+      logging.info(f'Loading overflow model from {model_path} on CPUs {sorted(cpus)}.')
+      predictor = YoloPredictor(cls._load_model(model_path), device='cpu')
+      iterations = WarmupRunner.run_predictors([predictor])
+    except Exception:
+      logging.exception('Failed to start the overflow lane, requests are only predicted on the GPU.')
+      return
+
+    logging.info(f'Overflow lane warmed up after {iterations} predictions.')
+    with cls._condition:
+      cls._ready = True
+
+    while True:
+      with cls._condition:
+        cls._condition.wait_for(lambda: cls._request is not None or cls._stop_requested)
+        request = cls._request
+        if request is None:
+          return
+        cls._request = None
+
+      try:
+        with request.tracker.as_current() if request.tracker is not None else contextlib.nullcontext(), \
+            PerformanceTracker.span(_PerformanceCheckpoint.OVERFLOW_LANE):
+          request.predictions = predictor.predict(request.image_data)
+      except Exception as e:
+        request.exception = e
+      finally:
+        with cls._condition:
+          cls._busy = False
+        request.done.set()
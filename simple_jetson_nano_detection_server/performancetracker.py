@@ -1,52 +1,164 @@
+import contextlib
+import threading
 import time
 from enum import Enum
-from typing import Dict, Generic, List, TypeVar, Union
+from typing import ContextManager, Dict, Generic, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union
 
 from influxdb_client.client.write.point import Point
+from line_protocol_cache.lineprotocolcache import LineProtocolCache
+
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
 
 PerformanceCheckpoints = TypeVar(name='PerformanceCheckpoints', bound=Enum)
 
 
+class _CurrentTracker(threading.local):
+  tracker: Optional['PerformanceTracker'] = None
+
+
+# Timestamps are compared with time.perf_counter_ns().
+class TracedSpan(NamedTuple):
+  span: str
+  start_ns: int
+  stop_ns: int
+  thread_id: int
+  thread_name: str
+
+
+# Checkpoints tracked while another checkpoint is being tracked with context are nested spans.
+# Nested spans are named by joining the names of the enclosing checkpoints with ".", e.g. "compute_response.predict".
+# A traced tracker also keeps the thread of each span, so the spans can be laid out on a timeline, see RequestTracer.
 class PerformanceTracker(Generic[PerformanceCheckpoints]):
 
-  def __init__(self) -> None:
-    self._start_timestamps_ns: Dict[PerformanceCheckpoints, int] = {}
-    self._stop_timestamp_ns: Dict[PerformanceCheckpoints, int] = {}
-    self._tracked_checkpoints_stack: List[PerformanceCheckpoints] = []
+  _current = _CurrentTracker()
+
+  def __init__(self, traced: bool = False) -> None:
+    self._start_timestamps_ns: Dict[str, int] = {}
+    self._stop_timestamp_ns: Dict[str, int] = {}
+    self._tracked_checkpoints_stack: List[Tuple[Enum, str]] = []
+    self._span_threads: Optional[Dict[str, Tuple[int, str]]] = {} if traced else None
 
   def __call__(self, checkpoint: PerformanceCheckpoints):
-    assert checkpoint not in self._tracked_checkpoints_stack, f'{checkpoint.name} is already being tracked'
-    self._tracked_checkpoints_stack.append(checkpoint)
-    return self
+    return self._track(checkpoint)
 
   def __enter__(self):
-    self._start_timestamps_ns[self._tracked_checkpoints_stack[-1]] = time.perf_counter_ns()
+    span = self._tracked_checkpoints_stack[-1][1]
+    self._start_timestamps_ns[span] = time.perf_counter_ns()
+    self._record_thread(span)
     return self
 
   def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
-    checkpoint = self._tracked_checkpoints_stack.pop()
-    self._stop_timestamp_ns[checkpoint] = time.perf_counter_ns()
+    _, span = self._tracked_checkpoints_stack.pop()
+    self._stop_timestamp_ns[span] = time.perf_counter_ns()
 
   def start(self, checkpoint: PerformanceCheckpoints) -> None:
-    assert checkpoint not in self._tracked_checkpoints_stack, f'{checkpoint.name} is already being tracked with context'
-    self._start_timestamps_ns[checkpoint] = time.perf_counter_ns()
+    assert not self._is_tracked(checkpoint), f'{checkpoint.name} is already being tracked with context'
+    span = self._get_span(checkpoint)
+    self._start_timestamps_ns[span] = time.perf_counter_ns()
+    self._record_thread(span)
 
   def stop(self, checkpoint: PerformanceCheckpoints) -> None:
-    assert checkpoint not in self._tracked_checkpoints_stack, f'{checkpoint.name} should only be stopped with context'
-    self._stop_timestamp_ns[checkpoint] = time.perf_counter_ns()
+    assert not self._is_tracked(checkpoint), f'{checkpoint.name} should only be stopped with context'
+    self._stop_timestamp_ns[self._get_span(checkpoint)] = time.perf_counter_ns()
 
-  def finalize(self, measurement: str, tags: Dict[str, Union[str, int]] = {}) -> Point:
-    assert len(self._tracked_checkpoints_stack) == 0, (
-        f'Cannot finalize before stop tracking {len(self._tracked_checkpoints_stack)} checkpoints')
-    assert self._start_timestamps_ns.keys() == self._stop_timestamp_ns.keys(), 'Start/stop calls do not pair'
-    assert len(self._start_timestamps_ns) > 0, 'Nothing to finalize'
+  # Makes this the current tracker of the thread, so the code called within can track nested spans with span()
+  # without having the tracker passed in.
+  @contextlib.contextmanager
+  def as_current(self) -> Iterator[None]:
+    previous = self._current.tracker
+    self._current.tracker = self
+    try:
+      yield
+    finally:
+      self._current.tracker = previous
+
+  # Returns the current tracker of the thread, so it can be made current on another thread that does part of the work.
+  @classmethod
+  def get_current(cls) -> Optional['PerformanceTracker']:
+    return cls._current.tracker
+
+  # Tracks a nested span with the current tracker of the thread. Does nothing if there is no current tracker,
+  # e.g. when predicting during warmup.
+  @classmethod
+  def span(cls, checkpoint: Enum) -> ContextManager:
+    tracker = cls._current.tracker
+    if tracker is None:
+      return contextlib.nullcontext()
+    return tracker._track(checkpoint)
+
+  # Adds a nested span that was timed elsewhere, e.g. by a library, to the current tracker of the thread.
+  # The span ends now, unless it ended earlier at stop_timestamp_ns compared with time.perf_counter_ns().
+  @classmethod
+  def add_span(cls, checkpoint: Enum, elapsed_ns: int, stop_timestamp_ns: Optional[int] = None) -> None:
+    tracker = cls._current.tracker
+    if tracker is None:
+      return
+
+    span = tracker._get_span(checkpoint)
+    if stop_timestamp_ns is None:
+      stop_timestamp_ns = time.perf_counter_ns()
+    tracker._start_timestamps_ns[span] = stop_timestamp_ns - elapsed_ns
+    tracker._stop_timestamp_ns[span] = stop_timestamp_ns
+    tracker._record_thread(span)
+
+  def is_traced(self) -> bool:
+    return self._span_threads is not None
 
+  # Returns the spans with their timestamps and the threads they were tracked on.
+  def get_traced_spans(self) -> List[TracedSpan]:
+    assert self._span_threads is not None, 'Spans are only traced by a tracker created with traced=True'
+    elapsed_ns = self._get_elapsed_ns('get traced spans')
+    return [
+        TracedSpan(span, self._start_timestamps_ns[span], self._start_timestamps_ns[span] + elapsed_ns[span],
+                   *self._span_threads[span]) for span in elapsed_ns.keys()
+    ]
+
+  # Only looks up the thread if traced, so an untraced tracker does no more work than before.
+  def _record_thread(self, span: str) -> None:
+    if self._span_threads is not None:
+      self._span_threads[span] = (threading.get_native_id(), threading.current_thread().name)
+
+  def _track(self, checkpoint: Enum):
+    assert not self._is_tracked(checkpoint), f'{checkpoint.name} is already being tracked'
+    self._tracked_checkpoints_stack.append((checkpoint, self._get_span(checkpoint)))
+    return self
+
+  def _is_tracked(self, checkpoint: Enum) -> bool:
+    return any(c == checkpoint for c, _ in self._tracked_checkpoints_stack)
+
+  def _get_span(self, checkpoint: Enum) -> str:
+    if len(self._tracked_checkpoints_stack) == 0:
+      return checkpoint.name.lower()
+    return self._tracked_checkpoints_stack[-1][1] + '.' + checkpoint.name.lower()
+
+  def finalize(self, measurement: str, tags: Dict[str, Union[str, int]] = {}) -> Point:
     point = Point(measurement).time(time.time_ns())
     for key, value in tags.items():
       point.tag(key, value)
 
-    for checkpoint in self._start_timestamps_ns.keys():
-      elapsed_ns = self._stop_timestamp_ns[checkpoint] - self._start_timestamps_ns[checkpoint]
-      point.field(checkpoint.name.lower() + '_ns', elapsed_ns)
+    for span, elapsed_ns in self._get_elapsed_ns('finalize').items():
+      point.field(span + '_ns', elapsed_ns)
 
     return point
+
+  def get_latencies_ns(self) -> Dict[str, int]:
+    return self._get_elapsed_ns('get latencies')
+
+  # Records the elapsed time of each checkpoint into the latency histograms in MetricsAggregator.
+  # The per-request point from finalize() is also generated if raw points are enabled.
+  def aggregate(self, measurement: str, tags: Dict[str, Union[str, int]] = {}) -> None:
+    MetricsAggregator.record_latencies(measurement, self._get_elapsed_ns('aggregate'), tags)
+
+    if MetricsAggregator.is_raw_points_enabled():
+      LineProtocolCache.put(self.finalize(measurement, tags))
+
+  def _get_elapsed_ns(self, action: str) -> Dict[str, int]:
+    assert len(self._tracked_checkpoints_stack) == 0, (
+        f'Cannot {action} before stop tracking {len(self._tracked_checkpoints_stack)} checkpoints')
+    assert self._start_timestamps_ns.keys() == self._stop_timestamp_ns.keys(), 'Start/stop calls do not pair'
+    assert len(self._start_timestamps_ns) > 0, f'Nothing to {action}'
+
+    return {
+        span: self._stop_timestamp_ns[span] - self._start_timestamps_ns[span]
+        for span in self._start_timestamps_ns.keys()
+    }
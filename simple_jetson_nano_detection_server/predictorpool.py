@@ -0,0 +1,85 @@
+import threading
+import time
+from enum import Enum, auto
+from typing import List
+
+from absl import flags
+
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import Prediction
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+PREDICTOR_POOL_SIZE = flags.DEFINE_integer(
+    name='predictor_pool_size',
+    default=1,
+    lower_bound=1,
+    help='Number of predictors that can predict at once. Each predictor loads its own copy of the engine with its own '
+    'execution context and buffers, so the pre and post-processing of one prediction overlaps with the inference of '
+    'another. Each copy takes its own GPU memory',
+)
+
+
+class _PerformanceCheckpoint(Enum):
+  POOL_WAIT = auto()
+
+
+# Hands out the predictors one prediction at a time, so each predictor is only used by one thread at once.
+# The predictors can be replaced while predicting, e.g. when reloading the engine. A replaced predictor that is still
+# predicting is dropped once it is returned, and wait_until_released() tells when that has happened.
+class PredictorPool:
+
+  _condition = threading.Condition()
+  _predictors: List[YoloPredictor] = []
+  _idle_predictors: List[YoloPredictor] = []
+  _busy_predictors: List[YoloPredictor] = []
+
+  # Returns the replaced predictors.
+  @classmethod
+  def set_predictors(cls, predictors: List[YoloPredictor]) -> List[YoloPredictor]:
+    assert len(predictors) > 0, 'Expected at least 1 predictor, got 0 instead'
+    with cls._condition:
+      previous_predictors = cls._predictors
+      cls._predictors = list(predictors)
+      # A predictor that is kept and still predicting becomes idle once it is returned.
+      cls._idle_predictors = [p for p in predictors if p not in cls._busy_predictors]
+      cls._condition.notify_all()
+    ServerStats.set_predictor_pool_size(len(predictors))
+    return previous_predictors
+
+  @classmethod
+  def get_size(cls) -> int:
+    with cls._condition:
+      return len(cls._predictors)
+
+  # Blocks until none of the predictors is predicting.
+  @classmethod
+  def wait_until_released(cls, predictors: List[YoloPredictor]) -> None:
+    with cls._condition:
+      cls._condition.wait_for(lambda: not any(p in cls._busy_predictors for p in predictors))
+
+  # Predicts with the first predictor that becomes idle. The time spent waiting for it is tracked as a nested span of
+  # the current tracker of the thread.
+  @classmethod
+  def predict(cls, image_data: bytes) -> List[Prediction]:
+    start_ns = time.perf_counter_ns()
+    with cls._condition:
+      assert len(cls._predictors) > 0, 'Predictors must be set before prediction'
+      cls._condition.wait_for(lambda: len(cls._idle_predictors) > 0)
+      predictor = cls._idle_predictors.pop()
+      cls._busy_predictors.append(predictor)
+
+    wait_ns = time.perf_counter_ns() - start_ns
+    PerformanceTracker.add_span(_PerformanceCheckpoint.POOL_WAIT, wait_ns)
+    MetricsAggregator.record_latencies('predictor_pool', {'wait': wait_ns})
+    ServerStats.record_predictor_pool_wait(wait_ns)
+
+    try:
+      return predictor.predict(image_data)
+    finally:
+      with cls._condition:
+        cls._busy_predictors.remove(predictor)
+        if predictor in cls._predictors:
+          cls._idle_predictors.append(predictor)
+        cls._condition.notify_all()
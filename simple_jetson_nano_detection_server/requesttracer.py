@@ -0,0 +1,114 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Union
+
+from absl import flags
+
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker, TracedSpan
+
+_REQUEST_TRACE_WINDOW_S = flags.DEFINE_float(
+    name='request_trace_window_s',
+    default=0.0,
+    lower_bound=0.0,
+    help='Keep the spans of the detection requests finished within this many seconds, so their timelines can be '
+    'fetched from the /admin/trace endpoint. Set to 0 to disable',
+)
+
+_REQUEST_TRACE_MAX_REQUESTS = flags.DEFINE_integer(
+    name='request_trace_max_requests',
+    default=10000,
+    lower_bound=1,
+    help='Maximum number of the most recent detection requests to keep the spans of',
+)
+
+
+class _TracedRequest(NamedTuple):
+  request_id: int
+  measurement: str
+  tags: Dict[str, Union[str, int]]
+  stop_ns: int
+  spans: List[TracedSpan]
+
+
+# Keeps the spans of the most recent detection requests, with the thread each span was tracked on, and exports them in
+# the Chrome trace event format, which chrome://tracing and https://ui.perfetto.dev open. Unlike the aggregated
+# latencies, the timeline shows how the concurrent requests overlap and where the scheduler threads sit idle.
+# When disabled, the trackers are not traced, so the requests do no extra work.
+class RequestTracer:
+
+  _lock = threading.Lock()
+  _requests: Deque[_TracedRequest] = deque()
+  _request_ids = itertools.count()
+
+  @classmethod
+  def reset(cls) -> None:
+    with cls._lock:
+      cls._requests = deque()
+
+  @classmethod
+  def is_enabled(cls) -> bool:
+    return _REQUEST_TRACE_WINDOW_S.value > 0
+
+  # Returns a tracker for a detection request, which is traced if tracing is enabled.
+  @classmethod
+  def create_tracker(cls) -> PerformanceTracker:
+    return PerformanceTracker(traced=cls.is_enabled())
+
+  # Keeps the spans of a finished request. Does nothing if the tracker is not traced. The measurement and the tags are
+  # the ones the latencies are aggregated with, e.g. "http_request_dispatcher" and the response code.
+  @classmethod
+  def record(cls, tracker: PerformanceTracker, measurement: str, tags: Dict[str, Union[str, int]]) -> None:
+    if not tracker.is_traced():
+      return
+
+    spans = tracker.get_traced_spans()
+    stop_ns = max(span.stop_ns for span in spans)
+    with cls._lock:
+      cls._requests.append(_TracedRequest(next(cls._request_ids), measurement, dict(tags), stop_ns, spans))
+      cls._drop_expired(stop_ns)
+
+  # Each span is a complete event on the thread it was tracked on, named after its checkpoint. The full span name and
+  # the request are in the args, so the spans of a request can be found across the threads.
+  @classmethod
+  def get_trace(cls) -> Dict[str, Any]:
+    with cls._lock:
+      cls._drop_expired(time.perf_counter_ns())
+      requests = list(cls._requests)
+
+    pid = os.getpid()
+    events: List[Dict[str, Any]] = []
+    thread_names: Dict[int, str] = {}
+    for request in requests:
+      for span in request.spans:
+        thread_names[span.thread_id] = span.thread_name
+        events.append({
+            'name': span.span.rsplit('.', 1)[-1],
+            'cat': request.measurement,
+            'ph': 'X',
+            'ts': span.start_ns / 1e3,
+            'dur': (span.stop_ns - span.start_ns) / 1e3,
+            'pid': pid,
+            'tid': span.thread_id,
+            'args': {
+                'request_id': request.request_id,
+                'span': span.span,
+                **request.tags
+            },
+        })
+    # The enclosing span goes first when spans start at the same time, so the viewers nest them.
+    events.sort(key=lambda event: (event['ts'], -event['dur']))
+
+    for thread_id, thread_name in sorted(thread_names.items()):
+      events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': thread_name}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+  # Must be called with the lock held.
+  @classmethod
+  def _drop_expired(cls, now_ns: int) -> None:
+    window_ns = int(_REQUEST_TRACE_WINDOW_S.value * 1e9)
+    while len(cls._requests) > 0 and (len(cls._requests) > _REQUEST_TRACE_MAX_REQUESTS.value or
+                                      now_ns - cls._requests[0].stop_ns > window_ns):
+      cls._requests.popleft()
@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Dict, List, Optional
+
+from absl import flags, logging
+
+_SAMPLING_INTERVAL_MS = flags.DEFINE_float(
+    name='profiler_sampling_interval_ms',
+    default=5.0,
+    lower_bound=0.1,
+    help='Duration in milliseconds between taking samples of the stacks of all threads while profiling',
+)
+
+
+def _get_frame_name(frame: FrameType) -> str:
+  code = frame.f_code
+  return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _get_collapsed_stack(thread_name: str, frame: Optional[FrameType]) -> str:
+  names: List[str] = []
+  while frame is not None:
+    names.append(_get_frame_name(frame))
+    frame = frame.f_back
+  names.append(thread_name)
+  return ';'.join(reversed(names))
+
+
+# Linux reports "R" as the state of a thread that is running or runnable.
+def _is_thread_running(native_id: int) -> bool:
+  try:
+    with open(f'/proc/self/task/{native_id}/stat', 'r') as fp:
+      stat = fp.read()
+  except OSError:
+    return False
+  return stat[stat.rindex(')') + 2] == 'R'
+
+
+# Periodically samples the Python stacks of all threads from a background thread, and counts them as collapsed stacks
+# for flame graphs. The thread only exists while profiling, so there is no overhead otherwise.
+# In wall-clock mode, every thread is sampled, including threads blocked on I/O or waiting for the GPU.
+# Otherwise, only the threads that are running on a CPU are sampled.
+class SamplingProfiler:
+
+  _lock = threading.Lock()
+  _thread: Optional[threading.Thread] = None
+  _collapsed_stacks: Optional[str] = None
+
+  # Returns false if profiling is already running.
+  @classmethod
+  def start(cls, duration_s: float, wall_clock: bool) -> bool:
+    with cls._lock:
+      if cls._thread is not None:
+        return False
+      cls._collapsed_stacks = None
+      cls._thread = threading.Thread(target=cls._run,
+                                     args=(duration_s, wall_clock),
+                                     name='sampling-profiler',
+                                     daemon=True)
+      cls._thread.start()
+      return True
+
+  @classmethod
+  def is_running(cls) -> bool:
+    return cls._thread is not None
+
+  # Returns the collapsed stacks of the last finished profiling, one "thread;outer;...;inner count" per line.
+  @classmethod
+  def get_collapsed_stacks(cls) -> Optional[str]:
+    return cls._collapsed_stacks
+
+  @classmethod
+  def join(cls) -> None:
+    thread = cls._thread
+    if thread is not None:
+      thread.join()
+
+  @classmethod
+  def _run(cls, duration_s: float, wall_clock: bool) -> None:
+    interval_s = _SAMPLING_INTERVAL_MS.value / 1000
+    own_ident = threading.get_ident()
+    stacks: Counter[str] = Counter()
+    samples = 0
+
+    logging.info(f'Profiling for {duration_s}s, {wall_clock=}.')
+    deadline = time.monotonic() + duration_s
+    try:
+      while time.monotonic() < deadline:
+        threads: Dict[int, threading.Thread] = {t.ident: t for t in threading.enumerate() if t.ident is not None}
+        for ident, frame in sys._current_frames().items():
+          if ident == own_ident:
+            continue
+
+          thread = threads.get(ident)
+          if not wall_clock and (thread is None or thread.native_id is None or
+                                 not _is_thread_running(thread.native_id)):
+            continue
+          stacks[_get_collapsed_stack(thread.name if thread is not None else str(ident), frame)] += 1
+
+        samples += 1
+        time.sleep(interval_s)
+    finally:
+      logging.info(f'Profiling finished after {samples} samples.')
+      with cls._lock:
+        cls._collapsed_stacks = ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+        cls._thread = None
@@ -0,0 +1,19 @@
+import threading
+
+
+# Tracks if the server has finished warming up and is ready to serve detection requests.
+class ServerReadiness:
+
+  _ready = threading.Event()
+
+  @classmethod
+  def set_ready(cls) -> None:
+    cls._ready.set()
+
+  @classmethod
+  def set_not_ready(cls) -> None:
+    cls._ready.clear()
+
+  @classmethod
+  def is_ready(cls) -> bool:
+    return cls._ready.is_set()
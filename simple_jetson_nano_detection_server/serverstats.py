@@ -0,0 +1,308 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from simple_jetson_nano_detection_server.latencyhistogram import LatencyHistogram
+from simple_jetson_nano_detection_server.memorymonitor import MemoryMonitor
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+
+_QUANTILES = (0.5, 0.9, 0.99)
+
+# The camera the requests of the cameras beyond the maximum number of tracked cameras are counted under.
+OTHER_CAMERA = 'other'
+
+
+def _escape_label_value(value: str) -> str:
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Cumulative statistics since the server started, served by the /metrics and /stats endpoints.
+# Unlike MetricsAggregator, these are always collected and never reset, so they do not depend on --generate_metrics.
+class ServerStats:
+
+  _lock = threading.Lock()
+  _responses: Dict[int, int] = {}
+  _latencies: Dict[Tuple[str, int], LatencyHistogram] = {}
+  _in_flight_requests = 0
+  _get_queue_depth: Optional[Callable[[], int]] = None
+  _engines: List[str] = []
+  _max_cameras: Optional[int] = None
+  _cameras: Set[str] = set()
+  _camera_requests: Dict[str, int] = {}
+  _camera_rejections: Dict[str, Dict[str, int]] = {}
+  _camera_queue_waits: Dict[str, LatencyHistogram] = {}
+  _predictor_pool_size = 0
+  _predictor_pool_waits = LatencyHistogram()
+  _thermal: Dict[str, Union[int, float]] = {}
+
+  @classmethod
+  def reset(cls) -> None:
+    with cls._lock:
+      cls._responses = {}
+      cls._latencies = {}
+      cls._in_flight_requests = 0
+      cls._get_queue_depth = None
+      cls._engines = []
+      cls._max_cameras = None
+      cls._cameras = set()
+      cls._camera_requests = {}
+      cls._camera_rejections = {}
+      cls._camera_queue_waits = {}
+      cls._predictor_pool_size = 0
+      cls._predictor_pool_waits = LatencyHistogram()
+      cls._thermal = {}
+
+  @classmethod
+  def set_engines(cls, engines: List[str]) -> None:
+    with cls._lock:
+      cls._engines = list(engines)
+
+  # Limits the number of cameras tracked by name, until set to None. The cameras already tracked are kept.
+  @classmethod
+  def set_max_cameras(cls, max_cameras: Optional[int]) -> None:
+    with cls._lock:
+      cls._max_cameras = max_cameras
+
+  # Returns the camera to count the request under, which is the camera itself, or OTHER_CAMERA once the maximum number
+  # of cameras are tracked. The camera ids come from the clients, so they would grow the stats and the metric tags
+  # without bound otherwise.
+  @classmethod
+  def get_tracked_camera(cls, camera: str) -> str:
+    with cls._lock:
+      if camera in cls._cameras:
+        return camera
+      if cls._max_cameras is not None and len(cls._cameras) >= cls._max_cameras:
+        return OTHER_CAMERA
+      cls._cameras.add(camera)
+      return camera
+
+  # Reports the number of queued requests with the callback while set, e.g. by InferenceScheduler while it is running.
+  # The callback is called without holding the lock.
+  @classmethod
+  def set_queue_depth_callback(cls, get_queue_depth: Optional[Callable[[], int]]) -> None:
+    with cls._lock:
+      cls._get_queue_depth = get_queue_depth
+
+  @classmethod
+  def _get_current_queue_depth(cls) -> int:
+    with cls._lock:
+      get_queue_depth = cls._get_queue_depth
+    return 0 if get_queue_depth is None else get_queue_depth()
+
+  @classmethod
+  def set_predictor_pool_size(cls, size: int) -> None:
+    with cls._lock:
+      cls._predictor_pool_size = size
+
+  # The latest thermal snapshot taken by ThermalGovernor.
+  @classmethod
+  def set_thermal(cls, snapshot: Dict[str, Union[int, float]]) -> None:
+    with cls._lock:
+      cls._thermal = dict(snapshot)
+
+  @classmethod
+  def start_request(cls) -> None:
+    with cls._lock:
+      cls._in_flight_requests += 1
+
+  # Counts the response and records the latency of each stage, then marks the request as no longer in flight.
+  @classmethod
+  def finish_request(cls, response_code: int, latencies_ns: Dict[str, int] = {}) -> None:
+    with cls._lock:
+      cls._in_flight_requests -= 1
+      cls._responses[response_code] = cls._responses.get(response_code, 0) + 1
+      for stage, latency_ns in latencies_ns.items():
+        key = (stage, response_code)
+        histogram = cls._latencies.get(key)
+        if histogram is None:
+          histogram = cls._latencies[key] = LatencyHistogram()
+        histogram.record(latency_ns)
+
+  # Counts a request of the camera that was predicted by InferenceScheduler, and records how long it was queued.
+  @classmethod
+  def record_camera_request(cls, camera: str, queue_wait_ns: int) -> None:
+    with cls._lock:
+      cls._camera_requests[camera] = cls._camera_requests.get(camera, 0) + 1
+      histogram = cls._camera_queue_waits.get(camera)
+      if histogram is None:
+        histogram = cls._camera_queue_waits[camera] = LatencyHistogram()
+      histogram.record(queue_wait_ns)
+
+  # Counts a request of the camera that InferenceScheduler responded without predicting, by the reason why.
+  @classmethod
+  def record_camera_rejection(cls, camera: str, reason: str) -> None:
+    with cls._lock:
+      rejections = cls._camera_rejections.setdefault(camera, {})
+      rejections[reason] = rejections.get(reason, 0) + 1
+
+  # Records how long a prediction waited for an idle predictor of PredictorPool.
+  @classmethod
+  def record_predictor_pool_wait(cls, wait_ns: int) -> None:
+    with cls._lock:
+      cls._predictor_pool_waits.record(wait_ns)
+
+  # Copies the histograms while holding the lock, so computing the percentiles does not block the requests.
+  @classmethod
+  def _snapshot(cls) -> Tuple[Dict[int, int], Dict[Tuple[str, int], LatencyHistogram], int, List[str]]:
+    with cls._lock:
+      latencies: Dict[Tuple[str, int], LatencyHistogram] = {}
+      for key, histogram in cls._latencies.items():
+        latencies[key] = LatencyHistogram()
+        latencies[key].merge(histogram)
+      return dict(cls._responses), latencies, cls._in_flight_requests, list(cls._engines)
+
+  # Returns the requests, rejections and queue wait histogram of each camera, sorted by camera.
+  @classmethod
+  def _snapshot_cameras(cls) -> List[Tuple[str, int, Dict[str, int], LatencyHistogram]]:
+    with cls._lock:
+      cameras: List[Tuple[str, int, Dict[str, int], LatencyHistogram]] = []
+      for camera in sorted(cls._camera_requests.keys() | cls._camera_rejections.keys()):
+        histogram = LatencyHistogram()
+        if camera in cls._camera_queue_waits:
+          histogram.merge(cls._camera_queue_waits[camera])
+        cameras.append(
+            (camera, cls._camera_requests.get(camera, 0), dict(sorted(cls._camera_rejections.get(camera, {}).items())),
+             histogram))
+      return cameras
+
+  @classmethod
+  def _snapshot_predictor_pool(cls) -> Tuple[int, LatencyHistogram]:
+    with cls._lock:
+      histogram = LatencyHistogram()
+      histogram.merge(cls._predictor_pool_waits)
+      return cls._predictor_pool_size, histogram
+
+  @classmethod
+  def _snapshot_thermal(cls) -> Dict[str, Union[int, float]]:
+    with cls._lock:
+      return dict(cls._thermal)
+
+  @classmethod
+  def get_stats(cls) -> Dict[str, Any]:
+    responses, latencies, in_flight_requests, engines = cls._snapshot()
+    predictor_pool_size, predictor_pool_waits = cls._snapshot_predictor_pool()
+    return {
+        'ready': ServerReadiness.is_ready(),
+        'in_flight_requests': in_flight_requests,
+        'queue_depth': cls._get_current_queue_depth(),
+        'responses': {str(code): count for code, count in sorted(responses.items())},
+        'stage_latencies': [{
+            'stage': stage,
+            'response_code': response_code,
+            'count': histogram.count,
+            'sum_ns': histogram.sum_ns,
+            'max_ns': histogram.max_ns,
+            **{f'p{int(q * 100)}_ns': histogram.get_percentile(q * 100) for q in _QUANTILES},
+        } for (stage, response_code), histogram in latencies.items()],
+        'engines': engines,
+        'cameras': [{
+            'camera': camera,
+            'requests': requests,
+            'rejected': rejected,
+            'queue_wait_sum_ns': histogram.sum_ns,
+            'queue_wait_max_ns': histogram.max_ns,
+            # A camera whose requests were all rejected has no queue wait to report.
+            **{
+                f'queue_wait_p{int(q * 100)}_ns': histogram.get_percentile(q * 100) if histogram.count > 0 else 0
+                for q in _QUANTILES
+            },
+        } for camera, requests, rejected, histogram in cls._snapshot_cameras()],
+        'predictor_pool': {
+            'size': predictor_pool_size,
+            'predictions': predictor_pool_waits.count,
+            'wait_sum_ns': predictor_pool_waits.sum_ns,
+            'wait_max_ns': predictor_pool_waits.max_ns,
+            **{
+                f'wait_p{int(q * 100)}_ns': predictor_pool_waits.get_percentile(q * 100)
+                if predictor_pool_waits.count > 0 else 0 for q in _QUANTILES
+            },
+        },
+        'memory': MemoryMonitor.get_stats(),
+        'thermal': cls._snapshot_thermal(),
+    }
+
+  # Formats the stats in the Prometheus text exposition format. Latencies are exported as summaries in seconds.
+  @classmethod
+  def get_prometheus_text(cls) -> str:
+    responses, latencies, in_flight_requests, engines = cls._snapshot()
+    lines = [
+        '# HELP detection_server_ready Whether the server has finished warming up.',
+        '# TYPE detection_server_ready gauge',
+        f'detection_server_ready {int(ServerReadiness.is_ready())}',
+        '# HELP detection_server_in_flight_requests Number of detection requests being processed.',
+        '# TYPE detection_server_in_flight_requests gauge',
+        f'detection_server_in_flight_requests {in_flight_requests}',
+        '# HELP detection_server_queue_depth Number of detection requests queued for inference.',
+        '# TYPE detection_server_queue_depth gauge',
+        f'detection_server_queue_depth {cls._get_current_queue_depth()}',
+        '# HELP detection_server_responses_total Number of detection responses by response code.',
+        '# TYPE detection_server_responses_total counter',
+    ]
+    for code, count in sorted(responses.items()):
+      lines.append(f'detection_server_responses_total{{response_code="{code}"}} {count}')
+
+    lines.append('# HELP detection_server_stage_latency_seconds Latency of each stage of the detection requests.')
+    lines.append('# TYPE detection_server_stage_latency_seconds summary')
+    for (stage, response_code), histogram in latencies.items():
+      labels = f'stage="{stage}",response_code="{response_code}"'
+      for q in _QUANTILES:
+        lines.append(f'detection_server_stage_latency_seconds{{{labels},quantile="{q}"}} '
+                     f'{histogram.get_percentile(q * 100) / 1e9}')
+      lines.append(f'detection_server_stage_latency_seconds_sum{{{labels}}} {histogram.sum_ns / 1e9}')
+      lines.append(f'detection_server_stage_latency_seconds_count{{{labels}}} {histogram.count}')
+
+    lines.append('# HELP detection_server_engine_info The loaded TensorRT engine files.')
+    lines.append('# TYPE detection_server_engine_info gauge')
+    for engine in engines:
+      lines.append(f'detection_server_engine_info{{path="{_escape_label_value(engine)}"}} 1')
+
+    # The lines of a metric must be grouped together, so the cameras are iterated once per metric.
+    cameras = cls._snapshot_cameras()
+    lines.append('# HELP detection_server_camera_requests_total Number of predictions by camera.')
+    lines.append('# TYPE detection_server_camera_requests_total counter')
+    for camera, requests, _, _ in cameras:
+      lines.append(f'detection_server_camera_requests_total{{camera="{_escape_label_value(camera)}"}} {requests}')
+    lines.append('# HELP detection_server_camera_rejected_total Number of requests responded without predicting by '
+                 'camera and reason.')
+    lines.append('# TYPE detection_server_camera_rejected_total counter')
+    for camera, _, rejected, _ in cameras:
+      for reason, count in rejected.items():
+        lines.append(f'detection_server_camera_rejected_total{{camera="{_escape_label_value(camera)}",'
+                     f'reason="{reason}"}} {count}')
+    lines.append('# HELP detection_server_camera_queue_wait_seconds Time the requests waited for inference by camera.')
+    lines.append('# TYPE detection_server_camera_queue_wait_seconds summary')
+    for camera, _, _, histogram in cameras:
+      labels = f'camera="{_escape_label_value(camera)}"'
+      for q in _QUANTILES if histogram.count > 0 else ():
+        lines.append(f'detection_server_camera_queue_wait_seconds{{{labels},quantile="{q}"}} '
+                     f'{histogram.get_percentile(q * 100) / 1e9}')
+      lines.append(f'detection_server_camera_queue_wait_seconds_sum{{{labels}}} {histogram.sum_ns / 1e9}')
+      lines.append(f'detection_server_camera_queue_wait_seconds_count{{{labels}}} {histogram.count}')
+
+    predictor_pool_size, predictor_pool_waits = cls._snapshot_predictor_pool()
+    lines.append('# HELP detection_server_predictor_pool_size Number of predictors that can predict at once.')
+    lines.append('# TYPE detection_server_predictor_pool_size gauge')
+    lines.append(f'detection_server_predictor_pool_size {predictor_pool_size}')
+    lines.append('# HELP detection_server_predictor_pool_wait_seconds Time the predictions waited for an idle '
+                 'predictor.')
+    lines.append('# TYPE detection_server_predictor_pool_wait_seconds summary')
+    for q in _QUANTILES if predictor_pool_waits.count > 0 else ():
+      lines.append(f'detection_server_predictor_pool_wait_seconds{{quantile="{q}"}} '
+                   f'{predictor_pool_waits.get_percentile(q * 100) / 1e9}')
+    lines.append(f'detection_server_predictor_pool_wait_seconds_sum {predictor_pool_waits.sum_ns / 1e9}')
+    lines.append(f'detection_server_predictor_pool_wait_seconds_count {predictor_pool_waits.count}')
+
+    # The lines of a metric must be grouped together, so the allocations are iterated by field first.
+    memory = MemoryMonitor.get_stats()
+    for key, value in memory['snapshot'].items():
+      lines.append(f'# TYPE detection_server_memory_{key} gauge')
+      lines.append(f'detection_server_memory_{key} {value}')
+    for key in ('count', 'retained_bytes', 'peak_bytes', 'max_peak_bytes'):
+      lines.append(f'# TYPE detection_server_request_allocations_{key} gauge')
+      for stage, allocation in memory['allocations'].items():
+        lines.append(f'detection_server_request_allocations_{key}{{stage="{stage}"}} {allocation[key]}')
+
+    for key, value in cls._snapshot_thermal().items():
+      lines.append(f'# TYPE detection_server_thermal_{key} gauge')
+      lines.append(f'detection_server_thermal_{key} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,55 @@
+import mmap
+import socket
+from typing import Optional, Tuple
+
+from simple_jetson_nano_detection_server.sharedmemoryprotocol import (HANDSHAKE, NO_DEADLINE, REQUEST, RESPONSE,
+                                                                      receive_exactly)
+
+
+# Sends detection requests to SharedMemoryServer from the same host, one at a time.
+# Connecting waits until the server leases a slot of the ring to the client. Each request writes the image into the
+# slot and sends the slot and the image length over the socket. The slot is released once the client is closed.
+# Use a client per thread to send requests concurrently.
+class SharedMemoryClient:
+
+  def __init__(self, socket_path: str) -> None:
+    self._connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      self._connection.connect(socket_path)
+      slot_count, self.slot_bytes, self.slot, ring_path_length = HANDSHAKE.unpack(
+          receive_exactly(self._connection, HANDSHAKE.size))
+      ring_path = receive_exactly(self._connection, ring_path_length).decode()
+      with open(ring_path, 'r+b') as fp:
+        self._mmap = mmap.mmap(fp.fileno(), slot_count * self.slot_bytes)
+    except Exception:
+      self._connection.close()
+      raise
+    self._offset = self.slot * self.slot_bytes
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    self.close()
+
+  def close(self) -> None:
+    self._connection.close()
+    self._mmap.close()
+
+  # Returns the HTTP response code and the response body, which are the same as posting the image over HTTP.
+  # The camera is identified by the client process if not given.
+  def detect(self,
+             image_data: bytes,
+             camera: Optional[str] = None,
+             deadline_ms: Optional[int] = None) -> Tuple[int, bytes]:
+    assert 0 < len(image_data) <= self.slot_bytes, (
+        f'Expected the image size to be in (0, {self.slot_bytes}] bytes, got {len(image_data)} instead')
+
+    self._mmap[self._offset:self._offset + len(image_data)] = image_data
+    encoded_camera = b'' if camera is None else camera.encode()
+    self._connection.sendall(
+        REQUEST.pack(self.slot, len(image_data), NO_DEADLINE if deadline_ms is None else deadline_ms,
+                     len(encoded_camera)) + encoded_camera)
+
+    response_code, response_length = RESPONSE.unpack(receive_exactly(self._connection, RESPONSE.size))
+    return response_code, receive_exactly(self._connection, response_length)
@@ -0,0 +1,30 @@
+import socket
+import struct
+
+# The messages exchanged over the control socket between SharedMemoryServer and SharedMemoryClient.
+# Only the descriptors of the images are sent over the socket, the images themselves are written into the ring.
+#
+# Once connected, the server leases a slot of the ring to the connection and sends the handshake: the number of slots,
+# the size of each slot in bytes, the leased slot, and the length of the ring path followed by the ring path.
+HANDSHAKE = struct.Struct('<IIIH')
+
+# The client writes an image into its slot then sends the request: the slot, the image length in bytes, the deadline
+# in milliseconds or NO_DEADLINE, and the length of the camera followed by the camera. An empty camera is identified by
+# the client process.
+REQUEST = struct.Struct('<IIiH')
+NO_DEADLINE = -1
+
+# The server responds with the HTTP response code of the same request over HTTP, and the length of the response body
+# followed by the body. The body is the same JSON as the HTTP response body.
+RESPONSE = struct.Struct('<HI')
+
+
+# Reads exactly the number of bytes, or raises ConnectionError if the other end closed the connection before that.
+def receive_exactly(connection: socket.socket, size: int) -> bytes:
+  data = bytearray()
+  while len(data) < size:
+    chunk = connection.recv(size - len(data))
+    if len(chunk) == 0:
+      raise ConnectionError(f'Connection closed after {len(data)} of {size} bytes')
+    data += chunk
+  return bytes(data)
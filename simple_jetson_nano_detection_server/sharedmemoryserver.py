@@ -0,0 +1,246 @@
+import collections
+import contextlib
+import json
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from enum import Enum, auto
+from typing import Deque, Dict, Optional, Tuple
+
+from absl import flags, logging
+
+from simple_jetson_nano_detection_server.detectionrequesthandler import (REJECTION_RESPONSE_CODES,
+                                                                         DetectionRequestHandler)
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceRejectedError
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.requesttracer import RequestTracer
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.sharedmemoryprotocol import (HANDSHAKE, NO_DEADLINE, REQUEST, RESPONSE,
+                                                                      receive_exactly)
+
+_SHARED_MEMORY_SOCKET_PATH = flags.DEFINE_string(
+    name='shared_memory_socket_path',
+    default=None,
+    help='If set, also serve detection requests from the clients on the same host over this Unix socket. '
+    'The clients write the images into a ring in shared memory and only send their location over the socket, '
+    'see SharedMemoryClient',
+)
+
+_SHARED_MEMORY_RING_PATH = flags.DEFINE_string(
+    name='shared_memory_ring_path',
+    default='/dev/shm/simple-jetson-nano-detection-ring',
+    help='Path of the file the ring of image slots is memory-mapped from. Should be on a tmpfs such as /dev/shm, and '
+    'must be accessible to the clients. Only used with --shared_memory_socket_path',
+)
+
+_SHARED_MEMORY_SLOTS = flags.DEFINE_integer(
+    name='shared_memory_slots',
+    default=8,
+    lower_bound=1,
+    help='Number of image slots in the ring. Each connection leases a slot until it is closed, so at most this many '
+    'connections send requests at once, the others wait for a slot',
+)
+
+_SHARED_MEMORY_SLOT_BYTES = flags.DEFINE_integer(
+    name='shared_memory_slot_bytes',
+    default=64 * 1024,  # The same as --max_image_data_bytes.
+    lower_bound=1,
+    help='Size of each image slot in bytes, which is the largest image a client can send',
+)
+
+_PEER_CREDENTIALS = struct.Struct('3i')
+
+
+class _PerformanceCheckpoint(Enum):
+  COMPUTE_RESPONSE = auto()
+  SEND_RESPONSE = auto()
+
+
+# The image slots shared with the clients. The server decides which slot each connection writes into, and hands out
+# the slots in the order they were released, so the clients need no coordination among themselves.
+class SharedMemoryRing:
+
+  def __init__(self, path: str, slot_count: int, slot_bytes: int) -> None:
+    self.path = path
+    self.slot_count = slot_count
+    self.slot_bytes = slot_bytes
+
+    with open(path, 'w+b') as fp:
+      fp.truncate(slot_count * slot_bytes)
+      self._mmap = mmap.mmap(fp.fileno(), 0)
+    self._condition = threading.Condition()
+    self._free_slots: Deque[int] = collections.deque(range(slot_count))
+
+  # Waits until a slot is free.
+  def acquire(self) -> int:
+    with self._condition:
+      self._condition.wait_for(lambda: len(self._free_slots) > 0)
+      return self._free_slots.popleft()
+
+  def release(self, slot: int) -> None:
+    with self._condition:
+      self._free_slots.append(slot)
+      self._condition.notify()
+
+  # Returns the image in the slot without copying it. The view must be released before the slot is.
+  def get_image_data(self, slot: int, length: int) -> memoryview:
+    assert 0 < length <= self.slot_bytes, (
+        f'Expected the image length to be in (0, {self.slot_bytes}] bytes, got {length} instead')
+    offset = slot * self.slot_bytes
+    return memoryview(self._mmap)[offset:offset + length]
+
+  # The clients can keep using their mappings, but new clients cannot map the ring anymore.
+  # The mapping is not closed, as a connection may still be reading an image from it. It is unmapped once unused.
+  def unlink(self) -> None:
+    with contextlib.suppress(FileNotFoundError):
+      os.unlink(self.path)
+
+
+class _ControlServer(socketserver.ThreadingUnixStreamServer):
+
+  # Each connection is handled on its own thread, which may be blocked on reading from an idle client.
+  daemon_threads = True
+
+  def __init__(self, socket_path: str, ring: SharedMemoryRing) -> None:
+    self.ring = ring
+    super().__init__(socket_path, _ControlRequestHandler)
+
+
+class _ControlRequestHandler(socketserver.BaseRequestHandler):
+
+  server: _ControlServer
+
+  # Leases a slot to the connection until it is closed, then handles its requests one at a time.
+  def handle(self) -> None:
+    connection: socket.socket = self.request
+    ring = self.server.ring
+    slot = ring.acquire()
+    try:
+      ring_path = ring.path.encode()
+      connection.sendall(HANDSHAKE.pack(ring.slot_count, ring.slot_bytes, slot, len(ring_path)) + ring_path)
+
+      default_camera = self._get_default_camera(connection)
+      while True:
+        header = connection.recv(REQUEST.size, socket.MSG_WAITALL)
+        if len(header) < REQUEST.size:
+          return
+        arrival_ns = time.monotonic_ns()
+        request_slot, image_length, deadline_ms, camera_length = REQUEST.unpack(header)
+        camera_data = receive_exactly(connection, camera_length)
+
+        ServerStats.start_request()
+        # The request is finished even if the client disconnected while the response was sent, so it does not stay
+        # in flight.
+        response_code = 500
+        latencies_ns: Dict[str, int] = {}
+        try:
+          response_code, latencies_ns = self._handle_request(connection, ring, slot, request_slot, image_length,
+                                                             camera_data, default_camera, deadline_ms, arrival_ns)
+        except ConnectionError:
+          response_code = 499
+          raise
+        finally:
+          ServerStats.finish_request(response_code, latencies_ns)
+    except ConnectionError:
+      return
+    finally:
+      ring.release(slot)
+
+  # Returns the response code and the latency of each stage.
+  def _handle_request(self, connection: socket.socket, ring: SharedMemoryRing, slot: int, request_slot: int,
+                      image_length: int, camera_data: bytes, default_camera: str, deadline_ms: int,
+                      arrival_ns: int) -> Tuple[int, Dict[str, int]]:
+    try:
+      camera = camera_data.decode() or default_camera
+    except UnicodeDecodeError as e:
+      response = json.dumps({'class': type(e).__name__, 'message': str(e)}).encode()
+      connection.sendall(RESPONSE.pack(400, len(response)) + response)
+      return 400, {}
+
+    if not ServerReadiness.is_ready():
+      connection.sendall(RESPONSE.pack(503, 0))
+      return 503, {}
+
+    tracker: PerformanceTracker[_PerformanceCheckpoint] = RequestTracer.create_tracker()
+    response_code = self._handle_detection_request(tracker, connection, ring, slot, request_slot, image_length, camera,
+                                                   deadline_ms, arrival_ns)
+    tracker.aggregate('shared_memory_server', {'response_code': response_code})
+    RequestTracer.record(tracker, 'shared_memory_server', {'response_code': response_code, 'camera': camera})
+    return response_code, tracker.get_latencies_ns()
+
+  def _handle_detection_request(self, tracker: PerformanceTracker[_PerformanceCheckpoint], connection: socket.socket,
+                                ring: SharedMemoryRing, slot: int, request_slot: int, image_length: int, camera: str,
+                                deadline_ms: int, arrival_ns: int) -> int:
+    try:
+      assert request_slot == slot, f'Expected slot {slot} leased to the connection, got {request_slot} instead'
+      assert deadline_ms >= 0 or deadline_ms == NO_DEADLINE, (
+          f'Expected the deadline to be a non-negative integer, got {deadline_ms} instead')
+      deadline_ns = None if deadline_ms == NO_DEADLINE else arrival_ns + deadline_ms * 1000000
+      with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE), tracker.as_current(), \
+          ring.get_image_data(slot, image_length) as image_data:
+        response = DetectionRequestHandler.get_response(image_data, None, camera, deadline_ns)
+      response_code = 200
+    except InferenceRejectedError as e:
+      response_code = REJECTION_RESPONSE_CODES[type(e)]
+      response = json.dumps({'class': type(e).__name__, 'message': str(e)}).encode()
+    except Exception as e:
+      response_code = 400
+      response = json.dumps({'class': type(e).__name__, 'message': str(e)}).encode()
+
+    with tracker(_PerformanceCheckpoint.SEND_RESPONSE):
+      connection.sendall(RESPONSE.pack(response_code, len(response)) + response)
+    return response_code
+
+  # Tells apart the client processes on their own, like the client IP address does for the HTTP requests.
+  def _get_default_camera(self, connection: socket.socket) -> str:
+    pid, _, _ = _PEER_CREDENTIALS.unpack(
+        connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEER_CREDENTIALS.size))
+    return f'pid-{pid}'
+
+
+# Serves detection requests from the clients on the same host when --shared_memory_socket_path is set.
+# Sending a JPEG over HTTP copies it through the kernel, then again when reading the request body and extracting the
+# image from it. Instead, the client writes the image into its slot of the ring memory-mapped from
+# --shared_memory_ring_path, and only sends the slot and the image length over a Unix socket. The server predicts on
+# the image in place.
+# The responses are the same as over HTTP, and the requests share the inference with the HTTP requests.
+class SharedMemoryServer:
+
+  _server: Optional[_ControlServer] = None
+  _thread: Optional[threading.Thread] = None
+
+  def __enter__(self):
+    cls = type(self)
+    assert cls._server is None, 'SharedMemoryServer is already running'
+    socket_path = _SHARED_MEMORY_SOCKET_PATH.value
+    if socket_path is None:
+      return self
+
+    ring = SharedMemoryRing(_SHARED_MEMORY_RING_PATH.value, _SHARED_MEMORY_SLOTS.value, _SHARED_MEMORY_SLOT_BYTES.value)
+    # A socket file left behind by a server that was killed would fail the bind.
+    with contextlib.suppress(FileNotFoundError):
+      os.unlink(socket_path)
+    cls._server = _ControlServer(socket_path, ring)
+    cls._thread = threading.Thread(target=cls._server.serve_forever, name='shared-memory-server', daemon=True)
+    cls._thread.start()
+    logging.info(f'Serving detection requests on {socket_path} with {ring.slot_count} slots in {ring.path}.')
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._server is None or cls._thread is None:
+      return
+
+    cls._server.shutdown()
+    cls._thread.join()
+    cls._server.server_close()
+    with contextlib.suppress(FileNotFoundError):
+      os.unlink(cls._server.server_address)
+    cls._server.ring.unlink()
+    cls._server = None
+    cls._thread = None
@@ -0,0 +1,161 @@
+import base64
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from absl import flags
+
+from simple_jetson_nano_detection_server.imagedataextractor import ImageDataExtractor
+
+_SLOW_REQUESTS_PER_WINDOW = flags.DEFINE_integer(
+    name='slow_requests_per_window',
+    default=5,
+    lower_bound=0,
+    help='Number of the slowest detection requests to keep for each window. Set to 0 to disable',
+)
+
+_SLOW_REQUESTS_WINDOW_S = flags.DEFINE_float(
+    name='slow_requests_window_s',
+    default=300.0,
+    lower_bound=1.0,
+    help='Duration in seconds of each window of slow requests',
+)
+
+_SLOW_REQUESTS_WINDOWS = flags.DEFINE_integer(
+    name='slow_requests_windows',
+    default=12,
+    lower_bound=1,
+    help='Number of the most recent windows of slow requests to keep',
+)
+
+_SLOW_REQUESTS_CAPTURE_IMAGES = flags.DEFINE_bool(
+    name='slow_requests_capture_images',
+    default=False,
+    help='Keep the image of each slow request so it can be replayed. '
+    'Uses up to --max_image_data_bytes of memory for each request kept',
+)
+
+SLOW_REQUESTS_DUMP_DIR = flags.DEFINE_string(
+    name='slow_requests_dump_dir',
+    default='data/slow-requests',
+    help='Directory to dump the slow requests to',
+)
+
+
+@dataclass(frozen=True)
+class SlowRequest:
+  timestamp_ns: int
+  total_ns: int
+  latencies_ns: Dict[str, int]
+  request_bytes: int
+  prediction_count: int
+  image_data: Optional[bytes]
+
+  def to_json_dict(self) -> Dict[str, Any]:
+    content = asdict(self)
+    content['image_data'] = None if self.image_data is None else base64.b64encode(self.image_data).decode()
+    return content
+
+  @classmethod
+  def from_json_dict(cls, content: Dict[str, Any]) -> 'SlowRequest':
+    image_data = None if content['image_data'] is None else base64.b64decode(content['image_data'])
+    return cls(**{**content, 'image_data': image_data})
+
+
+@dataclass
+class _Window:
+  start_ns: int
+  # A min-heap, so the fastest of the kept requests is replaced first.
+  heap: List[Tuple[int, int, SlowRequest]]
+
+
+# Keeps the slowest detection requests responded with 200 in memory, for each of the most recent time windows.
+class SlowRequestRecorder:
+
+  _lock = threading.Lock()
+  _windows: Deque[_Window] = deque()
+  _sequence = itertools.count()
+
+  @classmethod
+  def reset(cls) -> None:
+    with cls._lock:
+      cls._windows = deque()
+
+  # Only does the work of building the entry if the request is slow enough to be kept.
+  @classmethod
+  def offer(cls, latencies_ns: Dict[str, int], request_body: bytes, multipart_boundary: str, response: bytes) -> None:
+    capacity = _SLOW_REQUESTS_PER_WINDOW.value
+    if capacity == 0:
+      return
+
+    # Nested stages are already counted in their enclosing stages.
+    total_ns = sum(ns for stage, ns in latencies_ns.items() if '.' not in stage)
+    timestamp_ns = time.time_ns()
+    window = cls._get_window(timestamp_ns)
+    if len(window.heap) >= capacity and total_ns <= window.heap[0][0]:
+      return
+
+    # Detection failures are also responded with 200, in which case the image may not be extractable.
+    image_data = None
+    if _SLOW_REQUESTS_CAPTURE_IMAGES.value:
+      try:
+        image_data = ImageDataExtractor.get_first_image_data(request_body, multipart_boundary)
+      except Exception:
+        pass
+    slow_request = SlowRequest(
+        timestamp_ns=timestamp_ns,
+        total_ns=total_ns,
+        latencies_ns=dict(latencies_ns),
+        request_bytes=len(request_body),
+        prediction_count=len(json.loads(response)['predictions']),
+        image_data=image_data,
+    )
+
+    with cls._lock:
+      entry = (total_ns, next(cls._sequence), slow_request)
+      if len(window.heap) < capacity:
+        heapq.heappush(window.heap, entry)
+      elif total_ns > window.heap[0][0]:
+        heapq.heapreplace(window.heap, entry)
+
+  # Returns the kept requests of all windows, slowest first.
+  @classmethod
+  def get_slow_requests(cls) -> List[SlowRequest]:
+    with cls._lock:
+      entries = [entry for window in cls._windows for entry in window.heap]
+    return [slow_request for _, _, slow_request in sorted(entries, reverse=True)]
+
+  # Writes the kept requests to a JSON file in the directory, and returns the path to the file.
+  @classmethod
+  def dump(cls, dump_dir: str) -> str:
+    os.makedirs(dump_dir, exist_ok=True)
+    path = os.path.join(dump_dir, f'slow-requests-{time.time_ns()}.json')
+    content = {'slow_requests': [r.to_json_dict() for r in cls.get_slow_requests()]}
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as fp:
+      json.dump(content, fp)
+    os.replace(temp_path, path)
+    return path
+
+  @classmethod
+  def load(cls, path: str) -> List[SlowRequest]:
+    with open(path, 'r') as fp:
+      content = json.load(fp)
+    return [SlowRequest.from_json_dict(r) for r in content['slow_requests']]
+
+  @classmethod
+  def _get_window(cls, timestamp_ns: int) -> _Window:
+    window_ns = int(_SLOW_REQUESTS_WINDOW_S.value * 1e9)
+    with cls._lock:
+      if len(cls._windows) == 0 or timestamp_ns - cls._windows[-1].start_ns >= window_ns:
+        cls._windows.append(_Window(timestamp_ns, []))
+        while len(cls._windows) > _SLOW_REQUESTS_WINDOWS.value:
+          cls._windows.popleft()
+      return cls._windows[-1]
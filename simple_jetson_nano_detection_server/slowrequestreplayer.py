@@ -0,0 +1,79 @@
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from absl import app, flags, logging
+
+from simple_jetson_nano_detection_server.main import get_engine_path
+from simple_jetson_nano_detection_server.predictorpool import PredictorPool
+from simple_jetson_nano_detection_server.slowrequestrecorder import SlowRequest, SlowRequestRecorder
+from simple_jetson_nano_detection_server.warmuprunner import WarmupRunner
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+_SLOW_REQUESTS_PATH = flags.DEFINE_string(
+    name='slow_requests_path',
+    default=None,
+    required=True,
+    help='Path to a file dumped from the /admin/slow-requests/dump endpoint',
+)
+
+_REPLAY_ITERATIONS = flags.DEFINE_integer(
+    name='replay_iterations',
+    default=10,
+    lower_bound=1,
+    help='Number of predictions on the image of each slow request',
+)
+
+# The stage in which PredictorPool.predict() ran when the request was recorded.
+_PREDICT_STAGE = 'compute_response.predict'
+
+
+class SlowRequestReplayer:
+
+  # Predicts on the captured image of the slow request on an idle system.
+  # If the replayed predictions are as slow as the recorded one, the slowness comes from the content of the image.
+  @classmethod
+  def replay(cls, slow_request: SlowRequest, iterations: int) -> Dict[str, Any]:
+    assert slow_request.image_data is not None, 'The slow request has no image data'
+
+    latencies_ns: List[int] = []
+    for _ in range(iterations):
+      start_ns = time.perf_counter_ns()
+      PredictorPool.predict(slow_request.image_data)
+      latencies_ns.append(time.perf_counter_ns() - start_ns)
+
+    recorded_predict_ns = slow_request.latencies_ns.get(_PREDICT_STAGE)
+    median_ns = int(statistics.median(latencies_ns))
+    return {
+        'timestamp_ns': slow_request.timestamp_ns,
+        'recorded_total_ns': slow_request.total_ns,
+        'recorded_predict_ns': recorded_predict_ns,
+        'replayed_median_predict_ns': median_ns,
+        'replayed_max_predict_ns': max(latencies_ns),
+        'slowdown': None if recorded_predict_ns is None else recorded_predict_ns / median_ns,
+    }
+
+
+def main(args: List[str]) -> None:
+  slow_requests = SlowRequestRecorder.load(_SLOW_REQUESTS_PATH.value)
+
+  from ultralytics import YOLO
+  predictors = [YoloPredictor(YOLO(get_engine_path(), task='detect'))]
+  PredictorPool.set_predictors(predictors)
+  WarmupRunner.run_predictors(predictors)
+
+  for slow_request in slow_requests:
+    if slow_request.image_data is None:
+      logging.warning(f'Skipping slow request at {slow_request.timestamp_ns} without image data, '
+                      'was --slow_requests_capture_images set?')
+      continue
+    print(json.dumps(SlowRequestReplayer.replay(slow_request, _REPLAY_ITERATIONS.value)))
+
+
+def app_run_main() -> None:
+  app.run(main)
+
+
+if __name__ == '__main__':
+  app_run_main()
@@ -0,0 +1,227 @@
+import glob
+import os
+import re
+import threading
+from typing import Dict, Optional, Union
+
+from absl import flags, logging
+
+from simple_jetson_nano_detection_server.enginereloader import EngineReloader
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceScheduler
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+
+_THERMAL_SYSFS_ROOT = flags.DEFINE_string(
+    name='thermal_sysfs_root',
+    default='/sys',
+    help='Path the thermal zones and the CPU and GPU frequencies are read from, e.g. a directory of fake files',
+)
+
+_THERMAL_SAMPLE_INTERVAL_S = flags.DEFINE_float(
+    name='thermal_sample_interval_s',
+    default=5.0,
+    lower_bound=0.001,
+    help='Duration in seconds between reading the temperatures and the frequencies',
+)
+
+_THERMAL_ZONES = flags.DEFINE_list(
+    name='thermal_zones',
+    default=['CPU-therm', 'GPU-therm'],
+    help='Types of the thermal zones whose hottest temperature decides whether the board is throttled. All zones are '
+    'reported regardless. Empty to use all zones. The PMIC zone of Jetson Nano always reads 100C, so it is left out',
+)
+
+_THERMAL_THROTTLE_TEMPERATURE_C = flags.DEFINE_float(
+    name='thermal_throttle_temperature_c',
+    default=None,
+    help='If set, apply the --thermal_throttled_* limits once the hottest of --thermal_zones reaches this temperature '
+    'in Celsius. Jetson Nano lowers its clocks on its own at around 97C, so set this a few degrees lower',
+)
+
+_THERMAL_HYSTERESIS_C = flags.DEFINE_float(
+    name='thermal_hysteresis_c',
+    default=5.0,
+    lower_bound=0.0,
+    help='The limits are lifted once the temperature is this much below --thermal_throttle_temperature_c',
+)
+
+_THERMAL_THROTTLED_MAX_PREDICTING = flags.DEFINE_integer(
+    name='thermal_throttled_max_predicting',
+    default=None,
+    lower_bound=1,
+    help='If set, predict at most this many requests on the GPU at once while throttled, '
+    'instead of one for each predictor of --predictor_pool_size',
+)
+
+_THERMAL_THROTTLED_MAX_REQUEST_RATE = flags.DEFINE_float(
+    name='thermal_throttled_max_request_rate',
+    default=None,
+    lower_bound=0.001,
+    help='If set, accept at most this many requests per second while throttled. '
+    'The requests beyond the rate are responded with HTTP 429',
+)
+
+_THERMAL_THROTTLED_ENGINE_PATH = flags.DEFINE_string(
+    name='thermal_throttled_engine_path',
+    default=None,
+    help='If set, reload this cheaper engine file while throttled, e.g. a smaller model, '
+    'and reload the default engine once the limits are lifted',
+)
+
+Snapshot = Dict[str, Union[int, float]]
+
+
+def _read_int(path: str) -> Optional[int]:
+  try:
+    with open(path, 'r') as fp:
+      return int(fp.read().strip())
+  except (OSError, ValueError):
+    return None
+
+
+def _read_str(path: str) -> Optional[str]:
+  try:
+    with open(path, 'r') as fp:
+      return fp.read().strip()
+  except OSError:
+    return None
+
+
+# Turns a sysfs name into a field name that is also a valid Prometheus metric name, e.g. "CPU-therm" into "cpu_therm".
+def _get_field_name(name: str) -> str:
+  return re.sub('[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+# Periodically reads the temperatures of the thermal zones and the CPU and GPU frequencies from sysfs on a background
+# thread, and reports them along with the average prediction latency to MetricsAggregator as the "thermal" measurement,
+# so a slowdown can be told apart from a throttled board.
+# Once the board is hot, predicts fewer requests at once, accepts fewer requests, and reloads a cheaper engine, as set
+# by the --thermal_throttled_* flags. Each is restored once the board has cooled down by --thermal_hysteresis_c.
+class ThermalGovernor:
+
+  _lock = threading.Lock()
+  _throttled = False
+  # The engine the governor last reloaded, or None if it has not replaced the default engine.
+  _engine_path: Optional[str] = None
+
+  _stop_requested = threading.Event()
+  _thread: Optional[threading.Thread] = None
+
+  def __enter__(self):
+    cls = type(self)
+    assert cls._thread is None, 'ThermalGovernor is already running'
+
+    cls._stop_requested.clear()
+    cls._thread = threading.Thread(target=cls._run, name='thermal-governor', daemon=True)
+    cls._thread.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._thread is None:
+      return
+
+    cls._stop_requested.set()
+    cls._thread.join()
+    cls._thread = None
+    with cls._lock:
+      if cls._throttled:
+        InferenceScheduler.set_limits(None, None)
+      cls._throttled = False
+      cls._engine_path = None
+
+  @classmethod
+  def is_throttled(cls) -> bool:
+    with cls._lock:
+      return cls._throttled
+
+  # Temperatures are in Celsius and frequencies in Hz. Files that cannot be read are left out, e.g. if the CPU is
+  # offline, so the snapshot is empty on a machine without these files.
+  @classmethod
+  def take_snapshot(cls) -> Snapshot:
+    root = _THERMAL_SYSFS_ROOT.value
+    governed_zones = set(_THERMAL_ZONES.value)
+    snapshot: Snapshot = {}
+    governed_temperatures = []
+
+    for zone_path in sorted(glob.glob(os.path.join(root, 'class/thermal/thermal_zone*'))):
+      zone_type = _read_str(os.path.join(zone_path, 'type'))
+      millicelsius = _read_int(os.path.join(zone_path, 'temp'))
+      if zone_type is None or millicelsius is None:
+        continue
+      snapshot[f'{_get_field_name(zone_type)}_temperature_c'] = millicelsius / 1000
+      if len(governed_zones) == 0 or zone_type in governed_zones:
+        governed_temperatures.append(millicelsius / 1000)
+    if len(governed_temperatures) > 0:
+      snapshot['max_temperature_c'] = max(governed_temperatures)
+
+    for cpu_path in sorted(glob.glob(os.path.join(root, 'devices/system/cpu/cpu[0-9]*'))):
+      khz = _read_int(os.path.join(cpu_path, 'cpufreq/scaling_cur_freq'))
+      if khz is not None:
+        snapshot[f'{os.path.basename(cpu_path)}_frequency_hz'] = khz * 1000
+
+    # The GPU of Jetson Nano is named after its address, e.g. "57000000.gpu".
+    for device_path in sorted(glob.glob(os.path.join(root, 'class/devfreq/*'))):
+      hz = _read_int(os.path.join(device_path, 'cur_freq'))
+      if hz is not None:
+        snapshot[f'{_get_field_name(os.path.basename(device_path).rsplit(".", 1)[-1])}_frequency_hz'] = hz
+
+    return snapshot
+
+  # Decides whether the board is throttled from the snapshot, and applies or lifts the limits accordingly.
+  @classmethod
+  def update(cls, snapshot: Snapshot) -> None:
+    temperature_c = snapshot.get('max_temperature_c')
+    throttle_temperature_c = _THERMAL_THROTTLE_TEMPERATURE_C.value
+
+    with cls._lock:
+      if throttle_temperature_c is not None and temperature_c is not None:
+        if not cls._throttled and temperature_c >= throttle_temperature_c:
+          cls._set_throttled(True, temperature_c)
+        elif cls._throttled and temperature_c <= throttle_temperature_c - _THERMAL_HYSTERESIS_C.value:
+          cls._set_throttled(False, temperature_c)
+      cls._switch_engine()
+
+  # Must be called with the lock held.
+  @classmethod
+  def _set_throttled(cls, throttled: bool, temperature_c: float) -> None:
+    cls._throttled = throttled
+    average_predict_ms = InferenceScheduler.get_average_predict_ns() / 1e6
+    if throttled:
+      logging.warning(f'Board reached {temperature_c:.1f}C while predicting in {average_predict_ms:.1f}ms, '
+                      'applying the throttled limits.')
+      InferenceScheduler.set_limits(_THERMAL_THROTTLED_MAX_PREDICTING.value, _THERMAL_THROTTLED_MAX_REQUEST_RATE.value)
+    else:
+      logging.info(f'Board cooled down to {temperature_c:.1f}C while predicting in {average_predict_ms:.1f}ms, '
+                   'lifting the throttled limits.')
+      InferenceScheduler.set_limits(None, None)
+
+  # Must be called with the lock held. A reload that cannot start yet, e.g. while another reload is running, is retried
+  # on the next sample.
+  @classmethod
+  def _switch_engine(cls) -> None:
+    throttled_engine_path = _THERMAL_THROTTLED_ENGINE_PATH.value
+    if throttled_engine_path is None:
+      return
+
+    engine_path = throttled_engine_path if cls._throttled else None
+    if engine_path == cls._engine_path:
+      return
+    if EngineReloader.start(engine_path if engine_path is not None else EngineReloader.get_default_engine_path()):
+      cls._engine_path = engine_path
+
+  # Samples at least once, so the board is throttled right away if the server starts hot.
+  @classmethod
+  def _run(cls) -> None:
+    while True:
+      try:
+        snapshot = cls.take_snapshot()
+        cls.update(snapshot)
+        snapshot['throttled'] = int(cls.is_throttled())
+        snapshot['average_predict_ns'] = int(InferenceScheduler.get_average_predict_ns())
+        ServerStats.set_thermal(snapshot)
+        MetricsAggregator.record('thermal', snapshot)
+      except Exception:
+        logging.exception('Failed to update thermal governor')
+      if cls._stop_requested.wait(timeout=_THERMAL_SAMPLE_INTERVAL_S.value):
+        return
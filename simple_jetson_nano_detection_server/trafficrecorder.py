@@ -0,0 +1,212 @@
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from absl import flags, logging
+
+_TRAFFIC_RECORD_DIR = flags.DEFINE_string(
+    name='traffic_record_dir',
+    default=None,
+    help='If set, record every detection request and its response to a new log file in this directory, '
+    'so the traffic can be replayed with simple-jetson-nano-traffic-replayer',
+)
+
+_TRAFFIC_RECORD_MAX_BYTES = flags.DEFINE_integer(
+    name='traffic_record_max_bytes',
+    default=1024 * 1024 * 1024,  # 1GiB.
+    lower_bound=0,
+    help='Stop recording once the log file reaches this size in bytes',
+)
+
+_TRAFFIC_RECORD_QUEUE_SIZE = flags.DEFINE_integer(
+    name='traffic_record_queue_size',
+    default=100,
+    lower_bound=1,
+    help='Maximum number of requests waiting to be written. Requests are not recorded while the queue is full',
+)
+
+# Each record in the index locates a request in the log file: offset, arrival timestamp, latency, response code,
+# and the lengths of the headers, the request body and the response. The log file is the concatenation of them.
+_INDEX_ENTRY = struct.Struct('<QqqHIII')
+
+
+@dataclass(frozen=True)
+class RecordedRequest:
+  arrival_ns: int
+  latency_ns: int
+  response_code: int
+  headers: Dict[str, str]
+  body: bytes
+  response: bytes
+
+
+def get_index_path(log_path: str) -> str:
+  return os.path.splitext(log_path)[0] + '.idx'
+
+
+# Reads a log file written by TrafficRecorder by memory-mapping it, so only the requests being read are loaded.
+# Requests whose index entry or data was not completely written, e.g. because the server was killed, are left out.
+class TrafficLog:
+
+  def __init__(self, log_path: str) -> None:
+    with open(get_index_path(log_path), 'rb') as fp:
+      index = fp.read()
+    self._entries: List[Tuple[int, ...]] = [
+        _INDEX_ENTRY.unpack_from(index, offset)
+        for offset in range(0, len(index) - _INDEX_ENTRY.size + 1, _INDEX_ENTRY.size)
+    ]
+
+    self._fp = open(log_path, 'rb')
+    size = os.fstat(self._fp.fileno()).st_size
+    self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+    while len(self._entries) > 0 and self._get_end_offset(self._entries[-1]) > size:
+      self._entries.pop()
+
+  @staticmethod
+  def _get_end_offset(entry: Tuple[int, ...]) -> int:
+    offset, _, _, _, headers_length, body_length, response_length = entry
+    return offset + headers_length + body_length + response_length
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    self.close()
+
+  def close(self) -> None:
+    if self._mmap is not None:
+      self._mmap.close()
+    self._fp.close()
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def __getitem__(self, index: int) -> RecordedRequest:
+    offset, arrival_ns, latency_ns, response_code, headers_length, body_length, response_length = self._entries[index]
+    assert self._mmap is not None
+    body_offset = offset + headers_length
+    response_offset = body_offset + body_length
+    return RecordedRequest(
+        arrival_ns=arrival_ns,
+        latency_ns=latency_ns,
+        response_code=response_code,
+        headers=json.loads(self._mmap[offset:body_offset]),
+        body=self._mmap[body_offset:response_offset],
+        response=self._mmap[response_offset:response_offset + response_length],
+    )
+
+
+# Records the detection requests to an append-only log file and its index when --traffic_record_dir is set.
+# The files are written by a background thread, so the request path only puts the request into a queue.
+# If writing fails, e.g. the disk is full, recording stops and the server keeps serving.
+class TrafficRecorder:
+
+  _queue: Optional['queue.Queue[Optional[Tuple[int, int, int, bytes, bytes, bytes]]]'] = None
+  _thread: Optional[threading.Thread] = None
+  # Counted by both the request threads and the writer thread.
+  _dropped_lock = threading.Lock()
+  _dropped = 0
+
+  def __enter__(self):
+    cls = type(self)
+    assert cls._thread is None, 'TrafficRecorder is already running'
+    if _TRAFFIC_RECORD_DIR.value is None:
+      return self
+
+    os.makedirs(_TRAFFIC_RECORD_DIR.value, exist_ok=True)
+    log_path = os.path.join(_TRAFFIC_RECORD_DIR.value, f'traffic-{time.time_ns()}.log')
+    logging.info(f'Recording traffic to {log_path}.')
+
+    cls._dropped = 0
+    cls._queue = queue.Queue(maxsize=_TRAFFIC_RECORD_QUEUE_SIZE.value)
+    cls._thread = threading.Thread(target=cls._run,
+                                   args=(cls._queue, log_path, _TRAFFIC_RECORD_MAX_BYTES.value),
+                                   name='traffic-recorder',
+                                   daemon=True)
+    cls._thread.start()
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+    cls = type(self)
+    if cls._thread is None:
+      return
+
+    record_queue = cls._queue
+    cls._queue = None
+    # The queue can be full. Stops waiting for room once the writer thread is gone, e.g. after failing to write.
+    while record_queue is not None and cls._thread.is_alive():
+      try:
+        record_queue.put(None, timeout=0.1)
+        break
+      except queue.Full:
+        pass
+    cls._thread.join()
+    cls._thread = None
+    if cls._dropped > 0:
+      logging.warning(f'{cls._dropped} requests were not recorded because the queue was full or the log was too big.')
+
+  @classmethod
+  def record(cls, latencies_ns: Dict[str, int], headers: Dict[str, str], request_body: bytes, response_code: int,
+             response: bytes) -> None:
+    record_queue = cls._queue
+    if record_queue is None:
+      return
+
+    # Nested stages are already counted in their enclosing stages.
+    latency_ns = sum(ns for stage, ns in latencies_ns.items() if '.' not in stage)
+    arrival_ns = time.time_ns() - latency_ns
+    try:
+      record_queue.put_nowait(
+          (arrival_ns, latency_ns, response_code, json.dumps(headers).encode(), request_body, response))
+    except queue.Full:
+      cls._count_dropped()
+
+  @classmethod
+  def _count_dropped(cls) -> None:
+    with cls._dropped_lock:
+      cls._dropped += 1
+
+  @classmethod
+  def _run(cls, record_queue: 'queue.Queue[Optional[Tuple[int, int, int, bytes, bytes, bytes]]]', log_path: str,
+           max_bytes: int) -> None:
+    try:
+      cls._write(record_queue, log_path, max_bytes)
+    except Exception:
+      logging.exception(f'Failed to record traffic to {log_path}, stopping recording.')
+      # Stops accepting requests, unless the recorder has already been exited.
+      if cls._queue is record_queue:
+        cls._queue = None
+
+  @classmethod
+  def _write(cls, record_queue: 'queue.Queue[Optional[Tuple[int, int, int, bytes, bytes, bytes]]]', log_path: str,
+             max_bytes: int) -> None:
+    with open(log_path, 'wb') as log_fp, open(get_index_path(log_path), 'wb') as index_fp:
+      offset = 0
+      while True:
+        item = record_queue.get()
+        if item is None:
+          return
+
+        arrival_ns, latency_ns, response_code, headers, body, response = item
+        if offset + len(headers) + len(body) + len(response) > max_bytes:
+          cls._count_dropped()
+          continue
+
+        log_fp.write(headers)
+        log_fp.write(body)
+        log_fp.write(response)
+        index_fp.write(
+            _INDEX_ENTRY.pack(offset, arrival_ns, latency_ns, response_code, len(headers), len(body), len(response)))
+        offset += len(headers) + len(body) + len(response)
+
+        # Flushes when idle, so the files can be read while the server is running. The log is flushed first,
+        # so the flushed index entries point to flushed data.
+        if record_queue.empty():
+          log_fp.flush()
+          index_fp.flush()
@@ -0,0 +1,218 @@
+import http.client
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from absl import app, flags
+
+from simple_jetson_nano_detection_server.latencyhistogram import LatencyHistogram
+from simple_jetson_nano_detection_server.trafficrecorder import RecordedRequest, TrafficLog
+
+_TRAFFIC_LOG_PATH = flags.DEFINE_string(
+    name='traffic_log_path',
+    default=None,
+    required=True,
+    help='Path to a log file recorded with --traffic_record_dir',
+)
+
+_REPLAY_SERVER_URL = flags.DEFINE_string(
+    name='replay_server_url',
+    default='http://127.0.0.1:32168',
+    help='The URL of the server to replay the traffic against',
+)
+
+_REPLAY_SPEED = flags.DEFINE_float(
+    name='replay_speed',
+    default=1.0,
+    lower_bound=0.0,
+    help='Replay the requests this many times faster than they were recorded. '
+    'Set to 0 to send the requests as fast as --replay_concurrency allows',
+)
+
+_REPLAY_CONCURRENCY = flags.DEFINE_integer(
+    name='replay_concurrency',
+    default=8,
+    lower_bound=1,
+    help='Maximum number of requests outstanding at once. Requests are sent late if all are outstanding',
+)
+
+_CONFIDENCE_TOLERANCE = flags.DEFINE_float(
+    name='confidence_tolerance',
+    default=0.01,
+    lower_bound=0.0,
+    help='Predictions are considered the same if their confidences differ by no more than this',
+)
+
+_MAX_REPORTED_DIFFERENCES = flags.DEFINE_integer(
+    name='max_reported_differences',
+    default=10,
+    lower_bound=0,
+    help='Maximum number of requests with different predictions to include in the report',
+)
+
+_PERCENTILES = (50, 90, 99)
+
+_PredictionKey = Tuple[str, int, int, int, int]
+
+
+def _get_latency_summary(histogram: LatencyHistogram) -> Dict[str, Any]:
+  if histogram.count == 0:
+    return {'count': 0}
+  return {
+      'count': histogram.count,
+      **{f'p{p}_ns': histogram.get_percentile(p) for p in _PERCENTILES},
+      'max_ns': histogram.max_ns,
+  }
+
+
+class TrafficReplayer:
+
+  def __init__(self, traffic_log: TrafficLog, server_url: str, speed: float, concurrency: int,
+               confidence_tolerance: float, max_reported_differences: int) -> None:
+    self._traffic_log = traffic_log
+    self._server_url = urlsplit(server_url)
+    self._speed = speed
+    self._concurrency = concurrency
+    self._confidence_tolerance = confidence_tolerance
+    self._max_reported_differences = max_reported_differences
+
+    self._lock = threading.Lock()
+    self._next_index = 0
+    self._start_ns = 0
+    self._recorded_latencies = LatencyHistogram()
+    self._replayed_latencies = LatencyHistogram()
+    self._errors: Dict[str, int] = {}
+    self._same_responses = 0
+    self._differences: List[Dict[str, Any]] = []
+    self._difference_count = 0
+
+  # Returns None if the predictions are the same, otherwise describes how they differ.
+  # Predictions are matched by label and box, then their confidences are compared.
+  @classmethod
+  def compare_responses(cls, recorded: bytes, replayed: bytes, confidence_tolerance: float) -> Optional[str]:
+    recorded_content = json.loads(recorded)
+    replayed_content = json.loads(replayed)
+    if recorded_content['success'] != replayed_content['success']:
+      return f'Expected success to be {recorded_content["success"]}, got {replayed_content["success"]} instead'
+
+    recorded_predictions = cls._get_predictions(recorded_content)
+    replayed_predictions = cls._get_predictions(replayed_content)
+    if [key for key, _ in recorded_predictions] != [key for key, _ in replayed_predictions]:
+      return (f'Expected predictions {[key for key, _ in recorded_predictions]}, '
+              f'got {[key for key, _ in replayed_predictions]} instead')
+
+    for (key, recorded_confidence), (_, replayed_confidence) in zip(recorded_predictions, replayed_predictions):
+      if abs(recorded_confidence - replayed_confidence) > confidence_tolerance:
+        return f'Expected confidence of {key} to be {recorded_confidence}, got {replayed_confidence} instead'
+    return None
+
+  @classmethod
+  def _get_predictions(cls, content: Dict[str, Any]) -> List[Tuple[_PredictionKey, float]]:
+    return sorted(((p['label'], p['x_min'], p['y_min'], p['x_max'], p['y_max']), p['confidence'])
+                  for p in content['predictions'])
+
+  # Sends the requests at their recorded arrival times divided by the speed, from --replay_concurrency threads.
+  def replay(self) -> Dict[str, Any]:
+    threads = [
+        threading.Thread(target=self._run_worker, name=f'traffic-replayer-{i}') for i in range(self._concurrency)
+    ]
+    self._start_ns = time.perf_counter_ns()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    recorded = _get_latency_summary(self._recorded_latencies)
+    replayed = _get_latency_summary(self._replayed_latencies)
+    return {
+        'requests': len(self._traffic_log),
+        'errors': self._errors,
+        'recorded_latency': recorded,
+        'replayed_latency': replayed,
+        'p50_slowdown': replayed['p50_ns'] / recorded['p50_ns'] if replayed['count'] > 0 else None,
+        'same_responses': self._same_responses,
+        'different_responses': self._difference_count,
+        'differences': self._differences,
+    }
+
+  def _get_next_request(self) -> Optional[Tuple[int, RecordedRequest]]:
+    with self._lock:
+      if self._next_index >= len(self._traffic_log):
+        return None
+      index = self._next_index
+      self._next_index += 1
+    return index, self._traffic_log[index]
+
+  def _run_worker(self) -> None:
+    first_arrival_ns = self._traffic_log[0].arrival_ns if len(self._traffic_log) > 0 else 0
+    while True:
+      next_request = self._get_next_request()
+      if next_request is None:
+        return
+      index, recorded_request = next_request
+
+      if self._speed > 0:
+        scheduled_ns = self._start_ns + int((recorded_request.arrival_ns - first_arrival_ns) / self._speed)
+        time.sleep(max(scheduled_ns - time.perf_counter_ns(), 0) / 1e9)
+
+      start_ns = time.perf_counter_ns()
+      try:
+        response_code, response = self._send(recorded_request)
+      except Exception as e:
+        self._count_error(type(e).__name__)
+        continue
+      latency_ns = time.perf_counter_ns() - start_ns
+
+      if response_code != recorded_request.response_code:
+        self._count_error(f'http_{response_code}')
+        continue
+      # Only the predictions are compared, as the responses of the rejected and the invalid requests have no
+      # predictions.
+      difference = None
+      if response_code == 200:
+        difference = self.compare_responses(recorded_request.response, response, self._confidence_tolerance)
+
+      with self._lock:
+        self._recorded_latencies.record(recorded_request.latency_ns)
+        self._replayed_latencies.record(latency_ns)
+        if difference is None:
+          self._same_responses += 1
+          continue
+        self._difference_count += 1
+        if len(self._differences) < self._max_reported_differences:
+          self._differences.append({
+              'index': index,
+              'arrival_ns': recorded_request.arrival_ns,
+              'difference': difference,
+          })
+
+  def _send(self, recorded_request: RecordedRequest) -> Tuple[int, bytes]:
+    headers = {k: v for k, v in recorded_request.headers.items() if k.lower() not in ('host', 'content-length')}
+    connection = http.client.HTTPConnection(self._server_url.hostname or '127.0.0.1', self._server_url.port, timeout=30)
+    try:
+      connection.request('POST', '/v1/vision/detection', body=recorded_request.body, headers=headers)
+      response = connection.getresponse()
+      return response.status, response.read()
+    finally:
+      connection.close()
+
+  def _count_error(self, error: str) -> None:
+    with self._lock:
+      self._errors[error] = self._errors.get(error, 0) + 1
+
+
+def main(args: List[str]) -> None:
+  with TrafficLog(_TRAFFIC_LOG_PATH.value) as traffic_log:
+    replayer = TrafficReplayer(traffic_log, _REPLAY_SERVER_URL.value, _REPLAY_SPEED.value, _REPLAY_CONCURRENCY.value,
+                               _CONFIDENCE_TOLERANCE.value, _MAX_REPORTED_DIFFERENCES.value)
+    print(json.dumps(replayer.replay()))
+
+
+def app_run_main() -> None:
+  app.run(main)
+
+
+if __name__ == '__main__':
+  app_run_main()
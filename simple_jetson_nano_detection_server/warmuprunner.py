@@ -0,0 +1,87 @@
+import functools
+import time
+from typing import Callable, List
+
+from absl import flags, logging
+
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+_WARMUP_IMAGE_PATHS = flags.DEFINE_list(
+    name='warmup_image_paths',
+    default=['images/bus.jpg'],
+    help='Images to run predictions on before the server becomes ready. '
+    'Include one image for each input shape the clients are expected to send',
+)
+
+_WARMUP_STABLE_ITERATIONS = flags.DEFINE_integer(
+    name='warmup_stable_iterations',
+    default=3,
+    lower_bound=1,
+    help='Number of consecutive predictions on an image whose latencies must be within the tolerance '
+    'before the image is considered warmed up',
+)
+
+_WARMUP_MAX_ITERATIONS = flags.DEFINE_integer(
+    name='warmup_max_iterations',
+    default=50,
+    lower_bound=1,
+    help='Maximum number of predictions on an image, even if the latency has not stabilized',
+)
+
+_WARMUP_LATENCY_TOLERANCE = flags.DEFINE_float(
+    name='warmup_latency_tolerance',
+    default=0.1,
+    lower_bound=0.0,
+    help='Latency is considered stable when the slowest of the consecutive predictions is within this ratio '
+    'of the fastest one',
+)
+
+
+class WarmupRunner:
+
+  # Warms up each predictor on its own, as each has its own execution context to initialize. The predictions record no
+  # metrics, as they are not requested by the clients. Returns the total number of predictions made.
+  @classmethod
+  def run_predictors(cls, predictors: List[YoloPredictor]) -> int:
+    return sum(cls.run(functools.partial(predictor.predict, record_metrics=False)) for predictor in predictors)
+
+  # Returns the total number of predictions made.
+  @classmethod
+  def run(cls, predict: Callable[[bytes], object]) -> int:
+    assert _WARMUP_MAX_ITERATIONS.value >= _WARMUP_STABLE_ITERATIONS.value, (
+        f'Expected --warmup_max_iterations to be >= {_WARMUP_STABLE_ITERATIONS.value}, '
+        f'got {_WARMUP_MAX_ITERATIONS.value} instead')
+
+    iterations = 0
+    for image_path in _WARMUP_IMAGE_PATHS.value:
+      with open(image_path, 'rb') as fp:
+        image_data = fp.read()
+      iterations += cls._warm_up_image(image_path, image_data, predict)
+
+    return iterations
+
+  @classmethod
+  def _warm_up_image(cls, image_path: str, image_data: bytes, predict: Callable[[bytes], object]) -> int:
+    latencies_ns: List[int] = []
+
+    while len(latencies_ns) < _WARMUP_MAX_ITERATIONS.value:
+      start_ns = time.perf_counter_ns()
+      predict(image_data)
+      latencies_ns.append(time.perf_counter_ns() - start_ns)
+
+      if cls._is_latency_stable(latencies_ns):
+        logging.info(f'Warmed up with {image_path} after {len(latencies_ns)} predictions, '
+                     f'latency={latencies_ns[-1] / 1e6:.1f}ms.')
+        return len(latencies_ns)
+
+    logging.warning(f'Latency of {image_path} did not stabilize after {len(latencies_ns)} predictions, '
+                    f'latency={latencies_ns[-1] / 1e6:.1f}ms.')
+    return len(latencies_ns)
+
+  @classmethod
+  def _is_latency_stable(cls, latencies_ns: List[int]) -> bool:
+    if len(latencies_ns) < _WARMUP_STABLE_ITERATIONS.value:
+      return False
+
+    window = latencies_ns[-_WARMUP_STABLE_ITERATIONS.value:]
+    return max(window) <= min(window) * (1 + _WARMUP_LATENCY_TOLERANCE.value)
@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import os
+import socket
+import struct
+import threading
+from typing import BinaryIO, Optional, Tuple
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_MESSAGE_TOO_BIG = 1009
+
+_OPCODES = {OPCODE_CONTINUATION, OPCODE_TEXT, OPCODE_BINARY, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG}
+
+_ACCEPT_KEY_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+_MAX_CONTROL_PAYLOAD_BYTES = 125
+
+_LENGTH_16 = struct.Struct('>H')
+_LENGTH_64 = struct.Struct('>Q')
+_CLOSE_CODE = struct.Struct('>H')
+
+
+# The value of the Sec-WebSocket-Accept header that accepts the Sec-WebSocket-Key of the opening handshake.
+def get_accept_key(key: str) -> str:
+  return base64.b64encode(hashlib.sha1(key.encode() + _ACCEPT_KEY_GUID).digest()).decode()
+
+
+# XORs 4 bytes at a time with Python integers, which is much faster than XORing byte by byte.
+def _apply_mask(data: bytes, mask: bytes) -> bytes:
+  repeated_mask = (mask * (len(data) // 4 + 1))[:len(data)]
+  return (int.from_bytes(data, 'big') ^ int.from_bytes(repeated_mask, 'big')).to_bytes(len(data), 'big')
+
+
+# The frames of RFC 6455 over a connection that finished the opening handshake, e.g. the streams of an HTTP request
+# upgraded by HttpRequestDispatcher. Answers pings and the closing handshake by itself. Fragmented messages are joined.
+# The server side does not mask the frames it sends and requires the client to mask, and the client side does the
+# opposite. Messages can be sent from several threads.
+class WebSocketConnection:
+
+  def __init__(self, rfile: BinaryIO, wfile: BinaryIO, max_message_bytes: int, is_client: bool = False) -> None:
+    self._rfile = rfile
+    self._wfile = wfile
+    self._max_message_bytes = max_message_bytes
+    self._is_client = is_client
+    self._write_lock = threading.Lock()
+    self._close_sent = False
+
+  # Opens a connection as a client, e.g. for the benchmarks and the tests.
+  @classmethod
+  def connect(cls, host: str, port: int, path: str, max_message_bytes: int) -> 'WebSocketConnection':
+    connection = socket.create_connection((host, port))
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    rfile, wfile = connection.makefile('rb'), connection.makefile('wb')
+    # The streams keep the socket open until they are closed.
+    connection.close()
+
+    key = base64.b64encode(os.urandom(16)).decode()
+    wfile.write(f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'.encode())
+    wfile.flush()
+
+    status_line = rfile.readline().decode()
+    headers = {}
+    while True:
+      line = rfile.readline().decode().strip()
+      if line == '':
+        break
+      name, _, value = line.partition(':')
+      headers[name.strip().lower()] = value.strip()
+
+    if status_line.split(' ')[1:2] != ['101'] or headers.get('sec-websocket-accept') != get_accept_key(key):
+      rfile.close()
+      wfile.close()
+      raise ConnectionError(f'Expected the server to accept the WebSocket, got "{status_line.strip()}" instead')
+    return cls(rfile, wfile, max_message_bytes, is_client=True)
+
+  # Returns the opcode and the payload of the next text or binary message, or None once the connection is closed.
+  def receive(self) -> Optional[Tuple[int, bytes]]:
+    message_opcode: Optional[int] = None
+    message = bytearray()
+    try:
+      while True:
+        frame = self._receive_frame()
+        if frame is None:
+          return None
+        fin, opcode, payload_length, mask = frame
+
+        if opcode & 0x8:
+          if not fin or payload_length > _MAX_CONTROL_PAYLOAD_BYTES:
+            self.close(CLOSE_PROTOCOL_ERROR, 'Control frames must not be fragmented or exceed 125 bytes')
+            return None
+          payload = self._receive_payload(payload_length, mask)
+          if opcode == OPCODE_CLOSE:
+            self.close(_CLOSE_CODE.unpack_from(payload)[0] if len(payload) >= 2 else CLOSE_NORMAL)
+            return None
+          if opcode == OPCODE_PING:
+            self.send(OPCODE_PONG, payload)
+          continue
+
+        if (opcode == OPCODE_CONTINUATION) != (message_opcode is not None):
+          self.close(CLOSE_PROTOCOL_ERROR, 'Unexpected continuation frame')
+          return None
+        if len(message) + payload_length > self._max_message_bytes:
+          self.close(CLOSE_MESSAGE_TOO_BIG, f'Messages must be <= {self._max_message_bytes} bytes')
+          return None
+
+        if message_opcode is None:
+          message_opcode = opcode
+        message += self._receive_payload(payload_length, mask)
+        if fin:
+          return message_opcode, bytes(message)
+    except (OSError, EOFError):
+      return None
+
+  def send(self, opcode: int, payload: bytes) -> None:
+    if len(payload) < 126:
+      header = bytes([0x80 | opcode, len(payload)])
+    elif len(payload) < 1 << 16:
+      header = bytes([0x80 | opcode, 126]) + _LENGTH_16.pack(len(payload))
+    else:
+      header = bytes([0x80 | opcode, 127]) + _LENGTH_64.pack(len(payload))
+
+    if self._is_client:
+      mask = os.urandom(4)
+      frame = bytes([header[0], header[1] | 0x80]) + header[2:] + mask + _apply_mask(payload, mask)
+    else:
+      frame = header + payload
+
+    with self._write_lock:
+      self._wfile.write(frame)
+      self._wfile.flush()
+
+  # Sends the close frame once. The connection is closed once the other side answers, or once its streams are closed.
+  def close(self, code: int = CLOSE_NORMAL, reason: str = '') -> None:
+    with self._write_lock:
+      if self._close_sent:
+        return
+      self._close_sent = True
+    try:
+      frame = _CLOSE_CODE.pack(code) + reason.encode()[:_MAX_CONTROL_PAYLOAD_BYTES - _CLOSE_CODE.size]
+      self.send(OPCODE_CLOSE, frame)
+    except (OSError, ValueError):
+      pass
+
+  # Closes the streams, which the clients own. The streams of the servers are closed by the request handlers.
+  def close_streams(self) -> None:
+    self._rfile.close()
+    self._wfile.close()
+
+  # Returns fin, opcode, payload length and mask of the next frame, or None at the end of the stream.
+  def _receive_frame(self) -> Optional[Tuple[bool, int, int, Optional[bytes]]]:
+    header = self._rfile.read(2)
+    if len(header) < 2:
+      return None
+    fin, opcode = bool(header[0] & 0x80), header[0] & 0x0F
+    masked, payload_length = bool(header[1] & 0x80), header[1] & 0x7F
+    if payload_length == 126:
+      payload_length = _LENGTH_16.unpack(self._read_exactly(_LENGTH_16.size))[0]
+    elif payload_length == 127:
+      payload_length = _LENGTH_64.unpack(self._read_exactly(_LENGTH_64.size))[0]
+
+    if opcode not in _OPCODES:
+      self.close(CLOSE_PROTOCOL_ERROR, f'Unknown opcode {opcode}')
+      return None
+    # Only the client masks its frames.
+    if masked == self._is_client:
+      self.close(CLOSE_PROTOCOL_ERROR, 'Only the frames sent by the client are masked')
+      return None
+    return fin, opcode, payload_length, self._read_exactly(4) if masked else None
+
+  def _receive_payload(self, payload_length: int, mask: Optional[bytes]) -> bytes:
+    payload = self._read_exactly(payload_length)
+    return payload if mask is None else _apply_mask(payload, mask)
+
+  def _read_exactly(self, size: int) -> bytes:
+    data = self._rfile.read(size)
+    if len(data) < size:
+      raise EOFError(f'Stream ended after {len(data)} of {size} bytes')
+    return data
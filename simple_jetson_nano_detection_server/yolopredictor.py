@@ -1,15 +1,21 @@
+import time
 from enum import Enum, auto
-from tempfile import NamedTemporaryFile
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
 
-import ultralytics
 from absl import flags
-from line_protocol_cache.lineprotocolcache import LineProtocolCache
 
 from simple_jetson_nano_detection_server.cocolabel import CocoLabel
 from simple_jetson_nano_detection_server.eventmetricstracker import EventMetricsTracker
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
 from simple_jetson_nano_detection_server.prediction import Prediction
 
+# Importing ultralytics, numpy and OpenCV is slow, only do it for type checking. The model is loaded and passed in by
+# main. numpy and OpenCV are imported when the first image is decoded.
+if TYPE_CHECKING:
+  import numpy
+  import ultralytics
+
 _IMAGE_SIZE = flags.DEFINE_integer(
     name='image_size',
     default=320,
@@ -27,35 +33,107 @@ _HALF_PRECISION = flags.DEFINE_bool(
 
 
 class _EventMetricsFields(Enum):
+  IMAGES = auto()
   IMAGE_BYTES = auto()
 
 
+class _PerformanceCheckpoint(Enum):
+  RECORD_INPUT_METRICS = auto()
+  DECODE_IMAGE = auto()
+  MODEL_PREDICT = auto()
+  PREPROCESS = auto()
+  INFERENCE = auto()
+  POSTPROCESS = auto()
+  BUILD_PREDICTIONS = auto()
+  RECORD_OUTPUT_METRICS = auto()
+
+
+# Ultralytics times these stages of each prediction in milliseconds. Decoding the image is not included.
+_SPEED_CHECKPOINTS = {
+    'preprocess': _PerformanceCheckpoint.PREPROCESS,
+    'inference': _PerformanceCheckpoint.INFERENCE,
+    'postprocess': _PerformanceCheckpoint.POSTPROCESS,
+}
+
+
+# Predicts with its own model, which is not thread-safe. Ultralytics keeps the buffers and the TensorRT execution
+# context in the model, so each predictor must only be used by one thread at a time, see PredictorPool.
 class YoloPredictor:
 
-  _model: Optional[ultralytics.YOLO] = None
+  # The device is picked by Ultralytics unless given, e.g. "cpu" for the overflow lane. FP16 is only used off the CPU.
+  def __init__(self, model: 'ultralytics.YOLO', device: Optional[str] = None) -> None:
+    self.model = model
+    self.device = device
 
-  @classmethod
-  def set_model(cls, model: ultralytics.YOLO) -> None:
-    cls._model = model
+  # Warmup predictions should not record metrics, as they are not predictions requested by the clients.
+  def predict(self, image_data: Union[bytes, memoryview], record_metrics: bool = True) -> List[Prediction]:
+    if record_metrics:
+      with PerformanceTracker.span(_PerformanceCheckpoint.RECORD_INPUT_METRICS):
+        self._record_image_size(image_data)
+
+    with PerformanceTracker.span(_PerformanceCheckpoint.DECODE_IMAGE):
+      image = self.decode_image(image_data)
+    assert image is not None, 'Failed to decode the image'
+
+    with PerformanceTracker.span(_PerformanceCheckpoint.MODEL_PREDICT):
+      results = self.model.predict(image,
+                                   imgsz=_IMAGE_SIZE.value,
+                                   half=self._is_half_precision(),
+                                   device=self.device,
+                                   save=False,
+                                   verbose=False)
 
+      assert len(results) == 1, f'There must be exactly 1 result, got {len(results)} instead'
+      result = results[0]
+
+      assert result.boxes != None, 'Boxes cannot be None'
+      # The stages run one after another right before the prediction returns, so they are laid out back to back.
+      elapsed_ns = {
+          stage: int(elapsed_ms * 1e6)
+          for stage, elapsed_ms in result.speed.items()
+          if stage in _SPEED_CHECKPOINTS and elapsed_ms is not None
+      }
+      stop_timestamp_ns = time.perf_counter_ns() - sum(elapsed_ns.values())
+      for stage, stage_elapsed_ns in elapsed_ns.items():
+        stop_timestamp_ns += stage_elapsed_ns
+        PerformanceTracker.add_span(_SPEED_CHECKPOINTS[stage], stage_elapsed_ns, stop_timestamp_ns)
+
+    with PerformanceTracker.span(_PerformanceCheckpoint.BUILD_PREDICTIONS):
+      predictions = self._build_predictions(result)
+
+    if record_metrics:
+      with PerformanceTracker.span(_PerformanceCheckpoint.RECORD_OUTPUT_METRICS):
+        self._record_coco_categories(predictions)
+    return predictions
+
+  # Decodes the image where it is, e.g. in the slot of SharedMemoryServer, without copying it first. Ultralytics takes
+  # the decoded BGR array as it is. OpenCV comes with Ultralytics, and releases the GIL while decoding, so the threads
+  # decode in parallel. Returns None if the image cannot be decoded.
   @classmethod
-  def predict(cls, image_data: bytes) -> List[Prediction]:
-    assert cls._model is not None, 'A model must be set before prediction'
-
-    cls._record_image_size(image_data)
-    with NamedTemporaryFile(dir='/dev/shm', suffix='.jpg') as image_file:
-      image_file.write(image_data)
-      image_file.flush()
-      results = cls._model.predict(image_file.name,
+  def decode_image(cls, image_data: Union[bytes, memoryview]) -> Optional['numpy.ndarray']:
+    import cv2
+    import numpy
+    return cv2.imdecode(numpy.frombuffer(image_data, numpy.uint8), cv2.IMREAD_COLOR)
+
+  # Predicts on decoded images at once, e.g. for BulkDetector. The images are BGR arrays as decoded by OpenCV. An engine
+  # built for a fixed batch size must be given exactly that many images. Records no metrics, as the images are not
+  # requested by the clients.
+  def predict_batch(self, images: List['numpy.ndarray']) -> List[List[Prediction]]:
+    with PerformanceTracker.span(_PerformanceCheckpoint.MODEL_PREDICT):
+      results = self.model.predict(images,
                                    imgsz=_IMAGE_SIZE.value,
-                                   half=_HALF_PRECISION.value,
+                                   half=self._is_half_precision(),
+                                   device=self.device,
+                                   batch=len(images),
                                    save=False,
                                    verbose=False)
+      assert len(results) == len(images), f'There must be exactly {len(images)} results, got {len(results)} instead'
+      assert all(result.boxes != None for result in results), 'Boxes cannot be None'
 
-    assert len(results) == 1, f'There must be exactly 1 result, got {len(results)} instead'
-    result = results[0]
+    with PerformanceTracker.span(_PerformanceCheckpoint.BUILD_PREDICTIONS):
+      return [self._build_predictions(result) for result in results]
 
-    assert result.boxes != None, 'Boxes cannot be None'
+  def _build_predictions(self, result: 'ultralytics.engine.results.Results') -> List[Prediction]:
     zipped: zip[Tuple[List[float], float, float]] = zip(
         result.boxes.xyxy.tolist(),
         result.boxes.conf.tolist(),
@@ -71,29 +149,34 @@ class YoloPredictor:
               x_max=int(xyxy_coordinate[2]),
               y_max=int(xyxy_coordinate[3]),
               confidence=float(confidence),
-              label=str(cls._model.names.get(int(class_id))),
+              label=str(self.model.names.get(int(class_id))),
           ))
-
-    cls._record_coco_categories(predictions)
     return predictions
 
   @classmethod
-  def _record_image_size(cls, image_data: bytes) -> None:
+  def _record_image_size(cls, image_data: Union[bytes, memoryview]) -> None:
+    if not MetricsAggregator.is_enabled():
+      return
+
     tracker: EventMetricsTracker[_EventMetricsFields] = EventMetricsTracker()
-    tracker.record(_EventMetricsFields.IMAGE_BYTES, len(image_data))
-    LineProtocolCache.put(tracker.finalize('prediction_input'))
+    tracker.increment(_EventMetricsFields.IMAGES)
+    tracker.increment(_EventMetricsFields.IMAGE_BYTES, len(image_data))
+    tracker.aggregate('prediction_input')
 
-  @classmethod
-  def _record_coco_categories(cls, predictions: List[Prediction]) -> None:
-    if len(predictions) == 0:
+  def _is_half_precision(self) -> bool:
+    return _HALF_PRECISION.value and self.device != 'cpu'
+
+  # Tagged by the device, so the detections of the overflow lane can be told apart from the ones of the GPU models.
+  def _record_coco_categories(self, predictions: List[Prediction]) -> None:
+    if len(predictions) == 0 or not MetricsAggregator.is_enabled():
       return
 
     tracker: EventMetricsTracker[CocoLabel] = EventMetricsTracker()
     for prediction in predictions:
       tracker.increment(prediction.label, 1, {'confidence_percent': int(prediction.confidence * 100)})
 
-    LineProtocolCache.put(
-        tracker.finalize('prediction_output', {
-            'model_image_size': _IMAGE_SIZE.value,
-            'model_precision': 'fp16' if _HALF_PRECISION.value else 'fp32',
-        }))
+    tracker.aggregate('prediction_output', {
+        'model_device': 'auto' if self.device is None else self.device,
+        'model_image_size': _IMAGE_SIZE.value,
+        'model_precision': 'fp16' if self._is_half_precision() else 'fp32',
+    })
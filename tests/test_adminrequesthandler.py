@@ -0,0 +1,190 @@
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.adminrequesthandler import (_PROFILER_MAX_DURATION_S, AdminRequestHandler,
+                                                                     AdminResponse)
+from simple_jetson_nano_detection_server.enginereloader import EngineReloader
+from simple_jetson_nano_detection_server.requesttracer import RequestTracer
+from simple_jetson_nano_detection_server.samplingprofiler import SamplingProfiler
+from simple_jetson_nano_detection_server.slowrequestrecorder import (SLOW_REQUESTS_DUMP_DIR, SlowRequest,
+                                                                     SlowRequestRecorder)
+
+MOCK_START = Mock()
+MOCK_IS_RUNNING = Mock()
+MOCK_GET_COLLAPSED_STACKS = Mock()
+MOCK_START_RELOAD = Mock()
+
+
+@patch.object(SamplingProfiler, SamplingProfiler.start.__name__, MOCK_START)
+@patch.object(SamplingProfiler, SamplingProfiler.is_running.__name__, MOCK_IS_RUNNING)
+@patch.object(SamplingProfiler, SamplingProfiler.get_collapsed_stacks.__name__, MOCK_GET_COLLAPSED_STACKS)
+@patch.object(EngineReloader, EngineReloader.start.__name__, MOCK_START_RELOAD)
+class TestAdminRequestHandler(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_START.return_value = True
+    MOCK_IS_RUNNING.return_value = False
+    MOCK_GET_COLLAPSED_STACKS.return_value = None
+    MOCK_START_RELOAD.return_value = True
+
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.engine_path = os.path.join(self.temp_dir.name, 'yolo11s-320-fp16.engine')
+    with open(self.engine_path, 'wb') as fp:
+      fp.write(b'engine')
+
+    self.saved_flags = flagsaver.as_parsed(
+        (_PROFILER_MAX_DURATION_S, str(30)),
+        (SLOW_REQUESTS_DUMP_DIR, 'dump-dir'),
+    )
+    self.saved_flags.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    MOCK_START.reset_mock(return_value=True, side_effect=True)
+    MOCK_IS_RUNNING.reset_mock(return_value=True, side_effect=True)
+    MOCK_GET_COLLAPSED_STACKS.reset_mock(return_value=True, side_effect=True)
+    MOCK_START_RELOAD.reset_mock(return_value=True, side_effect=True)
+    self.temp_dir.cleanup()
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def test_invalidPath_returns404(self):
+    response = AdminRequestHandler.get_response('GET', '/admin/invalid-path', {})
+
+    self.assertEqual(response, AdminResponse.json(404, {'message': 'No admin endpoint for GET /admin/invalid-path'}))
+
+  def test_startProfiler_defaultQuery(self):
+    response = AdminRequestHandler.get_response('POST', '/admin/profile', {})
+
+    self.assertEqual(response, AdminResponse.json(202, {'duration_s': 10.0, 'mode': 'wall'}))
+    MOCK_START.assert_called_once_with(10.0, wall_clock=True)
+
+  def test_startProfiler_cpuMode(self):
+    response = AdminRequestHandler.get_response('POST', '/admin/profile', {'duration_s': '5', 'mode': 'cpu'})
+
+    self.assertEqual(response, AdminResponse.json(202, {'duration_s': 5.0, 'mode': 'cpu'}))
+    MOCK_START.assert_called_once_with(5.0, wall_clock=False)
+
+  def test_startProfiler_alreadyRunning_returns409(self):
+    MOCK_START.return_value = False
+
+    response = AdminRequestHandler.get_response('POST', '/admin/profile', {})
+
+    self.assertEqual(response, AdminResponse.json(409, {'message': 'Profiling is already running'}))
+
+  @parameterized.parameters('0', '31')
+  def test_startProfiler_invalidDuration_raises(self, duration_s: str):
+    with self.assertRaisesWithLiteralMatch(
+        AssertionError, f'Expected duration_s to be in (0, 30.0], got {float(duration_s)} instead'):
+      AdminRequestHandler.get_response('POST', '/admin/profile', {'duration_s': duration_s})
+
+  def test_startProfiler_invalidMode_raises(self):
+    with self.assertRaisesWithLiteralMatch(AssertionError,
+                                           'Expected mode to be "wall" or "cpu", got "invalid" instead'):
+      AdminRequestHandler.get_response('POST', '/admin/profile', {'mode': 'invalid'})
+
+  def test_getProfile_running_returns409(self):
+    MOCK_IS_RUNNING.return_value = True
+
+    response = AdminRequestHandler.get_response('GET', '/admin/profile', {})
+
+    self.assertEqual(response, AdminResponse.json(409, {'message': 'Profiling is still running'}))
+
+  def test_getProfile_noProfiling_returns404(self):
+    response = AdminRequestHandler.get_response('GET', '/admin/profile', {})
+
+    self.assertEqual(response, AdminResponse.json(404, {'message': 'No profiling has been run'}))
+
+  def test_getProfile_returnsCollapsedStacks(self):
+    MOCK_GET_COLLAPSED_STACKS.return_value = 'MainThread;main (main.py:1) 3\n'
+
+    response = AdminRequestHandler.get_response('GET', '/admin/profile', {})
+
+    self.assertEqual(response, AdminResponse(200, 'text/plain', 'MainThread;main (main.py:1) 3\n'))
+
+  @patch.object(SlowRequestRecorder, SlowRequestRecorder.get_slow_requests.__name__)
+  def test_getSlowRequests_leavesOutImageData(self, mock_get_slow_requests: Mock):
+    mock_get_slow_requests.return_value = [
+        SlowRequest(timestamp_ns=1, total_ns=2, latencies_ns={'stage': 2}, request_bytes=3, prediction_count=4,
+                    image_data=b'image-data'),
+    ]
+
+    response = AdminRequestHandler.get_response('GET', '/admin/slow-requests', {})
+
+    self.assertEqual(
+        response,
+        AdminResponse.json(
+            200, {
+                'slow_requests': [{
+                    'timestamp_ns': 1,
+                    'total_ns': 2,
+                    'latencies_ns': {
+                        'stage': 2
+                    },
+                    'request_bytes': 3,
+                    'prediction_count': 4,
+                    'image_data': None,
+                    'has_image_data': True,
+                }]
+            }))
+
+  @patch.object(SlowRequestRecorder, SlowRequestRecorder.dump.__name__, Mock(return_value='dump-dir/slow-requests.json'))
+  def test_dumpSlowRequests_returnsPath(self):
+    response = AdminRequestHandler.get_response('POST', '/admin/slow-requests/dump', {})
+
+    self.assertEqual(response, AdminResponse.json(200, {'path': 'dump-dir/slow-requests.json'}))
+    SlowRequestRecorder.dump.assert_called_once_with('dump-dir')
+
+  def test_startReload_enginePath(self):
+    response = AdminRequestHandler.get_response('POST', '/admin/reload', {'engine_path': self.engine_path})
+
+    self.assertEqual(response, AdminResponse.json(202, {'engine_path': self.engine_path}))
+    MOCK_START_RELOAD.assert_called_once_with(self.engine_path)
+
+  def test_startReload_defaultEnginePath(self):
+    with patch.object(EngineReloader, EngineReloader.get_default_engine_path.__name__,
+                      Mock(return_value=self.engine_path)):
+      response = AdminRequestHandler.get_response('POST', '/admin/reload', {})
+
+    self.assertEqual(response, AdminResponse.json(202, {'engine_path': self.engine_path}))
+    MOCK_START_RELOAD.assert_called_once_with(self.engine_path)
+
+  def test_startReload_missingEngineFile_raises(self):
+    with self.assertRaisesWithLiteralMatch(AssertionError, 'Engine file missing.engine does not exist'):
+      AdminRequestHandler.get_response('POST', '/admin/reload', {'engine_path': 'missing.engine'})
+
+    MOCK_START_RELOAD.assert_not_called()
+
+  def test_startReload_alreadyRunning_returns409(self):
+    MOCK_START_RELOAD.return_value = False
+
+    response = AdminRequestHandler.get_response('POST', '/admin/reload', {'engine_path': self.engine_path})
+
+    self.assertEqual(
+        response, AdminResponse.json(409, {'message': 'The server is still starting up or another reload is running'}))
+
+  def test_getReloadStatus(self):
+    status = {'running': {'engine_path': self.engine_path, 'stage': 'warmup'}, 'last_reload': None}
+    with patch.object(EngineReloader, EngineReloader.get_status.__name__, Mock(return_value=status)):
+      response = AdminRequestHandler.get_response('GET', '/admin/reload', {})
+
+    self.assertEqual(response, AdminResponse.json(200, status))
+
+  @patch.object(RequestTracer, RequestTracer.is_enabled.__name__, Mock(return_value=False))
+  def test_getTrace_disabled_returns404(self):
+    response = AdminRequestHandler.get_response('GET', '/admin/trace', {})
+
+    self.assertEqual(
+        response,
+        AdminResponse.json(404, {'message': 'Request tracing is disabled, set --request_trace_window_s to enable'}))
+
+  @patch.object(RequestTracer, RequestTracer.is_enabled.__name__, Mock(return_value=True))
+  def test_getTrace(self):
+    trace = {'traceEvents': [], 'displayTimeUnit': 'ms'}
+    with patch.object(RequestTracer, RequestTracer.get_trace.__name__, Mock(return_value=trace)):
+      response = AdminRequestHandler.get_response('GET', '/admin/trace', {})
+
+    self.assertEqual(response, AdminResponse.json(200, trace))
@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+from typing import Any, List, Optional
+from unittest.mock import Mock, patch
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.bulkdetector import BulkDetector, iterate_images
+from simple_jetson_nano_detection_server.prediction import Prediction
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+MOCK_DECODE_IMAGE = Mock()
+
+PERSON = Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='person', confidence=0.5)
+PERSON_JSON = {'x_min': 111, 'x_max': 319, 'y_min': 164, 'y_max': 319, 'label': 'person', 'confidence': 0.5}
+
+
+# The decoded images are the image data itself, and images that are not images cannot be decoded.
+def _decode_image(image_data: bytes) -> Optional[bytes]:
+  return None if image_data == b'not-an-image' else image_data
+
+
+def _predict_batch(images: List[bytes]) -> List[List[Prediction]]:
+  return [[PERSON] if image == b'person' else [] for image in images]
+
+
+@patch.object(YoloPredictor, YoloPredictor.decode_image.__name__, MOCK_DECODE_IMAGE)
+class TestBulkDetector(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_DECODE_IMAGE.side_effect = _decode_image
+    self.predictor = Mock(predict_batch=Mock(side_effect=_predict_batch))
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.output_path = os.path.join(self.temp_dir.name, 'detections.jsonl')
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.temp_dir.cleanup()
+    MOCK_DECODE_IMAGE.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  def _write_file(self, name: str, content: bytes) -> str:
+    path = os.path.join(self.temp_dir.name, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fp:
+      fp.write(content)
+    return path
+
+  def _run(self, image_data: List[bytes], batch_size: int = 2, resume: bool = True) -> Any:
+    images = [(f'image-{i}.jpg', (lambda data=data: data)) for i, data in enumerate(image_data)]
+    return BulkDetector(self.predictor, self.output_path, batch_size, 2, 3600).run(iter(images), resume)
+
+  def _read_output(self) -> List[Any]:
+    with open(self.output_path) as fp:
+      return [json.loads(line) for line in fp]
+
+  def test_iterateImages_searchesDirectoriesRecursively(self):
+    self._write_file('snapshots/b.jpg', b'b')
+    self._write_file('snapshots/front_door/a.JPG', b'a')
+    self._write_file('snapshots/notes.txt', b'notes')
+
+    snapshots_dir = os.path.join(self.temp_dir.name, 'snapshots')
+    images = [(name, read_image()) for name, read_image in iterate_images([snapshots_dir])]
+
+    self.assertEqual(images, [
+        (os.path.join(snapshots_dir, 'b.jpg'), b'b'),
+        (os.path.join(snapshots_dir, 'front_door/a.JPG'), b'a'),
+    ])
+
+  def test_iterateImages_matchesGlobs(self):
+    self._write_file('a.jpg', b'a')
+    self._write_file('b.png', b'b')
+
+    images = [name for name, _ in iterate_images([os.path.join(self.temp_dir.name, '*.png')])]
+
+    self.assertEqual(images, [os.path.join(self.temp_dir.name, 'b.png')])
+
+  @parameterized.named_parameters(
+      ('uncompressed', 'frames.tar', 'w'),
+      ('gzip', 'frames.tar.gz', 'w:gz'),
+  )
+  def test_iterateImages_streamsArchives(self, name: str, mode: str):
+    archive_path = os.path.join(self.temp_dir.name, name)
+    with tarfile.open(archive_path, mode) as archive:
+      members = (('front_door/0002.jpg', b'2'), ('notes.txt', b'notes'), ('front_door/0001.jpg', b'1'))
+      for member_name, content in members:
+        member = tarfile.TarInfo(member_name)
+        member.size = len(content)
+        archive.addfile(member, io.BytesIO(content))
+
+    images = [(name, read_image()) for name, read_image in iterate_images([archive_path])]
+
+    self.assertEqual(images, [
+        (f'{archive_path}:front_door/0002.jpg', b'2'),
+        (f'{archive_path}:front_door/0001.jpg', b'1'),
+    ])
+
+  def test_run_writesPredictionsInOrder(self):
+    summary = self._run([b'person', b'empty', b'person'])
+
+    self.assertEqual(self._read_output(), [
+        {'image': 'image-0.jpg', 'predictions': [PERSON_JSON], 'success': True},
+        {'image': 'image-1.jpg', 'predictions': [], 'success': True},
+        {'image': 'image-2.jpg', 'predictions': [PERSON_JSON], 'success': True},
+    ])
+    self.assertEqual((summary['predicted'], summary['skipped'], summary['failed']), (3, 0, 0))
+
+  def test_run_padsLastBatch(self):
+    self._run([b'person', b'empty', b'person'], batch_size=2)
+
+    self.assertEqual([call_args.args[0] for call_args in self.predictor.predict_batch.call_args_list],
+                     [[b'person', b'empty'], [b'person', b'person']])
+
+  def test_undecodableImage_isWrittenAsFailure(self):
+    summary = self._run([b'not-an-image', b'person'])
+
+    self.assertEqual(self._read_output()[0], {'image': 'image-0.jpg', 'predictions': [], 'success': False})
+    self.assertEqual(self.predictor.predict_batch.call_args.args[0], [b'person', b'person'])
+    self.assertEqual((summary['predicted'], summary['skipped'], summary['failed']), (1, 0, 1))
+
+  def test_resume_skipsWrittenImagesAndIncompleteLine(self):
+    with open(self.output_path, 'wb') as fp:
+      fp.write(b'{"image": "image-0.jpg", "predictions": [], "success": true}\n{"image": "image-1.jpg", "predi')
+
+    summary = self._run([b'empty', b'person'])
+
+    self.assertEqual([record['image'] for record in self._read_output()], ['image-0.jpg', 'image-1.jpg'])
+    self.assertEqual(self.predictor.predict_batch.call_args.args[0], [b'person', b'person'])
+    self.assertEqual((summary['predicted'], summary['skipped'], summary['failed']), (1, 1, 0))
+
+  def test_noResume_overwritesOutput(self):
+    with open(self.output_path, 'wb') as fp:
+      fp.write(b'{"image": "image-0.jpg", "predictions": [], "success": true}\n')
+
+    summary = self._run([b'person'], resume=False)
+
+    self.assertEqual([record['predictions'] for record in self._read_output()], [[PERSON_JSON]])
+    self.assertEqual(summary['skipped'], 0)
@@ -0,0 +1,152 @@
+import itertools
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.detectionjournal import (_DETECTION_JOURNAL_DIR,
+                                                                  _DETECTION_JOURNAL_QUEUE_SIZE,
+                                                                  _DETECTION_JOURNAL_SEGMENT_BYTES, _RECORD,
+                                                                  DetectionJournal, JournalRecord, JournalSegment,
+                                                                  get_segment_paths)
+from simple_jetson_nano_detection_server.prediction import Prediction
+
+_PERSON = Prediction.build(x_min=132, x_max=177, y_min=104, y_max=141, label='person', confidence=0.5)
+_CAR = Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='car', confidence=0.25)
+
+MOCK_TIME_NS = Mock()
+
+
+@patch.object(time, time.time_ns.__name__, MOCK_TIME_NS)
+class TestDetectionJournal(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_TIME_NS.return_value = 1700000000000000000
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.saved_flags = flagsaver.as_parsed(
+        (_DETECTION_JOURNAL_DIR, self.temp_dir.name),
+        (_DETECTION_JOURNAL_SEGMENT_BYTES, str(1024)),
+        (_DETECTION_JOURNAL_QUEUE_SIZE, str(10)),
+    )
+    self.saved_flags.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.saved_flags.__exit__(None, None, None)
+    self.temp_dir.cleanup()
+    MOCK_TIME_NS.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  def _read_records(self):
+    records = []
+    for segment_path in get_segment_paths(self.temp_dir.name):
+      with JournalSegment(segment_path) as segment:
+        records.extend(segment[i] for i in range(len(segment)))
+    return records
+
+  def test_record(self):
+    with DetectionJournal():
+      DetectionJournal.record('front_door', [_PERSON, _CAR])
+      DetectionJournal.record('backyard', [_CAR])
+
+    self.assertEqual(self._read_records(), [
+        JournalRecord(1700000000000000000, 'front_door', CocoLabel.PERSON, 0.5, 132, 104, 177, 141),
+        JournalRecord(1700000000000000000, 'front_door', CocoLabel.CAR, 0.25, 111, 164, 319, 319),
+        JournalRecord(1700000000000000000, 'backyard', CocoLabel.CAR, 0.25, 111, 164, 319, 319),
+    ])
+
+  def test_noPredictions_skipsRecord(self):
+    with DetectionJournal():
+      DetectionJournal.record('front_door', [])
+
+    self.assertEmpty(get_segment_paths(self.temp_dir.name))
+
+  def test_longCamera_isTruncated(self):
+    with DetectionJournal():
+      DetectionJournal.record('c' * 40, [_PERSON])
+
+    self.assertEqual(self._read_records()[0].camera, 'c' * 32)
+
+  @flagsaver.as_parsed((_DETECTION_JOURNAL_SEGMENT_BYTES, str(_RECORD.size * 2)))
+  def test_segmentFull_startsNewSegment(self):
+    with DetectionJournal():
+      for _ in range(3):
+        DetectionJournal.record('front_door', [_PERSON])
+        # Waits for each record to be written, so each is its own batch.
+        while not DetectionJournal._queue.empty():
+          time.sleep(0.01)
+        time.sleep(0.05)
+
+    segment_paths = get_segment_paths(self.temp_dir.name)
+    self.assertLen(segment_paths, 2)
+    self.assertEqual([os.path.getsize(p) for p in segment_paths], [_RECORD.size * 2, _RECORD.size])
+    self.assertLen(self._read_records(), 3)
+
+  def test_timestampGoesBackwards_keepsRecordsSorted(self):
+    MOCK_TIME_NS.side_effect = itertools.chain([300, 100, 200], itertools.repeat(400))
+    with DetectionJournal():
+      for _ in range(3):
+        DetectionJournal.record('front_door', [_PERSON])
+
+    self.assertEqual([r.timestamp_ns for r in self._read_records()], [300, 300, 300])
+
+  def test_queueFull_dropsDetections(self):
+    with flagsaver.as_parsed((_DETECTION_JOURNAL_QUEUE_SIZE, str(1))):
+      with patch.object(DetectionJournal, DetectionJournal._run.__name__, Mock()):
+        with DetectionJournal():
+          DetectionJournal.record('front_door', [_PERSON])
+          DetectionJournal.record('front_door', [_PERSON])
+          self.assertEqual(DetectionJournal._dropped, 1)
+          # Lets __exit__ put the stop signal into the queue.
+          DetectionJournal._queue.get_nowait()
+
+  def test_writeFailure_stopsJournaling(self):
+    release = threading.Event()
+
+    def write(*args) -> None:
+      release.wait(timeout=5)
+      raise OSError(28, 'No space left on device')
+
+    with patch.object(DetectionJournal, DetectionJournal._write.__name__, Mock(side_effect=write)):
+      with DetectionJournal():
+        for _ in range(20):
+          DetectionJournal.record('front_door', [_PERSON])
+        release.set()
+        assert DetectionJournal._thread is not None
+        DetectionJournal._thread.join(timeout=5)
+        DetectionJournal.record('front_door', [_PERSON])
+
+    self.assertIsNone(DetectionJournal._thread)
+    self.assertEqual(DetectionJournal._dropped, 10)
+
+  def test_noJournalDir_doesNothing(self):
+    with flagsaver.flagsaver((_DETECTION_JOURNAL_DIR, None)):
+      with DetectionJournal():
+        DetectionJournal.record('front_door', [_PERSON])
+
+    self.assertEmpty(os.listdir(self.temp_dir.name))
+
+  def test_partialRecord_isLeftOut(self):
+    with DetectionJournal():
+      DetectionJournal.record('front_door', [_PERSON])
+    segment_path = get_segment_paths(self.temp_dir.name)[0]
+    with open(segment_path, 'ab') as fp:
+      fp.write(b'partial')
+
+    self.assertLen(self._read_records(), 1)
+
+  def test_find(self):
+    MOCK_TIME_NS.side_effect = itertools.chain([100, 200, 200, 300], itertools.repeat(400))
+    with DetectionJournal():
+      for _ in range(4):
+        DetectionJournal.record('front_door', [_PERSON])
+
+    with JournalSegment(get_segment_paths(self.temp_dir.name)[0]) as segment:
+      self.assertEqual(segment.find(0), 0)
+      self.assertEqual(segment.find(200), 1)
+      self.assertEqual(segment.find(201), 3)
+      self.assertEqual(segment.find(400), 4)
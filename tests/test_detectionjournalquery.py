@@ -0,0 +1,94 @@
+import os
+import tempfile
+from typing import List, Tuple
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.detectionjournal import _RECORD, encode_camera, get_label_id
+from simple_jetson_nano_detection_server.detectionjournalquery import _get_summary, query
+
+
+class TestDetectionJournalQuery(parameterized.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.temp_dir = tempfile.TemporaryDirectory()
+    # Two records per segment, so the queries span several segments. The segment ids are not in lexicographic order.
+    cls._write_segment(cls.temp_dir.name, 900, [(1000, 'front_door', CocoLabel.PERSON),
+                                                (2000, 'backyard', CocoLabel.CAR)])
+    cls._write_segment(cls.temp_dir.name, 2500, [(3000, 'front_door', CocoLabel.CAR),
+                                                 (4000, 'front_door', CocoLabel.PERSON)])
+    cls._write_segment(cls.temp_dir.name, 10000, [(5000, 'backyard', CocoLabel.PERSON),
+                                                  (6000, 'front_door', CocoLabel.PERSON)])
+    return super().setUpClass()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.temp_dir.cleanup()
+    return super().tearDownClass()
+
+  @classmethod
+  def _write_segment(cls, journal_dir: str, segment_id: int, records: List[Tuple[int, str, CocoLabel]]) -> None:
+    with open(os.path.join(journal_dir, f'detections-{segment_id}.journal'), 'wb') as fp:
+      for timestamp_ns, camera, label in records:
+        fp.write(_RECORD.pack(timestamp_ns, encode_camera(camera), get_label_id(label), 0.5, 111, 164, 319, 319))
+
+  def test_noFilters_returnsAllDetections(self):
+    records = list(query(self.temp_dir.name))
+
+    self.assertEqual([r.timestamp_ns for r in records], [1000, 2000, 3000, 4000, 5000, 6000])
+    self.assertEqual(records[1].camera, 'backyard')
+    self.assertEqual(records[1].label, CocoLabel.CAR)
+    self.assertEqual((records[1].x_min, records[1].y_min, records[1].x_max, records[1].y_max), (111, 164, 319, 319))
+
+  @parameterized.named_parameters(
+      ('startOnly', 3000, None, [3000, 4000, 5000, 6000]),
+      ('endOnly', None, 3000, [1000, 2000]),
+      ('withinSegment', 2500, 3500, [3000]),
+      ('acrossSegments', 2000, 5001, [2000, 3000, 4000, 5000]),
+      ('beforeAll', 0, 1000, []),
+      ('afterAll', 6001, None, []),
+  )
+  def test_timeRange(self, start_ns, end_ns, expected_timestamps_ns):
+    records = query(self.temp_dir.name, start_ns=start_ns, end_ns=end_ns)
+
+    self.assertEqual([r.timestamp_ns for r in records], expected_timestamps_ns)
+
+  def test_timeRange_segmentsOutOfOrder(self):
+    with tempfile.TemporaryDirectory() as journal_dir:
+      # The clock was reset by restarts, so a segment can start later than the segments after it.
+      self._write_segment(journal_dir, 100, [(6000, 'front_door', CocoLabel.PERSON)])
+      self._write_segment(journal_dir, 200, [(100, 'front_door', CocoLabel.PERSON), (7000, 'backyard', CocoLabel.CAR)])
+      self._write_segment(journal_dir, 3000, [(3000, 'front_door', CocoLabel.CAR)])
+
+      records = query(journal_dir, end_ns=5000)
+
+      self.assertEqual([r.timestamp_ns for r in records], [100, 3000])
+
+  def test_label(self):
+    records = query(self.temp_dir.name, label=CocoLabel.CAR)
+
+    self.assertEqual([r.timestamp_ns for r in records], [2000, 3000])
+
+  def test_camera(self):
+    records = query(self.temp_dir.name, camera='backyard')
+
+    self.assertEqual([r.timestamp_ns for r in records], [2000, 5000])
+
+  def test_allFilters(self):
+    records = query(self.temp_dir.name, start_ns=2000, end_ns=6000, label=CocoLabel.PERSON, camera='front_door')
+
+    self.assertEqual([r.timestamp_ns for r in records], [4000])
+
+  def test_getSummary(self):
+    self.assertEqual(_get_summary(query(self.temp_dir.name)), {
+        'backyard': {
+            'car': 1,
+            'person': 1,
+        },
+        'front_door': {
+            'car': 1,
+            'person': 3,
+        },
+    })
@@ -1,4 +1,5 @@
 import json
+from enum import Enum, auto
 from unittest.mock import Mock, patch
 
 from absl import logging
@@ -7,15 +8,21 @@ from absl.testing import flagsaver, parameterized
 
 from simple_jetson_nano_detection_server.detectionrequesthandler import _LOG_RESPONSE, DetectionRequestHandler
 from simple_jetson_nano_detection_server.imagedataextractor import ImageDataExtractor
+from simple_jetson_nano_detection_server.inferencescheduler import CameraOverloadedError, InferenceScheduler
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
 from simple_jetson_nano_detection_server.prediction import Prediction
-from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+from simple_jetson_nano_detection_server.predictorpool import PredictorPool
 
 MOCK_GET_FIRST_IMAGE_DATA = Mock()
 MOCK_PREDICT = Mock()
 
 
+class _Checkpoint(Enum):
+  COMPUTE_RESPONSE = auto()
+
+
 @patch.object(ImageDataExtractor, ImageDataExtractor.get_first_image_data.__name__, MOCK_GET_FIRST_IMAGE_DATA)
-@patch.object(YoloPredictor, YoloPredictor.predict.__name__, MOCK_PREDICT)
+@patch.object(PredictorPool, PredictorPool.predict.__name__, MOCK_PREDICT)
 class TestDetectionRequestHandler(parameterized.TestCase):
 
   def setUp(self):
@@ -40,7 +47,7 @@ class TestDetectionRequestHandler(parameterized.TestCase):
     return super().tearDown()
 
   def test_success_returnsSuccessResponse(self):
-    response = DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary')
+    response = DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary', 'camera', None)
 
     MOCK_GET_FIRST_IMAGE_DATA.assert_called_once_with(b'request-body', 'multipart_boundary')
     MOCK_PREDICT.assert_called_once_with(b'image-data')
@@ -80,24 +87,30 @@ class TestDetectionRequestHandler(parameterized.TestCase):
     MOCK_GET_FIRST_IMAGE_DATA.side_effect = ValueError('ImageDataExtractor.get_first_image_data failed')
 
     with self.assertLogs(logger='absl', level=absl_to_standard(logging.ERROR)) as logs:
-      response = DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary')
+      response = DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary', 'camera', None)
 
     self.assertContainsInOrder(['Detection failed', 'ImageDataExtractor.get_first_image_data failed'], logs.output[0])
     self.assertJsonEqual(response, json.dumps({'predictions': [], 'success': False}))
 
   def test_predictionFailure_logsAndReturnsFailureResponse(self):
-    MOCK_GET_FIRST_IMAGE_DATA.side_effect = ValueError('YoloPredictor.predict failed')
+    MOCK_GET_FIRST_IMAGE_DATA.side_effect = ValueError('PredictorPool.predict failed')
 
     with self.assertLogs(logger='absl', level=absl_to_standard(logging.ERROR)) as logs:
-      response = DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary')
+      response = DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary', 'camera', None)
 
-    self.assertContainsInOrder(['Detection failed', 'YoloPredictor.predict failed'], logs.output[0])
+    self.assertContainsInOrder(['Detection failed', 'PredictorPool.predict failed'], logs.output[0])
     self.assertJsonEqual(response, json.dumps({'predictions': [], 'success': False}))
 
+  def test_cameraOverloaded_raises(self):
+    with patch.object(InferenceScheduler, InferenceScheduler.predict.__name__,
+                      Mock(side_effect=CameraOverloadedError('Camera "camera" already has 1 outstanding requests'))):
+      with self.assertRaisesRegex(CameraOverloadedError, 'already has 1 outstanding requests'):
+        DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary', 'camera', None)
+
   @flagsaver.as_parsed((_LOG_RESPONSE, str(True)))
   def test_logResponseEnabled_logsResponse(self):
     with self.assertLogs(logger='absl', level=absl_to_standard(logging.INFO)) as logs:
-      DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary')
+      DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary', 'camera', None)
 
     self.assertContainsInOrder([
         "response={",
@@ -109,3 +122,16 @@ class TestDetectionRequestHandler(parameterized.TestCase):
         "'success': True",
         "}",
     ], logs.output[0])
+
+  def test_currentTracker_tracksNestedSpans(self):
+    tracker: PerformanceTracker[_Checkpoint] = PerformanceTracker()
+
+    with tracker(_Checkpoint.COMPUTE_RESPONSE), tracker.as_current():
+      DetectionRequestHandler.get_response(b'request-body', 'multipart_boundary', 'camera', None)
+
+    self.assertListEqual(list(tracker.get_latencies_ns().keys()), [
+        'compute_response',
+        'compute_response.extract_image_data',
+        'compute_response.predict',
+        'compute_response.encode_response',
+    ])
@@ -0,0 +1,142 @@
+import json
+import socket
+import struct
+import threading
+from typing import Any, List, Optional, Tuple
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.detectionrequesthandler import DetectionRequestHandler
+from simple_jetson_nano_detection_server.detectionstreamhandler import (_DETECTION_STREAM_MAX_FRAME_BYTES,
+                                                                        _DETECTION_STREAM_MAX_PENDING_FRAMES,
+                                                                        DetectionStreamHandler)
+from simple_jetson_nano_detection_server.inferencescheduler import CameraOverloadedError
+from simple_jetson_nano_detection_server.requesttracer import _REQUEST_TRACE_WINDOW_S
+from simple_jetson_nano_detection_server.websocket import (CLOSE_UNSUPPORTED_DATA, OPCODE_BINARY, OPCODE_TEXT,
+                                                           WebSocketConnection)
+
+MOCK_GET_RESPONSE = Mock()
+
+
+@patch.object(DetectionRequestHandler, DetectionRequestHandler.get_response.__name__, MOCK_GET_RESPONSE)
+class TestDetectionStreamHandler(parameterized.TestCase):
+
+  def setUp(self):
+    self.call_args: List[Tuple[Any, ...]] = []
+    # Blocks the predictions of the images listed, until the event is set.
+    self.blocked_images: List[bytes] = []
+    self.unblock = threading.Event()
+    self.blocked = threading.Event()
+
+    def get_response(image_data: bytes, multipart_boundary: Optional[str], camera: str,
+                     deadline_ns: Optional[int]) -> bytes:
+      self.call_args.append((image_data, multipart_boundary, camera, deadline_ns))
+      if image_data in self.blocked_images:
+        self.blocked.set()
+        self.unblock.wait(timeout=5)
+      if image_data == b'overloaded-image':
+        raise CameraOverloadedError('Camera "front_door" already has 1 outstanding requests')
+      return b'{"predictions": [], "success": true}'
+
+    MOCK_GET_RESPONSE.side_effect = get_response
+
+    self.saved_flags = flagsaver.as_parsed(
+        (_DETECTION_STREAM_MAX_PENDING_FRAMES, str(1)),
+        (_DETECTION_STREAM_MAX_FRAME_BYTES, str(100)),
+        (_REQUEST_TRACE_WINDOW_S, str(0)),
+    )
+    self.saved_flags.__enter__()
+
+    self.server_socket, self.client_socket = socket.socketpair()
+    self.server_files = (self.server_socket.makefile('rb'), self.server_socket.makefile('wb'))
+    self.client = WebSocketConnection(self.client_socket.makefile('rb'),
+                                      self.client_socket.makefile('wb'),
+                                      max_message_bytes=100000,
+                                      is_client=True)
+    self.server_thread = threading.Thread(target=DetectionStreamHandler.serve,
+                                          args=(*self.server_files, 'front_door'),
+                                          name='detection-stream-server')
+    self.server_thread.start()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.unblock.set()
+    self.client.close()
+    self.server_thread.join(timeout=5)
+    self.client.close_streams()
+    for f in self.server_files:
+      f.close()
+    self.server_socket.close()
+    self.client_socket.close()
+
+    self.saved_flags.__exit__(None, None, None)
+    MOCK_GET_RESPONSE.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  def _receive_json(self) -> Any:
+    opcode, message = self.client.receive()
+    self.assertEqual(opcode, OPCODE_TEXT)
+    return json.loads(message)
+
+  def test_frames_areRespondedWithSequence(self):
+    for image_data in (b'image-0', b'image-1', b'image-2'):
+      self.client.send(OPCODE_BINARY, image_data)
+      self.assertEqual(self._receive_json()['sequence'], len(self.call_args) - 1)
+
+    self.assertEqual(self.call_args, [
+        (b'image-0', None, 'front_door', None),
+        (b'image-1', None, 'front_door', None),
+        (b'image-2', None, 'front_door', None),
+    ])
+
+  def test_response_isTheSameAsHttp(self):
+    self.client.send(OPCODE_BINARY, b'image-0')
+
+    self.assertEqual(self._receive_json(), {'sequence': 0, 'predictions': [], 'success': True})
+
+  def test_rejected_respondsRejection(self):
+    self.client.send(OPCODE_BINARY, b'overloaded-image')
+
+    self.assertEqual(
+        self._receive_json(), {
+            'sequence': 0,
+            'response_code': 429,
+            'class': 'CameraOverloadedError',
+            'message': 'Camera "front_door" already has 1 outstanding requests',
+        })
+
+  def test_tooManyPendingFrames_dropsOldest(self):
+    self.blocked_images.append(b'image-0')
+    self.client.send(OPCODE_BINARY, b'image-0')
+    self.assertTrue(self.blocked.wait(timeout=5))
+    # image-1 waits while image-0 is predicting, until image-2 arrives.
+    self.client.send(OPCODE_BINARY, b'image-1')
+    self.client.send(OPCODE_BINARY, b'image-2')
+
+    self.assertEqual(self._receive_json(), {'sequence': 1, 'dropped': True})
+    self.unblock.set()
+    self.assertEqual([self._receive_json()['sequence'] for _ in range(2)], [0, 2])
+    self.assertEqual([args[0] for args in self.call_args], [b'image-0', b'image-2'])
+
+  def test_textMessage_closesStream(self):
+    self.client.send(OPCODE_TEXT, b'image-0')
+
+    self.assertEqual(self.client_socket.recv(4)[2:], struct.pack('>H', CLOSE_UNSUPPORTED_DATA))
+    self.client.close()
+    self.server_thread.join(timeout=5)
+    self.assertFalse(self.server_thread.is_alive())
+    MOCK_GET_RESPONSE.assert_not_called()
+
+  def test_closed_dropsPendingFrames(self):
+    self.blocked_images.append(b'image-0')
+    self.client.send(OPCODE_BINARY, b'image-0')
+    self.assertTrue(self.blocked.wait(timeout=5))
+    self.client.send(OPCODE_BINARY, b'image-1')
+    self.client.close()
+
+    self.unblock.set()
+    self.server_thread.join(timeout=5)
+
+    self.assertFalse(self.server_thread.is_alive())
+    self.assertEqual([args[0] for args in self.call_args], [b'image-0'])
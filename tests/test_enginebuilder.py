@@ -0,0 +1,150 @@
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.enginebuilder import EngineBuilder
+from simple_jetson_nano_detection_server.enginemanifest import EngineManifest, EngineSpec
+
+
+def _write_file(path: str, content: bytes) -> None:
+  with open(path, 'wb') as fp:
+    fp.write(content)
+
+
+def _fake_export_onnx(weights_path: str, image_size: int, batch_size: int, onnx_path: str) -> None:
+  _write_file(onnx_path, f'onnx:{os.path.basename(weights_path)}:{image_size}:{batch_size}'.encode())
+
+
+def _fake_export_engine(onnx_path: str, half: bool, engine_path: str) -> None:
+  _write_file(engine_path, f'engine:{os.path.basename(onnx_path)}:{half}'.encode())
+
+
+MOCK_EXPORT_ONNX = Mock()
+MOCK_EXPORT_ENGINE = Mock()
+MOCK_DOWNLOAD_WEIGHTS = Mock()
+
+
+@patch.object(EngineBuilder, EngineBuilder._export_onnx.__name__, MOCK_EXPORT_ONNX)
+@patch.object(EngineBuilder, EngineBuilder._export_engine.__name__, MOCK_EXPORT_ENGINE)
+@patch.object(EngineBuilder, EngineBuilder._download_weights.__name__, MOCK_DOWNLOAD_WEIGHTS)
+class TestEngineBuilder(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_EXPORT_ONNX.side_effect = _fake_export_onnx
+    MOCK_EXPORT_ENGINE.side_effect = _fake_export_engine
+    MOCK_DOWNLOAD_WEIGHTS.side_effect = lambda path: _write_file(path, b'downloaded-weights')
+
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.models_dir = self.temp_dir.name
+    self.manifest_path = os.path.join(self.models_dir, 'manifest.json')
+    os.makedirs(os.path.join(self.models_dir, 'pytorch'))
+    _write_file(os.path.join(self.models_dir, 'pytorch', 'yolo11n.pt'), b'yolo11n-weights')
+    _write_file(os.path.join(self.models_dir, 'pytorch', 'yolo11s.pt'), b'yolo11s-weights')
+
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    MOCK_EXPORT_ONNX.reset_mock(return_value=True, side_effect=True)
+    MOCK_EXPORT_ENGINE.reset_mock(return_value=True, side_effect=True)
+    MOCK_DOWNLOAD_WEIGHTS.reset_mock(return_value=True, side_effect=True)
+    self.temp_dir.cleanup()
+    return super().tearDown()
+
+  def _build(self, *specs: str, workers: int = 1) -> int:
+    return EngineBuilder.build([EngineSpec.parse(s) for s in specs], self.models_dir,
+                               EngineManifest(self.manifest_path), workers)
+
+  def _path(self, *parts: str) -> str:
+    return os.path.join(self.models_dir, *parts)
+
+  def test_buildsEnginesAndWritesManifest(self):
+    self.assertEqual(self._build('yolo11n:320:fp16:1', 'yolo11s:640:fp32:4'), 2)
+
+    MOCK_EXPORT_ENGINE.assert_any_call(self._path('onnx', 'yolo11n-320.onnx'), True,
+                                       self._path('tensorrt', 'yolo11n-320-fp16.engine'))
+    MOCK_EXPORT_ENGINE.assert_any_call(self._path('onnx', 'yolo11s-640-b4.onnx'), False,
+                                       self._path('tensorrt', 'yolo11s-640-fp32-b4.engine'))
+
+    manifest = EngineManifest(self.manifest_path)
+    self.assertEqual(manifest.get_engine_path(EngineSpec.parse('yolo11n:320:fp16:1')),
+                     self._path('tensorrt', 'yolo11n-320-fp16.engine'))
+    self.assertEqual(manifest.get_engine_path(EngineSpec.parse('yolo11s:640:fp32:4')),
+                     self._path('tensorrt', 'yolo11s-640-fp32-b4.engine'))
+
+  def test_upToDate_skipsBuild(self):
+    self._build('yolo11n:320:fp16:1')
+    MOCK_EXPORT_ONNX.reset_mock()
+    MOCK_EXPORT_ENGINE.reset_mock()
+
+    self.assertEqual(self._build('yolo11n:320:fp16:1'), 0)
+
+    MOCK_EXPORT_ONNX.assert_not_called()
+    MOCK_EXPORT_ENGINE.assert_not_called()
+
+  def test_weightsChanged_rebuilds(self):
+    self._build('yolo11n:320:fp16:1')
+    MOCK_EXPORT_ENGINE.reset_mock()
+    _write_file(self._path('pytorch', 'yolo11n.pt'), b'yolo11n-fine-tuned-weights')
+
+    self.assertEqual(self._build('yolo11n:320:fp16:1'), 1)
+    MOCK_EXPORT_ENGINE.assert_called_once()
+
+  def test_modelsWithSameWeights_buildSeparateEngines(self):
+    _write_file(self._path('pytorch', 'yolo11n-copy.pt'), b'yolo11n-weights')
+
+    self.assertEqual(self._build('yolo11n:320:fp16:1', 'yolo11n-copy:320:fp16:1'), 2)
+
+    manifest = EngineManifest(self.manifest_path)
+    self.assertEqual(manifest.get_engine_path(EngineSpec.parse('yolo11n:320:fp16:1')),
+                     self._path('tensorrt', 'yolo11n-320-fp16.engine'))
+    self.assertEqual(manifest.get_engine_path(EngineSpec.parse('yolo11n-copy:320:fp16:1')),
+                     self._path('tensorrt', 'yolo11n-copy-320-fp16.engine'))
+
+  def test_engineFileDeleted_rebuilds(self):
+    self._build('yolo11n:320:fp16:1')
+    MOCK_EXPORT_ENGINE.reset_mock()
+    os.remove(self._path('tensorrt', 'yolo11n-320-fp16.engine'))
+
+    self.assertEqual(self._build('yolo11n:320:fp16:1'), 1)
+    MOCK_EXPORT_ENGINE.assert_called_once()
+
+  def test_onlyNewSpec_isBuilt(self):
+    self._build('yolo11n:320:fp16:1')
+    MOCK_EXPORT_ENGINE.reset_mock()
+
+    self.assertEqual(self._build('yolo11n:320:fp16:1', 'yolo11n:320:fp16:2'), 1)
+    MOCK_EXPORT_ENGINE.assert_called_once_with(self._path('onnx', 'yolo11n-320-b2.onnx'), True,
+                                               self._path('tensorrt', 'yolo11n-320-fp16-b2.engine'))
+
+  def test_specsDifferingInPrecision_shareOnnxExport(self):
+    self._build('yolo11n:320:fp16:1', 'yolo11n:320:fp32:1')
+
+    MOCK_EXPORT_ONNX.assert_called_once_with(self._path('pytorch', 'yolo11n.pt'), 320, 1,
+                                             self._path('onnx', 'yolo11n-320.onnx'))
+    self.assertEqual(MOCK_EXPORT_ENGINE.call_count, 2)
+
+  def test_missingWeights_downloads(self):
+    self._build('yolo11m:320:fp16:1')
+
+    MOCK_DOWNLOAD_WEIGHTS.assert_called_once_with(self._path('pytorch', 'yolo11m.pt'))
+    MOCK_EXPORT_ENGINE.assert_called_once()
+
+  def test_parallelOnnxExports_exportsAllFiles(self):
+    self.assertEqual(self._build('yolo11n:320:fp16:1', 'yolo11s:320:fp16:1', 'yolo11s:640:fp16:1', workers=2), 3)
+
+    with open(self._path('onnx', 'yolo11n-320.onnx'), 'rb') as fp:
+      self.assertEqual(fp.read(), b'onnx:yolo11n.pt:320:1')
+    with open(self._path('onnx', 'yolo11s-320.onnx'), 'rb') as fp:
+      self.assertEqual(fp.read(), b'onnx:yolo11s.pt:320:1')
+    with open(self._path('onnx', 'yolo11s-640.onnx'), 'rb') as fp:
+      self.assertEqual(fp.read(), b'onnx:yolo11s.pt:640:1')
+
+  def test_exportFails_keepsPreviouslyBuiltEngines(self):
+    MOCK_EXPORT_ENGINE.side_effect = [None, RuntimeError('Failed to build engine')]
+
+    with self.assertRaisesWithLiteralMatch(RuntimeError, 'Failed to build engine'):
+      self._build('yolo11n:320:fp16:1', 'yolo11s:320:fp16:1')
+
+    self.assertLen(EngineManifest(self.manifest_path)._entries, 1)
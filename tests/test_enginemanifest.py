@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.enginemanifest import EngineManifest, EngineManifestEntry, EngineSpec
+
+
+def _build_entry(engine_path: str, built_at_ns: int, precision: str = 'fp16') -> EngineManifestEntry:
+  return EngineManifestEntry(
+      model='yolo11s',
+      image_size=320,
+      precision=precision,
+      batch_size=1,
+      weights_path='pytorch/yolo11s.pt',
+      weights_sha256='weights-sha256',
+      onnx_path='onnx/yolo11s-320.onnx',
+      engine_path=engine_path,
+      built_at_ns=built_at_ns,
+  )
+
+
+class TestEngineSpec(parameterized.TestCase):
+
+  def test_parse(self):
+    self.assertEqual(EngineSpec.parse('yolo11s:320:fp16:1'), EngineSpec('yolo11s', 320, 'fp16', 1))
+
+  @parameterized.parameters(
+      ('yolo11s:320:fp16',),
+      ('yolo11s:320:fp16:1:1',),
+      (':320:fp16:1',),
+      ('yolo11s:0:fp16:1',),
+      ('yolo11s:320:int8:1',),
+      ('yolo11s:320:fp16:0',),
+      ('yolo11s:abc:fp16:1',),
+  )
+  def test_parseInvalidSpec_raises(self, spec: str):
+    with self.assertRaises(Exception):
+      EngineSpec.parse(spec)
+
+  @parameterized.parameters(
+      ('yolo11s:320:fp16:1', 'yolo11s-320-fp16', True),
+      ('yolo11s:640:fp32:4', 'yolo11s-640-fp32-b4', False),
+  )
+  def test_nameAndHalf(self, spec: str, name: str, half: bool):
+    self.assertEqual(EngineSpec.parse(spec).name, name)
+    self.assertEqual(EngineSpec.parse(spec).half, half)
+    self.assertEqual(str(EngineSpec.parse(spec)), spec)
+
+
+class TestEngineManifest(parameterized.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.manifest_path = os.path.join(self.temp_dir.name, 'manifest.json')
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.temp_dir.cleanup()
+    return super().tearDown()
+
+  def _create_file(self, name: str) -> str:
+    path = os.path.join(self.temp_dir.name, name)
+    with open(path, 'wb') as fp:
+      fp.write(b'engine')
+    return path
+
+  def test_saveAndLoad(self):
+    entry = _build_entry(self._create_file('a.engine'), 1)
+    manifest = EngineManifest(self.manifest_path)
+    manifest.put('key', entry)
+    manifest.save()
+
+    self.assertEqual(EngineManifest(self.manifest_path).get('key'), entry)
+    self.assertFalse(os.path.exists(self.manifest_path + '.tmp'))
+
+  def test_missingFile_isEmpty(self):
+    self.assertIsNone(EngineManifest(self.manifest_path).get('key'))
+
+  def test_getEnginePath_returnsMostRecentExistingEngine(self):
+    manifest = EngineManifest(self.manifest_path)
+    manifest.put('old', _build_entry(self._create_file('old.engine'), 1))
+    manifest.put('new', _build_entry(self._create_file('new.engine'), 3))
+    manifest.put('deleted', _build_entry(os.path.join(self.temp_dir.name, 'deleted.engine'), 5))
+    manifest.put('fp32', _build_entry(self._create_file('fp32.engine'), 7, precision='fp32'))
+
+    self.assertEqual(manifest.get_engine_path(EngineSpec.parse('yolo11s:320:fp16:1')),
+                     os.path.join(self.temp_dir.name, 'new.engine'))
+
+  def test_getEnginePath_noMatch_raises(self):
+    with self.assertRaisesWithLiteralMatch(Exception,
+                                           f'No engine file for yolo11s:320:fp16:1 was found in {self.manifest_path}'):
+      EngineManifest(self.manifest_path).get_engine_path(EngineSpec.parse('yolo11s:320:fp16:1'))
@@ -0,0 +1,148 @@
+import os
+import signal
+import threading
+import time
+from typing import List
+from unittest.mock import Mock, call, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.enginereloader import EngineReloader
+from simple_jetson_nano_detection_server.predictorpool import PREDICTOR_POOL_SIZE, PredictorPool
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.warmuprunner import WarmupRunner
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+MOCK_LOAD_MODEL = Mock()
+MOCK_WARMUP_RUN_PREDICTORS = Mock()
+
+
+@patch.object(EngineReloader, EngineReloader._load_model.__name__, MOCK_LOAD_MODEL)
+@patch.object(WarmupRunner, WarmupRunner.run_predictors.__name__, MOCK_WARMUP_RUN_PREDICTORS)
+class TestEngineReloader(parameterized.TestCase):
+
+  def setUp(self):
+    self.saved_flags = flagsaver.as_parsed((PREDICTOR_POOL_SIZE, str(2)))
+    self.saved_flags.__enter__()
+
+    self.current_predictor = YoloPredictor(Mock(name='current-model'))
+    self.new_models = [Mock(name='new-model-1'), Mock(name='new-model-2')]
+    PredictorPool.set_predictors([self.current_predictor])
+    MOCK_LOAD_MODEL.side_effect = self.new_models
+    MOCK_WARMUP_RUN_PREDICTORS.return_value = 3
+
+    ServerReadiness.set_ready()
+    ServerStats.reset()
+    EngineReloader._last_reload = None
+
+    self.engine_reloader = EngineReloader(lambda: 'default.engine')
+    self.engine_reloader.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.engine_reloader.__exit__(None, None, None)
+    MOCK_LOAD_MODEL.reset_mock(return_value=True, side_effect=True)
+    MOCK_WARMUP_RUN_PREDICTORS.reset_mock(return_value=True, side_effect=True)
+    ServerReadiness.set_not_ready()
+    ServerStats.reset()
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def _get_pool_models(self) -> List[Mock]:
+    return [predictor.model for predictor in PredictorPool._predictors]
+
+  def test_reload_switchesModels(self):
+    self.assertTrue(EngineReloader.start('new.engine'))
+    EngineReloader.join()
+
+    # The engine is loaded once for each predictor.
+    self.assertEqual(MOCK_LOAD_MODEL.call_args_list, [call('new.engine'), call('new.engine')])
+    self.assertEqual(self._get_pool_models(), self.new_models)
+    self.assertEqual(ServerStats.get_stats()['engines'], ['new.engine'])
+
+    status = EngineReloader.get_status()
+    self.assertIsNone(status['running'])
+    self.assertTrue(status['last_reload']['success'])
+    self.assertEqual(status['last_reload']['warmup_iterations'], 3)
+    self.assertEqual(status['last_reload']['latencies_ns'].keys(), {'load_engine', 'warmup', 'drain', 'release'})
+
+  def test_reload_warmsUpNewModels(self):
+    EngineReloader.start('new.engine')
+    EngineReloader.join()
+
+    predictors = MOCK_WARMUP_RUN_PREDICTORS.call_args.args[0]
+    self.assertEqual([predictor.model for predictor in predictors], self.new_models)
+
+  def test_warmupFailure_keepsCurrentModel(self):
+    MOCK_WARMUP_RUN_PREDICTORS.side_effect = RuntimeError('Engine was built for another image size')
+
+    EngineReloader.start('new.engine')
+    EngineReloader.join()
+
+    self.assertEqual(PredictorPool._predictors, [self.current_predictor])
+    self.assertEqual(ServerStats.get_stats()['engines'], [])
+    last_reload = EngineReloader.get_status()['last_reload']
+    self.assertFalse(last_reload['success'])
+    self.assertEqual(last_reload['error'], 'RuntimeError: Engine was built for another image size')
+    self.assertEqual(last_reload['latencies_ns'].keys(), {'load_engine', 'warmup'})
+
+  def test_inFlightPrediction_delaysRelease(self):
+    predicting = threading.Event()
+    release = threading.Event()
+
+    def predict(*args, **kwargs):
+      predicting.set()
+      release.wait(timeout=5)
+      return []
+
+    with patch.object(self.current_predictor, YoloPredictor.predict.__name__, Mock(side_effect=predict)):
+      prediction_thread = threading.Thread(target=PredictorPool.predict, args=(b'image-data',))
+      prediction_thread.start()
+      predicting.wait(timeout=5)
+
+      EngineReloader.start('new.engine')
+      for _ in range(500):
+        if EngineReloader.get_status()['running'] == {'engine_path': 'new.engine', 'stage': 'drain'}:
+          break
+        time.sleep(0.01)
+      # The new models serve the new predictions while the replaced model is still predicting.
+      self.assertEqual(self._get_pool_models(), self.new_models)
+      self.assertTrue(EngineReloader.is_running())
+
+      release.set()
+      prediction_thread.join(timeout=5)
+      EngineReloader.join()
+
+    self.assertTrue(EngineReloader.get_status()['last_reload']['success'])
+
+  def test_alreadyRunning_returnsFalse(self):
+    warming_up = threading.Event()
+    release = threading.Event()
+
+    def run_predictors(predictors) -> int:
+      warming_up.set()
+      release.wait(timeout=5)
+      return 3
+
+    MOCK_WARMUP_RUN_PREDICTORS.side_effect = run_predictors
+
+    self.assertTrue(EngineReloader.start('new.engine'))
+    self.assertTrue(warming_up.wait(timeout=5))
+    self.assertFalse(EngineReloader.start('another.engine'))
+    release.set()
+    EngineReloader.join()
+
+    MOCK_LOAD_MODEL.assert_called_with('new.engine')
+
+  def test_notReady_returnsFalse(self):
+    ServerReadiness.set_not_ready()
+
+    self.assertFalse(EngineReloader.start('new.engine'))
+
+  def test_sighup_reloadsDefaultEngine(self):
+    os.kill(os.getpid(), signal.SIGHUP)
+    EngineReloader.join()
+
+    MOCK_LOAD_MODEL.assert_called_with('default.engine')
+    self.assertEqual(self._get_pool_models(), self.new_models)
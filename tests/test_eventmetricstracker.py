@@ -5,6 +5,7 @@ from unittest.mock import Mock, patch
 from absl.testing import parameterized
 
 from simple_jetson_nano_detection_server.eventmetricstracker import EventMetricsTracker
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
 
 
 class _EventMetricsField(Enum):
@@ -93,3 +94,20 @@ class TestEventMetricsTracker(parameterized.TestCase):
         'm,tag1=value1 field_1=111i 1700000000000000000',
         'm,tag1=value2 field_1=222i 1700000000000000000',
     ])
+
+  @patch.object(MetricsAggregator, MetricsAggregator.increment.__name__)
+  def test_aggregate_groupsFieldsByTags(self, mock_increment: Mock):
+    self.tracker.increment(_EventMetricsField.FIELD_1, 11, {'tag1': 'value1'})
+    self.tracker.increment(_EventMetricsField.FIELD_2, 22, {'tag1': 'value1'})
+    self.tracker.increment(_EventMetricsField.FIELD_1, 33, {'tag1': 'value2'})
+
+    self.tracker.aggregate('m', {'tag2': 2})
+
+    self.assertEqual([c.args for c in mock_increment.call_args_list], [
+        ('m', {'field_1': 11, 'field_2': 22}, {'tag1': 'value1', 'tag2': 2}),
+        ('m', {'field_1': 33}, {'tag1': 'value2', 'tag2': 2}),
+    ])
+
+  def test_aggregateWithEmptyTracker_raises(self):
+    with self.assertRaisesWithLiteralMatch(Exception, 'Nothing to aggregate'):
+      self.tracker.aggregate('m')
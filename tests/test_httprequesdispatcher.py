@@ -3,7 +3,7 @@ from contextlib import ExitStack
 from http.server import HTTPServer
 from multiprocessing import Manager, Process
 from queue import Queue
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from unittest.mock import Mock, patch
 
 import requests
@@ -11,8 +11,22 @@ from absl.testing import flagsaver, parameterized
 from influxdb_client.client.write.point import Point
 from line_protocol_cache.lineprotocolcache import LineProtocolCache
 
+from simple_jetson_nano_detection_server.adminrequesthandler import _PROFILER_MAX_DURATION_S, ENABLE_ADMIN_ENDPOINTS
 from simple_jetson_nano_detection_server.detectionrequesthandler import DetectionRequestHandler
-from simple_jetson_nano_detection_server.httprequesdispatcher import _MAX_CONTENT_LENGTH, HttpRequestDispatcher
+from simple_jetson_nano_detection_server.detectionstreamhandler import (_DETECTION_STREAM_MAX_FRAME_BYTES,
+                                                                        _DETECTION_STREAM_MAX_PENDING_FRAMES)
+from simple_jetson_nano_detection_server.httprequesdispatcher import (_CAMERA_ID_HEADER, _DEADLINE_HEADER,
+                                                                      _MAX_CONTENT_LENGTH, HttpRequestDispatcher)
+from simple_jetson_nano_detection_server.inferencescheduler import (CameraOverloadedError, DeadlineExceededError,
+                                                                    RequestSupersededError)
+from simple_jetson_nano_detection_server.metricsaggregator import (_FLUSH_BATCH_SIZE, _FLUSH_INTERVAL_S, _RAW_POINTS,
+                                                                   MetricsAggregator)
+from simple_jetson_nano_detection_server.requesttracer import _REQUEST_TRACE_WINDOW_S
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.slowrequestrecorder import _SLOW_REQUESTS_PER_WINDOW
+from simple_jetson_nano_detection_server.trafficrecorder import TrafficRecorder
+from simple_jetson_nano_detection_server.websocket import OPCODE_BINARY, WebSocketConnection
 
 
 class TestHttpRequestDispatcher(parameterized.TestCase):
@@ -20,14 +34,29 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
   SERVER_PORT = 42069
 
   def setUp(self):
-    self.saved_flags = flagsaver.as_parsed((_MAX_CONTENT_LENGTH, str(10)))
+    # Flush after every request so each request produces the data points of its own stages.
+    self.saved_flags = flagsaver.as_parsed(
+        (_MAX_CONTENT_LENGTH, str(10)),
+        (_CAMERA_ID_HEADER, 'X-Camera-Id'),
+        (_DEADLINE_HEADER, 'X-Request-Deadline-Ms'),
+        (ENABLE_ADMIN_ENDPOINTS, str(False)),
+        (_SLOW_REQUESTS_PER_WINDOW, str(0)),
+        (_REQUEST_TRACE_WINDOW_S, str(0)),
+        (_FLUSH_INTERVAL_S, str(3600)),
+        (_FLUSH_BATCH_SIZE, str(1)),
+        (_RAW_POINTS, str(False)),
+        (_DETECTION_STREAM_MAX_PENDING_FRAMES, str(1)),
+        (_DETECTION_STREAM_MAX_FRAME_BYTES, str(10)),
+    )
     self.saved_flags.__enter__()
 
     self.manager = Manager()
     self.call_args = self.manager.Queue()
     self.line_protocol_cache: Queue[Point] = self.manager.Queue()
+    self.traffic_records: Queue[Tuple[bytes, int, bytes]] = self.manager.Queue()
 
-    self.server_process = Process(target=self._run_server, args=(self.call_args, self.line_protocol_cache))
+    self.server_process = Process(target=self._run_server,
+                                  args=(self.call_args, self.line_protocol_cache, self.traffic_records))
     self.server_process.start()
 
     for _ in range(100):
@@ -40,21 +69,41 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
     raise TimeoutError('HTTP server did not become ready')
 
   @classmethod
-  def _run_server(cls, call_args: 'Queue[Any]', line_protocol_cache: 'Queue[Point]') -> None:
+  def _run_server(cls, call_args: 'Queue[Any]', line_protocol_cache: 'Queue[Point]',
+                  traffic_records: 'Queue[Tuple[bytes, int, bytes]]') -> None:
+
+    # The camera of the request decides whether the handler rejects it.
+    rejections = {
+        'overloaded-camera': CameraOverloadedError('Camera "overloaded-camera" already has 1 outstanding requests'),
+        'superseded-camera': RequestSupersededError('A newer request from camera "superseded-camera" arrived'),
+        'expired-camera': DeadlineExceededError('Deadline exceeded while the request was queued'),
+    }
 
-    def put_call_args(*args: Tuple[Any, ...]) -> str:
+    def put_call_args(*args: Tuple[Any, ...]) -> Optional[bytes]:
       call_args.put(args)
-      return ''
+      if args[2] in rejections:
+        raise rejections[args[2]]
+      # Writing the response raises, as it does when the client disconnects.
+      if args[2] == 'unsendable-camera':
+        return None
+      return b''
 
-    def put_line_protocol_cache(point: Point) -> None:
-      line_protocol_cache.put(point)
+    def put_line_protocol_cache(points: List[Point]) -> None:
+      for point in points:
+        line_protocol_cache.put(point)
+
+    def put_traffic_record(latencies_ns: Dict[str, int], headers: Dict[str, str], request_body: bytes,
+                           response_code: int, response: bytes) -> None:
+      traffic_records.put((request_body, response_code, response))
 
     context_managers = [
         patch.object(LineProtocolCache, LineProtocolCache.put.__name__, Mock(side_effect=put_line_protocol_cache)),
         patch.object(DetectionRequestHandler, DetectionRequestHandler.get_response.__name__,
                      Mock(side_effect=put_call_args)),
+        patch.object(TrafficRecorder, TrafficRecorder.record.__name__, Mock(side_effect=put_traffic_record)),
         patch.object(time, time.time_ns.__name__, Mock(return_value=1700000000000000000)),
         patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[42, 69, 100, 420, 500, 690, 1000, 4200])),
+        MetricsAggregator(),
     ]
 
     # Need to patch immediately before the server starts because this function runs in a different process.
@@ -62,6 +111,8 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
       for cm in context_managers:
         stack.enter_context(cm)
 
+      ServerReadiness.set_ready()
+      ServerStats.reset()
       server = HTTPServer((cls.SERVER_IP, cls.SERVER_PORT), HttpRequestDispatcher)
       server.serve_forever()
 
@@ -76,6 +127,9 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
   def _assertDictContainsSubset(self, subset: Dict[Any, Any], dictionary: Dict[Any, Any], msg: object = None) -> None:
     self.assertEqual(dictionary, {**dictionary, **subset}, msg)
 
+  def _get_line_protocols(self, count: int) -> List[str]:
+    return [self.line_protocol_cache.get(timeout=5).to_line_protocol() for _ in range(count)]
+
   def test_invalidPath_returns404(self):
     r = requests.post(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/invalid-path')
 
@@ -90,10 +144,10 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
 
     self.assertEqual(r.status_code, 400)
     self._assertDictContainsSubset({'message': 'Expected Content-Length to be > 0'}, r.json())
-    self.assertEqual(
-        self.line_protocol_cache.get().to_line_protocol(),
-        'http_request_dispatcher,response_code=400 parse_request_body_ns=27i,send_response_ns=320i 1700000000000000000',
-    )
+    self.assertListEqual(self._get_line_protocols(2), [
+        'http_request_dispatcher,response_code=400,stage=parse_request_body count=1i,max_ns=27i,p50_ns=27i,p90_ns=27i,p99_ns=27i,sum_ns=27i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=send_response count=1i,max_ns=320i,p50_ns=320i,p90_ns=320i,p99_ns=320i,sum_ns=320i 1700000000000000000',
+    ])
     self.assertTrue(self.line_protocol_cache.empty())
 
   def test_noContentTypeHeader_returns400(self):
@@ -105,10 +159,11 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
 
     self.assertEqual(r.status_code, 400)
     self._assertDictContainsSubset({'message': 'Missing Content-Type'}, r.json())
-    self.assertEqual(
-        self.line_protocol_cache.get().to_line_protocol(),
-        'http_request_dispatcher,response_code=400 parse_multipart_boundary_ns=320i,parse_request_body_ns=27i,send_response_ns=190i 1700000000000000000',
-    )
+    self.assertListEqual(self._get_line_protocols(3), [
+        'http_request_dispatcher,response_code=400,stage=parse_request_body count=1i,max_ns=27i,p50_ns=27i,p90_ns=27i,p99_ns=27i,sum_ns=27i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=parse_multipart_boundary count=1i,max_ns=320i,p50_ns=320i,p90_ns=320i,p99_ns=320i,sum_ns=320i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=send_response count=1i,max_ns=190i,p50_ns=190i,p90_ns=190i,p99_ns=190i,sum_ns=190i 1700000000000000000',
+    ])
     self.assertTrue(self.line_protocol_cache.empty())
 
   def test_invalidMimeType_returns400(self):
@@ -121,10 +176,11 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
     self.assertEqual(r.status_code, 400)
     self._assertDictContainsSubset(
         {'message': 'Expected mime type to be "multipart/form-data", got "invalid/mime-type" instead'}, r.json())
-    self.assertEqual(
-        self.line_protocol_cache.get().to_line_protocol(),
-        'http_request_dispatcher,response_code=400 parse_multipart_boundary_ns=320i,parse_request_body_ns=27i,send_response_ns=190i 1700000000000000000',
-    )
+    self.assertListEqual(self._get_line_protocols(3), [
+        'http_request_dispatcher,response_code=400,stage=parse_request_body count=1i,max_ns=27i,p50_ns=27i,p90_ns=27i,p99_ns=27i,sum_ns=27i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=parse_multipart_boundary count=1i,max_ns=320i,p50_ns=320i,p90_ns=320i,p99_ns=320i,sum_ns=320i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=send_response count=1i,max_ns=190i,p50_ns=190i,p90_ns=190i,p99_ns=190i,sum_ns=190i 1700000000000000000',
+    ])
     self.assertTrue(self.line_protocol_cache.empty())
 
   def test_noBoundary_returns400(self):
@@ -136,10 +192,11 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
 
     self.assertEqual(r.status_code, 400)
     self._assertDictContainsSubset({'message': 'Missing "boundary" in Content-Type'}, r.json())
-    self.assertEqual(
-        self.line_protocol_cache.get().to_line_protocol(),
-        'http_request_dispatcher,response_code=400 parse_multipart_boundary_ns=320i,parse_request_body_ns=27i,send_response_ns=190i 1700000000000000000',
-    )
+    self.assertListEqual(self._get_line_protocols(3), [
+        'http_request_dispatcher,response_code=400,stage=parse_request_body count=1i,max_ns=27i,p50_ns=27i,p90_ns=27i,p99_ns=27i,sum_ns=27i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=parse_multipart_boundary count=1i,max_ns=320i,p50_ns=320i,p90_ns=320i,p99_ns=320i,sum_ns=320i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=send_response count=1i,max_ns=190i,p50_ns=190i,p90_ns=190i,p99_ns=190i,sum_ns=190i 1700000000000000000',
+    ])
     self.assertTrue(self.line_protocol_cache.empty())
 
   def test_validRequest_callsHandler(self):
@@ -150,13 +207,107 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
     )
 
     self.assertEqual(r.status_code, 200)
-    self.assertEqual(self.call_args.get(timeout=5), (b'12345', '241a860e9a94d2780e8e67095c27a662'))
-    self.assertEqual(
-        self.line_protocol_cache.get().to_line_protocol(),
-        'http_request_dispatcher,response_code=200 compute_response_ns=190i,parse_multipart_boundary_ns=320i,parse_request_body_ns=27i,send_response_ns=3200i 1700000000000000000',
-    )
+    self.assertEqual(self.call_args.get(timeout=5), (b'12345', '241a860e9a94d2780e8e67095c27a662', '127.0.0.1', None))
+    self.assertListEqual(self._get_line_protocols(4), [
+        'http_request_dispatcher,response_code=200,stage=parse_request_body count=1i,max_ns=27i,p50_ns=27i,p90_ns=27i,p99_ns=27i,sum_ns=27i 1700000000000000000',
+        'http_request_dispatcher,response_code=200,stage=parse_multipart_boundary count=1i,max_ns=320i,p50_ns=320i,p90_ns=320i,p99_ns=320i,sum_ns=320i 1700000000000000000',
+        'http_request_dispatcher,response_code=200,stage=compute_response count=1i,max_ns=190i,p50_ns=190i,p90_ns=190i,p99_ns=190i,sum_ns=190i 1700000000000000000',
+        'http_request_dispatcher,response_code=200,stage=send_response count=1i,max_ns=3200i,p50_ns=3200i,p90_ns=3200i,p99_ns=3200i,sum_ns=3200i 1700000000000000000',
+    ])
     self.assertTrue(self.line_protocol_cache.empty())
 
+  @parameterized.named_parameters(
+      ('header', '/v1/vision/detection?camera=backyard', {'X-Camera-Id': 'front_door'}, 'front_door'),
+      ('query', '/v1/vision/detection?camera=backyard', {}, 'backyard'),
+  )
+  def test_camera_passedToHandler(self, path: str, headers: Dict[str, str], expected_camera: str):
+    r = requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}{path}',
+        headers={
+            'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662',
+            **headers
+        },
+        data=b'12345',
+    )
+
+    self.assertEqual(r.status_code, 200)
+    self.assertEqual(self.call_args.get(timeout=5), (b'12345', '241a860e9a94d2780e8e67095c27a662', expected_camera, None))
+
+  @parameterized.named_parameters(
+      ('overloaded', 'overloaded-camera', 429, 'CameraOverloadedError',
+       'Camera "overloaded-camera" already has 1 outstanding requests'),
+      ('superseded', 'superseded-camera', 409, 'RequestSupersededError',
+       'A newer request from camera "superseded-camera" arrived'),
+      ('expired', 'expired-camera', 504, 'DeadlineExceededError', 'Deadline exceeded while the request was queued'),
+  )
+  def test_rejected_returnsResponseCode(self, camera: str, expected_status_code: int, expected_class: str,
+                                        expected_message: str):
+    r = requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={
+            'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662',
+            'X-Camera-Id': camera,
+        },
+        data=b'12345',
+    )
+
+    self.assertEqual(r.status_code, expected_status_code)
+    self.assertDictEqual(r.json(), {'class': expected_class, 'message': expected_message})
+
+  @parameterized.named_parameters(
+      ('predicted', {'X-Camera-Id': 'front_door'}, 200, b''),
+      ('rejected', {'X-Camera-Id': 'overloaded-camera'}, 429,
+       b'{"class": "CameraOverloadedError", "message": "Camera \\"overloaded-camera\\" already has 1 outstanding '
+       b'requests"}'),
+  )
+  def test_trafficRecorder_recordsResponseCode(self, headers: Dict[str, str], expected_response_code: int,
+                                               expected_response: bytes):
+    requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={
+            'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662',
+            **headers
+        },
+        data=b'12345',
+    )
+
+    self.assertEqual(self.traffic_records.get(timeout=5), (b'12345', expected_response_code, expected_response))
+
+  def test_trafficRecorder_recordsInvalidRequest(self):
+    requests.post(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection', data=b'12345')
+
+    request_body, response_code, _ = self.traffic_records.get(timeout=5)
+    self.assertEqual((request_body, response_code), (b'12345', 400))
+
+  def test_deadline_passedToHandler(self):
+    start_ns = time.monotonic_ns()
+    r = requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={
+            'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662',
+            'X-Request-Deadline-Ms': '500',
+        },
+        data=b'12345',
+    )
+
+    self.assertEqual(r.status_code, 200)
+    deadline_ns = self.call_args.get(timeout=5)[3]
+    self.assertBetween(deadline_ns, start_ns + 500000000, time.monotonic_ns() + 500000000)
+
+  def test_invalidDeadline_returns400(self):
+    r = requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={
+            'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662',
+            'X-Request-Deadline-Ms': 'soon',
+        },
+        data=b'12345',
+    )
+
+    self.assertEqual(r.status_code, 400)
+    self._assertDictContainsSubset(
+        {'message': 'Expected X-Request-Deadline-Ms to be a non-negative integer, got "soon" instead'}, r.json())
+
   def test_contentLengthTooLong_raises(self):
     r = requests.post(
         f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
@@ -166,8 +317,167 @@ class TestHttpRequestDispatcher(parameterized.TestCase):
 
     self.assertEqual(r.status_code, 400)
     self._assertDictContainsSubset({'message': 'Expected Content-Length to be <= 10, got 23 instead'}, r.json())
-    self.assertEqual(
-        self.line_protocol_cache.get().to_line_protocol(),
-        'http_request_dispatcher,response_code=400 parse_request_body_ns=27i,send_response_ns=320i 1700000000000000000',
-    )
+    self.assertListEqual(self._get_line_protocols(2), [
+        'http_request_dispatcher,response_code=400,stage=parse_request_body count=1i,max_ns=27i,p50_ns=27i,p90_ns=27i,p99_ns=27i,sum_ns=27i 1700000000000000000',
+        'http_request_dispatcher,response_code=400,stage=send_response count=1i,max_ns=320i,p50_ns=320i,p90_ns=320i,p99_ns=320i,sum_ns=320i 1700000000000000000',
+    ])
     self.assertTrue(self.line_protocol_cache.empty())
+
+  def test_stats_countsResponses(self):
+    requests.post(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/invalid-path')
+    requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662'},
+        data=b'',
+    )
+
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/stats')
+
+    self.assertEqual(r.status_code, 200)
+    self.assertEqual(r.headers['Content-Type'], 'application/json')
+    self._assertDictContainsSubset({
+        'ready': True,
+        'in_flight_requests': 0,
+        'responses': {
+            '400': 1,
+            '404': 1
+        },
+        'engines': [],
+    }, r.json())
+    self.assertListEqual([(s['stage'], s['response_code'], s['count']) for s in r.json()['stage_latencies']], [
+        ('parse_request_body', 400, 1),
+        ('send_response', 400, 1),
+    ])
+
+  def test_stats_sendingResponseFails_finishesRequest(self):
+    requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={
+            'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662',
+            'X-Camera-Id': 'unsendable-camera',
+        },
+        data=b'12345',
+    )
+
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/stats')
+
+    self._assertDictContainsSubset({'in_flight_requests': 0, 'responses': {'500': 1}}, r.json())
+
+  def test_metrics_returnsPrometheusText(self):
+    requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662'},
+        data=b'',
+    )
+
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/metrics')
+
+    self.assertEqual(r.status_code, 200)
+    self.assertEqual(r.headers['Content-Type'], 'text/plain; version=0.0.4')
+    self.assertIn('detection_server_responses_total{response_code="400"} 1\n', r.text)
+    self.assertIn('detection_server_stage_latency_seconds_count{stage="send_response",response_code="400"} 1\n',
+                  r.text)
+
+  def test_adminEndpointsDisabled_returns404(self):
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/admin/profile')
+
+    self.assertEqual(r.status_code, 404)
+
+  def test_getInvalidPath_returns404(self):
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/invalid-path')
+
+    self.assertEqual(r.status_code, 404)
+
+  def test_detectionStream_upgradesToWebSocket(self):
+    connection = WebSocketConnection.connect(self.SERVER_IP, self.SERVER_PORT,
+                                             '/v1/vision/detection/stream?camera=backyard', 100)
+    connection.send(OPCODE_BINARY, b'12345')
+    self.assertIsNotNone(connection.receive())
+    connection.close()
+    self.assertIsNone(connection.receive())
+    connection.close_streams()
+
+    self.assertEqual(self.call_args.get(timeout=5), (b'12345', None, 'backyard', None))
+
+  def test_detectionStreamWithoutUpgrade_returns400(self):
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection/stream')
+
+    self.assertEqual(r.status_code, 400)
+    self.assertEqual(r.json(), {'message': 'Expected a WebSocket upgrade request with Sec-WebSocket-Key'})
+
+
+class TestHttpRequestDispatcherNotReady(parameterized.TestCase):
+  SERVER_IP = '127.0.0.1'
+  SERVER_PORT = 42070
+
+  def setUp(self):
+    self.saved_flags = flagsaver.as_parsed(
+        (ENABLE_ADMIN_ENDPOINTS, str(True)),
+        (_PROFILER_MAX_DURATION_S, str(60)),
+    )
+    self.saved_flags.__enter__()
+
+    self.server_process = Process(target=self._run_server)
+    self.server_process.start()
+
+    for _ in range(100):
+      try:
+        requests.head(f'http://{self.SERVER_IP}:{self.SERVER_PORT}')
+        return super().setUp()
+      except Exception:
+        time.sleep(0.01)
+
+    raise TimeoutError('HTTP server did not start')
+
+  @classmethod
+  def _run_server(cls) -> None:
+    ServerReadiness.set_not_ready()
+    server = HTTPServer((cls.SERVER_IP, cls.SERVER_PORT), HttpRequestDispatcher)
+    server.serve_forever()
+
+  def tearDown(self):
+    self.server_process.terminate()
+    self.server_process.join(timeout=5)
+    assert self.server_process.exitcode is not None, 'Failed to terminate server process'
+
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def test_head_returns503(self):
+    r = requests.head(f'http://{self.SERVER_IP}:{self.SERVER_PORT}')
+
+    self.assertEqual(r.status_code, 503)
+
+  def test_detection_returns503(self):
+    r = requests.post(
+        f'http://{self.SERVER_IP}:{self.SERVER_PORT}/v1/vision/detection',
+        headers={'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662'},
+        data=b'12345',
+    )
+
+    self.assertEqual(r.status_code, 503)
+
+  def test_detectionStream_returns503(self):
+    with self.assertRaisesRegex(ConnectionError, '503'):
+      WebSocketConnection.connect(self.SERVER_IP, self.SERVER_PORT, '/v1/vision/detection/stream', 100)
+
+  def test_stats_returns200(self):
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/stats')
+
+    self.assertEqual(r.status_code, 200)
+    self.assertFalse(r.json()['ready'])
+
+  def test_adminEndpoint_isAvailableDuringStartup(self):
+    r = requests.get(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/admin/profile')
+
+    self.assertEqual(r.status_code, 404)
+    self.assertEqual(r.json(), {'message': 'No profiling has been run'})
+
+  def test_adminEndpointInvalidQuery_returns400(self):
+    r = requests.post(f'http://{self.SERVER_IP}:{self.SERVER_PORT}/admin/profile?duration_s=-1')
+
+    self.assertEqual(r.status_code, 400)
+    self.assertEqual(r.json(), {
+        'class': 'AssertionError',
+        'message': 'Expected duration_s to be in (0, 60.0], got -1.0 instead'
+    })
@@ -0,0 +1,339 @@
+import threading
+import time
+from enum import Enum, auto
+from typing import Dict, List, Optional, Tuple
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.inferencescheduler import (_CAMERA_MAX_OUTSTANDING, _CAMERA_WEIGHTS,
+                                                                    _DEFAULT_CAMERA_MAX_OUTSTANDING,
+                                                                    _DEFAULT_CAMERA_WEIGHT, _MAX_TRACKED_CAMERAS,
+                                                                    _OVERFLOW_QUEUE_WAIT_MS, _SUPERSEDE_QUEUED_FRAMES,
+                                                                    CameraOverloadedError, DeadlineExceededError,
+                                                                    InferenceScheduler, RequestRateExceededError,
+                                                                    RequestSupersededError)
+from simple_jetson_nano_detection_server.overflowlane import OverflowLane
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.predictorpool import PREDICTOR_POOL_SIZE, PredictorPool
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+
+MOCK_PREDICT = Mock()
+
+
+class _Checkpoint(Enum):
+  COMPUTE_RESPONSE = auto()
+
+
+@patch.object(PredictorPool, PredictorPool.predict.__name__, MOCK_PREDICT)
+class TestInferenceScheduler(parameterized.TestCase):
+
+  def setUp(self):
+    self.predicted: List[bytes] = []
+    self.exceptions: Dict[bytes, Exception] = {}
+    self.release = threading.Event()
+
+    # The first prediction blocks until released, so the following requests queue up behind it.
+    def predict(image_data: bytes) -> List[bytes]:
+      if len(self.predicted) == 0:
+        self.release.wait(timeout=5)
+      self.predicted.append(image_data)
+      return []
+
+    MOCK_PREDICT.side_effect = predict
+    ServerStats.reset()
+
+    self.saved_flags = flagsaver.as_parsed(
+        (_CAMERA_WEIGHTS, 'b:2'),
+        (_DEFAULT_CAMERA_WEIGHT, str(1.0)),
+        (_CAMERA_MAX_OUTSTANDING, 'c:1'),
+        (_DEFAULT_CAMERA_MAX_OUTSTANDING, str(0)),
+        (_SUPERSEDE_QUEUED_FRAMES, str(False)),
+        (PREDICTOR_POOL_SIZE, str(1)),
+        (_OVERFLOW_QUEUE_WAIT_MS, str(200.0)),
+        (_MAX_TRACKED_CAMERAS, str(32)),
+    )
+    self.saved_flags.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.release.set()
+    MOCK_PREDICT.reset_mock(return_value=True, side_effect=True)
+    ServerStats.reset()
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  # Starts predicting on another thread, and waits until the request is queued or predicting.
+  # The exception raised by the prediction, if any, is put into self.exceptions by image data.
+  def _start_predict(self,
+                     camera: str,
+                     image_data: bytes,
+                     expected_queue_depth: int,
+                     deadline_ns: Optional[int] = None) -> threading.Thread:
+
+    def predict() -> None:
+      try:
+        InferenceScheduler.predict(camera, image_data, deadline_ns)
+      except Exception as e:
+        self.exceptions[image_data] = e
+
+    thread = threading.Thread(target=predict)
+    thread.start()
+    for _ in range(500):
+      if InferenceScheduler.get_queue_depth() == expected_queue_depth and MOCK_PREDICT.call_count > 0:
+        return thread
+      time.sleep(0.01)
+    raise TimeoutError(f'Expected queue depth to be {expected_queue_depth}')
+
+  def _get_camera_counts(self) -> List[Tuple[str, int, Dict[str, int]]]:
+    return [(camera, requests, rejected) for camera, requests, rejected, _ in ServerStats._snapshot_cameras()]
+
+  def test_notRunning_predictsDirectly(self):
+    self.release.set()
+
+    self.assertEqual(InferenceScheduler.predict('a', b'a0', None), [])
+    self.assertEqual(self.predicted, [b'a0'])
+
+  def test_predict_sharesInferenceByWeight(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      for i, (camera, image_data) in enumerate(((b'a', b'a1'), (b'a', b'a2'), (b'a', b'a3'), (b'b', b'b1'),
+                                                (b'b', b'b2'))):
+        threads.append(self._start_predict(camera.decode(), image_data, i + 1))
+      self.release.set()
+      for thread in threads:
+        thread.join(timeout=5)
+
+    # Camera "b" has twice the weight of camera "a", so it gets two turns for each turn of camera "a".
+    self.assertEqual(self.predicted, [b'a0', b'b1', b'a1', b'b2', b'a2', b'a3'])
+
+  def test_queueDepth_isReportedToServerStats(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0), self._start_predict('b', b'b0', 1)]
+      self.assertEqual(ServerStats.get_stats()['queue_depth'], 1)
+      self.release.set()
+      for thread in threads:
+        thread.join(timeout=5)
+
+    self.assertEqual(ServerStats.get_stats()['queue_depth'], 0)
+
+  @flagsaver.flagsaver((PREDICTOR_POOL_SIZE, 2))
+  def test_predictorPoolSize_predictsConcurrently(self):
+
+    def predict(image_data: bytes) -> List[bytes]:
+      if image_data == b'a0':
+        self.release.wait(timeout=5)
+      self.predicted.append(image_data)
+      return []
+
+    MOCK_PREDICT.side_effect = predict
+
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      # The second request is predicted while the first one is still predicting.
+      threads.append(self._start_predict('b', b'b0', 0))
+      threads[1].join(timeout=5)
+      self.assertEqual(self.predicted, [b'b0'])
+
+      self.release.set()
+      threads[0].join(timeout=5)
+
+    self.assertEqual(self.predicted, [b'b0', b'a0'])
+
+  @patch.object(OverflowLane, OverflowLane.predict.__name__, Mock(return_value=[]))
+  @patch.object(OverflowLane, OverflowLane.try_acquire.__name__, Mock(return_value=True))
+  def test_gpuBehind_predictsOnOverflowLane(self):
+    with InferenceScheduler():
+      thread = self._start_predict('a', b'a0', 0)
+      # The next request would wait for 1s behind the predicting request, which is longer than 200ms.
+      InferenceScheduler._average_predict_ns = 1e9
+
+      self.assertEqual(InferenceScheduler.predict('b', b'b0', None), [])
+      OverflowLane.predict.assert_called_once_with(b'b0')
+      self.release.set()
+      thread.join(timeout=5)
+
+    self.assertEqual(self.predicted, [b'a0'])
+    self.assertEqual(self._get_camera_counts(), [('a', 1, {}), ('b', 1, {})])
+
+  @patch.object(OverflowLane, OverflowLane.predict.__name__, Mock(return_value=[]))
+  @patch.object(OverflowLane, OverflowLane.try_acquire.__name__, Mock(return_value=False))
+  def test_overflowLaneBusy_queuesForGpu(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      InferenceScheduler._average_predict_ns = 1e9
+      threads.append(self._start_predict('b', b'b0', 1))
+      self.release.set()
+      for thread in threads:
+        thread.join(timeout=5)
+
+    OverflowLane.predict.assert_not_called()
+    self.assertEqual(self.predicted, [b'a0', b'b0'])
+
+  @patch.object(OverflowLane, OverflowLane.try_acquire.__name__, Mock(return_value=True))
+  def test_gpuWithinQueueWait_queuesForGpu(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      InferenceScheduler._average_predict_ns = 1e6
+      threads.append(self._start_predict('b', b'b0', 1))
+      self.release.set()
+      for thread in threads:
+        thread.join(timeout=5)
+
+    OverflowLane.try_acquire.assert_not_called()
+    self.assertEqual(self.predicted, [b'a0', b'b0'])
+
+  def test_maxOutstanding_raises(self):
+    with InferenceScheduler():
+      thread = self._start_predict('c', b'c0', 0)
+
+      with self.assertRaisesRegex(CameraOverloadedError, 'Camera "c" already has 1 outstanding requests'):
+        InferenceScheduler.predict('c', b'c1', None)
+      self.release.set()
+      thread.join(timeout=5)
+
+      self.assertEqual(InferenceScheduler.predict('c', b'c2', None), [])
+
+    self.assertEqual(self.predicted, [b'c0', b'c2'])
+    self.assertEqual(self._get_camera_counts(), [('c', 2, {'overloaded': 1})])
+
+  def test_maxTrackedCameras_countsOtherCameras(self):
+    self.release.set()
+
+    with flagsaver.as_parsed((_MAX_TRACKED_CAMERAS, str(2))), InferenceScheduler():
+      for camera in ['a', 'b', 'c', 'd', 'a']:
+        InferenceScheduler.predict(camera, camera.encode(), None)
+      with self.assertRaises(DeadlineExceededError):
+        InferenceScheduler.predict('e', b'e', time.monotonic_ns())
+
+    self.assertEqual(self._get_camera_counts(), [('a', 2, {}), ('b', 1, {}), ('other', 2, {'expired': 1})])
+
+  @flagsaver.flagsaver((PREDICTOR_POOL_SIZE, 2))
+  def test_maxPredicting_predictsOneAtATime(self):
+
+    def predict(image_data: bytes) -> List[bytes]:
+      if image_data == b'a0':
+        self.release.wait(timeout=5)
+      self.predicted.append(image_data)
+      return []
+
+    MOCK_PREDICT.side_effect = predict
+
+    with InferenceScheduler():
+      InferenceScheduler.set_limits(1, None)
+      threads = [self._start_predict('a', b'a0', 0)]
+      # Queued behind the first request even though a predictor is idle.
+      threads.append(self._start_predict('b', b'b0', 1))
+
+      InferenceScheduler.set_limits(None, None)
+      threads[1].join(timeout=5)
+      self.assertEqual(self.predicted, [b'b0'])
+      self.release.set()
+      threads[0].join(timeout=5)
+
+    self.assertEqual(self.predicted, [b'b0', b'a0'])
+
+  @patch.object(time, time.monotonic_ns.__name__, Mock(return_value=0))
+  def test_maxRequestRate_raises(self):
+    self.release.set()
+    with InferenceScheduler():
+      InferenceScheduler.set_limits(None, 2.0)
+      self.assertEqual(InferenceScheduler.predict('a', b'a0', None), [])
+      self.assertEqual(InferenceScheduler.predict('b', b'b0', None), [])
+
+      with self.assertRaisesRegex(RequestRateExceededError, 'Server is accepting at most 2.0 requests per second'):
+        InferenceScheduler.predict('a', b'a1', None)
+
+      # Half a second later, another request is accepted.
+      time.monotonic_ns.return_value = 500000000
+      self.assertEqual(InferenceScheduler.predict('a', b'a2', None), [])
+
+    self.assertEqual(self.predicted, [b'a0', b'b0', b'a2'])
+    self.assertEqual(self._get_camera_counts(), [('a', 2, {'rate_limited': 1}), ('b', 1, {})])
+
+  def test_limitsLifted_acceptsAllRequests(self):
+    self.release.set()
+    with InferenceScheduler():
+      InferenceScheduler.set_limits(1, 0.001)
+      InferenceScheduler.predict('a', b'a0', None)
+      InferenceScheduler.set_limits(None, None)
+
+      for image_data in (b'a1', b'a2'):
+        self.assertEqual(InferenceScheduler.predict('a', image_data, None), [])
+
+    self.assertEqual(self.predicted, [b'a0', b'a1', b'a2'])
+
+  @flagsaver.flagsaver((_SUPERSEDE_QUEUED_FRAMES, True))
+  def test_supersedeQueuedFrames_predictsLatestFrame(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      threads.append(self._start_predict('a', b'a1', 1))
+      threads.append(self._start_predict('d', b'd1', 2))
+      threads.append(self._start_predict('a', b'a2', 2))
+      # The superseded request is responded right away.
+      threads[1].join(timeout=5)
+      self.assertIsInstance(self.exceptions[b'a1'], RequestSupersededError)
+
+      self.release.set()
+      for thread in threads:
+        thread.join(timeout=5)
+
+    # The latest frame of camera "a" takes the turn of the superseded frame, which was before camera "d".
+    self.assertEqual(self.predicted, [b'a0', b'a2', b'd1'])
+    self.assertEqual(self.exceptions.keys(), {b'a1'})
+    self.assertEqual(self._get_camera_counts(), [('a', 2, {'superseded': 1}), ('d', 1, {})])
+
+  def test_deadlineExceededBeforeQueued_raises(self):
+    with InferenceScheduler():
+      with self.assertRaisesRegex(DeadlineExceededError, 'Deadline exceeded before the request was queued'):
+        InferenceScheduler.predict('a', b'a0', time.monotonic_ns())
+
+    self.assertEmpty(self.predicted)
+
+  def test_deadlineExceededWhileQueued_raises(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      threads.append(self._start_predict('b', b'b0', 1, time.monotonic_ns() + 100000000))
+      threads[1].join(timeout=5)
+      self.release.set()
+      threads[0].join(timeout=5)
+
+    self.assertEqual(self.predicted, [b'a0'])
+    self.assertIsInstance(self.exceptions[b'b0'], DeadlineExceededError)
+    self.assertEqual(self._get_camera_counts(), [('a', 1, {}), ('b', 0, {'expired': 1})])
+
+  def test_deadlineExceededWhileQueued_keepsFinishTime(self):
+    with InferenceScheduler():
+      threads = [self._start_predict('a', b'a0', 0)]
+      expiring_thread = self._start_predict('c', b'c0', 1, time.monotonic_ns() + 100000000)
+      expiring_thread.join(timeout=5)
+      # Camera "c" already had its turn, so its next request waits behind the one of camera "a".
+      threads.append(self._start_predict('c', b'c1', 1))
+      threads.append(self._start_predict('a', b'a1', 2))
+      self.release.set()
+      for thread in threads:
+        thread.join(timeout=5)
+
+    self.assertEqual(self.predicted, [b'a0', b'a1', b'c1'])
+    self.assertEmpty(InferenceScheduler._finish_times)
+
+  def test_predictionFailure_raises(self):
+    self.release.set()
+    MOCK_PREDICT.side_effect = ValueError('PredictorPool.predict failed')
+
+    with InferenceScheduler():
+      with self.assertRaisesRegex(ValueError, 'PredictorPool.predict failed'):
+        InferenceScheduler.predict('a', b'a0', None)
+
+  def test_currentTracker_tracksQueueWait(self):
+    self.release.set()
+    tracker: PerformanceTracker[_Checkpoint] = PerformanceTracker()
+
+    with InferenceScheduler():
+      with tracker(_Checkpoint.COMPUTE_RESPONSE), tracker.as_current():
+        InferenceScheduler.predict('a', b'a0', None)
+
+    self.assertListEqual(list(tracker.get_latencies_ns().keys()), [
+        'compute_response',
+        'compute_response.queue_wait',
+    ])
@@ -0,0 +1,103 @@
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.latencyhistogram import (MAX_TRACKABLE_NS, LatencyHistogram,
+                                                                  _get_bucket_index, _get_bucket_upper_bound)
+
+
+class TestLatencyHistogram(parameterized.TestCase):
+
+  @parameterized.parameters(0, 1, 63, 64, 65, 100, 1000, 123456789, MAX_TRACKABLE_NS)
+  def test_bucketContainsValue(self, value_ns: int):
+    index = _get_bucket_index(value_ns)
+
+    self.assertGreaterEqual(_get_bucket_upper_bound(index), value_ns)
+    if index > 0:
+      self.assertLess(_get_bucket_upper_bound(index - 1), value_ns)
+
+  @parameterized.parameters(100, 1000, 123456789, MAX_TRACKABLE_NS)
+  def test_bucketRelativeErrorIsBounded(self, value_ns: int):
+    upper_bound = _get_bucket_upper_bound(_get_bucket_index(value_ns))
+
+    self.assertLessEqual((upper_bound - value_ns) / value_ns, 1 / 32)
+
+  def test_bucketsAreContiguous(self):
+    for value_ns in range(10000):
+      index = _get_bucket_index(value_ns)
+      self.assertIn(index, (_get_bucket_index(value_ns - 1), _get_bucket_index(value_ns - 1) + 1) if value_ns else (0,))
+
+  def test_record(self):
+    histogram = LatencyHistogram()
+    for value_ns in (10, 20, 30):
+      histogram.record(value_ns)
+
+    self.assertEqual(histogram.count, 3)
+    self.assertEqual(histogram.sum_ns, 60)
+    self.assertEqual(histogram.max_ns, 30)
+
+  def test_recordNegative_raises(self):
+    with self.assertRaisesWithLiteralMatch(Exception, 'Expected latency to be >= 0, got -1 instead'):
+      LatencyHistogram().record(-1)
+
+  def test_recordAboveMaxTrackable_keepsExactMax(self):
+    histogram = LatencyHistogram()
+    histogram.record(MAX_TRACKABLE_NS * 2)
+
+    self.assertEqual(histogram.max_ns, MAX_TRACKABLE_NS * 2)
+    self.assertEqual(histogram.get_percentile(50), MAX_TRACKABLE_NS)
+
+  @parameterized.parameters(
+      (50, 50),
+      (90, 91),
+      (99, 99),
+      (100, 100),
+      (0.1, 1),
+  )
+  def test_getPercentile_roundsUpToBucket(self, percentile: float, expected_ns: int):
+    histogram = LatencyHistogram()
+    for value_ns in range(1, 101):
+      histogram.record(value_ns)
+
+    self.assertEqual(histogram.get_percentile(percentile), expected_ns)
+
+  def test_getPercentile_isWithinRelativeError(self):
+    histogram = LatencyHistogram()
+    for value_ns in range(1000000, 2000000, 1000):
+      histogram.record(value_ns)
+
+    self.assertAlmostEqual(histogram.get_percentile(50), 1499000, delta=1499000 / 32)
+    self.assertAlmostEqual(histogram.get_percentile(99), 1989000, delta=1989000 / 32)
+
+  def test_getPercentile_neverAboveMax(self):
+    histogram = LatencyHistogram()
+    histogram.record(1000)
+
+    self.assertEqual(histogram.get_percentile(50), 1000)
+
+  def test_getPercentileOfEmptyHistogram_raises(self):
+    with self.assertRaisesWithLiteralMatch(Exception, 'Cannot get percentile of an empty histogram'):
+      LatencyHistogram().get_percentile(50)
+
+  @parameterized.parameters(0, 101)
+  def test_getInvalidPercentile_raises(self, percentile: float):
+    histogram = LatencyHistogram()
+    histogram.record(1)
+
+    with self.assertRaisesWithLiteralMatch(Exception,
+                                           f'Expected percentile to be in (0, 100], got {percentile} instead'):
+      histogram.get_percentile(percentile)
+
+  def test_merge_equalsRecordingAllValues(self):
+    merged = LatencyHistogram()
+    other = LatencyHistogram()
+    expected = LatencyHistogram()
+    for value_ns in range(0, 100000, 7):
+      (merged if value_ns % 2 else other).record(value_ns)
+      expected.record(value_ns)
+
+    merged.merge(other)
+
+    self.assertEqual(merged.count, expected.count)
+    self.assertEqual(merged.sum_ns, expected.sum_ns)
+    self.assertEqual(merged.max_ns, expected.max_ns)
+    for percentile in (1, 50, 90, 99, 100):
+      self.assertEqual(merged.get_percentile(percentile), expected.get_percentile(percentile))
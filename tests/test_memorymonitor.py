@@ -0,0 +1,119 @@
+import gc
+import tracemalloc
+from enum import Enum, auto
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.memorymonitor import (_ALLOCATION_SAMPLING_RATE, _MEMORY_REPORT_INTERVAL_S,
+                                                               MemoryMonitor)
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+
+
+class _Checkpoint(Enum):
+  ALLOCATE = auto()
+
+
+class TestMemoryMonitor(parameterized.TestCase):
+
+  def setUp(self):
+    # Tracing can be enabled for the whole test run, e.g. with "-X tracemalloc".
+    self.was_tracing = tracemalloc.is_tracing()
+    if self.was_tracing:
+      tracemalloc.stop()
+    MemoryMonitor._allocations = {}
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    MemoryMonitor._allocations = {}
+    if self.was_tracing:
+      tracemalloc.start()
+    return super().tearDown()
+
+  def test_takeSnapshot(self):
+    snapshot = MemoryMonitor.take_snapshot()
+
+    self.assertGreater(snapshot['rss_bytes'], 0)
+    self.assertGreater(snapshot['python_allocated_blocks'], 0)
+    for generation in range(3):
+      self.assertIn(f'gc_count_gen{generation}', snapshot)
+      self.assertIn(f'gc_collections_gen{generation}', snapshot)
+      self.assertIn(f'gc_pauses_gen{generation}', snapshot)
+      self.assertIn(f'gc_pause_ns_gen{generation}', snapshot)
+    self.assertIn('gc_max_pause_ns', snapshot)
+    self.assertEqual(MemoryMonitor.get_stats()['snapshot'], snapshot)
+
+  @flagsaver.as_parsed((_MEMORY_REPORT_INTERVAL_S, str(60)), (_ALLOCATION_SAMPLING_RATE, str(0)))
+  @patch.object(MetricsAggregator, MetricsAggregator.record.__name__)
+  def test_recordsSnapshot(self, record: Mock):
+    with MemoryMonitor():
+      pass
+
+    record.assert_called_once()
+    self.assertEqual(record.call_args.args[0], 'memory')
+
+  @flagsaver.as_parsed((_MEMORY_REPORT_INTERVAL_S, str(60)), (_ALLOCATION_SAMPLING_RATE, str(0)))
+  @patch.object(MetricsAggregator, MetricsAggregator.record.__name__, Mock())
+  def test_timesGcPauses(self):
+    pauses = MemoryMonitor.take_snapshot()['gc_pauses_gen2']
+    with MemoryMonitor():
+      gc.collect()
+    snapshot = MemoryMonitor.take_snapshot()
+
+    self.assertEqual(snapshot['gc_pauses_gen2'], pauses + 1)
+    self.assertGreater(snapshot['gc_max_pause_ns'], 0)
+    self.assertNotIn(MemoryMonitor._on_gc, gc.callbacks)
+
+  @parameterized.parameters((0.0, False), (1.0, True))
+  @patch.object(MetricsAggregator, MetricsAggregator.record.__name__, Mock())
+  def test_sampleAllocations(self, rate: float, expected: bool):
+    with flagsaver.as_parsed((_MEMORY_REPORT_INTERVAL_S, str(60)), (_ALLOCATION_SAMPLING_RATE, str(rate))):
+      with MemoryMonitor():
+        self.assertEqual(MemoryMonitor.sample_allocations(), expected)
+    self.assertFalse(MemoryMonitor.sample_allocations())
+
+  @flagsaver.as_parsed((_MEMORY_REPORT_INTERVAL_S, str(60)), (_ALLOCATION_SAMPLING_RATE, str(1)))
+  @patch.object(MetricsAggregator, MetricsAggregator.record.__name__, Mock())
+  def test_sampleAllocations_alreadyTracing(self):
+    tracemalloc.start()
+    try:
+      with MemoryMonitor():
+        self.assertFalse(MemoryMonitor.sample_allocations())
+    finally:
+      tracemalloc.stop()
+
+  @patch.object(MetricsAggregator, MetricsAggregator.increment.__name__)
+  def test_trackAllocations(self, increment: Mock):
+    with MemoryMonitor.track_allocations(_Checkpoint.ALLOCATE, True):
+      retained = bytearray(100000)
+      temporary = bytearray(200000)
+      del temporary
+
+    self.assertFalse(tracemalloc.is_tracing())
+    allocation = MemoryMonitor.get_stats()['allocations']['allocate']
+    self.assertEqual(allocation['count'], 1)
+    self.assertGreaterEqual(allocation['retained_bytes'], len(retained))
+    self.assertGreaterEqual(allocation['peak_bytes'], 300000)
+    self.assertEqual(allocation['max_peak_bytes'], allocation['peak_bytes'])
+    increment.assert_called_once_with('request_allocations', {
+        'count': 1,
+        'retained_bytes': allocation['retained_bytes'],
+        'peak_bytes': allocation['peak_bytes'],
+    }, {'stage': 'allocate'})
+
+  @patch.object(MetricsAggregator, MetricsAggregator.increment.__name__)
+  def test_trackAllocations_notSampled(self, increment: Mock):
+    with MemoryMonitor.track_allocations(_Checkpoint.ALLOCATE, False):
+      self.assertFalse(tracemalloc.is_tracing())
+
+    self.assertEqual(MemoryMonitor.get_stats()['allocations'], {})
+    increment.assert_not_called()
+
+  @patch.object(MetricsAggregator, MetricsAggregator.increment.__name__, Mock())
+  def test_trackAllocations_stopsTracingOnException(self):
+    with self.assertRaises(ValueError):
+      with MemoryMonitor.track_allocations(_Checkpoint.ALLOCATE, True):
+        raise ValueError()
+
+    self.assertFalse(tracemalloc.is_tracing())
+    self.assertEqual(MemoryMonitor.get_stats()['allocations']['allocate']['count'], 1)
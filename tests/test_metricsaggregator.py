@@ -0,0 +1,164 @@
+import threading
+import time
+from itertools import chain
+from typing import List
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+from line_protocol_cache.lineprotocolcache import LineProtocolCache
+
+from simple_jetson_nano_detection_server.metricsaggregator import (_FLUSH_BATCH_SIZE, _FLUSH_INTERVAL_S, _RAW_POINTS,
+                                                                   MetricsAggregator)
+
+LINE_PROTOCOL_CACHE_PUT = Mock(return_value=None)
+
+
+@patch.object(LineProtocolCache, LineProtocolCache.put.__name__, LINE_PROTOCOL_CACHE_PUT)
+@patch.object(time, time.time_ns.__name__, Mock(return_value=1700000000000000000))
+class TestMetricsAggregator(parameterized.TestCase):
+
+  def setUp(self):
+    self.saved_flags = flagsaver.as_parsed(
+        (_FLUSH_INTERVAL_S, str(3600)),
+        (_FLUSH_BATCH_SIZE, str(1000)),
+        (_RAW_POINTS, str(False)),
+    )
+    self.saved_flags.__enter__()
+    LINE_PROTOCOL_CACHE_PUT.reset_mock(return_value=True, side_effect=True)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def _get_line_protocols(self) -> List[str]:
+    points = chain.from_iterable([call_arg.args[0] for call_arg in LINE_PROTOCOL_CACHE_PUT.call_args_list])
+    return [p.to_line_protocol() for p in points]
+
+  def test_notEntered_ignoresUpdates(self):
+    MetricsAggregator.increment('m', {'field_1': 1})
+    MetricsAggregator.record('m', {'field_2': 2})
+    MetricsAggregator.flush()
+
+    LINE_PROTOCOL_CACHE_PUT.assert_not_called()
+
+  def test_disabled_ignoresUpdates(self):
+    with MetricsAggregator(enabled=False):
+      self.assertFalse(MetricsAggregator.is_enabled())
+      MetricsAggregator.increment('m', {'field_1': 1})
+
+    LINE_PROTOCOL_CACHE_PUT.assert_not_called()
+
+  def test_countersAreSummed(self):
+    with MetricsAggregator():
+      MetricsAggregator.increment('m', {'field_1': 1, 'field_2': 10})
+      MetricsAggregator.increment('m', {'field_1': 2})
+      MetricsAggregator.increment('m', {'field_1': 3}, {'tag1': 'value1'})
+      MetricsAggregator.flush()
+
+    self.assertListEqual(self._get_line_protocols(), [
+        'm field_1=3i,field_2=10i 1700000000000000000',
+        'm,tag1=value1 field_1=3i 1700000000000000000',
+    ])
+
+  def test_gaugesKeepLastValue(self):
+    with MetricsAggregator():
+      MetricsAggregator.record('m', {'field_1': 1, 'field_2': 0.5})
+      MetricsAggregator.record('m', {'field_1': 2})
+      MetricsAggregator.flush()
+
+    self.assertListEqual(self._get_line_protocols(), [
+        'm field_1=2i,field_2=0.5 1700000000000000000',
+    ])
+
+  def test_tagOrderDoesNotMatter(self):
+    with MetricsAggregator():
+      MetricsAggregator.increment('m', {'field_1': 1}, {'tag1': 'value1', 'tag2': 2})
+      MetricsAggregator.increment('m', {'field_1': 1}, {'tag2': 2, 'tag1': 'value1'})
+      MetricsAggregator.flush()
+
+    self.assertListEqual(self._get_line_protocols(), [
+        'm,tag1=value1,tag2=2 field_1=2i 1700000000000000000',
+    ])
+
+  def test_latenciesAreRecordedIntoHistograms(self):
+    with MetricsAggregator():
+      for latency_ns in range(1, 101):
+        MetricsAggregator.record_latencies('m', {'stage_1': latency_ns, 'stage_2': 1000}, {'tag1': 'value1'})
+      MetricsAggregator.record_latencies('m', {'stage_1': 5}, {'tag1': 'value2'})
+      MetricsAggregator.flush()
+
+    self.assertListEqual(self._get_line_protocols(), [
+        'm,stage=stage_1,tag1=value1 count=100i,max_ns=100i,p50_ns=50i,p90_ns=91i,p99_ns=99i,sum_ns=5050i 1700000000000000000',
+        'm,stage=stage_2,tag1=value1 count=100i,max_ns=1000i,p50_ns=1000i,p90_ns=1000i,p99_ns=1000i,sum_ns=100000i 1700000000000000000',
+        'm,stage=stage_1,tag1=value2 count=1i,max_ns=5i,p50_ns=5i,p90_ns=5i,p99_ns=5i,sum_ns=5i 1700000000000000000',
+    ])
+
+  def test_rawPoints_isDisabledByDefault(self):
+    with MetricsAggregator():
+      self.assertFalse(MetricsAggregator.is_raw_points_enabled())
+
+  def test_rawPoints_enabledByFlag(self):
+    with flagsaver.as_parsed((_RAW_POINTS, str(True))), MetricsAggregator():
+      self.assertTrue(MetricsAggregator.is_raw_points_enabled())
+      MetricsAggregator.set_enabled(False)
+      self.assertFalse(MetricsAggregator.is_raw_points_enabled())
+
+  def test_flushResetsValues(self):
+    with MetricsAggregator():
+      MetricsAggregator.increment('m', {'field_1': 1})
+      MetricsAggregator.flush()
+      MetricsAggregator.flush()
+      MetricsAggregator.increment('m', {'field_1': 2})
+      MetricsAggregator.flush()
+
+    self.assertListEqual(self._get_line_protocols(), [
+        'm field_1=1i 1700000000000000000',
+        'm field_1=2i 1700000000000000000',
+    ])
+
+  def test_exit_flushesRemainingValues(self):
+    with MetricsAggregator():
+      MetricsAggregator.increment('m', {'field_1': 1})
+
+    self.assertListEqual(self._get_line_protocols(), ['m field_1=1i 1700000000000000000'])
+    self.assertFalse(MetricsAggregator.is_enabled())
+
+  def test_setEnabled_pausesUpdates(self):
+    with MetricsAggregator():
+      MetricsAggregator.set_enabled(False)
+      MetricsAggregator.increment('m', {'field_1': 1})
+      MetricsAggregator.set_enabled(True)
+      MetricsAggregator.increment('m', {'field_1': 2})
+
+    self.assertListEqual(self._get_line_protocols(), ['m field_1=2i 1700000000000000000'])
+
+  def test_batchSizeReached_flushesInBackground(self):
+    flushed = threading.Event()
+    LINE_PROTOCOL_CACHE_PUT.side_effect = lambda points: flushed.set()
+
+    with flagsaver.as_parsed((_FLUSH_BATCH_SIZE, str(2))), MetricsAggregator():
+      MetricsAggregator.increment('m', {'field_1': 1})
+      MetricsAggregator.record('m', {'field_2': 2})
+      self.assertTrue(flushed.wait(timeout=5))
+
+    self.assertListEqual(self._get_line_protocols(), [
+        'm field_1=1i 1700000000000000000',
+        'm field_2=2i 1700000000000000000',
+    ])
+
+  def test_intervalElapsed_flushesInBackground(self):
+    flushed = threading.Event()
+    LINE_PROTOCOL_CACHE_PUT.side_effect = lambda points: flushed.set()
+
+    with flagsaver.as_parsed((_FLUSH_INTERVAL_S, str(0.01))), MetricsAggregator():
+      MetricsAggregator.increment('m', {'field_1': 1})
+      self.assertTrue(flushed.wait(timeout=5))
+
+    self.assertListEqual(self._get_line_protocols(), ['m field_1=1i 1700000000000000000'])
+
+  def test_enterTwice_raises(self):
+    with MetricsAggregator():
+      with self.assertRaisesWithLiteralMatch(Exception, 'MetricsAggregator is already running'):
+        with MetricsAggregator():
+          pass
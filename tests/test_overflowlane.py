@@ -0,0 +1,135 @@
+import os
+import time
+from enum import Enum, auto
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.overflowlane import _OVERFLOW_LANE_CPUS, _OVERFLOW_MODEL_PATH, OverflowLane
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.prediction import Prediction
+from simple_jetson_nano_detection_server.warmuprunner import WarmupRunner
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+MOCK_LOAD_MODEL = Mock()
+MOCK_WARMUP_RUN_PREDICTORS = Mock()
+MOCK_SCHED_SETAFFINITY = Mock()
+MOCK_PREDICT = Mock()
+
+_PREDICTION = Prediction.build(x_min=1, x_max=2, y_min=3, y_max=4, label='person', confidence=0.5)
+
+
+class _Checkpoint(Enum):
+  PREDICT = auto()
+
+
+@patch.object(OverflowLane, OverflowLane._load_model.__name__, MOCK_LOAD_MODEL)
+@patch.object(WarmupRunner, WarmupRunner.run_predictors.__name__, MOCK_WARMUP_RUN_PREDICTORS)
+@patch.object(YoloPredictor, YoloPredictor.predict.__name__, MOCK_PREDICT)
+@patch.object(os, os.sched_getaffinity.__name__, Mock(return_value={0, 1, 2, 3}))
+@patch.object(os, os.sched_setaffinity.__name__, MOCK_SCHED_SETAFFINITY)
+class TestOverflowLane(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_WARMUP_RUN_PREDICTORS.return_value = 2
+    MOCK_PREDICT.return_value = [_PREDICTION]
+
+    self.saved_flags = flagsaver.as_parsed(
+        (_OVERFLOW_MODEL_PATH, 'yolo11n-320.onnx'),
+        (_OVERFLOW_LANE_CPUS, str(2)),
+    )
+    self.saved_flags.__enter__()
+
+    self.overflow_lane = OverflowLane()
+    self.overflow_lane.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.overflow_lane.__exit__(None, None, None)
+    for mock in (MOCK_LOAD_MODEL, MOCK_WARMUP_RUN_PREDICTORS, MOCK_SCHED_SETAFFINITY, MOCK_PREDICT):
+      mock.reset_mock(return_value=True, side_effect=True)
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def _acquire(self) -> None:
+    for _ in range(500):
+      if OverflowLane.try_acquire():
+        return
+      time.sleep(0.01)
+    raise TimeoutError('Expected the overflow lane to become ready')
+
+  def test_noModelPath_returnsFalse(self):
+    with flagsaver.flagsaver((_OVERFLOW_MODEL_PATH, None)):
+      self.assertFalse(OverflowLane.start())
+
+    self.assertFalse(OverflowLane.try_acquire())
+    MOCK_LOAD_MODEL.assert_not_called()
+
+  def test_start_loadsModelOnLastCpus(self):
+    self.assertTrue(OverflowLane.start())
+    self._acquire()
+
+    MOCK_SCHED_SETAFFINITY.assert_called_once_with(0, {2, 3})
+    MOCK_LOAD_MODEL.assert_called_once_with('yolo11n-320.onnx')
+    predictor = MOCK_WARMUP_RUN_PREDICTORS.call_args.args[0][0]
+    self.assertEqual(predictor.device, 'cpu')
+
+  def test_tooManyCpus_raises(self):
+    with flagsaver.as_parsed((_OVERFLOW_LANE_CPUS, str(4))):
+      with self.assertRaisesWithLiteralMatch(
+          AssertionError,
+          'Expected --overflow_lane_cpus to be < 4 to leave a CPU for the HTTP requests, got 4 instead'):
+        OverflowLane.start()
+
+  def test_predict_releasesLane(self):
+    OverflowLane.start()
+    self._acquire()
+    self.assertFalse(OverflowLane.try_acquire())
+
+    self.assertEqual(OverflowLane.predict(b'image-data'), [_PREDICTION])
+    MOCK_PREDICT.assert_called_once_with(b'image-data')
+    self.assertTrue(OverflowLane.try_acquire())
+
+  def test_predictionFailure_raises(self):
+    MOCK_PREDICT.side_effect = ValueError('YoloPredictor.predict failed')
+    OverflowLane.start()
+    self._acquire()
+
+    with self.assertRaisesWithLiteralMatch(ValueError, 'YoloPredictor.predict failed'):
+      OverflowLane.predict(b'image-data')
+    self.assertTrue(OverflowLane.try_acquire())
+
+  def test_stoppedAfterAcquired_raises(self):
+    OverflowLane.start()
+    self._acquire()
+    with OverflowLane._condition:
+      OverflowLane._stop_requested = True
+      OverflowLane._condition.notify_all()
+    OverflowLane._thread.join(timeout=5)
+
+    with self.assertRaisesWithLiteralMatch(RuntimeError, 'The overflow lane was stopped'):
+      OverflowLane.predict(b'image-data')
+    MOCK_PREDICT.assert_not_called()
+    self.assertFalse(OverflowLane._busy)
+
+  def test_warmupFailure_neverReady(self):
+    MOCK_WARMUP_RUN_PREDICTORS.side_effect = RuntimeError('Model was exported for another image size')
+
+    OverflowLane.start()
+    OverflowLane._thread.join(timeout=5)
+
+    self.assertFalse(OverflowLane.try_acquire())
+
+  def test_notAcquired_raises(self):
+    with self.assertRaisesWithLiteralMatch(AssertionError, 'The overflow lane must be acquired before prediction'):
+      OverflowLane.predict(b'image-data')
+
+  def test_currentTracker_tracksOverflowLane(self):
+    OverflowLane.start()
+    self._acquire()
+    tracker: PerformanceTracker[_Checkpoint] = PerformanceTracker()
+
+    with tracker(_Checkpoint.PREDICT), tracker.as_current():
+      OverflowLane.predict(b'image-data')
+
+    self.assertListEqual(list(tracker.get_latencies_ns().keys()), ['predict', 'predict.overflow_lane'])
@@ -1,10 +1,13 @@
+import threading
 import time
 from enum import Enum, auto
 from unittest.mock import Mock, patch
 
 from absl.testing import parameterized
+from line_protocol_cache.lineprotocolcache import LineProtocolCache
 
-from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker, TracedSpan
 
 
 class _PerformanceCheckpoint(Enum):
@@ -12,6 +15,11 @@ class _PerformanceCheckpoint(Enum):
   CHECKPOINT_2 = auto()
 
 
+class _NestedCheckpoint(Enum):
+  NESTED_1 = auto()
+  NESTED_2 = auto()
+
+
 @patch.object(time, time.time_ns.__name__, Mock(return_value=1700000000000000000))
 class TestPerformanceTracker(parameterized.TestCase):
 
@@ -34,7 +42,93 @@ class TestPerformanceTracker(parameterized.TestCase):
         pass
 
     point = self.tracker.finalize('m')
-    self.assertEqual(point.to_line_protocol(), 'm checkpoint_1_ns=931i,checkpoint_2_ns=320i 1700000000000000000')
+    self.assertEqual(point.to_line_protocol(),
+                     'm checkpoint_1.checkpoint_2_ns=320i,checkpoint_1_ns=931i 1700000000000000000')
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 10, 30, 60, 100, 150]))
+  def test_span_tracksNestedSpansWithCurrentTracker(self):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1), self.tracker.as_current():
+      with PerformanceTracker.span(_NestedCheckpoint.NESTED_1):
+        with PerformanceTracker.span(_NestedCheckpoint.NESTED_2):
+          pass
+
+    self.assertDictEqual(self.tracker.get_latencies_ns(), {
+        'checkpoint_1': 150,
+        'checkpoint_1.nested_1': 90,
+        'checkpoint_1.nested_1.nested_2': 30,
+    })
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 10]))
+  def test_span_noCurrentTracker_doesNothing(self):
+    with PerformanceTracker.span(_NestedCheckpoint.NESTED_1):
+      PerformanceTracker.add_span(_NestedCheckpoint.NESTED_2, 100)
+
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1):
+      pass
+    self.assertDictEqual(self.tracker.get_latencies_ns(), {'checkpoint_1': 10})
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 20, 50, 60, 70]))
+  def test_addSpan_addsSpanUnderInnermostCheckpoint(self):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1), self.tracker.as_current():
+      with PerformanceTracker.span(_NestedCheckpoint.NESTED_1):
+        PerformanceTracker.add_span(_NestedCheckpoint.NESTED_2, 15)
+
+    self.assertDictEqual(self.tracker.get_latencies_ns(), {
+        'checkpoint_1': 70,
+        'checkpoint_1.nested_1': 40,
+        'checkpoint_1.nested_1.nested_2': 15,
+    })
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 70]))
+  def test_addSpan_withStopTimestamp(self):
+    tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker(traced=True)
+    with tracker(_PerformanceCheckpoint.CHECKPOINT_1), tracker.as_current():
+      PerformanceTracker.add_span(_NestedCheckpoint.NESTED_1, 15, 40)
+
+    self.assertEqual([(span.span, span.start_ns, span.stop_ns) for span in tracker.get_traced_spans()],
+                     [('checkpoint_1', 0, 70), ('checkpoint_1.nested_1', 25, 40)])
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 10, 20, 40]))
+  def test_getTracedSpans_recordsThreads(self):
+    tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker(traced=True)
+
+    def predict() -> None:
+      with tracker.as_current(), PerformanceTracker.span(_NestedCheckpoint.NESTED_1):
+        pass
+
+    with tracker(_PerformanceCheckpoint.CHECKPOINT_1):
+      thread = threading.Thread(target=predict, name='predict-thread')
+      thread.start()
+      thread.join()
+      with tracker.as_current():
+        PerformanceTracker.add_span(_NestedCheckpoint.NESTED_2, 5, 25)
+
+    main_thread = (threading.get_native_id(), threading.current_thread().name)
+    self.assertEqual(tracker.get_traced_spans(), [
+        TracedSpan('checkpoint_1', 0, 40, *main_thread),
+        TracedSpan('checkpoint_1.nested_1', 10, 20, thread.native_id, 'predict-thread'),
+        TracedSpan('checkpoint_1.nested_2', 20, 25, *main_thread),
+    ])
+
+  def test_getTracedSpans_notTraced_raises(self):
+    with self.assertRaisesWithLiteralMatch(AssertionError,
+                                           'Spans are only traced by a tracker created with traced=True'):
+      self.tracker.get_traced_spans()
+
+  def test_asCurrent_restoresPreviousTracker(self):
+    other_tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker()
+
+    with self.tracker.as_current():
+      with other_tracker.as_current():
+        self.assertIs(PerformanceTracker._current.tracker, other_tracker)
+      self.assertIs(PerformanceTracker._current.tracker, self.tracker)
+    self.assertIsNone(PerformanceTracker._current.tracker)
+
+  def test_span_alreadyTracking_raises(self):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1), self.tracker.as_current():
+      with self.assertRaisesWithLiteralMatch(Exception, 'CHECKPOINT_1 is already being tracked'):
+        with PerformanceTracker.span(_PerformanceCheckpoint.CHECKPOINT_1):
+          pass
 
   def test_contextManager_alreadyTracking_raises(self):
     with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1):
@@ -104,3 +198,43 @@ class TestPerformanceTracker(parameterized.TestCase):
     point = self.tracker.finalize('m', {'tag1': 'value1', 'tag2': 'value2', 'tag3': 3})
     self.assertEqual(point.to_line_protocol(),
                      'm,tag1=value1,tag2=value2,tag3=3 checkpoint_1_ns=351i 1700000000000000000')
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[69, 100, 420, 1000]))
+  @patch.object(MetricsAggregator, MetricsAggregator.record_latencies.__name__)
+  def test_aggregate_recordsLatencies(self, mock_record_latencies: Mock):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1):
+      with self.tracker(_PerformanceCheckpoint.CHECKPOINT_2):
+        pass
+
+    self.tracker.aggregate('m', {'tag1': 'value1'})
+
+    mock_record_latencies.assert_called_once_with('m', {
+        'checkpoint_1': 931,
+        'checkpoint_1.checkpoint_2': 320,
+    }, {'tag1': 'value1'})
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[69, 420]))
+  @patch.object(MetricsAggregator, MetricsAggregator.record_latencies.__name__, Mock())
+  @patch.object(MetricsAggregator, MetricsAggregator.is_raw_points_enabled.__name__, Mock(return_value=True))
+  @patch.object(LineProtocolCache, LineProtocolCache.put.__name__)
+  def test_aggregateWithRawPoints_putsPoint(self, mock_put: Mock):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1):
+      pass
+
+    self.tracker.aggregate('m', {'tag1': 'value1'})
+
+    mock_put.assert_called_once()
+    self.assertEqual(mock_put.call_args.args[0].to_line_protocol(),
+                     'm,tag1=value1 checkpoint_1_ns=351i 1700000000000000000')
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[69, 420]))
+  def test_getLatenciesNs(self):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1):
+      pass
+
+    self.assertDictEqual(self.tracker.get_latencies_ns(), {'checkpoint_1': 351})
+
+  def test_aggregateWhileTracking_raises(self):
+    with self.tracker(_PerformanceCheckpoint.CHECKPOINT_1):
+      with self.assertRaisesWithLiteralMatch(Exception, 'Cannot aggregate before stop tracking 1 checkpoints'):
+        self.tracker.aggregate('m')
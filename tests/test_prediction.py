@@ -1,9 +1,11 @@
 import json
+from typing import List
 
 from absl.testing import parameterized
 
 from simple_jetson_nano_detection_server.cocolabel import CocoLabel
-from simple_jetson_nano_detection_server.prediction import Prediction, PredictionJsonEncoder
+from simple_jetson_nano_detection_server.prediction import (Prediction, PredictionJsonEncoder,
+                                                           PredictionResponseEncoder)
 
 
 class TestPrediction(parameterized.TestCase):
@@ -48,3 +50,31 @@ class TestPredictionJsonEncoder(parameterized.TestCase):
   )
   def test_convertsToJson(self, p: Prediction, j: str):
     self.assertJsonEqual(json.dumps(p, cls=PredictionJsonEncoder), j)
+
+
+class TestPredictionResponseEncoder(parameterized.TestCase):
+
+  @parameterized.parameters(
+      ([], True),
+      ([], False),
+      ([Prediction(0, 0, 0, 0, CocoLabel.CAR, 0.5)], True),
+      ([Prediction(132, 177, 104, 141, CocoLabel.TRAFFIC_LIGHT, 0.6460136771202087)], True),
+      ([Prediction(1, 2, 3, 4, 'label-"1"', 1e-07), Prediction(5, 6, 7, 8, CocoLabel.PERSON, 0.9)], False),
+  )
+  def test_encode_sameAsJsonEncoder(self, predictions: List[Prediction], success: bool):
+    self.assertEqual(
+        PredictionResponseEncoder.encode(predictions, success),
+        json.dumps({
+            'predictions': predictions,
+            'success': success
+        }, cls=PredictionJsonEncoder).encode())
+
+  def test_encode_allLabels_sameAsJsonEncoder(self):
+    predictions = [Prediction(i, i + 1, i, i + 2, label, 1 / (i + 2)) for i, label in enumerate(CocoLabel)]
+
+    self.assertEqual(
+        PredictionResponseEncoder.encode(predictions, True),
+        json.dumps({
+            'predictions': predictions,
+            'success': True
+        }, cls=PredictionJsonEncoder).encode())
@@ -0,0 +1,143 @@
+import threading
+import time
+from enum import Enum, auto
+from typing import List
+from unittest.mock import Mock
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.predictorpool import PredictorPool
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+
+class _Checkpoint(Enum):
+  PREDICT = auto()
+
+
+class TestPredictorPool(parameterized.TestCase):
+
+  def setUp(self):
+    self.release = threading.Event()
+    self.predicting = threading.Event()
+    ServerStats.reset()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.release.set()
+    ServerStats.reset()
+    return super().tearDown()
+
+  # Returns a predictor whose predictions block until released.
+  def _build_blocking_predictor(self, name: str) -> YoloPredictor:
+
+    def predict(image_data: bytes) -> List[str]:
+      self.predicting.set()
+      self.release.wait(timeout=5)
+      return [name]
+
+    return Mock(spec=YoloPredictor, predict=Mock(side_effect=predict))
+
+  def _start_predict(self, results: List[List[str]]) -> threading.Thread:
+    thread = threading.Thread(target=lambda: results.append(PredictorPool.predict(b'image-data')))
+    thread.start()
+    return thread
+
+  def test_noPredictors_raises(self):
+    PredictorPool._predictors = []
+
+    with self.assertRaisesWithLiteralMatch(Exception, 'Predictors must be set before prediction'):
+      PredictorPool.predict(b'image-data')
+
+  def test_setPredictors_returnsReplacedPredictors(self):
+    predictors = [Mock(spec=YoloPredictor), Mock(spec=YoloPredictor)]
+    PredictorPool.set_predictors(predictors)
+
+    self.assertEqual(PredictorPool.set_predictors([Mock(spec=YoloPredictor)]), predictors)
+    self.assertEqual(PredictorPool.get_size(), 1)
+    self.assertEqual(ServerStats.get_stats()['predictor_pool']['size'], 1)
+
+  def test_predict_usesIdlePredictors(self):
+    PredictorPool.set_predictors([self._build_blocking_predictor('first'), self._build_blocking_predictor('second')])
+    results: List[List[str]] = []
+
+    threads = [self._start_predict(results)]
+    self.predicting.wait(timeout=5)
+    # The second prediction does not wait for the first one, as there is another idle predictor.
+    self.predicting.clear()
+    threads.append(self._start_predict(results))
+    self.assertTrue(self.predicting.wait(timeout=5))
+
+    self.release.set()
+    for thread in threads:
+      thread.join(timeout=5)
+    self.assertCountEqual(results, [['first'], ['second']])
+
+  def test_predict_waitsForBusyPredictor(self):
+    predictor = self._build_blocking_predictor('only')
+    PredictorPool.set_predictors([predictor])
+    results: List[List[str]] = []
+
+    thread = self._start_predict(results)
+    self.predicting.wait(timeout=5)
+    waiting_thread = self._start_predict(results)
+    time.sleep(0.05)
+    self.assertEqual(predictor.predict.call_count, 1)
+
+    self.release.set()
+    thread.join(timeout=5)
+    waiting_thread.join(timeout=5)
+    self.assertEqual(results, [['only'], ['only']])
+
+    stats = ServerStats.get_stats()['predictor_pool']
+    self.assertEqual(stats['predictions'], 2)
+    self.assertGreaterEqual(stats['wait_max_ns'], 50000000)
+
+  def test_replacedBusyPredictor_isReleasedAfterPredicting(self):
+    previous_predictor = self._build_blocking_predictor('previous')
+    PredictorPool.set_predictors([previous_predictor])
+    results: List[List[str]] = []
+
+    thread = self._start_predict(results)
+    self.predicting.wait(timeout=5)
+    new_predictor = Mock(spec=YoloPredictor, predict=Mock(return_value=['new']))
+    PredictorPool.set_predictors([new_predictor])
+
+    # The new predictor serves the new predictions while the replaced predictor is still predicting.
+    self.assertEqual(PredictorPool.predict(b'image-data'), ['new'])
+    released = threading.Thread(target=PredictorPool.wait_until_released, args=([previous_predictor],))
+    released.start()
+    released.join(timeout=0.05)
+    self.assertTrue(released.is_alive())
+
+    self.release.set()
+    thread.join(timeout=5)
+    released.join(timeout=5)
+    self.assertFalse(released.is_alive())
+    self.assertEqual(PredictorPool._idle_predictors, [new_predictor])
+
+  def test_keptBusyPredictor_isNotHandedOutTwice(self):
+    kept_predictor = self._build_blocking_predictor('kept')
+    PredictorPool.set_predictors([kept_predictor])
+    results: List[List[str]] = []
+
+    thread = self._start_predict(results)
+    self.predicting.wait(timeout=5)
+    new_predictor = Mock(spec=YoloPredictor, predict=Mock(return_value=['new']))
+    PredictorPool.set_predictors([kept_predictor, new_predictor])
+
+    self.assertEqual(PredictorPool._idle_predictors, [new_predictor])
+    self.release.set()
+    thread.join(timeout=5)
+    self.assertEqual(PredictorPool._idle_predictors, [new_predictor, kept_predictor])
+    self.assertEqual(kept_predictor.predict.call_count, 1)
+
+  def test_currentTracker_tracksPoolWait(self):
+    PredictorPool.set_predictors([Mock(spec=YoloPredictor, predict=Mock(return_value=[]))])
+    tracker: PerformanceTracker[_Checkpoint] = PerformanceTracker()
+
+    with tracker(_Checkpoint.PREDICT), tracker.as_current():
+      PredictorPool.predict(b'image-data')
+
+    self.assertListEqual(list(tracker.get_latencies_ns().keys()), ['predict', 'predict.pool_wait'])
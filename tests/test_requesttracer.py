@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from enum import Enum, auto
+from typing import List
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
+from simple_jetson_nano_detection_server.requesttracer import (_REQUEST_TRACE_MAX_REQUESTS, _REQUEST_TRACE_WINDOW_S,
+                                                               RequestTracer)
+
+MOCK_PERF_COUNTER_NS = Mock()
+
+
+class _PerformanceCheckpoint(Enum):
+  COMPUTE_RESPONSE = auto()
+  PREDICT = auto()
+
+
+@patch.object(time, time.perf_counter_ns.__name__, MOCK_PERF_COUNTER_NS)
+class TestRequestTracer(parameterized.TestCase):
+
+  def setUp(self):
+    self.saved_flags = flagsaver.as_parsed(
+        (_REQUEST_TRACE_WINDOW_S, str(10)),
+        (_REQUEST_TRACE_MAX_REQUESTS, str(100)),
+    )
+    self.saved_flags.__enter__()
+    RequestTracer.reset()
+    self.thread = (threading.get_native_id(), threading.current_thread().name)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    RequestTracer.reset()
+    self.saved_flags.__exit__(None, None, None)
+    MOCK_PERF_COUNTER_NS.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  # Tracks a request whose spans start at start_ns, as the HTTP requests are tracked.
+  def _record(self, start_ns: int, response_code: int = 200) -> None:
+    MOCK_PERF_COUNTER_NS.side_effect = [start_ns, start_ns + 1000, start_ns + 3000, start_ns + 4000]
+    tracker = RequestTracer.create_tracker()
+    with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE), tracker.as_current():
+      with PerformanceTracker.span(_PerformanceCheckpoint.PREDICT):
+        pass
+    RequestTracer.record(tracker, 'http_request_dispatcher', {'response_code': response_code, 'camera': 'front_door'})
+
+  def _get_request_ids(self, now_ns: int) -> List[int]:
+    MOCK_PERF_COUNTER_NS.side_effect = [now_ns]
+    return sorted({e['args']['request_id'] for e in RequestTracer.get_trace()['traceEvents'] if e['ph'] == 'X'})
+
+  def test_disabled_doesNotTrace(self):
+    with flagsaver.as_parsed((_REQUEST_TRACE_WINDOW_S, str(0))):
+      self.assertFalse(RequestTracer.is_enabled())
+      self.assertFalse(RequestTracer.create_tracker().is_traced())
+
+  def test_getTrace(self):
+    self._record(2000000)
+    MOCK_PERF_COUNTER_NS.side_effect = [2004000]
+    trace = RequestTracer.get_trace()
+
+    request_id = trace['traceEvents'][0]['args']['request_id']
+    self.assertEqual(trace, {
+        'traceEvents': [
+            {
+                'name': 'compute_response',
+                'cat': 'http_request_dispatcher',
+                'ph': 'X',
+                'ts': 2000.0,
+                'dur': 4.0,
+                'pid': os.getpid(),
+                'tid': self.thread[0],
+                'args': {
+                    'request_id': request_id,
+                    'span': 'compute_response',
+                    'response_code': 200,
+                    'camera': 'front_door'
+                },
+            },
+            {
+                'name': 'predict',
+                'cat': 'http_request_dispatcher',
+                'ph': 'X',
+                'ts': 2001.0,
+                'dur': 2.0,
+                'pid': os.getpid(),
+                'tid': self.thread[0],
+                'args': {
+                    'request_id': request_id,
+                    'span': 'compute_response.predict',
+                    'response_code': 200,
+                    'camera': 'front_door'
+                },
+            },
+            {
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': os.getpid(),
+                'tid': self.thread[0],
+                'args': {
+                    'name': self.thread[1]
+                },
+            },
+        ],
+        'displayTimeUnit': 'ms',
+    })
+
+  def test_getTrace_noRequests(self):
+    MOCK_PERF_COUNTER_NS.side_effect = [0]
+    self.assertEqual(RequestTracer.get_trace(), {'traceEvents': [], 'displayTimeUnit': 'ms'})
+
+  def test_requestsOutsideWindow_areDropped(self):
+    self._record(0)
+    self._record(5000000000)
+
+    self.assertLen(self._get_request_ids(10000004001), 1)
+    self.assertEmpty(self._get_request_ids(15000004001))
+
+  def test_tooManyRequests_dropsOldest(self):
+    with flagsaver.as_parsed((_REQUEST_TRACE_MAX_REQUESTS, str(2))):
+      for i in range(3):
+        self._record(i * 10000)
+      request_ids = self._get_request_ids(30000)
+
+    self.assertLen(request_ids, 2)
+    self.assertEqual(request_ids[1] - request_ids[0], 1)
+
+  def test_untracedTracker_isNotRecorded(self):
+    MOCK_PERF_COUNTER_NS.side_effect = [0, 1000]
+    tracker: PerformanceTracker[_PerformanceCheckpoint] = PerformanceTracker()
+    with tracker(_PerformanceCheckpoint.COMPUTE_RESPONSE):
+      pass
+    RequestTracer.record(tracker, 'http_request_dispatcher', {'response_code': 200})
+
+    self.assertEmpty(self._get_request_ids(1000))
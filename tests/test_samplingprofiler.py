@@ -0,0 +1,72 @@
+import threading
+import time
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.samplingprofiler import _SAMPLING_INTERVAL_MS, SamplingProfiler
+
+
+def _wait_for_event(event: threading.Event) -> None:
+  event.wait()
+
+
+def _spin_until_event(event: threading.Event) -> None:
+  while not event.is_set():
+    pass
+
+
+class TestSamplingProfiler(parameterized.TestCase):
+
+  def setUp(self):
+    self.saved_flags = flagsaver.as_parsed((_SAMPLING_INTERVAL_MS, str(1)))
+    self.saved_flags.__enter__()
+
+    self.stop_event = threading.Event()
+    self.threads = [
+        threading.Thread(target=_wait_for_event, args=(self.stop_event,), name='waiting-thread'),
+        threading.Thread(target=_spin_until_event, args=(self.stop_event,), name='spinning-thread'),
+    ]
+    for thread in self.threads:
+      thread.start()
+
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.stop_event.set()
+    for thread in self.threads:
+      thread.join()
+    SamplingProfiler.join()
+
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def _profile(self, wall_clock: bool) -> str:
+    self.assertTrue(SamplingProfiler.start(0.2, wall_clock))
+    SamplingProfiler.join()
+
+    collapsed_stacks = SamplingProfiler.get_collapsed_stacks()
+    assert collapsed_stacks is not None
+    return collapsed_stacks
+
+  def test_wallClock_samplesBlockedThreads(self):
+    collapsed_stacks = self._profile(wall_clock=True)
+
+    self.assertRegex(collapsed_stacks, r'(?m)^waiting-thread;.*;_wait_for_event \(test_samplingprofiler.py:\d+\);.* \d+$')
+    self.assertRegex(collapsed_stacks, r'(?m)^spinning-thread;.*;_spin_until_event \(test_samplingprofiler.py:\d+\) \d+$')
+    self.assertNotIn('sampling-profiler', collapsed_stacks)
+
+  def test_cpu_skipsBlockedThreads(self):
+    collapsed_stacks = self._profile(wall_clock=False)
+
+    self.assertNotIn('waiting-thread', collapsed_stacks)
+    self.assertRegex(collapsed_stacks, r'(?m)^spinning-thread;.*;_spin_until_event \(test_samplingprofiler.py:\d+\) \d+$')
+
+  def test_startWhileRunning_returnsFalse(self):
+    self.assertTrue(SamplingProfiler.start(0.2, wall_clock=True))
+
+    self.assertTrue(SamplingProfiler.is_running())
+    self.assertFalse(SamplingProfiler.start(0.2, wall_clock=True))
+
+  def test_notRunning_hasNoThread(self):
+    self.assertFalse(SamplingProfiler.is_running())
+    self.assertNotIn('sampling-profiler', [t.name for t in threading.enumerate()])
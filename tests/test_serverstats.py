@@ -0,0 +1,245 @@
+from unittest.mock import Mock, patch
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.memorymonitor import MemoryMonitor
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+
+
+_MEMORY_STATS = {
+    'snapshot': {
+        'rss_bytes': 1000,
+        'gc_collections_gen0': 2
+    },
+    'allocations': {
+        'predict': {
+            'count': 1,
+            'retained_bytes': 10,
+            'peak_bytes': 20,
+            'max_peak_bytes': 20
+        },
+        'encode_response': {
+            'count': 1,
+            'retained_bytes': 0,
+            'peak_bytes': 5,
+            'max_peak_bytes': 5
+        },
+    },
+}
+
+
+@patch.object(MemoryMonitor, MemoryMonitor.get_stats.__name__, Mock(return_value=_MEMORY_STATS))
+class TestServerStats(parameterized.TestCase):
+
+  def setUp(self):
+    ServerStats.reset()
+    ServerReadiness.set_ready()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    ServerStats.reset()
+    ServerReadiness.set_not_ready()
+    return super().tearDown()
+
+  def test_getStats_empty(self):
+    self.assertDictEqual(ServerStats.get_stats(), {
+        'ready': True,
+        'in_flight_requests': 0,
+        'queue_depth': 0,
+        'responses': {},
+        'stage_latencies': [],
+        'engines': [],
+        'cameras': [],
+        'predictor_pool': {
+            'size': 0,
+            'predictions': 0,
+            'wait_sum_ns': 0,
+            'wait_max_ns': 0,
+            'wait_p50_ns': 0,
+            'wait_p90_ns': 0,
+            'wait_p99_ns': 0,
+        },
+        'memory': _MEMORY_STATS,
+        'thermal': {},
+    })
+
+  def test_getStats(self):
+    ServerStats.set_engines(['yolo11s-320-fp16.engine'])
+    for latency_ns in (100, 200, 300):
+      ServerStats.start_request()
+      ServerStats.finish_request(200, {'compute_response': latency_ns})
+    ServerStats.start_request()
+    ServerStats.finish_request(503)
+    ServerStats.start_request()
+    ServerStats.record_camera_request('front_door', 1000)
+    ServerStats.record_camera_rejection('backyard', 'superseded')
+    ServerStats.record_camera_rejection('backyard', 'expired')
+    ServerStats.record_camera_rejection('backyard', 'superseded')
+    ServerStats.set_predictor_pool_size(2)
+    ServerStats.record_predictor_pool_wait(0)
+    ServerStats.record_predictor_pool_wait(500)
+    ServerStats.set_thermal({'max_temperature_c': 45.5, 'throttled': 0})
+    ServerStats.set_queue_depth_callback(lambda: 3)
+
+    self.assertDictEqual(
+        ServerStats.get_stats(), {
+            'ready': True,
+            'in_flight_requests': 1,
+            'queue_depth': 3,
+            'responses': {
+                '200': 3,
+                '503': 1
+            },
+            'stage_latencies': [{
+                'stage': 'compute_response',
+                'response_code': 200,
+                'count': 3,
+                'sum_ns': 600,
+                'max_ns': 300,
+                'p50_ns': 203,
+                'p90_ns': 300,
+                'p99_ns': 300,
+            }],
+            'engines': ['yolo11s-320-fp16.engine'],
+            'cameras': [
+                {
+                    'camera': 'backyard',
+                    'requests': 0,
+                    'rejected': {
+                        'expired': 1,
+                        'superseded': 2
+                    },
+                    'queue_wait_sum_ns': 0,
+                    'queue_wait_max_ns': 0,
+                    'queue_wait_p50_ns': 0,
+                    'queue_wait_p90_ns': 0,
+                    'queue_wait_p99_ns': 0,
+                },
+                {
+                    'camera': 'front_door',
+                    'requests': 1,
+                    'rejected': {},
+                    'queue_wait_sum_ns': 1000,
+                    'queue_wait_max_ns': 1000,
+                    'queue_wait_p50_ns': 1000,
+                    'queue_wait_p90_ns': 1000,
+                    'queue_wait_p99_ns': 1000,
+                },
+            ],
+            'predictor_pool': {
+                'size': 2,
+                'predictions': 2,
+                'wait_sum_ns': 500,
+                'wait_max_ns': 500,
+                'wait_p50_ns': 0,
+                'wait_p90_ns': 500,
+                'wait_p99_ns': 500,
+            },
+            'memory': _MEMORY_STATS,
+            'thermal': {
+                'max_temperature_c': 45.5,
+                'throttled': 0
+            },
+        })
+
+  def test_getPrometheusText(self):
+    ServerStats.set_engines(['models/"quoted".engine'])
+    ServerStats.start_request()
+    ServerStats.finish_request(200, {'compute_response': 1000000})
+    ServerStats.record_camera_request('front_door', 2000000)
+    ServerStats.record_camera_rejection('front_door', 'overloaded')
+    ServerStats.set_predictor_pool_size(2)
+    ServerStats.record_predictor_pool_wait(3000000)
+    ServerStats.set_thermal({'cpu_therm_temperature_c': 45.5, 'throttled': 0})
+    ServerStats.set_queue_depth_callback(lambda: 4)
+
+    self.assertEqual(
+        ServerStats.get_prometheus_text(), '\n'.join([
+            '# HELP detection_server_ready Whether the server has finished warming up.',
+            '# TYPE detection_server_ready gauge',
+            'detection_server_ready 1',
+            '# HELP detection_server_in_flight_requests Number of detection requests being processed.',
+            '# TYPE detection_server_in_flight_requests gauge',
+            'detection_server_in_flight_requests 0',
+            '# HELP detection_server_queue_depth Number of detection requests queued for inference.',
+            '# TYPE detection_server_queue_depth gauge',
+            'detection_server_queue_depth 4',
+            '# HELP detection_server_responses_total Number of detection responses by response code.',
+            '# TYPE detection_server_responses_total counter',
+            'detection_server_responses_total{response_code="200"} 1',
+            '# HELP detection_server_stage_latency_seconds Latency of each stage of the detection requests.',
+            '# TYPE detection_server_stage_latency_seconds summary',
+            'detection_server_stage_latency_seconds{stage="compute_response",response_code="200",quantile="0.5"} 0.001',
+            'detection_server_stage_latency_seconds{stage="compute_response",response_code="200",quantile="0.9"} 0.001',
+            'detection_server_stage_latency_seconds{stage="compute_response",response_code="200",quantile="0.99"} 0.001',
+            'detection_server_stage_latency_seconds_sum{stage="compute_response",response_code="200"} 0.001',
+            'detection_server_stage_latency_seconds_count{stage="compute_response",response_code="200"} 1',
+            '# HELP detection_server_engine_info The loaded TensorRT engine files.',
+            '# TYPE detection_server_engine_info gauge',
+            'detection_server_engine_info{path="models/\\"quoted\\".engine"} 1',
+            '# HELP detection_server_camera_requests_total Number of predictions by camera.',
+            '# TYPE detection_server_camera_requests_total counter',
+            'detection_server_camera_requests_total{camera="front_door"} 1',
+            '# HELP detection_server_camera_rejected_total Number of requests responded without predicting by camera and '
+            'reason.',
+            '# TYPE detection_server_camera_rejected_total counter',
+            'detection_server_camera_rejected_total{camera="front_door",reason="overloaded"} 1',
+            '# HELP detection_server_camera_queue_wait_seconds Time the requests waited for inference by camera.',
+            '# TYPE detection_server_camera_queue_wait_seconds summary',
+            'detection_server_camera_queue_wait_seconds{camera="front_door",quantile="0.5"} 0.002',
+            'detection_server_camera_queue_wait_seconds{camera="front_door",quantile="0.9"} 0.002',
+            'detection_server_camera_queue_wait_seconds{camera="front_door",quantile="0.99"} 0.002',
+            'detection_server_camera_queue_wait_seconds_sum{camera="front_door"} 0.002',
+            'detection_server_camera_queue_wait_seconds_count{camera="front_door"} 1',
+            '# HELP detection_server_predictor_pool_size Number of predictors that can predict at once.',
+            '# TYPE detection_server_predictor_pool_size gauge',
+            'detection_server_predictor_pool_size 2',
+            '# HELP detection_server_predictor_pool_wait_seconds Time the predictions waited for an idle predictor.',
+            '# TYPE detection_server_predictor_pool_wait_seconds summary',
+            'detection_server_predictor_pool_wait_seconds{quantile="0.5"} 0.003',
+            'detection_server_predictor_pool_wait_seconds{quantile="0.9"} 0.003',
+            'detection_server_predictor_pool_wait_seconds{quantile="0.99"} 0.003',
+            'detection_server_predictor_pool_wait_seconds_sum 0.003',
+            'detection_server_predictor_pool_wait_seconds_count 1',
+            '# TYPE detection_server_memory_rss_bytes gauge',
+            'detection_server_memory_rss_bytes 1000',
+            '# TYPE detection_server_memory_gc_collections_gen0 gauge',
+            'detection_server_memory_gc_collections_gen0 2',
+            '# TYPE detection_server_request_allocations_count gauge',
+            'detection_server_request_allocations_count{stage="predict"} 1',
+            'detection_server_request_allocations_count{stage="encode_response"} 1',
+            '# TYPE detection_server_request_allocations_retained_bytes gauge',
+            'detection_server_request_allocations_retained_bytes{stage="predict"} 10',
+            'detection_server_request_allocations_retained_bytes{stage="encode_response"} 0',
+            '# TYPE detection_server_request_allocations_peak_bytes gauge',
+            'detection_server_request_allocations_peak_bytes{stage="predict"} 20',
+            'detection_server_request_allocations_peak_bytes{stage="encode_response"} 5',
+            '# TYPE detection_server_request_allocations_max_peak_bytes gauge',
+            'detection_server_request_allocations_max_peak_bytes{stage="predict"} 20',
+            'detection_server_request_allocations_max_peak_bytes{stage="encode_response"} 5',
+            '# TYPE detection_server_thermal_cpu_therm_temperature_c gauge',
+            'detection_server_thermal_cpu_therm_temperature_c 45.5',
+            '# TYPE detection_server_thermal_throttled gauge',
+            'detection_server_thermal_throttled 0',
+        ]) + '\n')
+
+  def test_getTrackedCamera(self):
+    ServerStats.set_max_cameras(2)
+
+    self.assertEqual([ServerStats.get_tracked_camera(camera) for camera in ['a', 'b', 'c', 'a']],
+                     ['a', 'b', 'other', 'a'])
+
+  def test_getTrackedCamera_noMaxCameras(self):
+    self.assertEqual([ServerStats.get_tracked_camera(str(i)) for i in range(100)], [str(i) for i in range(100)])
+
+  def test_snapshotIsNotAffectedByLaterRequests(self):
+    ServerStats.start_request()
+    ServerStats.finish_request(200, {'compute_response': 100})
+    responses, latencies, _, _ = ServerStats._snapshot()
+
+    ServerStats.start_request()
+    ServerStats.finish_request(200, {'compute_response': 100})
+
+    self.assertEqual(responses, {200: 1})
+    self.assertEqual(latencies[('compute_response', 200)].count, 1)
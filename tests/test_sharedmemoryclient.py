@@ -0,0 +1,79 @@
+import os
+import socket
+import tempfile
+import threading
+from typing import List
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.sharedmemoryclient import SharedMemoryClient
+from simple_jetson_nano_detection_server.sharedmemoryprotocol import HANDSHAKE, REQUEST, RESPONSE, receive_exactly
+
+
+# Each test serves the client in place of SharedMemoryServer, which leases slot 1 of 2 and responds to each request with
+# the image read from the slot.
+class TestSharedMemoryClient(parameterized.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.socket_path = os.path.join(self.temp_dir.name, 'detection.sock')
+    self.ring_path = os.path.join(self.temp_dir.name, 'detection-ring')
+    with open(self.ring_path, 'wb') as fp:
+      fp.truncate(2 * 16)
+
+    self.requests: List[bytes] = []
+    self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.listener.bind(self.socket_path)
+    self.listener.listen()
+    self.thread = threading.Thread(target=self._serve, daemon=True)
+    self.thread.start()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.listener.close()
+    self.thread.join(timeout=5)
+    self.temp_dir.cleanup()
+    return super().tearDown()
+
+  def _serve(self) -> None:
+    connection, _ = self.listener.accept()
+    with connection:
+      ring_path = self.ring_path.encode()
+      connection.sendall(HANDSHAKE.pack(2, 16, 1, len(ring_path)) + ring_path)
+      while True:
+        try:
+          header = receive_exactly(connection, REQUEST.size)
+        except ConnectionError:
+          return
+        _, image_length, _, camera_length = REQUEST.unpack(header)
+        self.requests.append(header + receive_exactly(connection, camera_length))
+
+        with open(self.ring_path, 'rb') as fp:
+          fp.seek(16)
+          image_data = fp.read(image_length)
+        connection.sendall(RESPONSE.pack(200, len(image_data)) + image_data)
+
+  def test_connect_leasesSlot(self):
+    with SharedMemoryClient(self.socket_path) as client:
+      self.assertEqual((client.slot, client.slot_bytes), (1, 16))
+
+  def test_detect_writesImageIntoSlot(self):
+    with SharedMemoryClient(self.socket_path) as client:
+      self.assertEqual(client.detect(b'image-data'), (200, b'image-data'))
+      self.assertEqual(client.detect(b'image', 'front_door', deadline_ms=50), (200, b'image'))
+
+    self.assertEqual(self.requests, [
+        REQUEST.pack(1, 10, -1, 0),
+        REQUEST.pack(1, 5, 50, 10) + b'front_door',
+    ])
+
+  @parameterized.named_parameters(
+      ('imageTooBig', b'i' * 17, 'Expected the image size to be in (0, 16] bytes, got 17 instead'),
+      ('emptyImage', b'', 'Expected the image size to be in (0, 16] bytes, got 0 instead'),
+  )
+  def test_invalidImage_raises(self, image_data, message):
+    with SharedMemoryClient(self.socket_path) as client:
+      with self.assertRaisesWithLiteralMatch(AssertionError, message):
+        client.detect(image_data)
+
+    self.assertEmpty(self.requests)
@@ -0,0 +1,210 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.detectionrequesthandler import DetectionRequestHandler
+from simple_jetson_nano_detection_server.inferencescheduler import CameraOverloadedError
+from simple_jetson_nano_detection_server.requesttracer import _REQUEST_TRACE_WINDOW_S
+from simple_jetson_nano_detection_server.serverreadiness import ServerReadiness
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.sharedmemoryclient import SharedMemoryClient
+from simple_jetson_nano_detection_server.sharedmemoryprotocol import HANDSHAKE, REQUEST, RESPONSE, receive_exactly
+from simple_jetson_nano_detection_server.sharedmemoryserver import (_SHARED_MEMORY_RING_PATH,
+                                                                    _SHARED_MEMORY_SLOT_BYTES, _SHARED_MEMORY_SLOTS,
+                                                                    _SHARED_MEMORY_SOCKET_PATH, SharedMemoryServer)
+
+MOCK_GET_RESPONSE = Mock()
+
+
+@patch.object(DetectionRequestHandler, DetectionRequestHandler.get_response.__name__, MOCK_GET_RESPONSE)
+@patch.object(time, time.monotonic_ns.__name__, Mock(return_value=1000000))
+class TestSharedMemoryServer(parameterized.TestCase):
+
+  def setUp(self):
+    self.call_args: List[Tuple[Any, ...]] = []
+
+    # The image is copied, as the view is released once the response is computed.
+    def get_response(image_data: memoryview, multipart_boundary: Optional[str], camera: str,
+                     deadline_ns: Optional[int]) -> bytes:
+      self.call_args.append((bytes(image_data), multipart_boundary, camera, deadline_ns))
+      if camera == 'overloaded-camera':
+        raise CameraOverloadedError('Camera "overloaded-camera" already has 1 outstanding requests')
+      return b'{"predictions": [], "success": true}'
+
+    MOCK_GET_RESPONSE.side_effect = get_response
+
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.socket_path = os.path.join(self.temp_dir.name, 'detection.sock')
+    self.ring_path = os.path.join(self.temp_dir.name, 'detection-ring')
+    self.saved_flags = flagsaver.as_parsed(
+        (_SHARED_MEMORY_SOCKET_PATH, self.socket_path),
+        (_SHARED_MEMORY_RING_PATH, self.ring_path),
+        (_SHARED_MEMORY_SLOTS, str(2)),
+        (_SHARED_MEMORY_SLOT_BYTES, str(16)),
+        (_REQUEST_TRACE_WINDOW_S, str(0)),
+    )
+    self.saved_flags.__enter__()
+
+    ServerReadiness.set_ready()
+    ServerStats.reset()
+    self.server = SharedMemoryServer()
+    self.server.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.server.__exit__(None, None, None)
+    ServerReadiness.set_not_ready()
+    ServerStats.reset()
+    self.saved_flags.__exit__(None, None, None)
+    self.temp_dir.cleanup()
+    MOCK_GET_RESPONSE.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  def test_detect_readsImageFromSlot(self):
+    with SharedMemoryClient(self.socket_path) as client:
+      response_code, response = client.detect(b'image-data', 'front_door')
+      self.assertEqual(client.detect(b'image', 'front_door', deadline_ms=50), (200, response))
+
+    self.assertEqual(response_code, 200)
+    self.assertEqual(json.loads(response), {'predictions': [], 'success': True})
+    self.assertEqual(self.call_args, [
+        (b'image-data', None, 'front_door', None),
+        (b'image', None, 'front_door', 51000000),
+    ])
+
+  def test_noCamera_identifiesClientProcess(self):
+    with SharedMemoryClient(self.socket_path) as client:
+      client.detect(b'image-data')
+
+    self.assertEqual(self.call_args[0][2], f'pid-{os.getpid()}')
+
+  def test_rejected_returnsRejectionResponseCode(self):
+    with SharedMemoryClient(self.socket_path) as client:
+      response_code, response = client.detect(b'image-data', 'overloaded-camera')
+
+    self.assertEqual(response_code, 429)
+    self.assertEqual(json.loads(response), {
+        'class': 'CameraOverloadedError',
+        'message': 'Camera "overloaded-camera" already has 1 outstanding requests',
+    })
+
+  def test_notReady_returns503(self):
+    ServerReadiness.set_not_ready()
+
+    with SharedMemoryClient(self.socket_path) as client:
+      self.assertEqual(client.detect(b'image-data'), (503, b''))
+    MOCK_GET_RESPONSE.assert_not_called()
+
+  @parameterized.named_parameters(
+      ('imageTooBig', 0, 17, 'Expected the image length to be in (0, 16] bytes, got 17 instead'),
+      ('emptyImage', 0, 0, 'Expected the image length to be in (0, 16] bytes, got 0 instead'),
+      ('otherSlot', 1, 5, 'Expected slot 0 leased to the connection, got 1 instead'),
+  )
+  def test_invalidRequest_returns400(self, slot_offset, image_length, message):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+      connection.connect(self.socket_path)
+      _, _, slot, ring_path_length = HANDSHAKE.unpack(receive_exactly(connection, HANDSHAKE.size))
+      receive_exactly(connection, ring_path_length)
+      self.assertEqual(slot, 0)
+
+      connection.sendall(REQUEST.pack(slot + slot_offset, image_length, -1, 0))
+      response_code, response_length = RESPONSE.unpack(receive_exactly(connection, RESPONSE.size))
+      response = json.loads(receive_exactly(connection, response_length))
+
+    self.assertEqual(response_code, 400)
+    self.assertEqual(response, {'class': 'AssertionError', 'message': message})
+    MOCK_GET_RESPONSE.assert_not_called()
+
+  def test_invalidCamera_returns400(self):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+      connection.connect(self.socket_path)
+      _, _, slot, ring_path_length = HANDSHAKE.unpack(receive_exactly(connection, HANDSHAKE.size))
+      receive_exactly(connection, ring_path_length)
+
+      connection.sendall(REQUEST.pack(slot, 5, -1, 2) + b'\xff\xfe')
+      response_code, response_length = RESPONSE.unpack(receive_exactly(connection, RESPONSE.size))
+      response = json.loads(receive_exactly(connection, response_length))
+    self._wait_for_free_slot(slot)
+
+    self.assertEqual(response_code, 400)
+    self.assertEqual(response['class'], 'UnicodeDecodeError')
+    self.assertEqual(ServerStats.get_stats()['in_flight_requests'], 0)
+    self.assertEqual(ServerStats.get_stats()['responses'], {'400': 1})
+    MOCK_GET_RESPONSE.assert_not_called()
+
+  def test_clientDisconnected_finishesRequest(self):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+      connection.connect(self.socket_path)
+      _, _, slot, ring_path_length = HANDSHAKE.unpack(receive_exactly(connection, HANDSHAKE.size))
+      receive_exactly(connection, ring_path_length)
+      # Closes the connection in the middle of the camera.
+      connection.sendall(REQUEST.pack(slot, 5, -1, 10) + b'front')
+    self._wait_for_free_slot(slot)
+
+    self.assertEqual(ServerStats.get_stats()['in_flight_requests'], 0)
+    self.assertEmpty(ServerStats.get_stats()['responses'])
+
+  # Waits until the connection leasing the slot is closed on the server.
+  def _wait_for_free_slot(self, slot: int) -> None:
+    assert SharedMemoryServer._server is not None
+    ring = SharedMemoryServer._server.ring
+    for _ in range(500):
+      with ring._condition:
+        if slot in ring._free_slots:
+          return
+      time.sleep(0.01)
+    self.fail(f'Slot {slot} was not released')
+
+  def test_slotsAreReusedInReleasedOrder(self):
+    client_0 = SharedMemoryClient(self.socket_path)
+    client_1 = SharedMemoryClient(self.socket_path)
+    self.assertEqual((client_0.slot, client_1.slot), (0, 1))
+
+    # Waits for each connection to be closed on the server, so the slots are released in this order.
+    client_1.close()
+    self._wait_for_free_slot(1)
+    client_0.close()
+    self._wait_for_free_slot(0)
+
+    with SharedMemoryClient(self.socket_path) as client_2, SharedMemoryClient(self.socket_path) as client_3:
+      self.assertEqual((client_2.slot, client_3.slot), (1, 0))
+
+  def test_noFreeSlot_waitsForSlot(self):
+    clients = [SharedMemoryClient(self.socket_path) for _ in range(2)]
+    waiting_clients: List[SharedMemoryClient] = []
+    thread = threading.Thread(target=lambda: waiting_clients.append(SharedMemoryClient(self.socket_path)))
+    thread.start()
+
+    time.sleep(0.1)
+    self.assertEmpty(waiting_clients)
+
+    clients[1].close()
+    thread.join(timeout=5)
+    self.assertEqual(waiting_clients[0].slot, 1)
+    self.assertEqual(waiting_clients[0].detect(b'image-data')[0], 200)
+
+    waiting_clients[0].close()
+    clients[0].close()
+
+  def test_exit_removesFiles(self):
+    self.assertTrue(os.path.exists(self.socket_path))
+    self.assertEqual(os.path.getsize(self.ring_path), 32)
+
+    self.server.__exit__(None, None, None)
+
+    self.assertFalse(os.path.exists(self.socket_path))
+    self.assertFalse(os.path.exists(self.ring_path))
+
+  def test_noSocketPath_doesNothing(self):
+    self.server.__exit__(None, None, None)
+
+    with flagsaver.flagsaver((_SHARED_MEMORY_SOCKET_PATH, None)), SharedMemoryServer():
+      self.assertFalse(os.path.exists(self.socket_path))
+      self.assertFalse(os.path.exists(self.ring_path))
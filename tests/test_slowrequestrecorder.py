@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.imagedataextractor import _MAX_IMAGE_DATA_BYTES
+from simple_jetson_nano_detection_server.slowrequestrecorder import (_SLOW_REQUESTS_CAPTURE_IMAGES,
+                                                                     _SLOW_REQUESTS_PER_WINDOW, _SLOW_REQUESTS_WINDOW_S,
+                                                                     _SLOW_REQUESTS_WINDOWS, SlowRequest,
+                                                                     SlowRequestRecorder)
+
+MOCK_TIME_NS = Mock()
+
+_BOUNDARY = '241a860e9a94d2780e8e67095c27a662'
+_REQUEST_BODY = (b'--241a860e9a94d2780e8e67095c27a662\r\n'
+                 b'Content-Disposition: form-data; name="image"; filename="image"\r\n'
+                 b'\r\n'
+                 b'image-data\r\n'
+                 b'--241a860e9a94d2780e8e67095c27a662--\r\n')
+_RESPONSE = json.dumps({'predictions': [{'label': 'car'}, {'label': 'person'}], 'success': True}).encode()
+
+
+def _latencies_ns(compute_response_ns: int) -> Dict[str, int]:
+  return {
+      'parse_request_body': 10,
+      'compute_response': compute_response_ns,
+      'compute_response.predict': compute_response_ns - 1,
+  }
+
+
+@patch.object(time, time.time_ns.__name__, MOCK_TIME_NS)
+class TestSlowRequestRecorder(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_TIME_NS.return_value = 1700000000000000000
+    self.saved_flags = flagsaver.as_parsed(
+        (_SLOW_REQUESTS_PER_WINDOW, str(2)),
+        (_SLOW_REQUESTS_WINDOW_S, str(10)),
+        (_SLOW_REQUESTS_WINDOWS, str(2)),
+        (_SLOW_REQUESTS_CAPTURE_IMAGES, str(False)),
+        (_MAX_IMAGE_DATA_BYTES, str(1024)),
+    )
+    self.saved_flags.__enter__()
+    SlowRequestRecorder.reset()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    MOCK_TIME_NS.reset_mock(return_value=True, side_effect=True)
+    SlowRequestRecorder.reset()
+    self.saved_flags.__exit__(None, None, None)
+    return super().tearDown()
+
+  def _offer(self, compute_response_ns: int) -> None:
+    SlowRequestRecorder.offer(_latencies_ns(compute_response_ns), _REQUEST_BODY, _BOUNDARY, _RESPONSE)
+
+  def _get_total_ns(self):
+    return [r.total_ns for r in SlowRequestRecorder.get_slow_requests()]
+
+  def test_offer_buildsEntry(self):
+    self._offer(100)
+
+    self.assertListEqual(SlowRequestRecorder.get_slow_requests(), [
+        SlowRequest(
+            timestamp_ns=1700000000000000000,
+            total_ns=110,
+            latencies_ns=_latencies_ns(100),
+            request_bytes=len(_REQUEST_BODY),
+            prediction_count=2,
+            image_data=None,
+        )
+    ])
+
+  @flagsaver.as_parsed((_SLOW_REQUESTS_CAPTURE_IMAGES, str(True)))
+  def test_captureImages_keepsImageData(self):
+    self._offer(100)
+
+    self.assertEqual(SlowRequestRecorder.get_slow_requests()[0].image_data, b'image-data')
+
+  @flagsaver.as_parsed((_SLOW_REQUESTS_CAPTURE_IMAGES, str(True)))
+  def test_captureImages_noImage_keepsEntryWithoutImageData(self):
+    SlowRequestRecorder.offer(_latencies_ns(100), b'invalid-body', _BOUNDARY, _RESPONSE)
+
+    self.assertIsNone(SlowRequestRecorder.get_slow_requests()[0].image_data)
+
+  def test_keepsSlowestRequests(self):
+    for compute_response_ns in (300, 100, 500, 200, 400):
+      self._offer(compute_response_ns)
+
+    self.assertListEqual(self._get_total_ns(), [510, 410])
+
+  def test_keepsSlowestRequestsOfEachWindow(self):
+    for timestamp_ns, compute_response_ns in ((0, 100), (1, 200), (int(10e9), 50), (int(10e9) + 1, 300)):
+      MOCK_TIME_NS.return_value = 1700000000000000000 + timestamp_ns
+      self._offer(compute_response_ns)
+
+    self.assertListEqual(self._get_total_ns(), [310, 210, 110, 60])
+
+  def test_dropsOldestWindows(self):
+    for window in range(3):
+      MOCK_TIME_NS.return_value = 1700000000000000000 + window * int(10e9)
+      self._offer(window)
+
+    self.assertListEqual(self._get_total_ns(), [12, 11])
+
+  @flagsaver.as_parsed((_SLOW_REQUESTS_PER_WINDOW, str(0)))
+  def test_disabled_keepsNothing(self):
+    self._offer(100)
+
+    self.assertEmpty(SlowRequestRecorder.get_slow_requests())
+
+  @flagsaver.as_parsed((_SLOW_REQUESTS_CAPTURE_IMAGES, str(True)))
+  def test_dumpAndLoad(self):
+    self._offer(100)
+    self._offer(200)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+      path = SlowRequestRecorder.dump(os.path.join(temp_dir, 'slow-requests'))
+
+      self.assertEqual(path, os.path.join(temp_dir, 'slow-requests', 'slow-requests-1700000000000000000.json'))
+      self.assertListEqual(SlowRequestRecorder.load(path), SlowRequestRecorder.get_slow_requests())
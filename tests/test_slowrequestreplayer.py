@@ -0,0 +1,52 @@
+import time
+from unittest.mock import Mock, patch
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.predictorpool import PredictorPool
+from simple_jetson_nano_detection_server.slowrequestrecorder import SlowRequest
+from simple_jetson_nano_detection_server.slowrequestreplayer import SlowRequestReplayer
+
+MOCK_PREDICT = Mock()
+
+
+def _build_slow_request(image_data=b'image-data') -> SlowRequest:
+  return SlowRequest(
+      timestamp_ns=1700000000000000000,
+      total_ns=1100,
+      latencies_ns={
+          'compute_response': 1000,
+          'compute_response.predict': 900
+      },
+      request_bytes=100,
+      prediction_count=1,
+      image_data=image_data,
+  )
+
+
+@patch.object(PredictorPool, PredictorPool.predict.__name__, MOCK_PREDICT)
+class TestSlowRequestReplayer(parameterized.TestCase):
+
+  def tearDown(self) -> None:
+    MOCK_PREDICT.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 100, 0, 300, 0, 200]))
+  def test_replay(self):
+    result = SlowRequestReplayer.replay(_build_slow_request(), 3)
+
+    self.assertEqual(MOCK_PREDICT.call_count, 3)
+    MOCK_PREDICT.assert_called_with(b'image-data')
+    self.assertDictEqual(
+        result, {
+            'timestamp_ns': 1700000000000000000,
+            'recorded_total_ns': 1100,
+            'recorded_predict_ns': 900,
+            'replayed_median_predict_ns': 200,
+            'replayed_max_predict_ns': 300,
+            'slowdown': 4.5,
+        })
+
+  def test_noImageData_raises(self):
+    with self.assertRaisesWithLiteralMatch(Exception, 'The slow request has no image data'):
+      SlowRequestReplayer.replay(_build_slow_request(image_data=None), 3)
@@ -0,0 +1,166 @@
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.enginereloader import EngineReloader
+from simple_jetson_nano_detection_server.inferencescheduler import InferenceScheduler
+from simple_jetson_nano_detection_server.metricsaggregator import MetricsAggregator
+from simple_jetson_nano_detection_server.serverstats import ServerStats
+from simple_jetson_nano_detection_server.thermalgovernor import (_THERMAL_HYSTERESIS_C, _THERMAL_SAMPLE_INTERVAL_S,
+                                                                 _THERMAL_SYSFS_ROOT, _THERMAL_THROTTLE_TEMPERATURE_C,
+                                                                 _THERMAL_THROTTLED_ENGINE_PATH,
+                                                                 _THERMAL_THROTTLED_MAX_PREDICTING,
+                                                                 _THERMAL_THROTTLED_MAX_REQUEST_RATE, _THERMAL_ZONES,
+                                                                 ThermalGovernor)
+
+MOCK_SET_LIMITS = Mock()
+MOCK_START = Mock()
+MOCK_GET_DEFAULT_ENGINE_PATH = Mock()
+
+
+@patch.object(InferenceScheduler, InferenceScheduler.set_limits.__name__, MOCK_SET_LIMITS)
+@patch.object(EngineReloader, EngineReloader.start.__name__, MOCK_START)
+@patch.object(EngineReloader, EngineReloader.get_default_engine_path.__name__, MOCK_GET_DEFAULT_ENGINE_PATH)
+class TestThermalGovernor(parameterized.TestCase):
+
+  def setUp(self):
+    MOCK_START.return_value = True
+    MOCK_GET_DEFAULT_ENGINE_PATH.return_value = 'yolov8n.engine'
+
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self._write_file('class/thermal/thermal_zone0/type', 'CPU-therm\n')
+    self._write_file('class/thermal/thermal_zone0/temp', '45500\n')
+    self._write_file('class/thermal/thermal_zone1/type', 'GPU-therm\n')
+    self._write_file('class/thermal/thermal_zone1/temp', '44000\n')
+    # The PMIC zone of Jetson Nano always reads 100C.
+    self._write_file('class/thermal/thermal_zone2/type', 'PMIC-Die\n')
+    self._write_file('class/thermal/thermal_zone2/temp', '100000\n')
+    self._write_file('devices/system/cpu/cpu0/cpufreq/scaling_cur_freq', '1479000\n')
+    # An offline CPU has no frequency.
+    os.makedirs(os.path.join(self.temp_dir.name, 'devices/system/cpu/cpu1'))
+    self._write_file('class/devfreq/57000000.gpu/cur_freq', '921600000\n')
+
+    self.saved_flags = flagsaver.as_parsed(
+        (_THERMAL_SYSFS_ROOT, self.temp_dir.name),
+        (_THERMAL_SAMPLE_INTERVAL_S, str(3600)),
+        (_THERMAL_ZONES, 'CPU-therm,GPU-therm'),
+        (_THERMAL_THROTTLE_TEMPERATURE_C, str(80)),
+        (_THERMAL_HYSTERESIS_C, str(5)),
+        (_THERMAL_THROTTLED_MAX_PREDICTING, str(1)),
+        (_THERMAL_THROTTLED_MAX_REQUEST_RATE, str(2)),
+        (_THERMAL_THROTTLED_ENGINE_PATH, 'yolov8n-320.engine'),
+    )
+    self.saved_flags.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.saved_flags.__exit__(None, None, None)
+    self.temp_dir.cleanup()
+    ThermalGovernor._throttled = False
+    ThermalGovernor._engine_path = None
+    MOCK_SET_LIMITS.reset_mock(return_value=True, side_effect=True)
+    MOCK_START.reset_mock(return_value=True, side_effect=True)
+    MOCK_GET_DEFAULT_ENGINE_PATH.reset_mock(return_value=True, side_effect=True)
+    return super().tearDown()
+
+  def _write_file(self, name: str, content: str) -> None:
+    path = os.path.join(self.temp_dir.name, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fp:
+      fp.write(content)
+
+  def test_takeSnapshot(self):
+    self.assertEqual(
+        ThermalGovernor.take_snapshot(), {
+            'cpu_therm_temperature_c': 45.5,
+            'gpu_therm_temperature_c': 44.0,
+            'pmic_die_temperature_c': 100.0,
+            'max_temperature_c': 45.5,
+            'cpu0_frequency_hz': 1479000000,
+            'gpu_frequency_hz': 921600000,
+        })
+
+  def test_takeSnapshot_allZones(self):
+    with flagsaver.as_parsed((_THERMAL_ZONES, '')):
+      self.assertEqual(ThermalGovernor.take_snapshot()['max_temperature_c'], 100.0)
+
+  def test_takeSnapshot_noSysfs(self):
+    with flagsaver.as_parsed((_THERMAL_SYSFS_ROOT, os.path.join(self.temp_dir.name, 'missing'))):
+      self.assertEqual(ThermalGovernor.take_snapshot(), {})
+
+  @parameterized.named_parameters(
+      ('belowThreshold', 79.9, False),
+      ('atThreshold', 80.0, True),
+  )
+  def test_update_throttles(self, temperature_c: float, expected: bool):
+    ThermalGovernor.update({'max_temperature_c': temperature_c})
+
+    self.assertEqual(ThermalGovernor.is_throttled(), expected)
+    if expected:
+      MOCK_SET_LIMITS.assert_called_once_with(1, 2.0)
+    else:
+      MOCK_SET_LIMITS.assert_not_called()
+
+  def test_update_liftsLimitsAfterHysteresis(self):
+    ThermalGovernor.update({'max_temperature_c': 85.0})
+    ThermalGovernor.update({'max_temperature_c': 75.1})
+    self.assertTrue(ThermalGovernor.is_throttled())
+
+    ThermalGovernor.update({'max_temperature_c': 75.0})
+
+    self.assertFalse(ThermalGovernor.is_throttled())
+    self.assertEqual(MOCK_SET_LIMITS.call_args_list[-1].args, (None, None))
+    self.assertEqual(MOCK_SET_LIMITS.call_count, 2)
+
+  def test_update_noThreshold_neverThrottles(self):
+    with flagsaver.flagsaver((_THERMAL_THROTTLE_TEMPERATURE_C, None)):
+      ThermalGovernor.update({'max_temperature_c': 100.0})
+
+    self.assertFalse(ThermalGovernor.is_throttled())
+    MOCK_SET_LIMITS.assert_not_called()
+
+  def test_update_noEnginePath_keepsEngine(self):
+    with flagsaver.flagsaver((_THERMAL_THROTTLED_ENGINE_PATH, None)):
+      ThermalGovernor.update({'max_temperature_c': 85.0})
+
+    self.assertTrue(ThermalGovernor.is_throttled())
+    MOCK_START.assert_not_called()
+
+  def test_update_switchesEngine(self):
+    ThermalGovernor.update({'max_temperature_c': 85.0})
+    ThermalGovernor.update({'max_temperature_c': 85.0})
+    ThermalGovernor.update({'max_temperature_c': 70.0})
+
+    self.assertEqual([call_args.args[0] for call_args in MOCK_START.call_args_list],
+                     ['yolov8n-320.engine', 'yolov8n.engine'])
+
+  def test_update_retriesEngineReload(self):
+    MOCK_START.return_value = False
+    ThermalGovernor.update({'max_temperature_c': 85.0})
+    MOCK_START.return_value = True
+    ThermalGovernor.update({'max_temperature_c': 85.0})
+    ThermalGovernor.update({'max_temperature_c': 85.0})
+
+    self.assertEqual(MOCK_START.call_count, 2)
+    self.assertEqual(ThermalGovernor._engine_path, 'yolov8n-320.engine')
+
+  @patch.object(ServerStats, ServerStats.set_thermal.__name__)
+  @patch.object(MetricsAggregator, MetricsAggregator.record.__name__)
+  def test_run_recordsSnapshotAndLiftsLimitsOnExit(self, record: Mock, set_thermal: Mock):
+    self._write_file('class/thermal/thermal_zone1/temp', '90000\n')
+
+    with ThermalGovernor():
+      pass
+
+    record.assert_called_once()
+    self.assertEqual(record.call_args.args[0], 'thermal')
+    snapshot = record.call_args.args[1]
+    self.assertEqual(snapshot['max_temperature_c'], 90.0)
+    self.assertEqual(snapshot['throttled'], 1)
+    self.assertIn('average_predict_ns', snapshot)
+    set_thermal.assert_called_once_with(snapshot)
+
+    self.assertEqual([call_args.args for call_args in MOCK_SET_LIMITS.call_args_list], [(1, 2.0), (None, None)])
+    self.assertFalse(ThermalGovernor.is_throttled())
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.trafficrecorder import (_TRAFFIC_RECORD_DIR, _TRAFFIC_RECORD_MAX_BYTES,
+                                                                 _TRAFFIC_RECORD_QUEUE_SIZE, RecordedRequest,
+                                                                 TrafficLog, TrafficRecorder, get_index_path)
+
+_HEADERS = {'Content-Type': 'multipart/form-data; boundary=241a860e9a94d2780e8e67095c27a662'}
+_LATENCIES_NS = {'parse_request_body': 100, 'compute_response': 1000, 'compute_response.predict': 900}
+
+
+@patch.object(time, time.time_ns.__name__, Mock(return_value=1700000000000000000))
+class TestTrafficRecorder(parameterized.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.saved_flags = flagsaver.as_parsed(
+        (_TRAFFIC_RECORD_DIR, self.temp_dir.name),
+        (_TRAFFIC_RECORD_MAX_BYTES, str(1024)),
+        (_TRAFFIC_RECORD_QUEUE_SIZE, str(10)),
+    )
+    self.saved_flags.__enter__()
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    self.saved_flags.__exit__(None, None, None)
+    self.temp_dir.cleanup()
+    return super().tearDown()
+
+  def _get_log_path(self) -> str:
+    log_paths = [p for p in os.listdir(self.temp_dir.name) if p.endswith('.log')]
+    self.assertLen(log_paths, 1)
+    return os.path.join(self.temp_dir.name, log_paths[0])
+
+  def test_record(self):
+    with TrafficRecorder():
+      TrafficRecorder.record(_LATENCIES_NS, _HEADERS, b'request-body-1', 200, b'{"success": true}')
+      TrafficRecorder.record({'compute_response': 2000}, {}, b'request-body-2', 200, b'{"success": false}')
+
+    with TrafficLog(self._get_log_path()) as traffic_log:
+      self.assertLen(traffic_log, 2)
+      self.assertEqual(
+          traffic_log[0],
+          RecordedRequest(
+              arrival_ns=1700000000000000000 - 1100,
+              latency_ns=1100,
+              response_code=200,
+              headers=_HEADERS,
+              body=b'request-body-1',
+              response=b'{"success": true}',
+          ))
+      self.assertEqual(
+          traffic_log[1],
+          RecordedRequest(
+              arrival_ns=1700000000000000000 - 2000,
+              latency_ns=2000,
+              response_code=200,
+              headers={},
+              body=b'request-body-2',
+              response=b'{"success": false}',
+          ))
+
+  def test_maxBytes_stopsRecording(self):
+    with TrafficRecorder():
+      TrafficRecorder.record(_LATENCIES_NS, {}, b'0' * 1000, 200, b'{}')
+      TrafficRecorder.record(_LATENCIES_NS, {}, b'1' * 1000, 200, b'{}')
+
+    with TrafficLog(self._get_log_path()) as traffic_log:
+      self.assertLen(traffic_log, 1)
+      self.assertEqual(traffic_log[0].body, b'0' * 1000)
+
+  def test_writeFailure_stopsRecording(self):
+    release = threading.Event()
+
+    def write(*args) -> None:
+      release.wait(timeout=5)
+      raise OSError(28, 'No space left on device')
+
+    with patch.object(TrafficRecorder, TrafficRecorder._write.__name__, Mock(side_effect=write)):
+      with TrafficRecorder():
+        for _ in range(20):
+          TrafficRecorder.record(_LATENCIES_NS, {}, b'request-body', 200, b'{}')
+        release.set()
+        assert TrafficRecorder._thread is not None
+        TrafficRecorder._thread.join(timeout=5)
+        TrafficRecorder.record(_LATENCIES_NS, {}, b'request-body', 200, b'{}')
+
+    self.assertIsNone(TrafficRecorder._thread)
+    self.assertEqual(TrafficRecorder._dropped, 10)
+
+  def test_notEntered_doesNothing(self):
+    TrafficRecorder.record(_LATENCIES_NS, _HEADERS, b'request-body', 200, b'{}')
+
+    self.assertEmpty(os.listdir(self.temp_dir.name))
+
+  @flagsaver.flagsaver((_TRAFFIC_RECORD_DIR, None))
+  def test_noRecordDir_doesNothing(self):
+    with TrafficRecorder():
+      TrafficRecorder.record(_LATENCIES_NS, _HEADERS, b'request-body', 200, b'{}')
+
+    self.assertEmpty(os.listdir(self.temp_dir.name))
+
+  def test_truncatedLog_leavesOutIncompleteRequests(self):
+    with TrafficRecorder():
+      TrafficRecorder.record(_LATENCIES_NS, {}, b'request-body-1', 200, b'{}')
+      TrafficRecorder.record(_LATENCIES_NS, {}, b'request-body-2', 200, b'{}')
+
+    log_path = self._get_log_path()
+    with open(log_path, 'r+b') as fp:
+      fp.truncate(os.path.getsize(log_path) - 1)
+    with open(get_index_path(log_path), 'ab') as fp:
+      fp.write(b'partial')
+
+    with TrafficLog(log_path) as traffic_log:
+      self.assertLen(traffic_log, 1)
+      self.assertEqual(traffic_log[0].body, b'request-body-1')
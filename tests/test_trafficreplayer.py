@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.trafficrecorder import (_TRAFFIC_RECORD_DIR, _TRAFFIC_RECORD_MAX_BYTES,
+                                                                 _TRAFFIC_RECORD_QUEUE_SIZE, TrafficLog,
+                                                                 TrafficRecorder)
+from simple_jetson_nano_detection_server.trafficreplayer import TrafficReplayer
+
+_CAR = {'x_min': 1, 'y_min': 2, 'x_max': 3, 'y_max': 4, 'label': 'car', 'confidence': 0.5}
+_PERSON = {'x_min': 5, 'y_min': 6, 'x_max': 7, 'y_max': 8, 'label': 'person', 'confidence': 0.7}
+
+
+def _response(*predictions, success=True) -> bytes:
+  return json.dumps({'predictions': list(predictions), 'success': success}).encode()
+
+
+# Responds with the request body, which the tests set to the response to replay.
+class _EchoRequestHandler(BaseHTTPRequestHandler):
+
+  def do_POST(self) -> None:
+    body = self.rfile.read(int(self.headers['Content-Length']))
+    self.send_response_only(200 if self.headers['Content-Type'] == 'multipart/form-data; boundary=b' else 400)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args) -> None:
+    pass
+
+
+class TestTrafficReplayer(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('same', _response(_CAR, _PERSON), _response(_PERSON, _CAR), None),
+      ('withinTolerance', _response(_CAR), _response({**_CAR, 'confidence': 0.505}), None),
+      ('success', _response(), _response(success=False), 'Expected success to be True, got False instead'),
+      ('missing', _response(_CAR, _PERSON), _response(_CAR),
+       "Expected predictions [('car', 1, 2, 3, 4), ('person', 5, 6, 7, 8)], got [('car', 1, 2, 3, 4)] instead"),
+      ('box', _response(_CAR), _response({**_CAR, 'x_max': 4}),
+       "Expected predictions [('car', 1, 2, 3, 4)], got [('car', 1, 2, 4, 4)] instead"),
+      ('confidence', _response(_CAR), _response({**_CAR, 'confidence': 0.6}),
+       "Expected confidence of ('car', 1, 2, 3, 4) to be 0.5, got 0.6 instead"),
+  )
+  def test_compareResponses(self, recorded: bytes, replayed: bytes, expected):
+    self.assertEqual(TrafficReplayer.compare_responses(recorded, replayed, 0.01), expected)
+
+  def test_replay(self):
+    http_server = HTTPServer(('127.0.0.1', 0), _EchoRequestHandler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    self.addCleanup(http_server.server_close)
+    self.addCleanup(http_server.shutdown)
+
+    temp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(temp_dir.cleanup)
+    headers = {'Content-Type': 'multipart/form-data; boundary=b', 'Host': 'recorded-host', 'Content-Length': '1'}
+    with flagsaver.as_parsed((_TRAFFIC_RECORD_DIR, temp_dir.name), (_TRAFFIC_RECORD_MAX_BYTES, str(1024)),
+                             (_TRAFFIC_RECORD_QUEUE_SIZE, str(10))), TrafficRecorder():
+      # The echo server responds with the request body, so the third request gets a different response.
+      TrafficRecorder.record({'compute_response': 1000}, headers, _response(_CAR), 200, _response(_CAR))
+      TrafficRecorder.record({'compute_response': 1000}, headers, _response(), 200, _response())
+      TrafficRecorder.record({'compute_response': 1000}, headers, _response(), 200, _response(_PERSON))
+      TrafficRecorder.record({'compute_response': 1000}, {}, _response(), 200, _response())
+      # A request recorded with its error is replayed with the same error, which has no predictions to compare.
+      TrafficRecorder.record({'compute_response': 1000}, {}, b'invalid', 400, b'{"class": "AssertionError"}')
+
+    log_path = os.path.join(temp_dir.name, [p for p in os.listdir(temp_dir.name) if p.endswith('.log')][0])
+    with TrafficLog(log_path) as traffic_log:
+      report = TrafficReplayer(traffic_log, f'http://127.0.0.1:{http_server.server_port}', 0, 2, 0.01, 10).replay()
+
+    self.assertEqual(report['requests'], 5)
+    self.assertEqual(report['errors'], {'http_400': 1})
+    self.assertEqual(report['same_responses'], 3)
+    self.assertEqual(report['different_responses'], 1)
+    self.assertEqual(report['differences'][0]['index'], 2)
+    self.assertEqual(report['recorded_latency']['count'], 4)
+    self.assertEqual(report['recorded_latency']['max_ns'], 1000)
+    self.assertEqual(report['replayed_latency']['count'], 4)
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+from unittest.mock import Mock, patch
+
+from absl.testing import flagsaver, parameterized
+
+from simple_jetson_nano_detection_server.warmuprunner import (_WARMUP_IMAGE_PATHS, _WARMUP_LATENCY_TOLERANCE,
+                                                              _WARMUP_MAX_ITERATIONS, _WARMUP_STABLE_ITERATIONS,
+                                                              WarmupRunner)
+from simple_jetson_nano_detection_server.yolopredictor import YoloPredictor
+
+MOCK_PREDICT = Mock()
+
+
+class TestWarmupRunner(parameterized.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.image_path_1 = os.path.join(self.temp_dir.name, 'image-1.jpg')
+    self.image_path_2 = os.path.join(self.temp_dir.name, 'image-2.jpg')
+    with open(self.image_path_1, 'wb') as fp:
+      fp.write(b'image-data-1')
+    with open(self.image_path_2, 'wb') as fp:
+      fp.write(b'image-data-2')
+
+    self.saved_flags = flagsaver.as_parsed(
+        (_WARMUP_IMAGE_PATHS, self.image_path_1),
+        (_WARMUP_STABLE_ITERATIONS, str(2)),
+        (_WARMUP_MAX_ITERATIONS, str(5)),
+        (_WARMUP_LATENCY_TOLERANCE, str(0.1)),
+    )
+    self.saved_flags.__enter__()
+
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    MOCK_PREDICT.reset_mock(return_value=True, side_effect=True)
+    self.saved_flags.__exit__(None, None, None)
+    self.temp_dir.cleanup()
+    return super().tearDown()
+
+  # Latencies are 1000, 200, 105, 100.
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 1000, 0, 200, 0, 105, 0, 100]))
+  def test_stopsOnceLatencyIsStable(self):
+    self.assertEqual(WarmupRunner.run(MOCK_PREDICT), 4)
+
+    self.assertEqual(MOCK_PREDICT.call_count, 4)
+    MOCK_PREDICT.assert_called_with(b'image-data-1')
+
+  # Latencies are 1000, 200, 100, 50, 25.
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 1000, 0, 200, 0, 100, 0, 50, 0, 25]))
+  def test_latencyNeverStable_stopsAtMaxIterations(self):
+    self.assertEqual(WarmupRunner.run(MOCK_PREDICT), 5)
+    self.assertEqual(MOCK_PREDICT.call_count, 5)
+
+  # Latencies are 1000, 100, 100 for the first image, then 100, 100 for the second image.
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 1000, 0, 100, 0, 100, 0, 100, 0, 100]))
+  def test_multipleImages_warmsUpEachImage(self):
+    with flagsaver.as_parsed((_WARMUP_IMAGE_PATHS, f'{self.image_path_1},{self.image_path_2}')):
+      self.assertEqual(WarmupRunner.run(MOCK_PREDICT), 5)
+
+    self.assertEqual([c.args for c in MOCK_PREDICT.call_args_list], [
+        (b'image-data-1',),
+        (b'image-data-1',),
+        (b'image-data-1',),
+        (b'image-data-2',),
+        (b'image-data-2',),
+    ])
+
+  def test_maxIterationsLessThanStableIterations_raises(self):
+    with flagsaver.as_parsed((_WARMUP_MAX_ITERATIONS, str(1))):
+      with self.assertRaisesWithLiteralMatch(Exception, 'Expected --warmup_max_iterations to be >= 2, got 1 instead'):
+        WarmupRunner.run(MOCK_PREDICT)
+
+    MOCK_PREDICT.assert_not_called()
+
+  def test_predictionFails_raises(self):
+    MOCK_PREDICT.side_effect = ValueError('Prediction failed')
+
+    with self.assertRaisesWithLiteralMatch(ValueError, 'Prediction failed'):
+      WarmupRunner.run(MOCK_PREDICT)
+
+  # Latencies are 100, 100 for each predictor.
+  @patch.object(time, time.perf_counter_ns.__name__, Mock(side_effect=[0, 100, 0, 100, 0, 100, 0, 100]))
+  def test_runPredictors_warmsUpEachPredictor(self):
+    predictors = [Mock(spec=YoloPredictor), Mock(spec=YoloPredictor)]
+
+    self.assertEqual(WarmupRunner.run_predictors(predictors), 4)
+
+    for predictor in predictors:
+      self.assertEqual(predictor.predict.call_count, 2)
+      predictor.predict.assert_called_with(b'image-data-1', record_metrics=False)
@@ -0,0 +1,122 @@
+import socket
+import struct
+import threading
+
+from absl.testing import parameterized
+
+from simple_jetson_nano_detection_server.websocket import (CLOSE_MESSAGE_TOO_BIG, CLOSE_NORMAL, CLOSE_PROTOCOL_ERROR,
+                                                           OPCODE_BINARY, OPCODE_CLOSE, OPCODE_CONTINUATION,
+                                                           OPCODE_PING, OPCODE_PONG, OPCODE_TEXT, WebSocketConnection,
+                                                           get_accept_key)
+
+
+class TestWebSocket(parameterized.TestCase):
+
+  def setUp(self):
+    self.server_socket, self.client_socket = socket.socketpair()
+    self.server_files = (self.server_socket.makefile('rb'), self.server_socket.makefile('wb'))
+    self.client_files = (self.client_socket.makefile('rb'), self.client_socket.makefile('wb'))
+    self.server = WebSocketConnection(*self.server_files, max_message_bytes=100000)
+    self.client = WebSocketConnection(*self.client_files, max_message_bytes=100000, is_client=True)
+    return super().setUp()
+
+  def tearDown(self) -> None:
+    for f in (*self.server_files, *self.client_files):
+      f.close()
+    self.server_socket.close()
+    self.client_socket.close()
+    return super().tearDown()
+
+  def _send_raw(self, data: bytes) -> None:
+    self.client_files[1].write(data)
+    self.client_files[1].flush()
+
+  def _receive_raw(self, size: int) -> bytes:
+    return self.client_files[0].read(size)
+
+  def test_getAcceptKey_matchesRfcExample(self):
+    self.assertEqual(get_accept_key('dGhlIHNhbXBsZSBub25jZQ=='), 's3pPLMBiTxaQ9kYGzzhZRbK+xOo=')
+
+  @parameterized.named_parameters(
+      ('empty', 0),
+      ('short', 125),
+      ('length16', 126),
+      ('length64', 65536),
+  )
+  def test_clientToServer_unmasksPayload(self, size):
+    payload = bytes(i % 251 for i in range(size))
+
+    self.client.send(OPCODE_BINARY, payload)
+
+    self.assertEqual(self.server.receive(), (OPCODE_BINARY, payload))
+
+  def test_serverToClient_isNotMasked(self):
+    self.server.send(OPCODE_TEXT, b'{"sequence": 0}')
+
+    self.assertEqual(self._receive_raw(17), b'\x81\x0f{"sequence": 0}')
+
+  def test_rfcMaskedExample(self):
+    # A single-frame masked text message containing "Hello" from RFC 6455 section 5.7.
+    self._send_raw(b'\x81\x85\x37\xfa\x21\x3d\x7f\x9f\x4d\x51\x58')
+
+    self.assertEqual(self.server.receive(), (OPCODE_TEXT, b'Hello'))
+
+  def test_fragmentedMessage_isJoined(self):
+    self._send_raw(b'\x02\x83\x00\x00\x00\x00abc')
+    self._send_raw(b'\x89\x80\x00\x00\x00\x00')  # A ping between the fragments.
+    self._send_raw(b'\x80\x82\x00\x00\x00\x00de')
+
+    self.assertEqual(self.server.receive(), (OPCODE_BINARY, b'abcde'))
+    self.assertEqual(self._receive_raw(2), bytes([0x80 | OPCODE_PONG, 0]))
+
+  def test_ping_answersPong(self):
+    self.client.send(OPCODE_PING, b'ping')
+    self.client.send(OPCODE_BINARY, b'image')
+
+    self.assertEqual(self.server.receive(), (OPCODE_BINARY, b'image'))
+    self.assertEqual(self._receive_raw(6), bytes([0x80 | OPCODE_PONG, 4]) + b'ping')
+
+  def test_close_answersClose(self):
+    self.client.close(CLOSE_NORMAL, 'bye')
+
+    self.assertIsNone(self.server.receive())
+    self.assertEqual(self._receive_raw(4), bytes([0x80 | OPCODE_CLOSE, 2]) + struct.pack('>H', CLOSE_NORMAL))
+
+  def test_tooBig_closesWithMessageTooBig(self):
+    server = WebSocketConnection(*self.server_files, max_message_bytes=4)
+    self.client.send(OPCODE_BINARY, b'image')
+
+    self.assertIsNone(server.receive())
+    self.assertEqual(self._receive_raw(4)[2:], struct.pack('>H', CLOSE_MESSAGE_TOO_BIG))
+
+  @parameterized.named_parameters(
+      ('unmasked', b'\x82\x05image'),
+      ('unexpectedContinuation', bytes([0x80 | OPCODE_CONTINUATION, 0x80]) + b'\x00\x00\x00\x00'),
+      ('unknownOpcode', b'\x83\x80\x00\x00\x00\x00'),
+      ('fragmentedControl', bytes([OPCODE_PING, 0x80]) + b'\x00\x00\x00\x00'),
+  )
+  def test_invalidFrame_closesWithProtocolError(self, frame):
+    self._send_raw(frame)
+
+    self.assertIsNone(self.server.receive())
+    self.assertEqual(self._receive_raw(4)[2:], struct.pack('>H', CLOSE_PROTOCOL_ERROR))
+
+  def test_endOfStream_returnsNone(self):
+    self._send_raw(b'\x82\x85\x00\x00')
+    self.client_socket.shutdown(socket.SHUT_WR)
+
+    self.assertIsNone(self.server.receive())
+
+  def test_concurrentSends_areNotInterleaved(self):
+    payloads = [bytes([i]) * 70000 for i in range(4)]
+    threads = [threading.Thread(target=self.server.send, args=(OPCODE_BINARY, p)) for p in payloads]
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(self.client.receive() for _ in payloads))
+    reader.start()
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    reader.join(timeout=5)
+
+    self.assertCountEqual(received, [(OPCODE_BINARY, p) for p in payloads])
@@ -1,4 +1,5 @@
 import time
+from enum import Enum, auto
 from itertools import chain
 from typing import Any, Dict, List
 from unittest.mock import Mock, patch
@@ -7,23 +8,38 @@ from absl.testing import flagsaver, parameterized
 from line_protocol_cache.lineprotocolcache import LineProtocolCache
 
 from simple_jetson_nano_detection_server.cocolabel import CocoLabel
+from simple_jetson_nano_detection_server.metricsaggregator import (_FLUSH_BATCH_SIZE, _FLUSH_INTERVAL_S, _RAW_POINTS,
+                                                                   MetricsAggregator)
+from simple_jetson_nano_detection_server.performancetracker import PerformanceTracker
 from simple_jetson_nano_detection_server.prediction import Prediction
 from simple_jetson_nano_detection_server.yolopredictor import _HALF_PRECISION, _IMAGE_SIZE, YoloPredictor
 
 LINE_PROTOCOL_CACHE_PUT = Mock(return_value=None)
+MOCK_DECODE_IMAGE = Mock()
+
+
+class _Checkpoint(Enum):
+  PREDICT = auto()
 
 
 @patch.object(LineProtocolCache, LineProtocolCache.put.__name__, LINE_PROTOCOL_CACHE_PUT)
 @patch.object(time, time.time_ns.__name__, Mock(return_value=1700000000000000000))
+@patch.object(YoloPredictor, YoloPredictor.decode_image.__name__, MOCK_DECODE_IMAGE)
 class TestYoloPredictor(parameterized.TestCase):
 
   def setUp(self):
     self.saved_flags = flagsaver.as_parsed(
         (_HALF_PRECISION, str(False)),
         (_IMAGE_SIZE, str(12345)),
+        (_FLUSH_INTERVAL_S, str(3600)),
+        (_FLUSH_BATCH_SIZE, str(1000)),
+        (_RAW_POINTS, str(False)),
     )
     self.saved_flags.__enter__()
 
+    self.metrics_aggregator = MetricsAggregator()
+    self.metrics_aggregator.__enter__()
+
     mock_xyxy = Mock(tolist=Mock(return_value=[
         [132.5, 104.5, 177.5, 141.875],
         [264.25, 173.40625, 319.75, 179.09375],
@@ -46,23 +62,27 @@ class TestYoloPredictor(parameterized.TestCase):
         3.0,
     ]))
     mock_boxes = Mock(xyxy=mock_xyxy, conf=mock_conf, cls=mock_cls)
-    mock_result = Mock(boxes=mock_boxes)
+    mock_result = Mock(boxes=mock_boxes, speed={'preprocess': 1.5, 'inference': 20.25, 'postprocess': 2.0})
     mock_results = [mock_result]
 
     self.mock_yolo_predict = Mock(return_value=mock_results)
     self.mock_yolo = Mock(predict=self.mock_yolo_predict, names={1: 'person', 2: 'bicycle', 3: 'car'})
 
-    YoloPredictor.set_model(self.mock_yolo)
+    self.predictor = YoloPredictor(self.mock_yolo)
 
     LINE_PROTOCOL_CACHE_PUT.reset_mock(return_value=True, side_effect=True)
+    MOCK_DECODE_IMAGE.reset_mock(return_value=True, side_effect=True)
+    MOCK_DECODE_IMAGE.return_value = 'decoded-image'
 
     return super().setUp()
 
   def tearDown(self) -> None:
+    self.metrics_aggregator.__exit__(None, None, None)
     self.saved_flags.__exit__(None, None, None)
     return super().tearDown()
 
   def _assert_line_protocols(self, expected: List[str]) -> None:
+    MetricsAggregator.flush()
     points = chain.from_iterable([call_arg.args[0] for call_arg in LINE_PROTOCOL_CACHE_PUT.call_args_list])
     line_protocols = [p.to_line_protocol() for p in points]
     self.assertListEqual(line_protocols, expected)
@@ -70,45 +90,38 @@ class TestYoloPredictor(parameterized.TestCase):
   def _assertDictContainsSubset(self, subset: Dict[Any, Any], dictionary: Dict[Any, Any], msg: object = None) -> None:
     self.assertEqual(dictionary, {**dictionary, **subset}, msg)
 
-  def test_noModel_raises(self):
-    YoloPredictor._model = None
-
-    with self.assertRaisesWithLiteralMatch(Exception, 'A model must be set before prediction'):
-      YoloPredictor.predict(b'image-bytes')
-    LINE_PROTOCOL_CACHE_PUT.assert_not_called()
-
   def test_noResults_raises(self):
     self.mock_yolo_predict.return_value = []
 
     with self.assertRaisesWithLiteralMatch(Exception, 'There must be exactly 1 result, got 0 instead'):
-      YoloPredictor.predict(b'image-bytes')
+      self.predictor.predict(b'image-bytes')
 
     self._assert_line_protocols([
-        'prediction_input image_bytes=11i 1700000000000000000',
+        'prediction_input image_bytes=11i,images=1i 1700000000000000000',
     ])
 
   def test_moreThan1Results_raises(self):
     self.mock_yolo_predict.return_value = [Mock(), Mock()]
 
     with self.assertRaisesWithLiteralMatch(Exception, 'There must be exactly 1 result, got 2 instead'):
-      YoloPredictor.predict(b'image-bytes')
+      self.predictor.predict(b'image-bytes')
 
     self._assert_line_protocols([
-        'prediction_input image_bytes=11i 1700000000000000000',
+        'prediction_input image_bytes=11i,images=1i 1700000000000000000',
     ])
 
   def test_boxesIsNone_raises(self):
     self.mock_yolo_predict.return_value = [Mock(boxes=None)]
 
     with self.assertRaisesWithLiteralMatch(Exception, 'Boxes cannot be None'):
-      YoloPredictor.predict(b'image-bytes')
+      self.predictor.predict(b'image-bytes')
 
     self._assert_line_protocols([
-        'prediction_input image_bytes=11i 1700000000000000000',
+        'prediction_input image_bytes=11i,images=1i 1700000000000000000',
     ])
 
   def test_convertsToPredictions(self):
-    predictions = YoloPredictor.predict(b'image-bytes')
+    predictions = self.predictor.predict(b'image-bytes')
 
     self.assertEqual(predictions, [
         Prediction.build(x_min=132, x_max=177, y_min=104, y_max=141, label='person', confidence=0.6460136771202087),
@@ -118,32 +131,137 @@ class TestYoloPredictor(parameterized.TestCase):
         Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='car', confidence=0.40346994376182556),
     ])
     self._assert_line_protocols([
-        'prediction_input image_bytes=11i 1700000000000000000',
-        'prediction_output,confidence_percent=64,model_image_size=12345,model_precision=fp32 person=1i 1700000000000000000',
-        'prediction_output,confidence_percent=42,model_image_size=12345,model_precision=fp32 bicycle=1i 1700000000000000000',
-        'prediction_output,confidence_percent=29,model_image_size=12345,model_precision=fp32 car=2i 1700000000000000000',
-        'prediction_output,confidence_percent=40,model_image_size=12345,model_precision=fp32 car=1i 1700000000000000000',
+        'prediction_input image_bytes=11i,images=1i 1700000000000000000',
+        'prediction_output,confidence_percent=64,model_device=auto,model_image_size=12345,model_precision=fp32 person=1i 1700000000000000000',
+        'prediction_output,confidence_percent=42,model_device=auto,model_image_size=12345,model_precision=fp32 bicycle=1i 1700000000000000000',
+        'prediction_output,confidence_percent=29,model_device=auto,model_image_size=12345,model_precision=fp32 car=2i 1700000000000000000',
+        'prediction_output,confidence_percent=40,model_device=auto,model_image_size=12345,model_precision=fp32 car=1i 1700000000000000000',
     ])
 
   def test_callsModelWithFlagValues(self):
-    YoloPredictor.predict(b'image-bytes')
+    self.predictor.predict(b'image-bytes')
 
     call_args = self.mock_yolo_predict.call_args
     self._assertDictContainsSubset({'imgsz': 12345, 'half': False}, call_args.kwargs)
 
+  def test_decodesImageFromBuffer(self):
+    image_data = memoryview(b'image-bytes')
+
+    self.predictor.predict(image_data)
+
+    MOCK_DECODE_IMAGE.assert_called_once_with(image_data)
+    self.assertEqual(self.mock_yolo_predict.call_args.args, ('decoded-image',))
+
+  def test_imageCannotBeDecoded_raises(self):
+    MOCK_DECODE_IMAGE.return_value = None
+
+    with self.assertRaisesWithLiteralMatch(Exception, 'Failed to decode the image'):
+      self.predictor.predict(b'image-bytes')
+
+    self.mock_yolo_predict.assert_not_called()
+
+  @flagsaver.flagsaver((_HALF_PRECISION, True))
+  def test_cpuDevice_callsModelWithoutHalfPrecision(self):
+    YoloPredictor(self.mock_yolo, device='cpu').predict(b'image-bytes')
+
+    call_args = self.mock_yolo_predict.call_args
+    self._assertDictContainsSubset({'half': False, 'device': 'cpu'}, call_args.kwargs)
+
+  @flagsaver.flagsaver((_HALF_PRECISION, True))
+  def test_cpuDevice_recordsDeviceAndPrecision(self):
+    YoloPredictor(self.mock_yolo, device='cpu').predict(b'image-bytes')
+
+    self._assert_line_protocols([
+        'prediction_input image_bytes=11i,images=1i 1700000000000000000',
+        'prediction_output,confidence_percent=64,model_device=cpu,model_image_size=12345,model_precision=fp32 person=1i 1700000000000000000',
+        'prediction_output,confidence_percent=42,model_device=cpu,model_image_size=12345,model_precision=fp32 bicycle=1i 1700000000000000000',
+        'prediction_output,confidence_percent=29,model_device=cpu,model_image_size=12345,model_precision=fp32 car=2i 1700000000000000000',
+        'prediction_output,confidence_percent=40,model_device=cpu,model_image_size=12345,model_precision=fp32 car=1i 1700000000000000000',
+    ])
+
+  def test_multiplePredictions_aggregatesMetrics(self):
+    self.predictor.predict(b'image-bytes')
+    self.predictor.predict(b'more-image-bytes')
+
+    self._assert_line_protocols([
+        'prediction_input image_bytes=27i,images=2i 1700000000000000000',
+        'prediction_output,confidence_percent=64,model_device=auto,model_image_size=12345,model_precision=fp32 person=2i 1700000000000000000',
+        'prediction_output,confidence_percent=42,model_device=auto,model_image_size=12345,model_precision=fp32 bicycle=2i 1700000000000000000',
+        'prediction_output,confidence_percent=29,model_device=auto,model_image_size=12345,model_precision=fp32 car=4i 1700000000000000000',
+        'prediction_output,confidence_percent=40,model_device=auto,model_image_size=12345,model_precision=fp32 car=2i 1700000000000000000',
+    ])
+
   def test_noPredictions_skipsPredictionOutputMetrics(self):
     mock_xyxy = Mock(tolist=Mock(return_value=[]))
     mock_conf = Mock(tolist=Mock(return_value=[]))
     mock_cls = Mock(tolist=Mock(return_value=[]))
     mock_boxes = Mock(xyxy=mock_xyxy, conf=mock_conf, cls=mock_cls)
-    mock_result = Mock(boxes=mock_boxes)
+    mock_result = Mock(boxes=mock_boxes, speed={'preprocess': 1.5, 'inference': None, 'postprocess': None})
     mock_results = [mock_result]
     self.mock_yolo_predict = Mock(return_value=mock_results)
     self.mock_yolo = Mock(predict=self.mock_yolo_predict, names={1: 'person', 2: 'bicycle', 3: 'car'})
-    YoloPredictor.set_model(self.mock_yolo)
+    self.predictor = YoloPredictor(self.mock_yolo)
 
-    YoloPredictor.predict(b'image-bytes')
+    self.predictor.predict(b'image-bytes')
 
     self._assert_line_protocols([
-        'prediction_input image_bytes=11i 1700000000000000000',
+        'prediction_input image_bytes=11i,images=1i 1700000000000000000',
+    ])
+
+  def test_recordMetricsFalse_skipsMetrics(self):
+    tracker: PerformanceTracker[_Checkpoint] = PerformanceTracker()
+
+    with tracker(_Checkpoint.PREDICT), tracker.as_current():
+      self.predictor.predict(b'image-bytes', record_metrics=False)
+
+    self.assertNotIn('predict.record_input_metrics', tracker.get_latencies_ns())
+    self._assert_line_protocols([])
+
+  def test_currentTracker_tracksNestedSpans(self):
+    tracker: PerformanceTracker[_Checkpoint] = PerformanceTracker()
+
+    with tracker(_Checkpoint.PREDICT), tracker.as_current():
+      self.predictor.predict(b'image-bytes')
+
+    latencies_ns = tracker.get_latencies_ns()
+    self.assertListEqual(list(latencies_ns.keys()), [
+        'predict',
+        'predict.record_input_metrics',
+        'predict.decode_image',
+        'predict.model_predict',
+        'predict.model_predict.preprocess',
+        'predict.model_predict.inference',
+        'predict.model_predict.postprocess',
+        'predict.build_predictions',
+        'predict.record_output_metrics',
     ])
+    self.assertEqual(latencies_ns['predict.model_predict.preprocess'], 1500000)
+    self.assertEqual(latencies_ns['predict.model_predict.inference'], 20250000)
+    self.assertEqual(latencies_ns['predict.model_predict.postprocess'], 2000000)
+
+  def test_predictBatch_convertsEachResult(self):
+    self.mock_yolo_predict.return_value = self.mock_yolo_predict.return_value * 2
+
+    predictions = self.predictor.predict_batch(['image-0', 'image-1'])
+
+    self.assertEqual(predictions, [[
+        Prediction.build(x_min=132, x_max=177, y_min=104, y_max=141, label='person', confidence=0.6460136771202087),
+        Prediction.build(x_min=264, x_max=319, y_min=173, y_max=179, label='bicycle', confidence=0.42441198229789734),
+        Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='car', confidence=0.29746994376182556),
+        Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='car', confidence=0.29746994376182556),
+        Prediction.build(x_min=111, x_max=319, y_min=164, y_max=319, label='car', confidence=0.40346994376182556),
+    ]] * 2)
+    call_args = self.mock_yolo_predict.call_args_list[0]
+    self.assertEqual(call_args.args, (['image-0', 'image-1'],))
+    self._assertDictContainsSubset({'imgsz': 12345, 'half': False, 'batch': 2}, call_args.kwargs)
+
+  def test_predictBatch_skipsMetrics(self):
+    self.mock_yolo_predict.return_value = self.mock_yolo_predict.return_value * 2
+
+    self.predictor.predict_batch(['image-0', 'image-1'])
+
+    self._assert_line_protocols([])
+
+  def test_predictBatchWrongNumberOfResults_raises(self):
+    with self.assertRaisesWithLiteralMatch(Exception, 'There must be exactly 2 results, got 1 instead'):
+      self.predictor.predict_batch(['image-0', 'image-1'])